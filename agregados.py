@@ -0,0 +1,49 @@
+"""Totales del banco mantenidos de forma incremental"""
+import threading
+import time
+
+CAMPOS = ('total_usuarios', 'total_depositos', 'total_prestamos')
+
+
+class Agregados:
+    """Totales que BancoRealista actualiza en cada movimiento.
+
+    Leerlos cuesta O(1); `reconciliar` los contrasta con un recálculo
+    completo y corrige cualquier desvío.
+    """
+
+    def __init__(self):
+        self._valores = dict.fromkeys(CAMPOS, 0)
+        self._bloqueo = threading.Lock()
+        self.ultima_reconciliacion = None
+
+    def sumar(self, campo, delta):
+        with self._bloqueo:
+            self._valores[campo] += delta
+
+    def fijar(self, valores):
+        with self._bloqueo:
+            self._valores.update(valores)
+
+    def como_dict(self):
+        with self._bloqueo:
+            return dict(self._valores)
+
+    def __getattr__(self, campo):
+        if campo in CAMPOS:
+            return self._valores[campo]
+        raise AttributeError(campo)
+
+    def reconciliar(self, recalculados, tolerancia=1e-6):
+        """Compara con un recálculo completo, corrige y devuelve las diferencias"""
+        with self._bloqueo:
+            diferencias = {campo: recalculados[campo] - self._valores[campo]
+                           for campo in CAMPOS
+                           if abs(recalculados[campo] - self._valores[campo]) > tolerancia}
+            self._valores.update(recalculados)
+        self.ultima_reconciliacion = {
+            'fecha': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'diferencias': diferencias,
+        }
+        return diferencias
+
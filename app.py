@@ -1,79 +1,188 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import (Flask, Response, before_render_template, g, render_template, request, jsonify, session,
+                   redirect, stream_with_context, template_rendered, url_for)
+import click
+import csv
+import io
 import json
 import hashlib
-import random
+import hmac
 from datetime import datetime, timedelta
 import os
 import math
+import time
+import atexit
+import signal
+import sys
+from banco_realista import ErrorBanco, crear_banco
+from cache_paginas import CachePaginas
+from cuentas import es_valido as es_cuenta_valida
+from importacion import detectar_formato, importar
+from limites import LIMITES_POR_RUTA, ControlAdmision, CupoConexiones, Limitador, limites_por_worker
+from metricas import Metricas, Perfilador
+from prestamos import tabla_amortizacion
 
 app = Flask(__name__)
 app.secret_key = 'chiquibank_secreto_realista_2024'
 
-class BancoRealista:
-    def __init__(self):
-        self.solicitudes_pendientes = []
-        self.transacciones = []
-        self.saldo_banco = 50000000  # 50 millones de capital inicial
-        self.tasa_interes_activa = 0.12  # 12% anual para préstamos
-        self.tasa_interes_pasiva = 0.03  # 3% anual para ahorros
-        self.impuesto_transacciones = 0.02  # 2% de impuesto
-        
-        # Mercado de valores simulado
-        self.acciones = {
-            'TECH': {'precio': 150, 'volatilidad': 0.15, 'dividendo': 0.04},
-            'ENERGY': {'precio': 80, 'volatilidad': 0.08, 'dividendo': 0.06},
-            'BANK': {'precio': 120, 'volatilidad': 0.12, 'dividendo': 0.05},
-            'REALESTATE': {'precio': 95, 'volatilidad': 0.10, 'dividendo': 0.03}
-        }
-        
-        # Eventos deportivos para apuestas
-        self.eventos_deportivos = [
-            {'id': 1, 'evento': 'Barcelona vs Real Madrid', 'cuota_local': 2.1, 'cuota_visitante': 3.2, 'cuota_empate': 3.0},
-            {'id': 2, 'evento': 'Messi vs Ronaldo - Partido Amistoso', 'cuota_local': 1.8, 'cuota_visitante': 4.0, 'cuota_empate': 3.5},
-            {'id': 3, 'evento': 'Champions League Final', 'cuota_local': 2.5, 'cuota_visitante': 2.7, 'cuota_empate': 3.1}
-        ]
-        
-        # Usuarios iniciales
-        self.usuarios = {
-            'admin': {
-                'password': self._hash_password('admin123'), 
-                'tipo': 'admin',
-                'nombre': 'Director del Banco',
-                'fecha_creacion': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'saldo': 0
-            }
-        }
-        
-        # Portafolios de inversión
-        self.portafolios = {}
-    
-    def _hash_password(self, password):
-        return hashlib.sha256(password.encode()).hexdigest()
-    
-    def _generar_numero_cuenta(self):
-        while True:
-            numero = 'CHQ' + ''.join([str(random.randint(0, 9)) for _ in range(7)])
-            if not any(usuario_data.get('numero_cuenta') == numero 
-                      for usuario_data in self.usuarios.values()):
-                return numero
-    
-    def calcular_impuesto(self, monto):
-        return monto * self.impuesto_transacciones
-    
-    def actualizar_mercado(self):
-        """Actualiza los precios del mercado de valores"""
-        for simbolo, datos in self.acciones.items():
-            cambio = random.gauss(0, datos['volatilidad'])
-            nuevo_precio = datos['precio'] * (1 + cambio)
-            self.acciones[simbolo]['precio'] = max(10, nuevo_precio)  # Mínimo 10 ChiqDollars
+# Paginación del historial de transacciones
+LIMITE_TRANSACCIONES = 100
+LIMITE_MAXIMO_TRANSACCIONES = 1000
+
+# Estado de cuenta descargable: columnas del CSV y filas por trozo enviado
+COLUMNAS_ESTADO_CUENTA = ('id', 'fecha', 'tipo', 'descripcion', 'monto', 'estado')
+FILAS_POR_TROZO = 500
+
+banco = crear_banco()
+banco.iniciar_tareas()
+atexit.register(banco.cerrar)
+
+# Páginas ya renderizadas por usuario, válidas mientras no cambie su versión
+cache_paginas = CachePaginas()
+
+# Plantillas compiladas al arrancar y no en la primera visita de cada worker
+for plantilla in app.jinja_env.list_templates():
+    app.jinja_env.get_template(plantilla)
 
-banco = BancoRealista()
+# Límite por usuario y descarte de carga en las rutas que mueven dinero. Cada
+# worker lleva sus cubos y aplica su parte del límite; la saturación sí es
+# de cada proceso
+limitador = Limitador(limites_por_worker(int(os.environ.get('WEB_CONCURRENCY', 1))))
+admision = ControlAdmision(cola=banco.ordenes_en_cola)
+
+# Latencias por ruta, plantilla y tarea, y medidores del banco (ver /metrics)
+instrumentacion = Metricas()
+perfilador = Perfilador()
+for tarea in banco.tareas:
+    instrumentacion.agregar('tarea_segundos', tarea.duracion, 'Duración de cada ejecución de las tareas de fondo',
+                     tarea=tarea.nombre)
+instrumentacion.medidor('tarea_errores_total', 'Ejecuciones fallidas de las tareas de fondo',
+                 lambda: {(('tarea', t.nombre),): t.errores for t in banco.tareas}, 'counter')
+instrumentacion.medidor('transacciones', 'Transacciones en el libro', lambda: len(banco.transacciones))
+instrumentacion.medidor('transacciones_en_memoria', 'Transacciones del libro aún sin archivar',
+                 lambda: banco.transacciones.estadisticas()['en_memoria'])
+instrumentacion.medidor('asientos', 'Asientos en el diario', lambda: len(banco.diario))
+instrumentacion.medidor('solicitudes_pendientes', 'Solicitudes esperando aprobación',
+                 lambda: len(banco.solicitudes_pendientes))
+instrumentacion.medidor('ordenes_en_cola', 'Órdenes esperando su lote', banco.ordenes_en_cola)
+instrumentacion.medidor('ordenes_abiertas', 'Órdenes límite en reposo', lambda: len(banco.ordenes))
+instrumentacion.medidor('streams_mercado', 'Streams del mercado abiertos', lambda: streams_mercado.en_uso)
+instrumentacion.medidor('peticiones_en_curso', 'Peticiones admitidas en curso', lambda: admision.en_curso)
+instrumentacion.medidor('peticiones_descartadas_total', 'Peticiones rechazadas por saturación',
+                 lambda: {(('motivo', m),): n for m, n in admision.descartadas.items()}, 'counter')
+instrumentacion.medidor('peticiones_limitadas_total', 'Peticiones rechazadas por el límite por usuario',
+                 lambda: limitador.limitadas, 'counter')
+instrumentacion.medidor('saldo_banco', 'Fondos propios del banco', lambda: banco.saldo_banco)
+instrumentacion.medidor('cache_paginas_total', 'Páginas servidas desde la caché o renderizadas',
+                 lambda: {(('resultado', 'acierto'),): cache_paginas.aciertos,
+                          (('resultado', 'fallo'),): cache_paginas.fallos}, 'counter')
+
+@app.before_request
+def cronometrar():
+    g.inicio = time.perf_counter()
+
+@app.teardown_request
+def registrar_latencia(error=None):
+    inicio = g.pop('inicio', None)
+    if inicio is not None:
+        instrumentacion.medir('peticion_segundos', time.perf_counter() - inicio, 'Latencia de las peticiones por ruta',
+                       ruta=request.endpoint or 'desconocida', metodo=request.method)
+
+@before_render_template.connect_via(app)
+def inicio_plantilla(sender, template, context, **extra):
+    g.inicio_plantilla = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def fin_plantilla(sender, template, context, **extra):
+    inicio = g.pop('inicio_plantilla', None)
+    if inicio is not None:
+        instrumentacion.medir('plantilla_segundos', time.perf_counter() - inicio, 'Tiempo de render de las plantillas',
+                       plantilla=template.name)
 
-# Actualizar mercado cada vez que se accede
 @app.before_request
-def actualizar_mercado_antes():
-    if random.random() < 0.3:  # 30% de probabilidad de actualizar
-        banco.actualizar_mercado()
+def admitir():
+    if request.endpoint not in LIMITES_POR_RUTA or request.method == 'GET':
+        return None
+    espera = limitador.permitir(session.get('usuario') or request.remote_addr, request.endpoint)
+    if espera:
+        respuesta = jsonify({'error': 'Demasiadas solicitudes, intenta más tarde'})
+        respuesta.headers['Retry-After'] = str(math.ceil(espera))
+        return respuesta, 429
+    motivo = admision.entrar()
+    if motivo:
+        respuesta = jsonify({'error': 'Servicio saturado, intenta más tarde', 'motivo': motivo})
+        respuesta.headers['Retry-After'] = '1'
+        return respuesta, 503
+    g.inicio_admision = time.perf_counter()
+    return None
+
+@app.teardown_request
+def liberar_admision(error=None):
+    inicio = g.pop('inicio_admision', None)
+    if inicio is not None:
+        admision.salir(time.perf_counter() - inicio)
+
+def leer_monto(data, campo='monto'):
+    """`data[campo]` como número finito; ValueError si falta o no lo es.
+    
+    request.json acepta NaN e Infinity, y float() también los da desde texto.
+    """
+    valor = data.get(campo)
+    if isinstance(valor, bool) or not isinstance(valor, (int, float, str)):
+        raise ValueError(f'{campo} inválido')
+    monto = float(valor)
+    if not math.isfinite(monto):
+        raise ValueError(f'{campo} inválido')
+    return monto
+
+# ======================
+# CACHÉ DE PÁGINAS Y ESTÁTICOS
+# ======================
+
+_huellas_estaticos = {}
+
+def huella_estatico(archivo):
+    """Hash corto del contenido de un archivo de static (se calcula una vez por proceso)"""
+    huella = _huellas_estaticos.get(archivo)
+    if huella is None:
+        try:
+            with open(os.path.join(app.static_folder, archivo), 'rb') as f:
+                huella = hashlib.sha1(f.read()).hexdigest()[:12]
+        except OSError:
+            huella = ''
+        _huellas_estaticos[archivo] = huella
+    return huella
+
+@app.url_defaults
+def versionar_estaticos(endpoint, values):
+    # url_for('static', ...) lleva ?v=<huella>: al cambiar el archivo cambia la URL
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        values['v'] = huella_estatico(values['filename'])
+
+@app.after_request
+def cachear_estaticos(respuesta):
+    """Los estáticos con la huella vigente no caducan; sin ella se revalidan por ETag"""
+    if request.endpoint == 'static' and respuesta.status_code in (200, 304):
+        version = request.args.get('v')
+        if version and version == huella_estatico(request.view_args['filename']):
+            respuesta.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        else:
+            respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta
+
+def pagina_cacheada(pagina, version, armar):
+    """Respuesta de `pagina` para el usuario en sesión, desde la caché si su
+    `version` no cambió; si no, `armar()` la renderiza y se guarda.
+    
+    Lleva ETag, así una recarga sin cambios responde 304 sin cuerpo.
+    """
+    clave = (pagina, session['usuario'])
+    guardada = cache_paginas.obtener(clave, version)
+    if guardada is None:
+        guardada = cache_paginas.guardar(clave, version, armar())
+    respuesta = Response(guardada.html, mimetype='text/html')
+    respuesta.set_etag(guardada.etag)
+    respuesta.headers['Cache-Control'] = 'private, no-cache'
+    return respuesta.make_conditional(request)
 
 # ======================
 # RUTAS PRINCIPALES
@@ -121,32 +230,12 @@ def registro():
         if len(password) < 6:
             return render_template('registro.html', error='Contraseña muy corta (mínimo 6 caracteres)')
         
-        numero_cuenta = banco._generar_numero_cuenta()
         saldo_inicial = 1000  # Más realista: 1000 en lugar de 100
         
-        banco.usuarios[usuario] = {
-            'password': banco._hash_password(password),
-            'tipo': 'usuario',
-            'nombre': nombre,
-            'email': email,
-            'numero_cuenta': numero_cuenta,
-            'saldo': saldo_inicial,
-            'fecha_creacion': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'inversiones': {},
-            'prestamos': []
-        }
-        
-        # Inicializar portafolio
-        banco.portafolios[usuario] = {}
-        
-        banco.transacciones.append({
-            'usuario': usuario,
-            'tipo': 'apertura_cuenta',
-            'monto': saldo_inicial,
-            'fecha': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'estado': 'completado',
-            'descripcion': 'Apertura de cuenta + Capital inicial'
-        })
+        try:
+            numero_cuenta = banco.registrar_usuario(usuario, password, nombre, email, saldo_inicial)
+        except ErrorBanco as e:
+            return render_template('registro.html', error=str(e))
         
         return render_template('registro_exitoso.html', 
                              usuario=usuario, 
@@ -166,29 +255,31 @@ def usuario_dashboard():
         return redirect(url_for('login'))
     
     usuario = session['usuario']
-    info_usuario = banco.usuarios[usuario]
-    saldo = info_usuario.get('saldo', 0)
-    
-    # Calcular valor del portafolio
-    valor_portafolio = 0
-    if usuario in banco.portafolios:
-        for simbolo, cantidad in banco.portafolios[usuario].items():
-            if simbolo in banco.acciones:
-                valor_portafolio += cantidad * banco.acciones[simbolo]['precio']
-    
-    # Calcular deuda total
-    deuda_total = sum([p['monto_restante'] for p in info_usuario.get('prestamos', [])])
-    
-    patrimonio = saldo + valor_portafolio - deuda_total
-    
-    return render_template('usuario_realista.html', 
-                         usuario=usuario,
-                         nombre=session['nombre'],
-                         saldo=saldo,
-                         info_usuario=info_usuario,
-                         valor_portafolio=valor_portafolio,
-                         deuda_total=deuda_total,
-                         patrimonio=patrimonio)
+    mercado = banco.mercado.instantanea()
+    
+    def armar():
+        info_usuario = banco.usuarios[usuario]
+        saldo = info_usuario.get('saldo', 0)
+        
+        # Valor del portafolio (precalculado en cada tick del mercado)
+        valor_portafolio = banco.contabilidad.valoracion(usuario, mercado)['valor']
+        
+        # Calcular deuda total
+        deuda_total = sum([p['monto_restante'] for p in info_usuario.get('prestamos', [])])
+        
+        patrimonio = saldo + valor_portafolio - deuda_total
+        
+        return render_template('usuario_realista.html', 
+                             usuario=usuario,
+                             nombre=session['nombre'],
+                             saldo=saldo,
+                             info_usuario=info_usuario,
+                             valor_portafolio=valor_portafolio,
+                             deuda_total=deuda_total,
+                             patrimonio=patrimonio)
+    
+    # Sólo se recalcula si cambiaron sus cuentas o avanzó el mercado
+    return pagina_cacheada('usuario', (banco.version_usuario(usuario), mercado.secuencia, session['nombre']), armar)
 
 # ======================
 # SISTEMA DE INVERSIONES REALISTA
@@ -200,21 +291,109 @@ def inversiones():
         return redirect(url_for('login'))
     
     usuario = session['usuario']
-    portafolio = banco.portafolios.get(usuario, {})
-    
-    # Calcular ganancias/perdidas
-    ganancias_portafolio = {}
-    for simbolo, cantidad in portafolio.items():
-        if simbolo in banco.acciones:
-            precio_actual = banco.acciones[simbolo]['precio']
-            # En un sistema real, aquí calcularías el precio de compra
-            ganancias_portafolio[simbolo] = cantidad * precio_actual
-    
-    return render_template('inversiones.html',
-                         acciones=banco.acciones,
-                         portafolio=portafolio,
-                         ganancias_portafolio=ganancias_portafolio,
-                         usuario=usuario)
+    mercado = banco.mercado.instantanea()
+    
+    def armar():
+        # Costo, valor y ganancias por símbolo según los lotes de compra
+        resumen = banco.contabilidad.resumen(usuario, mercado)
+        
+        return render_template('inversiones.html',
+                             acciones=mercado,
+                             portafolio=resumen['simbolos'],
+                             totales=resumen['total'],
+                             usuario=usuario)
+    
+    return pagina_cacheada('inversiones', (banco.version_usuario(usuario), mercado.secuencia), armar)
+
+# Máximo que un long-poll de /api/mercado espera un tick nuevo
+ESPERA_MAXIMA_MERCADO = 30
+
+# Cada stream del mercado ocupa un hilo del worker mientras está abierto:
+# como mucho la mitad de los hilos, y cada uno dura DURACION_STREAM_MERCADO
+# segundos. Después (o si no hay lugar) la página sigue con el long-poll
+streams_mercado = CupoConexiones(int(os.environ.get(
+    'CHIQUIBANK_MAX_STREAMS', max(1, int(os.environ.get('CHIQUIBANK_HILOS', 8)) // 2))))
+DURACION_STREAM_MERCADO = 120
+
+def valorar_portafolio(usuario, mercado):
+    """Valor y ganancia de cada posición y del portafolio con los precios de `mercado`"""
+    resumen = banco.contabilidad.resumen(usuario, mercado)
+    return {'posiciones': {simbolo: p['valor'] for simbolo, p in resumen['simbolos'].items()},
+            'ganancias': {simbolo: p['no_realizado'] for simbolo, p in resumen['simbolos'].items()},
+            'valor_portafolio': resumen['total']['valor'],
+            'no_realizado': resumen['total']['no_realizado'],
+            'realizado': resumen['total']['realizado']}
+
+@app.route('/api/portafolio')
+def obtener_portafolio():
+    """Posiciones con costo medio y ganancias realizadas y no realizadas"""
+    if 'usuario' not in session:
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    return jsonify(banco.contabilidad.resumen(session['usuario'], banco.mercado.instantanea()))
+
+@app.route('/api/mercado')
+def obtener_mercado():
+    """Cotizaciones del último tick del mercado.
+    
+    Con `?desde=<secuencia>` funciona como long-poll: espera hasta que haya
+    un tick posterior (o hasta `espera` segundos) antes de responder.
+    """
+    desde = request.args.get('desde', type=int)
+    if desde is None:
+        mercado = banco.mercado.instantanea()
+    else:
+        espera = min(request.args.get('espera', ESPERA_MAXIMA_MERCADO, type=float), ESPERA_MAXIMA_MERCADO)
+        mercado = banco.mercado.esperar(desde, espera)
+    return Response(mercado.como_json(), mimetype='application/json')
+
+@app.route('/api/mercado/stream')
+def stream_mercado():
+    """Server-Sent Events: un evento por tick con precios y valor del portafolio.
+    
+    Todos los clientes comparten el mismo productor y la misma serialización
+    de precios; uno lento se salta ticks y recibe directamente el último.
+    Sin lugar en `streams_mercado` responde 503, y pasados
+    DURACION_STREAM_MERCADO segundos envía 'fin' y cierra: en los dos casos
+    la página sigue con el long-poll de /api/mercado.
+    """
+    if 'usuario' not in session:
+        return jsonify({'error': 'No autorizado'}), 401
+    if not streams_mercado.tomar():
+        respuesta = jsonify({'error': 'Demasiados streams abiertos, usa /api/mercado?desde='})
+        respuesta.headers['Retry-After'] = str(DURACION_STREAM_MERCADO)
+        return respuesta, 503
+    
+    usuario = session['usuario']
+    desde = request.headers.get('Last-Event-ID', 0, type=int)
+    fin = time.monotonic() + DURACION_STREAM_MERCADO
+    
+    def eventos():
+        yield 'retry: 3000\n\n'
+        for mercado in banco.mercado.suscribir(desde):
+            if time.monotonic() >= fin:
+                yield 'event: fin\ndata: {}\n\n'
+                return
+            if mercado is None:
+                yield ': latido\n\n'
+                continue
+            valoracion = json.dumps(valorar_portafolio(usuario, mercado))
+            yield (f'id: {mercado.secuencia}\nevent: precios\ndata: {mercado.como_json()}\n\n'
+                   f'event: portafolio\ndata: {valoracion}\n\n')
+    
+    respuesta = Response(eventos(), mimetype='text/event-stream',
+                         headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Se suelta al cerrar la respuesta, aunque el generador no haya llegado a empezar
+    respuesta.call_on_close(streams_mercado.soltar)
+    return respuesta
+
+@app.route('/api/mercado/<simbolo>/historial')
+def historial_mercado(simbolo):
+    """Velas OHLC de un símbolo"""
+    if simbolo not in banco.mercado.instantanea():
+        return jsonify({'error': 'Acción no encontrada'}), 404
+    limite = request.args.get('limite', type=int)
+    return jsonify({'simbolo': simbolo, 'velas': banco.mercado.historial(simbolo, limite)})
 
 @app.route('/comprar_acciones', methods=['POST'])
 def comprar_acciones():
@@ -226,47 +405,61 @@ def comprar_acciones():
     cantidad = int(data.get('cantidad', 0))
     usuario = session['usuario']
     
-    if simbolo not in banco.acciones:
-        return jsonify({'error': 'Acción no encontrada'}), 404
-    
-    precio = banco.acciones[simbolo]['precio']
-    costo_total = precio * cantidad
-    comision = costo_total * 0.01  # 1% de comisión
-    
-    total_a_pagar = costo_total + comision
-    
-    if banco.usuarios[usuario]['saldo'] < total_a_pagar:
-        return jsonify({'error': 'Fondos insuficientes'}), 400
-    
-    # Ejecutar compra
-    banco.usuarios[usuario]['saldo'] -= total_a_pagar
-    
-    # Actualizar portafolio
-    if usuario not in banco.portafolios:
-        banco.portafolios[usuario] = {}
-    
-    if simbolo in banco.portafolios[usuario]:
-        banco.portafolios[usuario][simbolo] += cantidad
-    else:
-        banco.portafolios[usuario][simbolo] = cantidad
-    
-    # Registrar transacción
-    banco.transacciones.append({
-        'usuario': usuario,
-        'tipo': 'compra_acciones',
-        'monto': total_a_pagar,
-        'fecha': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        'estado': 'completado',
-        'descripcion': f'Compra de {cantidad} acciones {simbolo} a {precio:.2f} c/u'
-    })
+    try:
+        compra = banco.comprar_acciones(usuario, simbolo, cantidad)
+    except ErrorBanco as e:
+        return jsonify({'error': str(e)}), e.codigo
     
     return jsonify({
         'mensaje': f'Compra exitosa: {cantidad} acciones {simbolo}',
-        'costo_total': costo_total,
-        'comision': comision,
-        'nuevo_saldo': banco.usuarios[usuario]['saldo']
+        'costo_total': compra['costo_total'],
+        'comision': compra['comision'],
+        'nuevo_saldo': compra['nuevo_saldo']
     })
 
+@app.route('/api/ordenes', methods=['GET', 'POST'])
+def ordenes():
+    """GET: órdenes abiertas del usuario. POST: nueva orden de mercado o límite"""
+    if 'usuario' not in session:
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    usuario = session['usuario']
+    if request.method == 'GET':
+        return jsonify({'ordenes': banco.ordenes.abiertas_de(usuario)})
+    
+    data = request.json or {}
+    try:
+        orden = banco.enviar_orden(usuario,
+                                   data.get('simbolo'),
+                                   data.get('lado'),
+                                   data.get('tipo', 'mercado'),
+                                   int(data.get('cantidad', 0)),
+                                   leer_monto(data, 'precio') if data.get('precio') is not None else None)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Cantidad o precio inválido'}), 400
+    except ErrorBanco as e:
+        return jsonify({'error': str(e)}), e.codigo
+    
+    return jsonify(orden)
+
+@app.route('/api/ordenes/<int:orden_id>', methods=['DELETE'])
+def cancelar_orden(orden_id):
+    if 'usuario' not in session:
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    try:
+        return jsonify(banco.cancelar_orden(session['usuario'], orden_id))
+    except ErrorBanco as e:
+        return jsonify({'error': str(e)}), e.codigo
+
+@app.route('/api/mercado/<simbolo>/libro')
+def libro_ordenes(simbolo):
+    """Profundidad del libro de órdenes de un símbolo"""
+    if simbolo not in banco.mercado.instantanea():
+        return jsonify({'error': 'Acción no encontrada'}), 404
+    niveles = min(request.args.get('niveles', 10, type=int), 100)
+    return jsonify(banco.ordenes.libro(simbolo).profundidad(niveles))
+
 # ======================
 # APUESTAS DEPORTIVAS REALISTAS
 # ======================
@@ -286,60 +479,64 @@ def apostar_deportes():
         return jsonify({'error': 'No autorizado'}), 401
     
     data = request.json
-    evento_id = int(data.get('evento_id'))
-    monto = float(data.get('monto'))
+    try:
+        evento_id = int(data.get('evento_id'))
+        monto = leer_monto(data)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Evento o monto inválido'}), 400
     resultado = data.get('resultado')  # 'local', 'visitante', 'empate'
     usuario = session['usuario']
     
-    # Encontrar evento
-    evento = next((e for e in banco.eventos_deportivos if e['id'] == evento_id), None)
-    if not evento:
-        return jsonify({'error': 'Evento no encontrada'}), 404
+    try:
+        apuesta = banco.apostar_deportes(usuario, evento_id, monto, resultado)
+    except ErrorBanco as e:
+        return jsonify({'error': str(e)}), e.codigo
     
-    if banco.usuarios[usuario]['saldo'] < monto:
-        return jsonify({'error': 'Fondos insuficientes'}), 400
+    # El premio se paga cuando el evento se liquida
+    return jsonify(dict(apuesta, mensaje=f"🎟️ Apuesta registrada a {apuesta['cuota']}x: "
+                                         f"premio posible {apuesta['premio_posible']:.2f}"))
+
+@app.route('/api/eventos')
+def eventos_deportivos():
+    """Eventos sin liquidar con sus cuotas y su exposición"""
+    if 'usuario' not in session:
+        return jsonify({'error': 'No autorizado'}), 401
     
-    # Determinar cuota
-    if resultado == 'local':
-        cuota = evento['cuota_local']
-    elif resultado == 'visitante':
-        cuota = evento['cuota_visitante']
-    else:
-        cuota = evento['cuota_empate']
-    
-    # Simular resultado (en la realidad sería impredecible)
-    resultados_posibles = ['local', 'visitante', 'empate']
-    pesos = [0.45, 0.35, 0.2]  # Probabilidades aproximadas
-    resultado_real = random.choices(resultados_posibles, weights=pesos)[0]
-    
-    ganancia = 0
-    if resultado == resultado_real:
-        ganancia = monto * cuota
-        mensaje = f"🎉 ¡GANASTE! Resultado: {resultado_real}"
-        banco.usuarios[usuario]['saldo'] += ganancia
-        estado = 'ganada'
-    else:
-        banco.usuarios[usuario]['saldo'] -= monto
-        mensaje = f"😞 Perdiste. Resultado real: {resultado_real}"
-        estado = 'perdida'
-        ganancia = -monto
-    
-    # Registrar apuesta
-    banco.transacciones.append({
-        'usuario': usuario,
-        'tipo': 'apuesta_deportiva',
-        'monto': ganancia,
-        'fecha': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        'estado': estado,
-        'descripcion': f'Apuesta en {evento["evento"]}: {resultado} (Cuota: {cuota}x)'
-    })
+    return jsonify({'eventos': banco.eventos_deportivos})
+
+@app.route('/api/admin/eventos', methods=['POST'])
+def crear_evento():
+    if 'usuario' not in session or session['tipo'] != 'admin':
+        return jsonify({'error': 'No autorizado'}), 401
     
-    return jsonify({
-        'mensaje': mensaje,
-        'resultado_real': resultado_real,
-        'ganancia': ganancia,
-        'nuevo_saldo': banco.usuarios[usuario]['saldo']
-    })
+    data = request.json or {}
+    try:
+        evento = banco.crear_evento(data.get('evento'), data.get('cuota_local'),
+                                    data.get('cuota_empate'), data.get('cuota_visitante'))
+    except ErrorBanco as e:
+        return jsonify({'error': str(e)}), e.codigo
+    return jsonify(evento), 201
+
+@app.route('/api/admin/eventos/<int:evento_id>/cerrar', methods=['POST'])
+def cerrar_evento(evento_id):
+    if 'usuario' not in session or session['tipo'] != 'admin':
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    try:
+        return jsonify(banco.cerrar_evento(evento_id))
+    except ErrorBanco as e:
+        return jsonify({'error': str(e)}), e.codigo
+
+@app.route('/api/admin/eventos/<int:evento_id>/liquidar', methods=['POST'])
+def liquidar_evento(evento_id):
+    """Fija el resultado (o lo sortea) y paga todas las apuestas del evento"""
+    if 'usuario' not in session or session['tipo'] != 'admin':
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    try:
+        return jsonify(banco.liquidar_evento(evento_id, (request.get_json(silent=True) or {}).get('resultado')))
+    except ErrorBanco as e:
+        return jsonify({'error': str(e)}), e.codigo
 
 # ======================
 # SISTEMA DE PRÉSTAMOS
@@ -351,12 +548,14 @@ def prestamos():
         return redirect(url_for('login'))
     
     usuario = session['usuario']
-    prestamos_usuario = banco.usuarios[usuario].get('prestamos', [])
     
-    return render_template('prestamos.html',
-                         prestamos=prestamos_usuario,
-                         tasa_interes=banco.tasa_interes_activa * 100,
-                         usuario=usuario)
+    def armar():
+        return render_template('prestamos.html',
+                             prestamos=banco.usuarios[usuario].get('prestamos', []),
+                             tasa_interes=banco.tasa_interes_activa * 100,
+                             usuario=usuario)
+    
+    return pagina_cacheada('prestamos', (banco.version_usuario(usuario), banco.tasa_interes_activa), armar)
 
 @app.route('/solicitar_prestamo', methods=['POST'])
 def solicitar_prestamo():
@@ -364,53 +563,44 @@ def solicitar_prestamo():
         return jsonify({'error': 'No autorizado'}), 401
     
     data = request.json
-    monto = float(data.get('monto'))
-    plazo_meses = int(data.get('plazo_meses', 12))
+    try:
+        monto = leer_monto(data)
+        plazo_meses = int(data.get('plazo_meses', 12))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Monto o plazo inválido'}), 400
+    if monto <= 0 or plazo_meses <= 0:
+        return jsonify({'error': 'Monto o plazo inválido'}), 400
     usuario = session['usuario']
     
-    # Análisis de riesgo básico
-    salario_promedio = 2000  # Salario promedio simulado
-    capacidad_pago = salario_promedio * 0.3  # 30% del salario para deudas
-    
-    cuota_mensual = (monto * (1 + banco.tasa_interes_activa)) / plazo_meses
-    
-    if cuota_mensual > capacidad_pago:
-        return jsonify({'error': 'Préstamo rechazado: capacidad de pago insuficiente'}), 400
-    
-    # Crear préstamo
-    prestamo = {
-        'id': len(banco.usuarios[usuario].get('prestamos', [])) + 1,
-        'monto_original': monto,
-        'monto_restante': monto * (1 + banco.tasa_interes_activa),
-        'tasa_interes': banco.tasa_interes_activa,
-        'plazo_meses': plazo_meses,
-        'cuota_mensual': cuota_mensual,
-        'fecha_otorgamiento': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        'estado': 'activo'
-    }
-    
-    if 'prestamos' not in banco.usuarios[usuario]:
-        banco.usuarios[usuario]['prestamos'] = []
-    
-    banco.usuarios[usuario]['prestamos'].append(prestamo)
-    banco.usuarios[usuario]['saldo'] += monto
-    banco.saldo_banco -= monto
-    
-    banco.transacciones.append({
-        'usuario': usuario,
-        'tipo': 'prestamo_otorgado',
-        'monto': monto,
-        'fecha': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        'estado': 'completado',
-        'descripcion': f'Préstamo aprobado: {monto} a {plazo_meses} meses'
-    })
+    # Análisis de riesgo con el historial del usuario (ver riesgo.py)
+    evaluacion = banco.riesgo.evaluar(usuario, monto, plazo_meses)
+    if not evaluacion.aprobado:
+        return jsonify({'error': f'Préstamo rechazado: {evaluacion.motivo.lower()}',
+                        'puntaje_riesgo': evaluacion.puntaje}), 400
+    
+    prestamo = banco.otorgar_prestamo(usuario, monto, plazo_meses)
     
     return jsonify({
         'mensaje': 'Préstamo aprobado',
         'prestamo': prestamo,
+        'puntaje_riesgo': evaluacion.puntaje,
         'nuevo_saldo': banco.usuarios[usuario]['saldo']
     })
 
+@app.route('/api/prestamos/<int:prestamo_id>/amortizacion')
+def amortizacion_prestamo(prestamo_id):
+    """Tabla de amortización del préstamo según sus condiciones originales"""
+    if 'usuario' not in session:
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    prestamo = next((p for p in banco.prestamos_de(session['usuario']) if p['id'] == prestamo_id), None)
+    if prestamo is None:
+        return jsonify({'error': 'Préstamo no encontrado'}), 404
+    
+    return jsonify({'prestamo': prestamo,
+                    'tabla': tabla_amortizacion(prestamo['monto_original'], prestamo['tasa_interes'],
+                                                prestamo['plazo_meses'])})
+
 # ======================
 # ADMINISTRACIÓN
 # ======================
@@ -420,29 +610,85 @@ def admin_dashboard():
     if 'usuario' not in session or session['tipo'] != 'admin':
         return redirect(url_for('login'))
     
-    total_usuarios = len([u for u in banco.usuarios.values() if u['tipo'] == 'usuario'])
-    total_solicitudes = len(banco.solicitudes_pendientes)
+    # Métricas financieras mantenidas de forma incremental por el banco
+    agregados = banco.agregados.como_dict()
+    valores = dict(nombre=session['nombre'],
+                   total_usuarios=agregados['total_usuarios'],
+                   total_solicitudes=len(banco.solicitudes_pendientes),
+                   saldo_banco=banco.saldo_banco,
+                   total_depositos=agregados['total_depositos'],
+                   total_prestamos=agregados['total_prestamos'])
+    
+    # Los valores son baratos de leer: la página sólo se renderiza si alguno cambió
+    return pagina_cacheada('admin', tuple(valores.values()),
+                           lambda: render_template('admin.html', usuario=session['usuario'], **valores))
+
+@app.route('/api/metrics', methods=['GET'])
+def metricas():
+    """Las mismas métricas del panel en JSON, para monitoreo"""
+    if 'usuario' not in session or session['tipo'] != 'admin':
+        return jsonify({'error': 'No autorizado'}), 401
     
-    # Calcular métricas financieras
-    total_depositos = sum([u.get('saldo', 0) for u in banco.usuarios.values() if u['tipo'] == 'usuario'])
-    total_prestamos = sum([sum(p['monto_restante'] for p in u.get('prestamos', [])) 
-                          for u in banco.usuarios.values() if u['tipo'] == 'usuario'])
+    metricas_banco = banco.agregados.como_dict()
+    metricas_banco['total_solicitudes'] = len(banco.solicitudes_pendientes)
+    metricas_banco['saldo_banco'] = banco.saldo_banco
+    metricas_banco['ultima_reconciliacion'] = banco.agregados.ultima_reconciliacion
+    metricas_banco['limitador'] = limitador.estadisticas()
+    metricas_banco['admision'] = admision.estadisticas()
+    metricas_banco['historial'] = banco.transacciones.estadisticas()
+    metricas_banco['cache_paginas'] = cache_paginas.estadisticas()
+    return jsonify(metricas_banco)
+
+@app.route('/metrics')
+def metricas_prometheus():
+    """Latencias y medidores en formato de texto de Prometheus.
+    
+    Exponen el saldo del banco y el estado de los límites, así que piden
+    una sesión de admin o el token Bearer de CHIQUIBANK_METRICAS_TOKEN;
+    CHIQUIBANK_METRICAS_PUBLICAS=1 las abre a cualquiera.
+    """
+    token = os.environ.get('CHIQUIBANK_METRICAS_TOKEN')
+    autorizado = (os.environ.get('CHIQUIBANK_METRICAS_PUBLICAS') == '1'
+                  or session.get('tipo') == 'admin'
+                  or (token and hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                                    f'Bearer {token}'.encode())))
+    if not autorizado:
+        return Response('No autorizado\n', status=401, mimetype='text/plain')
+    return Response(instrumentacion.prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/admin/perfilador', methods=['GET', 'POST'])
+def perfilador_admin():
+    """GET: pilas muestreadas en formato plegado (flamegraph.pl, speedscope).
+    POST {"activo": true|false, "reiniciar": bool}: enciende o apaga el muestreo"""
+    if 'usuario' not in session or session['tipo'] != 'admin':
+        return jsonify({'error': 'No autorizado'}), 401
     
-    return render_template('admin.html', 
-                         usuario=session['usuario'],
-                         nombre=session['nombre'],
-                         total_usuarios=total_usuarios,
-                         total_solicitudes=total_solicitudes,
-                         saldo_banco=banco.saldo_banco,
-                         total_depositos=total_depositos,
-                         total_prestamos=total_prestamos)
+    if request.method == 'GET':
+        return Response(perfilador.plegado(), mimetype='text/plain')
+    data = request.json or {}
+    if data.get('reiniciar'):
+        perfilador.reiniciar()
+    if data.get('activo'):
+        perfilador.iniciar()
+    elif 'activo' in data:
+        perfilador.detener()
+    return jsonify({'activo': perfilador.activo, 'muestras': perfilador.muestras,
+                    'pilas': len(perfilador.pilas), 'descartadas': perfilador.descartadas})
+
+@app.route('/api/admin/reconciliar', methods=['POST'])
+def reconciliar():
+    """Fuerza la reconciliación de los totales contra un recálculo completo"""
+    if 'usuario' not in session or session['tipo'] != 'admin':
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    return jsonify({'diferencias': banco.reconciliar_agregados()})
 
 @app.route('/api/solicitudes', methods=['GET'])
 def obtener_solicitudes():
     if 'usuario' not in session or session['tipo'] != 'admin':
         return jsonify({'error': 'No autorizado'}), 401
     
-    return jsonify({'solicitudes': banco.solicitudes_pendientes})
+    return jsonify({'solicitudes': list(banco.solicitudes_pendientes)})
 
 @app.route('/api/procesar_solicitud', methods=['POST'])
 def procesar_solicitud():
@@ -453,52 +699,111 @@ def procesar_solicitud():
     solicitud_id = data.get('solicitud_id')
     accion = data.get('accion')
     
-    for solicitud in banco.solicitudes_pendientes:
-        if solicitud['id'] == solicitud_id:
-            usuario = solicitud['usuario']
-            tipo = solicitud['tipo']
-            monto = solicitud['monto']
-            descripcion = solicitud.get('descripcion', '')
-            
-            if accion == 'aprobar':
-                if tipo == 'deposito':
-                    # Aplicar impuesto
-                    impuesto = banco.calcular_impuesto(monto)
-                    monto_neto = monto - impuesto
-                    
-                    banco.usuarios[usuario]['saldo'] += monto_neto
-                    banco.saldo_banco += monto_neto
-                    estado_final = 'aprobado'
-                    mensaje = f'Depósito de {monto} aprobado (Impuesto: -{impuesto})'
-                elif tipo == 'retiro':
-                    if banco.usuarios[usuario]['saldo'] >= monto:
-                        banco.usuarios[usuario]['saldo'] -= monto
-                        banco.saldo_banco -= monto
-                        estado_final = 'aprobado'
-                        mensaje = f'Retiro de {monto} aprobado'
-                    else:
-                        estado_final = 'rechazado_fondos'
-                        mensaje = 'Fondos insuficientes'
-            else:
-                estado_final = 'rechazado'
-                mensaje = f'Solicitud de {tipo} rechazada'
-            
-            # Actualizar transacción
-            for trans in banco.transacciones:
-                if (trans['usuario'] == usuario and 
-                    trans['monto'] == monto and 
-                    trans['tipo'] == tipo and
-                    trans.get('descripcion') == descripcion and
-                    trans['estado'] == 'pendiente_aprobacion'):
-                    trans['estado'] = estado_final
-                    trans['fecha_procesamiento'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    trans['procesado_por'] = session['usuario']
-                    break
-            
-            banco.solicitudes_pendientes.remove(solicitud)
-            return jsonify({'mensaje': mensaje})
-    
-    return jsonify({'error': 'Solicitud no encontrada'}), 404
+    try:
+        resultado = banco.procesar_solicitud(solicitud_id, accion, session['usuario'])
+    except ErrorBanco as e:
+        return jsonify({'error': str(e)}), e.codigo
+    if resultado is None:
+        return jsonify({'error': 'Solicitud no encontrada'}), 404
+    
+    mensaje, _ = resultado
+    return jsonify({'mensaje': mensaje})
+
+@app.route('/api/procesar_solicitudes', methods=['POST'])
+def procesar_solicitudes():
+    """Aprobación/rechazo masivo: {'solicitud_ids': [...]} o {'todas': true}"""
+    if 'usuario' not in session or session['tipo'] != 'admin':
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    data = request.json
+    accion = data.get('accion')
+    if accion not in ('aprobar', 'rechazar'):
+        return jsonify({'error': 'Acción inválida'}), 400
+    
+    if data.get('todas'):
+        solicitud_ids = banco.solicitudes_pendientes.ids()
+    else:
+        solicitud_ids = data.get('solicitud_ids', [])
+    
+    por_estado = {}
+    errores = []
+    for solicitud_id in solicitud_ids:
+        try:
+            resultado = banco.procesar_solicitud(solicitud_id, accion, session['usuario'])
+        except ErrorBanco as e:
+            errores.append({'id': solicitud_id, 'error': str(e)})
+            continue
+        if resultado is None:
+            errores.append({'id': solicitud_id, 'error': 'Solicitud no encontrada'})
+            continue
+        _, estado_final = resultado
+        por_estado[estado_final] = por_estado.get(estado_final, 0) + 1
+    
+    return jsonify({
+        'procesadas': sum(por_estado.values()),
+        'por_estado': por_estado,
+        'errores': errores
+    })
+
+@app.route('/api/admin/cierre_mes', methods=['POST'])
+def cierre_mes():
+    """Ejecuta el cierre de mes de los préstamos (por defecto, el mes anterior)"""
+    if 'usuario' not in session or session['tipo'] != 'admin':
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    try:
+        resumen = banco.cerrar_mes((request.get_json(silent=True) or {}).get('mes'))
+    except ErrorBanco as e:
+        return jsonify({'error': str(e)}), e.codigo
+    return jsonify(resumen)
+
+@app.route('/api/admin/intereses', methods=['POST'])
+def devengar_intereses():
+    """Abona los intereses de los ahorros hasta un día (por defecto, ayer)"""
+    if 'usuario' not in session or session['tipo'] != 'admin':
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    try:
+        resumen = banco.devengar_intereses((request.get_json(silent=True) or {}).get('dia'))
+    except ErrorBanco as e:
+        return jsonify({'error': str(e)}), e.codigo
+    return jsonify(resumen)
+
+@app.route('/api/admin/riesgo')
+def riesgo_cartera():
+    """Vuelve a puntuar la cartera de préstamos, del mayor al menor riesgo"""
+    if 'usuario' not in session or session['tipo'] != 'admin':
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    limite = request.args.get('limite', 100, type=int)
+    cartera = banco.riesgo.evaluar_cartera()
+    return jsonify({'modelo': banco.riesgo.modelo.nombre,
+                    'deudores': len(cartera),
+                    'cartera': cartera[:limite]})
+
+@app.route('/api/admin/diario')
+def diario_contable():
+    """Cuadre del diario, o el saldo de una cuenta (?cuenta=) a una fecha (?fecha=)"""
+    if 'usuario' not in session or session['tipo'] != 'admin':
+        return jsonify({'error': 'No autorizado'}), 401
+
+    cuenta = request.args.get('cuenta')
+    if cuenta is None:
+        return jsonify(banco.verificar_diario())
+    fecha = request.args.get('fecha')
+    try:
+        saldo = banco.diario.saldo(cuenta, fecha=fecha)
+    except ValueError:
+        return jsonify({'error': 'Fecha inválida, use AAAA-MM-DD o AAAA-MM-DD HH:MM:SS'}), 400
+    return jsonify({'cuenta': cuenta, 'fecha': fecha, 'saldo': saldo})
+
+@app.route('/api/almacen', methods=['GET'])
+def estadisticas_almacen():
+    """Tiempo de recuperación y latencia de commit del almacén"""
+    if 'usuario' not in session or session['tipo'] != 'admin':
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    return jsonify(banco.almacen.estadisticas())
 
 # ======================
 # TRANSACCIONES BÁSICAS
@@ -511,54 +816,124 @@ def solicitar_transaccion():
     
     data = request.json
     tipo = data.get('tipo')
-    monto = data.get('monto')
+    try:
+        monto = leer_monto(data)
+    except ValueError:
+        return jsonify({'error': 'Monto inválido'}), 400
     descripcion = data.get('descripcion', '')
     
     usuario = session['usuario']
     
-    if tipo == 'retiro' and banco.usuarios[usuario]['saldo'] < monto:
-        return jsonify({'error': 'Fondos insuficientes'}), 400
-    
-    solicitud_id = len(banco.solicitudes_pendientes) + 1
-    solicitud = {
-        'id': solicitud_id,
-        'usuario': usuario,
-        'tipo': tipo,
-        'monto': monto,
-        'descripcion': descripcion,
-        'fecha': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        'estado': 'pendiente'
-    }
-    
-    banco.solicitudes_pendientes.append(solicitud)
-    
-    banco.transacciones.append({
-        'usuario': usuario,
-        'tipo': tipo,
-        'monto': monto,
-        'descripcion': descripcion,
-        'fecha': solicitud['fecha'],
-        'estado': 'pendiente_aprobacion'
-    })
+    try:
+        solicitud = banco.crear_solicitud(usuario, tipo, monto, descripcion)
+    except ErrorBanco as e:
+        return jsonify({'error': str(e)}), e.codigo
+    solicitud_id = solicitud['id']
     
     return jsonify({
         'mensaje': f'Solicitud de {tipo} por {monto} ChiqDollars registrada', 
         'id': solicitud_id
     })
 
+@app.route('/api/transferir', methods=['POST'])
+def transferir():
+    if 'usuario' not in session:
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    data = request.json
+    cuenta_destino = (data.get('cuenta_destino') or '').strip().upper()
+    try:
+        monto = leer_monto(data)
+    except ValueError:
+        return jsonify({'error': 'Monto inválido'}), 400
+    descripcion = data.get('descripcion', '')
+    usuario = session['usuario']
+    
+    if not es_cuenta_valida(cuenta_destino):
+        return jsonify({'error': 'Número de cuenta inválido'}), 400
+    
+    destino = banco.buscar_por_cuenta(cuenta_destino)
+    if destino is None:
+        return jsonify({'error': 'Cuenta destino no encontrada'}), 404
+    
+    try:
+        nuevo_saldo = banco.transferir(usuario, destino, monto, descripcion)
+    except ErrorBanco as e:
+        return jsonify({'error': str(e)}), e.codigo
+    
+    return jsonify({
+        'mensaje': f'Transferencia de {monto} ChiqDollars a {cuenta_destino} realizada',
+        'nuevo_saldo': nuevo_saldo
+    })
+
 @app.route('/api/transacciones')
 def obtener_transacciones():
     if 'usuario' not in session:
         return jsonify({'error': 'No autorizado'}), 401
     
     usuario = session['usuario']
-    transacciones_usuario = [
-        trans for trans in banco.transacciones 
-        if trans['usuario'] == usuario
-    ]
-    transacciones_usuario.sort(key=lambda x: x['fecha'], reverse=True)
+    limite = min(request.args.get('limite', LIMITE_TRANSACCIONES, type=int), LIMITE_MAXIMO_TRANSACCIONES)
+    cursor = request.args.get('cursor', type=int)
+    
+    # El libro ya está en orden de llegada: sin filtrar ni reordenar todo el historial
+    transacciones_usuario, siguiente_cursor = banco.transacciones.por_usuario(
+        usuario, cursor=cursor, limite=max(1, limite))
+    
+    return jsonify({'transacciones': transacciones_usuario,
+                    'siguiente_cursor': siguiente_cursor})
+
+def _limite_dia(texto, dias=0):
+    """'AAAA-MM-DD' (más `dias`) como límite comparable con las fechas del libro"""
+    if not texto:
+        return None
+    return (datetime.strptime(texto, '%Y-%m-%d') + timedelta(days=dias)).strftime('%Y-%m-%d %H:%M:%S')
+
+def _trozos_csv(transacciones):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(COLUMNAS_ESTADO_CUENTA)
+    for indice, transaccion in enumerate(transacciones, 1):
+        escritor.writerow([transaccion.get(columna, '') for columna in COLUMNAS_ESTADO_CUENTA])
+        if indice % FILAS_POR_TROZO == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def _trozos_json(transacciones):
+    trozo = ['[']
+    for indice, transaccion in enumerate(transacciones):
+        trozo.append((',' if indice else '') + json.dumps(transaccion, ensure_ascii=False))
+        if len(trozo) >= FILAS_POR_TROZO:
+            yield ''.join(trozo)
+            trozo = []
+    trozo.append(']')
+    yield ''.join(trozo)
+
+@app.route('/api/transacciones/exportar')
+def exportar_transacciones():
+    """Estado de cuenta en CSV o JSON entre `desde` y `hasta` (AAAA-MM-DD, inclusive).
+    
+    Se envía por trozos a medida que se lee el libro (memoria y segmentos
+    archivados), sin cargar el historial completo del usuario.
+    """
+    if 'usuario' not in session:
+        return jsonify({'error': 'No autorizado'}), 401
     
-    return jsonify({'transacciones': transacciones_usuario})
+    formato = request.args.get('formato', 'csv')
+    if formato not in ('csv', 'json'):
+        return jsonify({'error': 'Formato inválido (csv o json)'}), 400
+    try:
+        desde = _limite_dia(request.args.get('desde'))
+        hasta = _limite_dia(request.args.get('hasta'), dias=1)
+    except ValueError:
+        return jsonify({'error': 'Fecha inválida, use AAAA-MM-DD'}), 400
+    
+    transacciones = banco.transacciones.historial(session['usuario'], desde, hasta)
+    trozos = _trozos_csv(transacciones) if formato == 'csv' else _trozos_json(transacciones)
+    return Response(stream_with_context(trozos),
+                    mimetype='text/csv' if formato == 'csv' else 'application/json',
+                    headers={'Content-Disposition': f'attachment; filename="estado_cuenta.{formato}"'})
 
 @app.route('/api/saldo')
 def obtener_saldo():
@@ -574,11 +949,39 @@ def logout():
     session.clear()
     return redirect(url_for('index'))
 
+# ======================
+# IMPORTACIÓN MASIVA
+# ======================
+
+@app.route('/api/admin/importar/<tipo>', methods=['POST'])
+def importar_masivo(tipo):
+    """Recibe NDJSON o CSV (según Content-Type o ?formato=) y lo importa en lotes"""
+    if 'usuario' not in session or session['tipo'] != 'admin':
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    if tipo not in ('usuarios', 'transacciones'):
+        return jsonify({'error': 'Tipo de importación desconocido'}), 404
+    
+    formato = detectar_formato(request.args.get('formato') or request.content_type)
+    resumen = importar(banco, request.stream, formato, tipo)
+    return jsonify(resumen)
+
+@app.cli.command('importar')
+@click.argument('tipo', type=click.Choice(['usuarios', 'transacciones']))
+@click.argument('archivo', type=click.File('rb'))
+def importar_cli(tipo, archivo):
+    """Importa clientes o transacciones desde un archivo NDJSON o CSV"""
+    resumen = importar(banco, archivo, detectar_formato(archivo.name), tipo)
+    click.echo(json.dumps(resumen, ensure_ascii=False, indent=2))
+
 # ======================
 # INICIO DEL SERVIDOR
 # ======================
 
 if __name__ == '__main__':
+    # Servidor de desarrollo; en producción: gunicorn -c gunicorn.conf.py wsgi:app.
+    # SIGTERM sale por sys.exit para que atexit cierre el banco.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
     port = int(os.environ.get("PORT", 5000))
     print("=" * 70)
     print("🏦 CHIQUIBANK - SISTEMA BANCARIO REALISTA")
@@ -589,5 +992,6 @@ if __name__ == '__main__':
     print("📈 Sistema de inversiones activado")
     print("🎯 Apuestas deportivas disponibles")
     print("🏠 Sistema de préstamos con análisis de riesgo")
+    print(f"💾 Almacén: {banco.almacen.estadisticas()}")
     print("=" * 70)
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,163 @@
+"""Apuestas deportivas: eventos, cuotas dinámicas y liquidación por evento.
+
+Cada evento pasa por 'abierto' (acepta apuestas), 'cerrado' y 'liquidado'
+y tiene un único resultado, que se fija al liquidarlo. Las apuestas de un
+evento se agrupan por resultado, así liquidar sólo recorre las ganadoras y
+paga a cada usuario una vez.
+
+Las cuotas salen del libro de exposición del evento, como en un pozo
+común: cada resultado arranca con una liquidez ficticia repartida según
+las cuotas iniciales y suma lo apostado a él, y su cuota es el pozo total
+(menos el margen del banco) sobre su parte. Lo más apostado baja de cuota.
+El margen es el que ya traen las cuotas iniciales (lo que la suma de sus
+inversas pasa de 1), así un evento abre exactamente con esas cuotas.
+Cada apuesta se paga a la cuota vigente al apostar; las cuotas se
+recalculan sólo cuando cambia lo apostado.
+"""
+import threading
+
+RESULTADOS = ('local', 'empate', 'visitante')
+ESTADOS = ('abierto', 'cerrado', 'liquidado')
+
+# Parte del pozo que se queda el banco en eventos guardados antes de que
+# cada uno llevara el margen de sus cuotas iniciales
+MARGEN = 0.05
+
+# Dinero ficticio con el que arranca el pozo de cada evento
+LIQUIDEZ = 10000
+
+CUOTA_MINIMA = 1.01
+
+EVENTOS_INICIALES = [
+    {'id': 1, 'evento': 'Barcelona vs Real Madrid', 'cuota_local': 2.1, 'cuota_visitante': 3.2, 'cuota_empate': 3.0},
+    {'id': 2, 'evento': 'Messi vs Ronaldo - Partido Amistoso', 'cuota_local': 1.8, 'cuota_visitante': 4.0, 'cuota_empate': 3.5},
+    {'id': 3, 'evento': 'Champions League Final', 'cuota_local': 2.5, 'cuota_visitante': 2.7, 'cuota_empate': 3.1}
+]
+
+
+class Evento:
+    """Un evento con su libro de exposición y sus apuestas por resultado"""
+
+    __slots__ = ('id', 'nombre', 'estado', 'resultado', 'probabilidades',
+                 'margen', 'apostado', 'pagos', 'cantidad', 'apuestas', '_cuotas')
+
+    def __init__(self, evento_id, nombre, probabilidades, estado='abierto', resultado=None,
+                 apostado=None, pagos=None, cantidad=0, margen=MARGEN):
+        self.id = evento_id
+        self.nombre = nombre
+        self.estado = estado
+        self.resultado = resultado
+        self.probabilidades = probabilidades
+        self.margen = margen
+        # Por resultado: total apostado y total a pagar si sale
+        self.apostado = apostado or dict.fromkeys(RESULTADOS, 0)
+        self.pagos = pagos or dict.fromkeys(RESULTADOS, 0)
+        self.cantidad = cantidad
+        self.apuestas = {r: [] for r in RESULTADOS}
+        self._cuotas = None
+
+    @classmethod
+    def con_cuotas(cls, evento_id, nombre, cuotas):
+        """Evento nuevo cuyas probabilidades y margen salen de sus cuotas iniciales"""
+        inversas = {r: 1 / cuotas[r] for r in RESULTADOS}
+        total = sum(inversas.values())
+        return cls(evento_id, nombre, {r: inversas[r] / total for r in RESULTADOS}, margen=1 - 1 / total)
+
+    def cuotas(self):
+        if self._cuotas is None:
+            pozos = {r: LIQUIDEZ * self.probabilidades[r] + self.apostado[r] for r in RESULTADOS}
+            total = sum(pozos.values()) * (1 - self.margen)
+            self._cuotas = {r: max(CUOTA_MINIMA, round(total / pozos[r], 2)) for r in RESULTADOS}
+        return self._cuotas
+
+    def apostar(self, usuario, resultado, monto):
+        """Registra una apuesta a la cuota actual y devuelve esa cuota"""
+        cuota = self.cuotas()[resultado]
+        self.apuestas[resultado].append((usuario, monto, cuota))
+        self.apostado[resultado] += monto
+        self.pagos[resultado] += monto * cuota
+        self.cantidad += 1
+        self._cuotas = None
+        return cuota
+
+    def liquidar(self, resultado):
+        """Fija el resultado y devuelve el premio de cada ganador"""
+        premios = {}
+        for usuario, monto, cuota in self.apuestas[resultado]:
+            premios[usuario] = premios.get(usuario, 0) + monto * cuota
+        self.estado = 'liquidado'
+        self.resultado = resultado
+        self.apuestas = {r: [] for r in RESULTADOS}
+        return premios
+
+    def como_dict(self):
+        cuotas = self.cuotas()
+        apostado = sum(self.apostado.values())
+        return {
+            'id': self.id,
+            'evento': self.nombre,
+            'estado': self.estado,
+            'resultado': self.resultado,
+            'cuota_local': cuotas['local'],
+            'cuota_empate': cuotas['empate'],
+            'cuota_visitante': cuotas['visitante'],
+            'apuestas': self.cantidad,
+            'apostado': apostado,
+            # Lo que pierde el banco si sale cada resultado (negativo: gana)
+            'exposicion': {r: self.pagos[r] - apostado for r in RESULTADOS},
+        }
+
+    def exportar(self):
+        """Estado sin las apuestas individuales"""
+        return {'id': self.id, 'nombre': self.nombre, 'estado': self.estado, 'resultado': self.resultado,
+                'probabilidades': self.probabilidades, 'margen': self.margen, 'apostado': self.apostado,
+                'pagos': self.pagos, 'cantidad': self.cantidad}
+
+
+class MotorApuestas:
+    """Registro de eventos indexado por id"""
+
+    def __init__(self, eventos_iniciales=()):
+        self.eventos = {}
+        self._ultimo_id = 0
+        # Los ids se reparten fuera de _ejecutar, desde varios hilos
+        self._bloqueo = threading.Lock()
+        for datos in eventos_iniciales:
+            self.agregar(Evento.con_cuotas(datos['id'], datos['evento'], {
+                'local': datos['cuota_local'], 'empate': datos['cuota_empate'],
+                'visitante': datos['cuota_visitante']}))
+
+    def nuevo_id(self):
+        with self._bloqueo:
+            self._ultimo_id += 1
+            return self._ultimo_id
+
+    def agregar(self, evento):
+        with self._bloqueo:
+            # Al reproducir el log los ids llegan ya asignados
+            self._ultimo_id = max(self._ultimo_id, evento.id)
+            self.eventos[evento.id] = evento
+
+    def evento(self, evento_id):
+        return self.eventos.get(evento_id)
+
+    def vigentes(self):
+        """Eventos abiertos o cerrados sin liquidar, por id"""
+        return [self.eventos[i] for i in sorted(self.eventos) if self.eventos[i].estado != 'liquidado']
+
+    def exportar(self):
+        return {'ultimo_id': self._ultimo_id,
+                'eventos': [dict(evento.exportar(), apuestas={r: [list(a) for a in evento.apuestas[r]]
+                                                              for r in RESULTADOS})
+                            for evento in self.eventos.values()]}
+
+    def importar(self, estado):
+        self.__init__()
+        for datos in estado['eventos']:
+            datos = dict(datos)
+            apuestas = datos.pop('apuestas', {})
+            evento = Evento(datos.pop('id'), datos.pop('nombre'), **datos)
+            for resultado, lista in apuestas.items():
+                evento.apuestas[resultado] = [tuple(a) for a in lista]
+            self.agregar(evento)
+        self._ultimo_id = estado['ultimo_id']
@@ -0,0 +1,1321 @@
+"""Estado y operaciones del banco ChiquiBank"""
+import hashlib
+import itertools
+import math
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+
+from libro_transacciones import LibroTransacciones
+from solicitudes import ColaSolicitudes
+from bloqueos import BloqueosPorCuenta
+from cuentas import AsignadorCuentas
+from agregados import Agregados
+from tareas import TareaPeriodica
+from mercado import Mercado
+from contabilidad import Contabilidad
+from prestamos import cerrar_mes, nuevo_prestamo
+from intereses import devengar, validar_dia
+from riesgo import MODELOS, ServicioRiesgo
+from apuestas import EVENTOS_INICIALES, RESULTADOS, Evento, MotorApuestas
+from diario import BANCO, EXTERNO, IMPUESTOS, RESERVAS, Diario, es_cuenta_cliente
+from ordenes import LADOS, TIPOS, MotorOrdenes, ProcesadorLotes
+from persistencia import AlmacenMemoria, AlmacenWAL
+
+
+# Comisión por lado en cada ejecución de acciones
+COMISION_ACCIONES = 0.01
+
+# Para `_ejecutar`: la operación puede tocar cualquier cuenta
+TODAS_LAS_CUENTAS = '*'
+
+# Cuentas por operación al devengar intereses (cada lote, una franja)
+CUENTAS_POR_LOTE_INTERESES = 1000
+
+
+class ErrorBanco(Exception):
+    """Operación rechazada por el banco; `codigo` es el estado HTTP a devolver"""
+    def __init__(self, mensaje, codigo=400):
+        super().__init__(mensaje)
+        self.codigo = codigo
+
+
+def validar_monto(monto):
+    """Lanza ErrorBanco salvo que `monto` sea un número finito y positivo.
+    
+    NaN no cumple ninguna comparación: un `monto <= 0` solo lo dejaría
+    pasar hasta los saldos y el diario.
+    """
+    if isinstance(monto, bool) or not isinstance(monto, (int, float)) or not math.isfinite(monto) or monto <= 0:
+        raise ErrorBanco('Monto inválido')
+
+
+class BancoRealista:
+    def __init__(self, almacen=None, historico=None):
+        self.tasa_interes_activa = 0.12  # 12% anual para préstamos
+        self.tasa_interes_pasiva = 0.03  # 3% anual para ahorros
+        self.impuesto_transacciones = 0.02  # 2% de impuesto
+        
+        # Mercado de valores simulado (ver mercado.py)
+        self.mercado = Mercado()
+        
+        self._bloqueo_saldo_banco = threading.Lock()
+        # Directorio de los segmentos del historial archivado (ver historico.py)
+        self._historico = historico
+        # Versión de lo que ve cada usuario, para la caché de páginas
+        self._versiones = {}
+        self._contador_versiones = itertools.count(1)
+        self._version_base = 0
+        self._crear_estado_inicial()
+        self.tareas = []
+        
+        # Cada operación se aplica con las cuentas que toca bloqueadas y se
+        # entrega al almacén, que puede persistirla (ver persistencia.py)
+        self._bloqueos = BloqueosPorCuenta()
+        self.almacen = almacen or AlmacenMemoria()
+        self.almacen.abrir(self)
+        
+        # Las órdenes de acciones se casan por lotes en un hilo propio
+        self._procesador_ordenes = ProcesadorLotes('ordenes', self._ejecutar_lote_ordenes)
+        
+        # Evaluación de solicitudes de préstamo (ver riesgo.py)
+        self.riesgo = ServicioRiesgo(self)
+    
+    def _crear_estado_inicial(self):
+        self.solicitudes_pendientes = ColaSolicitudes()
+        self.transacciones = LibroTransacciones(self._historico)
+        self.saldo_banco = 50000000  # 50 millones de capital inicial
+        self.ultimo_cierre_mes = None
+        self.ultimo_devengo = None
+        self.cuentas = AsignadorCuentas()
+        self.agregados = Agregados()
+        self.ordenes = MotorOrdenes()
+        self.contabilidad = Contabilidad()
+        # Eventos deportivos para apuestas (ver apuestas.py)
+        self.apuestas = MotorApuestas(EVENTOS_INICIALES)
+        
+        # Usuarios iniciales
+        self.usuarios = {
+            'admin': {
+                'password': self._hash_password('admin123'), 
+                'tipo': 'admin',
+                'nombre': 'Director del Banco',
+                'fecha_creacion': self._ahora(),
+                'saldo': 0
+            }
+        }
+        
+        # Portafolios de inversión
+        self.portafolios = {}
+        
+        # Diario de partida doble (ver diario.py)
+        self.diario = Diario()
+        self._abrir_diario()
+    
+    def _hash_password(self, password):
+        return hashlib.sha256(password.encode()).hexdigest()
+    
+    def _ahora(self):
+        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    
+    def _generar_numero_cuenta(self):
+        return self.cuentas.asignar()
+    
+    def _reservar_numeros_cuenta(self, cantidad):
+        return self.cuentas.reservar(cantidad)
+    
+    @property
+    def eventos_deportivos(self):
+        """Eventos sin liquidar con sus cuotas actuales"""
+        return [evento.como_dict() for evento in self.apuestas.vigentes()]
+    
+    def buscar_por_cuenta(self, numero_cuenta):
+        """Usuario titular de un número de cuenta, o None"""
+        return self.cuentas.usuario_de(numero_cuenta)
+    
+    def calcular_impuesto(self, monto):
+        return monto * self.impuesto_transacciones
+    
+    def actualizar_mercado(self):
+        """Actualiza los precios del mercado de valores y revalora los portafolios"""
+        instantanea = self.mercado.avanzar()
+        self.contabilidad.valorar(instantanea)
+        return instantanea
+    
+    # ----------------------
+    # Primitivas de estado
+    # ----------------------
+    # Las operaciones modifican el estado sólo a través de estos métodos;
+    # BancoSQLite los reimplementa sobre la base de datos.
+    
+    def saldo(self, usuario):
+        return self.usuarios[usuario].get('saldo', 0)
+    
+    def prestamos_de(self, usuario):
+        return self.usuarios[usuario].get('prestamos', [])
+    
+    def _crear_usuario(self, usuario, datos):
+        self.usuarios[usuario] = datos
+        self.portafolios[usuario] = {}
+        self.cuentas.registrar(datos['numero_cuenta'], usuario)
+        self.agregados.sumar('total_usuarios', 1)
+        self.agregados.sumar('total_depositos', datos['saldo'])
+        self._tocar(usuario)
+    
+    def _tocar(self, *usuarios):
+        """Marca que cambió el saldo, las posiciones o los préstamos de `usuarios`"""
+        version = next(self._contador_versiones)
+        for usuario in usuarios:
+            self._versiones[usuario] = version
+    
+    def version_usuario(self, usuario):
+        """Número que cambia cada vez que cambia el saldo, las posiciones o los
+        préstamos del usuario (para cachear lo que se arma con ellos)"""
+        return self._versiones.get(usuario, self._version_base)
+    
+    def _mover_saldo_banco(self, monto):
+        with self._bloqueo_saldo_banco:
+            self.saldo_banco += monto
+    
+    def _ajustar_posicion(self, usuario, simbolo, cantidad):
+        portafolio = self.portafolios.setdefault(usuario, {})
+        portafolio[simbolo] = portafolio.get(simbolo, 0) + cantidad
+        if not portafolio[simbolo]:
+            del portafolio[simbolo]
+        self._tocar(usuario)
+    
+    def _agregar_prestamo(self, usuario, prestamo):
+        self.usuarios[usuario].setdefault('prestamos', []).append(prestamo)
+        self.agregados.sumar('total_prestamos', prestamo['monto_restante'])
+        self._tocar(usuario)
+    
+    def _actualizar_prestamo(self, usuario, prestamo_id, **cambios):
+        """Modifica un préstamo (pagos, mora, estado) y devuelve el préstamo"""
+        prestamo = self.prestamos_de(usuario)[prestamo_id - 1]
+        if 'monto_restante' in cambios:
+            self.agregados.sumar('total_prestamos', cambios['monto_restante'] - prestamo['monto_restante'])
+        prestamo.update(cambios)
+        self._tocar(usuario)
+        return prestamo
+    
+    def _nuevo_id_orden(self):
+        return self.ordenes.nuevo_id()
+    
+    def _reposar_orden(self, orden):
+        """Deja una orden límite en el libro"""
+        self.ordenes.agregar(orden)
+    
+    def _actualizar_orden(self, orden):
+        """Persiste el `restante` de una orden en reposo (en memoria ya está)"""
+    
+    def _retirar_orden(self, orden_id):
+        return self.ordenes.retirar(orden_id)
+    
+    def _todos_los_prestamos(self):
+        """(usuario, prestamo) de todos los préstamos del banco"""
+        for usuario, datos in list(self.usuarios.items()):
+            for prestamo in datos.get('prestamos', ()):
+                yield usuario, prestamo
+    
+    def _actualizar_prestamos(self, cambios):
+        """`_actualizar_prestamo` para muchos préstamos: [(usuario, id, cambios)]"""
+        usuarios = self.usuarios
+        variacion = 0
+        for usuario, prestamo_id, campos in cambios:
+            prestamo = usuarios[usuario]['prestamos'][prestamo_id - 1]
+            if 'monto_restante' in campos:
+                variacion += campos['monto_restante'] - prestamo['monto_restante']
+            prestamo.update(campos)
+        self.agregados.sumar('total_prestamos', variacion)
+        self._tocar(*{usuario for usuario, _, _ in cambios})
+    
+    def _saldos(self):
+        return {usuario: datos.get('saldo', 0) for usuario, datos in self.usuarios.items()}
+    
+    def _fijar_ultimo_cierre(self, mes):
+        self.ultimo_cierre_mes = mes
+    
+    def _cuentas_para_interes(self, usuarios):
+        """(usuario, saldo, interes_hasta) de los clientes de `usuarios`"""
+        cuentas = []
+        for usuario in usuarios:
+            datos = self.usuarios.get(usuario)
+            if datos is not None and datos['tipo'] == 'usuario':
+                cuentas.append((usuario, datos.get('saldo', 0),
+                                datos.get('interes_hasta') or datos['fecha_creacion'][:10]))
+        return cuentas
+    
+    def _mover_saldos(self, movimientos):
+        """Suma a cada saldo su monto (negativo para debitar): [(usuario, monto)]"""
+        usuarios = self.usuarios
+        variacion = 0
+        for usuario, monto in movimientos:
+            datos = usuarios[usuario]
+            datos['saldo'] += monto
+            if datos['tipo'] == 'usuario':
+                variacion += monto
+        self.agregados.sumar('total_depositos', variacion)
+        self._tocar(*(usuario for usuario, _ in movimientos))
+    
+    def _marcar_interes(self, usuarios, dia):
+        for usuario in usuarios:
+            self.usuarios[usuario]['interes_hasta'] = dia
+    
+    def _fijar_ultimo_devengo(self, dia):
+        self.ultimo_devengo = dia
+    
+    def _nuevo_id_evento(self):
+        return self.apuestas.nuevo_id()
+    
+    def _crear_evento(self, evento):
+        self.apuestas.agregar(evento)
+    
+    def _registrar_apuesta(self, evento, usuario, resultado, monto):
+        """Anota la apuesta en el libro del evento y devuelve su cuota"""
+        return evento.apostar(usuario, resultado, monto)
+    
+    def _cerrar_evento(self, evento):
+        evento.estado = 'cerrado'
+    
+    def _liquidar_evento(self, evento, resultado):
+        """Fija el resultado y devuelve {usuario: premio}"""
+        return evento.liquidar(resultado)
+    
+    # ----------------------
+    # Diario
+    # ----------------------
+    # Todo movimiento de dinero de una operación es un asiento del diario:
+    # `_asentar` lo registra y lleva cada monto a los saldos con las
+    # primitivas de arriba, así el diario y los saldos no se separan.
+    
+    def _asentar(self, movimientos, concepto, fecha):
+        """Registra un asiento [(cuenta, monto)] que suma cero y lo aplica.
+        
+        Las cuentas de clientes van a su saldo y @banco a `saldo_banco`; las
+        demás cuentas internas sólo existen en el diario.
+        """
+        asiento = self.diario.asentar(movimientos, concepto, fecha)
+        self._mover_saldos([(cuenta, monto) for cuenta, monto in movimientos if es_cuenta_cliente(cuenta)])
+        banco = sum(monto for cuenta, monto in movimientos if cuenta == BANCO)
+        if banco:
+            self._mover_saldo_banco(banco)
+        return asiento
+    
+    def _debitar(self, usuario, monto, contrapartida, concepto, fecha):
+        """Pasa `monto` de `usuario` a `contrapartida` sólo si hay fondos.
+        
+        La cuenta debe estar bloqueada. Devuelve el nuevo saldo.
+        """
+        validar_monto(monto)
+        if self.saldo(usuario) < monto:
+            raise ErrorBanco('Fondos insuficientes')
+        self._asentar([(usuario, -monto), (contrapartida, monto)], concepto, fecha)
+        return self.saldo(usuario)
+    
+    def _abrir_diario(self):
+        """Asiento de apertura con los saldos actuales contra @externo.
+        
+        Para un banco nuevo o un estado anterior al diario; desde aquí todo
+        movimiento pasa por `_asentar`.
+        """
+        movimientos = [(usuario, saldo) for usuario, saldo in self._saldos().items() if saldo]
+        movimientos.append((BANCO, self.saldo_banco))
+        movimientos.append((RESERVAS, sum(orden['restante'] * orden['precio'] * (1 + COMISION_ACCIONES)
+                                          for orden in self.ordenes.todas() if orden['lado'] == 'compra')))
+        movimientos.append((EXTERNO, -sum(monto for _, monto in movimientos)))
+        self.diario.asentar(movimientos, 'apertura', self._ahora())
+    
+    def verificar_diario(self):
+        """Descuadre del diario y cuentas cuyo saldo no coincide con él"""
+        with self.bloqueo_global():
+            saldos = self._saldos()
+            saldos[BANCO] = self.saldo_banco
+            diario = self.diario.saldos()
+        diferencias = {cuenta: {'diario': diario.get(cuenta, 0), 'saldo': saldo}
+                       for cuenta, saldo in saldos.items() if abs(diario.get(cuenta, 0) - saldo) > 1e-6}
+        return {'asientos': len(self.diario), 'descuadre': self.diario.descuadre(), 'diferencias': diferencias}
+    
+    # ----------------------
+    # Registro de operaciones
+    # ----------------------
+    
+    def _ejecutar(self, operacion, cuentas=None, **datos):
+        """Aplica una operación y la registra en el almacén.
+        
+        Todo lo no determinista (fechas, azar, precios) llega ya resuelto en
+        `datos`, así reproducir el log da exactamente el mismo estado. Si la
+        operación lanza ErrorBanco no se registra.
+        
+        Mientras se aplica y se encola en el log quedan bloqueadas las
+        `cuentas` que toca (por defecto `datos['usuario']`), de modo que el
+        log conserva el orden de las operaciones de cada cuenta. Con
+        TODAS_LAS_CUENTAS se detiene el banco entero.
+        """
+        if cuentas == TODAS_LAS_CUENTAS:
+            bloqueo = self._bloqueos.bloquear_todo()
+        else:
+            bloqueo = self._bloqueos.bloquear(*(cuentas or (datos['usuario'],)))
+        with bloqueo:
+            resultado = getattr(self, '_aplicar_' + operacion)(**datos)
+            ticket = self.almacen.registrar(operacion, datos)
+        self.almacen.confirmar(ticket)
+        return resultado
+    
+    def reproducir(self, operacion, datos):
+        """Aplica una operación leída del almacén durante la recuperación"""
+        getattr(self, '_aplicar_' + operacion)(**datos)
+    
+    def bloqueo_global(self):
+        """Bloqueo que detiene todas las operaciones (para snapshots)"""
+        return self._bloqueos.bloquear_todo()
+    
+    def exportar_estado(self):
+        return {
+            'usuarios': self.usuarios,
+            'portafolios': self.portafolios,
+            'transacciones': self.transacciones.exportar(),
+            'solicitudes': self.solicitudes_pendientes.exportar(),
+            'saldo_banco': self.saldo_banco,
+            'ultimo_cierre_mes': self.ultimo_cierre_mes,
+            'ultimo_devengo': self.ultimo_devengo,
+            'acciones': self.mercado.exportar(),
+            'ordenes': self.ordenes.exportar(),
+            'contabilidad': self.contabilidad.exportar(),
+            'apuestas': self.apuestas.exportar(),
+            'diario': self.diario.exportar(),
+        }
+    
+    def importar_estado(self, estado):
+        # Todo lo armado con el estado anterior deja de valer
+        self._versiones = {}
+        self._version_base = next(self._contador_versiones)
+        self.usuarios = estado['usuarios']
+        self.portafolios = estado['portafolios']
+        self.cuentas = AsignadorCuentas()
+        for usuario, datos in self.usuarios.items():
+            if datos.get('numero_cuenta'):
+                self.cuentas.registrar(datos['numero_cuenta'], usuario)
+        self.agregados = Agregados()
+        self.agregados.fijar(self.calcular_agregados())
+        if isinstance(estado['transacciones'], list):
+            # Snapshot anterior al historial archivado
+            self.transacciones.cargar(estado['transacciones'])
+        else:
+            self.transacciones.importar(estado['transacciones'])
+        self.solicitudes_pendientes.importar(estado['solicitudes'])
+        self.saldo_banco = estado['saldo_banco']
+        self.ultimo_cierre_mes = estado.get('ultimo_cierre_mes')
+        self.ultimo_devengo = estado.get('ultimo_devengo')
+        self.mercado.importar(estado['acciones'])
+        self.ordenes.importar(estado.get('ordenes', {'ultimo_id': 0, 'abiertas': []}))
+        if 'contabilidad' in estado:
+            self.contabilidad.importar(estado['contabilidad'])
+        else:
+            self.contabilidad = Contabilidad()
+            self.contabilidad.inicializar(self.portafolios, self.mercado.instantanea())
+        if 'apuestas' in estado:
+            self.apuestas.importar(estado['apuestas'])
+        # Un estado anterior al diario lo abre con los saldos que trae
+        self.diario = Diario()
+        if 'diario' in estado:
+            self.diario.importar(estado['diario'])
+        else:
+            self._abrir_diario()
+    
+    def iniciar_tareas(self, intervalo_reconciliacion=300, intervalo_mercado=5, intervalo_cierre=3600,
+                       intervalo_intereses=3600, intervalo_riesgo=30, intervalo_archivado=60):
+        """Arranca los trabajos de fondo del banco.
+        
+        El cierre de mes, los intereses, el archivado y la reconciliación
+        tocan el banco entero: con varios procesos sólo los corre el que
+        está a cargo (ver `a_cargo_de_tareas`). Los perfiles de riesgo
+        viven en la memoria de cada proceso y se actualizan en todos.
+        """
+        self.tareas.append(TareaPeriodica(
+            'mercado', intervalo_mercado, self.actualizar_mercado).iniciar())
+        self.tareas.append(TareaPeriodica(
+            'reconciliacion', intervalo_reconciliacion, self._si_a_cargo(self.reconciliar_agregados)).iniciar())
+        self.tareas.append(TareaPeriodica(
+            'cierre_mes', intervalo_cierre, self._si_a_cargo(self.cierre_automatico)).iniciar())
+        self.tareas.append(TareaPeriodica(
+            'intereses', intervalo_intereses, self._si_a_cargo(self.devengo_automatico)).iniciar())
+        # Mantiene los perfiles de riesgo al día para que evaluar sólo lea lo último
+        self.tareas.append(TareaPeriodica(
+            'riesgo', intervalo_riesgo, self.riesgo.perfiles.actualizar).iniciar())
+        self.tareas.append(TareaPeriodica(
+            'archivado', intervalo_archivado, self._si_a_cargo(self.transacciones.archivar)).iniciar())
+    
+    def a_cargo_de_tareas(self):
+        """Si este proceso corre las tareas que cambian el banco entero"""
+        return True
+    
+    def _si_a_cargo(self, funcion):
+        def tarea():
+            if self.a_cargo_de_tareas():
+                funcion()
+        return tarea
+    
+    def cerrar(self):
+        for tarea in self.tareas:
+            tarea.detener()
+        self._procesador_ordenes.cerrar()
+        self.almacen.cerrar()
+    
+    # ----------------------
+    # Agregados
+    # ----------------------
+    
+    def calcular_agregados(self):
+        """Recalcula los totales recorriendo todos los usuarios y préstamos"""
+        clientes = [u for u in self.usuarios.values() if u['tipo'] == 'usuario']
+        return {
+            'total_usuarios': len(clientes),
+            'total_depositos': sum(u.get('saldo', 0) for u in clientes),
+            'total_prestamos': sum(p['monto_restante'] for u in clientes for p in u.get('prestamos', [])),
+        }
+    
+    def reconciliar_agregados(self):
+        """Contrasta los totales incrementales con un recálculo completo.
+        
+        El recálculo se hace con el banco detenido para comparar contra un
+        estado consistente; devuelve las diferencias corregidas.
+        """
+        with self.bloqueo_global():
+            recalculados = self.calcular_agregados()
+            return self.agregados.reconciliar(recalculados)
+    
+    # ----------------------
+    # Operaciones
+    # ----------------------
+    
+    def registrar_usuario(self, usuario, password, nombre, email, saldo_inicial):
+        if saldo_inicial:
+            validar_monto(saldo_inicial)
+        return self._ejecutar('registrar_usuario',
+                              usuario=usuario,
+                              password=self._hash_password(password),
+                              nombre=nombre,
+                              email=email,
+                              numero_cuenta=self._generar_numero_cuenta(),
+                              saldo_inicial=saldo_inicial,
+                              fecha=self._ahora())
+    
+    def _aplicar_registrar_usuario(self, usuario, password, nombre, email, numero_cuenta, saldo_inicial, fecha):
+        if usuario in self.usuarios:
+            raise ErrorBanco('El usuario ya existe')
+        
+        self._crear_usuario(usuario, {
+            'password': password,
+            'tipo': 'usuario',
+            'nombre': nombre,
+            'email': email,
+            'numero_cuenta': numero_cuenta,
+            'saldo': 0,
+            'fecha_creacion': fecha,
+            'inversiones': {},
+            'prestamos': []
+        })
+        self._asentar([(EXTERNO, -saldo_inicial), (usuario, saldo_inicial)], 'apertura_cuenta', fecha)
+        
+        self.transacciones.append({
+            'usuario': usuario,
+            'tipo': 'apertura_cuenta',
+            'monto': saldo_inicial,
+            'fecha': fecha,
+            'estado': 'completado',
+            'descripcion': 'Apertura de cuenta + Capital inicial'
+        })
+        return numero_cuenta
+    
+    def comprar_acciones(self, usuario, simbolo, cantidad):
+        """Compra a mercado: pasa por el libro de órdenes como cualquier orden"""
+        orden = self.enviar_orden(usuario, simbolo, 'compra', 'mercado', cantidad)
+        return {
+            'costo_total': orden['costo_total'] - orden['comision'],
+            'comision': orden['comision'],
+            'nuevo_saldo': orden['nuevo_saldo'],
+            'ejecutado': orden['ejecutado'],
+            'precio_medio': orden['precio_medio'],
+        }
+    
+    def _aplicar_comprar_acciones(self, usuario, simbolo, cantidad, precio, fecha):
+        costo_total = precio * cantidad
+        comision = costo_total * COMISION_ACCIONES
+        
+        total_a_pagar = costo_total + comision
+        
+        # Ejecutar compra
+        nuevo_saldo = self._debitar(usuario, total_a_pagar, EXTERNO, 'compra_acciones', fecha)
+        
+        # Actualizar portafolio
+        self._ajustar_posicion(usuario, simbolo, cantidad)
+        self.contabilidad.comprar(usuario, simbolo, cantidad, total_a_pagar / cantidad)
+        
+        # Registrar transacción
+        self.transacciones.append({
+            'usuario': usuario,
+            'tipo': 'compra_acciones',
+            'monto': total_a_pagar,
+            'fecha': fecha,
+            'estado': 'completado',
+            'descripcion': f'Compra de {cantidad} acciones {simbolo} a {precio:.2f} c/u'
+        })
+        return {
+            'costo_total': costo_total,
+            'comision': comision,
+            'nuevo_saldo': nuevo_saldo
+        }
+    
+    def otorgar_prestamo(self, usuario, monto, plazo_meses):
+        validar_monto(monto)
+        return self._ejecutar('otorgar_prestamo',
+                              usuario=usuario,
+                              monto=monto,
+                              plazo_meses=plazo_meses,
+                              fecha=self._ahora())
+    
+    def _aplicar_otorgar_prestamo(self, usuario, monto, plazo_meses, fecha):
+        # Crear préstamo (cuota fija, ver prestamos.py)
+        prestamo = nuevo_prestamo(len(self.prestamos_de(usuario)) + 1, monto,
+                                  self.tasa_interes_activa, plazo_meses, fecha)
+        
+        self._agregar_prestamo(usuario, prestamo)
+        self._asentar([(BANCO, -monto), (usuario, monto)], 'prestamo_otorgado', fecha)
+        
+        self.transacciones.append({
+            'usuario': usuario,
+            'tipo': 'prestamo_otorgado',
+            'monto': monto,
+            'fecha': fecha,
+            'estado': 'completado',
+            'descripcion': f'Préstamo aprobado: {monto} a {plazo_meses} meses'
+        })
+        return prestamo
+    
+    def cerrar_mes(self, mes=None):
+        """Cierre de mes de todos los préstamos (por defecto, el mes anterior).
+        
+        Devenga intereses, cobra cuotas y marca la mora en una sola pasada;
+        cada mes se cierra una sola vez y en orden.
+        """
+        mes = mes or self._mes_anterior()
+        if len(mes) != 7 or mes[4] != '-' or not (mes[:4] + mes[5:]).isdigit():
+            raise ErrorBanco('Mes inválido (AAAA-MM)')
+        return self._ejecutar('cerrar_mes', cuentas=TODAS_LAS_CUENTAS, mes=mes, fecha=self._ahora())
+    
+    def _aplicar_cerrar_mes(self, mes, fecha):
+        if self.ultimo_cierre_mes is not None and mes <= self.ultimo_cierre_mes:
+            raise ErrorBanco(f'El mes {mes} ya está cerrado (último cierre: {self.ultimo_cierre_mes})', 409)
+        
+        cambios, cobros, resumen = cerrar_mes(self._todos_los_prestamos(), self._saldos(), mes)
+        self._actualizar_prestamos(cambios)
+        del cambios
+        self._asentar([(usuario, -monto) for usuario, monto in cobros.items()] + [(BANCO, resumen['cobrado'])],
+                      'pago_prestamo', fecha)
+        self.transacciones.extend([{
+            'usuario': usuario,
+            'tipo': 'pago_prestamo',
+            'monto': -monto,
+            'fecha': fecha,
+            'estado': 'completado',
+            'descripcion': f'Cuotas de préstamo {mes}'
+        } for usuario, monto in cobros.items()])
+        self._fijar_ultimo_cierre(mes)
+        return resumen
+    
+    def _mes_anterior(self):
+        anio, mes = int(self._ahora()[:4]), int(self._ahora()[5:7])
+        anio, mes = (anio - 1, 12) if mes == 1 else (anio, mes - 1)
+        return f'{anio:04d}-{mes:02d}'
+    
+    def cierre_automatico(self):
+        """Cierra el mes anterior si todavía no se cerró (tarea de fondo)"""
+        mes = self._mes_anterior()
+        if self.ultimo_cierre_mes is None or self.ultimo_cierre_mes < mes:
+            resumen = self.cerrar_mes(mes)
+            print(f"🏦 Cierre de {mes}: {resumen['prestamos']} préstamos, "
+                  f"{resumen['cobrado']:.2f} cobrado, {resumen['en_mora']} en mora")
+    
+    def devengar_intereses(self, dia=None):
+        """Abona el interés de los ahorros hasta `dia` (por defecto, ayer).
+        
+        `dia` identifica la corrida: cada uno se devenga una sola vez y en
+        orden. Las cuentas se procesan en lotes de una franja de bloqueos,
+        cada lote una operación, así la corrida no detiene al banco; si se
+        interrumpe, repetirla sólo abona a las cuentas que faltaron.
+        """
+        dia = dia or self._dia_anterior()
+        if not validar_dia(dia):
+            raise ErrorBanco('Día inválido (AAAA-MM-DD)')
+        if self.ultimo_devengo is not None and dia <= self.ultimo_devengo:
+            raise ErrorBanco(f'Los intereses ya están devengados hasta {self.ultimo_devengo}', 409)
+        
+        resumen = {'dia': dia, 'cuentas': 0, 'abonadas': 0, 'interes': 0}
+        for lote in self._bloqueos.repartir(list(self.usuarios), CUENTAS_POR_LOTE_INTERESES):
+            parcial = self._ejecutar('devengar_intereses', cuentas=lote, usuarios=lote, dia=dia,
+                                     tasa=self.tasa_interes_pasiva, fecha=self._ahora())
+            for clave in ('cuentas', 'abonadas', 'interes'):
+                resumen[clave] += parcial[clave]
+        self._ejecutar('fin_devengo', cuentas=TODAS_LAS_CUENTAS, dia=dia)
+        return resumen
+    
+    def _aplicar_devengar_intereses(self, usuarios, dia, tasa, fecha):
+        abonos, al_dia, resumen = devengar(self._cuentas_para_interes(usuarios), tasa, dia)
+        self._asentar([(usuario, interes) for usuario, interes, _ in abonos] + [(BANCO, -resumen['interes'])],
+                      'interes', fecha)
+        self._marcar_interes(al_dia, dia)
+        self.transacciones.extend([{
+            'usuario': usuario,
+            'tipo': 'interes',
+            'monto': interes,
+            'fecha': fecha,
+            'estado': 'completado',
+            'descripcion': f'Intereses al {dia} ({dias} días)' if dias > 1 else f'Intereses del {dia}'
+        } for usuario, interes, dias in abonos])
+        return resumen
+    
+    def _aplicar_fin_devengo(self, dia):
+        if self.ultimo_devengo is None or dia > self.ultimo_devengo:
+            self._fijar_ultimo_devengo(dia)
+    
+    def _dia_anterior(self):
+        return (datetime.strptime(self._ahora()[:10], '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
+    
+    def devengo_automatico(self):
+        """Devenga hasta ayer si todavía no se hizo (tarea de fondo).
+        
+        Si el servidor estuvo parado, la corrida abona de una vez todos los
+        días que falten.
+        """
+        dia = self._dia_anterior()
+        if self.ultimo_devengo is None or self.ultimo_devengo < dia:
+            resumen = self.devengar_intereses(dia)
+            print(f"🏦 Intereses al {dia}: {resumen['abonadas']} cuentas, {resumen['interes']:.2f} abonado")
+    
+    def crear_solicitud(self, usuario, tipo, monto, descripcion):
+        """Registra una solicitud de depósito/retiro pendiente de aprobación"""
+        if tipo not in ('deposito', 'retiro'):
+            raise ErrorBanco('Tipo de solicitud inválido')
+        validar_monto(monto)
+        return self._ejecutar('crear_solicitud',
+                              solicitud_id=self.solicitudes_pendientes.nuevo_id(),
+                              usuario=usuario,
+                              tipo=tipo,
+                              monto=monto,
+                              descripcion=descripcion,
+                              fecha=self._ahora())
+    
+    def _aplicar_crear_solicitud(self, solicitud_id, usuario, tipo, monto, descripcion, fecha):
+        if tipo == 'retiro' and self.saldo(usuario) < monto:
+            raise ErrorBanco('Fondos insuficientes')
+        
+        solicitud = {
+            'id': solicitud_id,
+            'usuario': usuario,
+            'tipo': tipo,
+            'monto': monto,
+            'descripcion': descripcion,
+            'fecha': fecha,
+            'estado': 'pendiente'
+        }
+        
+        trans_id = self.transacciones.append({
+            'usuario': usuario,
+            'tipo': tipo,
+            'monto': monto,
+            'descripcion': descripcion,
+            'fecha': fecha,
+            'estado': 'pendiente_aprobacion'
+        })
+        self.solicitudes_pendientes.agregar(solicitud, trans_id)
+        return solicitud
+    
+    def procesar_solicitud(self, solicitud_id, accion, procesado_por):
+        """Aprueba o rechaza una solicitud pendiente.
+        
+        Devuelve (mensaje, estado_final), o None si la solicitud no existe.
+        """
+        solicitud = self.solicitudes_pendientes.obtener(solicitud_id)
+        if solicitud is None:
+            return None
+        try:
+            return self._ejecutar('procesar_solicitud',
+                                  cuentas=(solicitud['usuario'],),
+                                  solicitud_id=solicitud_id,
+                                  accion=accion,
+                                  procesado_por=procesado_por,
+                                  fecha=self._ahora())
+        except ErrorBanco as e:
+            if e.codigo != 404:
+                raise
+            # Otro administrador la procesó mientras tanto
+            return None
+    
+    def _aplicar_procesar_solicitud(self, solicitud_id, accion, procesado_por, fecha):
+        if solicitud_id not in self.solicitudes_pendientes:
+            raise ErrorBanco('Solicitud no encontrada', 404)
+        solicitud = self.solicitudes_pendientes.obtener(solicitud_id)
+        
+        usuario = solicitud['usuario']
+        tipo = solicitud['tipo']
+        monto = solicitud['monto']
+        
+        if accion == 'aprobar':
+            # Las solicitudes registradas antes de validar el monto pueden
+            # traer cualquier cosa: se comprueba (y se calcula el impuesto)
+            # antes de sacarla de la cola, para que siga pendiente si falla
+            validar_monto(monto)
+            impuesto = self.calcular_impuesto(monto)
+        solicitud, trans_id = self.solicitudes_pendientes.retirar(solicitud_id)
+        
+        if accion == 'aprobar' and tipo == 'deposito':
+            monto_neto = monto - impuesto
+            
+            self._asentar([(EXTERNO, -monto), (usuario, monto_neto), (IMPUESTOS, impuesto)], 'deposito', fecha)
+            estado_final = 'aprobado'
+            mensaje = f'Depósito de {monto} aprobado (Impuesto: -{impuesto})'
+        elif accion == 'aprobar' and tipo == 'retiro':
+            if self.saldo(usuario) >= monto:
+                self._debitar(usuario, monto, EXTERNO, 'retiro', fecha)
+                estado_final = 'aprobado'
+                mensaje = f'Retiro de {monto} aprobado'
+            else:
+                estado_final = 'rechazado_fondos'
+                mensaje = 'Fondos insuficientes'
+        else:
+            estado_final = 'rechazado'
+            mensaje = f'Solicitud de {tipo} rechazada'
+        
+        # Actualizar la transacción enlazada, sin buscarla en el libro
+        self.transacciones.actualizar_estado(
+            trans_id, estado_final,
+            fecha_procesamiento=fecha,
+            procesado_por=procesado_por)
+        return mensaje, estado_final
+
+    
+    def acreditar(self, usuario, monto, descripcion=''):
+        """Abona `monto` a la cuenta de forma atómica"""
+        validar_monto(monto)
+        return self._ejecutar('acreditar', usuario=usuario, monto=monto,
+                              descripcion=descripcion, fecha=self._ahora())
+    
+    def _aplicar_acreditar(self, usuario, monto, descripcion, fecha):
+        self._asentar([(EXTERNO, -monto), (usuario, monto)], 'abono', fecha)
+        self.transacciones.append({
+            'usuario': usuario,
+            'tipo': 'abono',
+            'monto': monto,
+            'fecha': fecha,
+            'estado': 'completado',
+            'descripcion': descripcion
+        })
+        return self.saldo(usuario)
+    
+    def debitar(self, usuario, monto, descripcion=''):
+        """Carga `monto` a la cuenta sólo si hay fondos, de forma atómica"""
+        validar_monto(monto)
+        return self._ejecutar('debitar', usuario=usuario, monto=monto,
+                              descripcion=descripcion, fecha=self._ahora())
+    
+    def _aplicar_debitar(self, usuario, monto, descripcion, fecha):
+        nuevo_saldo = self._debitar(usuario, monto, EXTERNO, 'cargo', fecha)
+        self.transacciones.append({
+            'usuario': usuario,
+            'tipo': 'cargo',
+            'monto': -monto,
+            'fecha': fecha,
+            'estado': 'completado',
+            'descripcion': descripcion
+        })
+        return nuevo_saldo
+    
+    def transferir(self, origen, destino, monto, descripcion=''):
+        """Mueve `monto` de una cuenta a otra con ambas bloqueadas"""
+        validar_monto(monto)
+        if origen == destino:
+            raise ErrorBanco('No puedes transferir a tu propia cuenta')
+        return self._ejecutar('transferir', cuentas=(origen, destino),
+                              origen=origen, destino=destino, monto=monto,
+                              descripcion=descripcion, fecha=self._ahora())
+    
+    def _aplicar_transferir(self, origen, destino, monto, descripcion, fecha):
+        if destino not in self.usuarios:
+            raise ErrorBanco('Cuenta destino no encontrada', 404)
+        
+        nuevo_saldo = self._debitar(origen, monto, destino, 'transferencia', fecha)
+        
+        self.transacciones.append({
+            'usuario': origen,
+            'tipo': 'transferencia_enviada',
+            'monto': -monto,
+            'fecha': fecha,
+            'estado': 'completado',
+            'descripcion': descripcion or f'Transferencia a {destino}'
+        })
+        self.transacciones.append({
+            'usuario': destino,
+            'tipo': 'transferencia_recibida',
+            'monto': monto,
+            'fecha': fecha,
+            'estado': 'completado',
+            'descripcion': descripcion or f'Transferencia de {origen}'
+        })
+        return nuevo_saldo
+    
+    # ----------------------
+    # Apuestas deportivas
+    # ----------------------
+    # Las apuestas de un evento toman además el bloqueo 'evento:<id>', así
+    # las cuotas de cada apuesta se calculan en el mismo orden en que quedan
+    # en el log. Liquidar paga a todos los ganadores en una sola operación.
+    
+    def crear_evento(self, nombre, cuota_local, cuota_empate, cuota_visitante):
+        cuotas = {'local': cuota_local, 'empate': cuota_empate, 'visitante': cuota_visitante}
+        if not nombre or any(not isinstance(c, (int, float)) or c <= 1 for c in cuotas.values()):
+            raise ErrorBanco('Evento inválido: hace falta un nombre y cuotas mayores que 1')
+        # Las cuotas iniciales fijan el margen del banco (ver apuestas.py)
+        if sum(1 / c for c in cuotas.values()) < 1:
+            raise ErrorBanco('Evento inválido: con esas cuotas el banco no tiene margen')
+        evento_id = self._nuevo_id_evento()
+        return self._ejecutar('crear_evento', cuentas=(f'evento:{evento_id}',),
+                              evento_id=evento_id, nombre=nombre, cuotas=cuotas)
+    
+    def _aplicar_crear_evento(self, evento_id, nombre, cuotas):
+        evento = Evento.con_cuotas(evento_id, nombre, cuotas)
+        self._crear_evento(evento)
+        return evento.como_dict()
+    
+    def apostar_deportes(self, usuario, evento_id, monto, resultado):
+        """Apuesta `monto` a un resultado; se paga al liquidar el evento"""
+        if resultado not in RESULTADOS:
+            raise ErrorBanco('Resultado inválido')
+        validar_monto(monto)
+        return self._ejecutar('apostar',
+                              cuentas=(usuario, f'evento:{evento_id}'),
+                              usuario=usuario,
+                              evento_id=evento_id,
+                              monto=monto,
+                              resultado=resultado,
+                              fecha=self._ahora())
+    
+    def _aplicar_apostar(self, usuario, evento_id, monto, resultado, fecha):
+        evento = self.apuestas.evento(evento_id)
+        if evento is None:
+            raise ErrorBanco('Evento no encontrado', 404)
+        if evento.estado != 'abierto':
+            raise ErrorBanco('El evento ya no acepta apuestas', 409)
+        
+        nuevo_saldo = self._debitar(usuario, monto, BANCO, 'apuesta_deportiva', fecha)
+        cuota = self._registrar_apuesta(evento, usuario, resultado, monto)
+        
+        self.transacciones.append({
+            'usuario': usuario,
+            'tipo': 'apuesta_deportiva',
+            'monto': -monto,
+            'fecha': fecha,
+            'estado': 'completado',
+            'descripcion': f'Apuesta en {evento.nombre}: {resultado} (Cuota: {cuota}x)'
+        })
+        return {
+            'evento_id': evento_id,
+            'resultado': resultado,
+            'monto': monto,
+            'cuota': cuota,
+            'premio_posible': monto * cuota,
+            'nuevo_saldo': nuevo_saldo
+        }
+    
+    def cerrar_evento(self, evento_id):
+        """Deja de aceptar apuestas en un evento"""
+        return self._ejecutar('cerrar_evento', cuentas=(f'evento:{evento_id}',), evento_id=evento_id)
+    
+    def _aplicar_cerrar_evento(self, evento_id):
+        evento = self.apuestas.evento(evento_id)
+        if evento is None:
+            raise ErrorBanco('Evento no encontrado', 404)
+        if evento.estado != 'abierto':
+            raise ErrorBanco(f'El evento está {evento.estado}', 409)
+        self._cerrar_evento(evento)
+        return evento.como_dict()
+    
+    def liquidar_evento(self, evento_id, resultado=None):
+        """Fija el resultado de un evento cerrado y paga a todos sus ganadores.
+        
+        Sin `resultado` se sortea uno según las probabilidades iniciales del
+        evento; el mismo para todas las apuestas.
+        """
+        evento = self.apuestas.evento(evento_id)
+        if evento is None:
+            raise ErrorBanco('Evento no encontrado', 404)
+        # Los estados sólo avanzan, así que basta comprobarlo antes de
+        # ejecutar: el log puede traer liquidaciones de eventos abiertos
+        # anteriores a esta regla y tienen que seguir reproduciéndose
+        if evento.estado != 'cerrado':
+            raise ErrorBanco(f'Sólo se liquida un evento cerrado (está {evento.estado})', 409)
+        if resultado is None:
+            resultado = random.choices(RESULTADOS, weights=[evento.probabilidades[r] for r in RESULTADOS])[0]
+        elif resultado not in RESULTADOS:
+            raise ErrorBanco('Resultado inválido')
+        return self._ejecutar('liquidar_evento', cuentas=TODAS_LAS_CUENTAS,
+                              evento_id=evento_id, resultado=resultado, fecha=self._ahora())
+    
+    def _aplicar_liquidar_evento(self, evento_id, resultado, fecha):
+        evento = self.apuestas.evento(evento_id)
+        if evento.estado == 'liquidado':
+            raise ErrorBanco(f'El evento ya está liquidado ({evento.resultado})', 409)
+        
+        apuestas = evento.cantidad
+        apostado = sum(evento.apostado.values())
+        premios = self._liquidar_evento(evento, resultado)
+        pagado = sum(premios.values())
+        self._asentar(list(premios.items()) + [(BANCO, -pagado)], 'premio_apuesta', fecha)
+        self.transacciones.extend([{
+            'usuario': usuario,
+            'tipo': 'premio_apuesta',
+            'monto': premio,
+            'fecha': fecha,
+            'estado': 'completado',
+            'descripcion': f'Premio en {evento.nombre}: {resultado}'
+        } for usuario, premio in premios.items()])
+        return {
+            'evento_id': evento_id,
+            'resultado': resultado,
+            'apuestas': apuestas,
+            'ganadores': len(premios),
+            'apostado': apostado,
+            'pagado': pagado
+        }
+    
+    def _aplicar_apostar_deportes(self, usuario, evento_id, monto, resultado, resultado_real, fecha):
+        # Apuestas resueltas al instante con su propio sorteo: sólo aparecen
+        # en logs anteriores a los eventos con liquidación
+        evento = next(e for e in EVENTOS_INICIALES if e['id'] == evento_id)
+        
+        if self.saldo(usuario) < monto:
+            raise ErrorBanco('Fondos insuficientes')
+        
+        cuota = evento['cuota_' + resultado]
+        if resultado == resultado_real:
+            ganancia = monto * cuota
+            estado = 'ganada'
+        else:
+            estado = 'perdida'
+            ganancia = -monto
+        self._asentar([(EXTERNO, -ganancia), (usuario, ganancia)], 'apuesta_deportiva', fecha)
+        nuevo_saldo = self.saldo(usuario)
+        
+        self.transacciones.append({
+            'usuario': usuario,
+            'tipo': 'apuesta_deportiva',
+            'monto': ganancia,
+            'fecha': fecha,
+            'estado': estado,
+            'descripcion': f'Apuesta en {evento["evento"]}: {resultado} (Cuota: {cuota}x)'
+        })
+        return {
+            'resultado_real': resultado_real,
+            'ganancia': ganancia,
+            'nuevo_saldo': nuevo_saldo
+        }
+    
+    # ----------------------
+    # Órdenes de acciones
+    # ----------------------
+    # Las órdenes se encolan en el procesador y se casan por lotes: cada lote
+    # es una sola operación `ejecutar_ordenes` con los precios de referencia
+    # ya resueltos, así reproducir el log vuelve a casar exactamente igual.
+    # Las órdenes límite reservan al entrar el dinero (compras) o las
+    # acciones (ventas) que pueden llegar a necesitar. Una orden que cruza
+    # con otra del mismo usuario cancela la que estaba en reposo. Lo que una orden de
+    # mercado no encuentra en el libro lo ejecuta el banco al precio de
+    # referencia del mercado.
+    
+    def enviar_orden(self, usuario, simbolo, lado, tipo, cantidad, precio=None):
+        """Envía una orden y espera a que su lote se ejecute"""
+        if simbolo not in self.mercado.instantanea():
+            raise ErrorBanco('Acción no encontrada', 404)
+        if lado not in LADOS:
+            raise ErrorBanco('Lado inválido (compra o venta)')
+        if tipo not in TIPOS:
+            raise ErrorBanco('Tipo de orden inválido (mercado o limite)')
+        if not isinstance(cantidad, int) or cantidad <= 0:
+            raise ErrorBanco('Cantidad inválida')
+        if tipo == 'limite' and (precio is None or not math.isfinite(precio) or precio <= 0):
+            raise ErrorBanco('Las órdenes límite necesitan un precio positivo')
+        return self._procesador_ordenes.enviar({
+            'accion': 'orden', 'usuario': usuario, 'simbolo': simbolo, 'lado': lado,
+            'tipo': tipo, 'cantidad': cantidad, 'precio': precio if tipo == 'limite' else None,
+        })
+    
+    def cancelar_orden(self, usuario, orden_id):
+        return self._procesador_ordenes.enviar({'accion': 'cancelar', 'usuario': usuario, 'orden_id': orden_id})
+    
+    def ordenes_en_cola(self):
+        return self._procesador_ordenes.pendientes()
+    
+    def _ejecutar_lote_ordenes(self, peticiones):
+        mercado = self.mercado.instantanea()
+        precios = {p['simbolo']: mercado.precio(p['simbolo']) for p in peticiones if 'simbolo' in p}
+        return self._ejecutar('ejecutar_ordenes', cuentas=TODAS_LAS_CUENTAS,
+                              peticiones=peticiones, precios=precios, fecha=self._ahora())
+    
+    def _aplicar_ejecutar_ordenes(self, peticiones, precios, fecha):
+        """Aplica un lote en orden de llegada; un ErrorBanco sólo rechaza su orden"""
+        resultados = []
+        for peticion in peticiones:
+            try:
+                if peticion['accion'] == 'cancelar':
+                    resultados.append(self._cancelar_orden(peticion['usuario'], peticion['orden_id'], fecha))
+                else:
+                    resultados.append(self._casar_orden(peticion, precios[peticion['simbolo']], fecha))
+            except ErrorBanco as e:
+                resultados.append(e)
+        return resultados
+    
+    def _casar_orden(self, peticion, precio_referencia, fecha):
+        usuario, simbolo, lado = peticion['usuario'], peticion['simbolo'], peticion['lado']
+        orden = dict(peticion, id=self._nuevo_id_orden(), restante=peticion['cantidad'], fecha=fecha)
+        del orden['accion']
+        limite = orden['precio']
+        
+        # Reservar lo que la orden puede llegar a necesitar
+        if lado == 'venta':
+            if self.portafolios.get(usuario, {}).get(simbolo, 0) < orden['cantidad']:
+                raise ErrorBanco('No tienes suficientes acciones')
+            self._ajustar_posicion(usuario, simbolo, -orden['cantidad'])
+        elif limite is not None:
+            self._debitar(usuario, orden['cantidad'] * limite * (1 + COMISION_ACCIONES),
+                          RESERVAS, 'reserva_orden', fecha)
+        
+        ejecuciones = []  # (cantidad, precio)
+        libro = self.ordenes.libro(simbolo)
+        if lado == 'compra' and limite is None:
+            # Los fondos se comprueban antes de cancelar ninguna orden propia:
+            # la primera ejecución es contra la mejor venta ajena o el banco
+            precio = libro.mejor_precio_ajeno(lado, usuario)
+            if not self._acciones_pagables(usuario, precio if precio is not None else precio_referencia):
+                raise ErrorBanco('Fondos insuficientes')
+        while orden['restante']:
+            contraparte = libro.contraparte(lado, limite)
+            if contraparte is None:
+                break
+            if contraparte['usuario'] == usuario:
+                # Nadie se ejecuta contra sí mismo: la orden propia en reposo se cancela
+                self._cancelar_orden(usuario, contraparte['id'], fecha)
+                continue
+            cantidad = min(orden['restante'], contraparte['restante'])
+            if lado == 'compra' and limite is None:
+                cantidad = min(cantidad, self._acciones_pagables(usuario, contraparte['precio']))
+                if not cantidad:
+                    break
+            compra, venta = (orden, contraparte) if lado == 'compra' else (contraparte, orden)
+            self._liquidar(compra, venta, cantidad, contraparte['precio'], fecha)
+            self._registrar_ejecucion(contraparte, cantidad, cantidad * contraparte['precio'], fecha)
+            ejecuciones.append((cantidad, contraparte['precio']))
+            if contraparte['restante']:
+                self._actualizar_orden(contraparte)
+            else:
+                self._retirar_orden(contraparte['id'])
+        
+        # El banco hace de contraparte del resto de una orden de mercado
+        if orden['restante'] and limite is None:
+            cantidad = orden['restante']
+            if lado == 'compra':
+                cantidad = min(cantidad, self._acciones_pagables(usuario, precio_referencia))
+            if cantidad:
+                self._liquidar_con_banco(orden, cantidad, precio_referencia, fecha)
+                ejecuciones.append((cantidad, precio_referencia))
+        
+        ejecutado = sum(c for c, _ in ejecuciones)
+        if limite is None and not ejecutado:
+            raise ErrorBanco('Fondos insuficientes')
+        
+        if orden['restante'] and limite is not None:
+            self._reposar_orden(orden)
+            estado = 'abierta' if not ejecutado else 'parcial'
+        else:
+            estado = 'completada' if not orden['restante'] else 'parcial'
+        
+        importe = sum(c * p for c, p in ejecuciones)
+        comision = importe * COMISION_ACCIONES
+        if ejecutado:
+            self._registrar_ejecucion(orden, ejecutado, importe, fecha)
+        return {
+            'orden_id': orden['id'],
+            'estado': estado,
+            'ejecutado': ejecutado,
+            'restante': orden['restante'] if limite is not None else 0,
+            'precio_medio': importe / ejecutado if ejecutado else None,
+            'costo_total': importe + comision if lado == 'compra' else importe - comision,
+            'comision': comision,
+            'nuevo_saldo': self.saldo(usuario),
+        }
+    
+    def _acciones_pagables(self, usuario, precio):
+        return int(self.saldo(usuario) // (precio * (1 + COMISION_ACCIONES)))
+    
+    def _liquidar(self, compra, venta, cantidad, precio, fecha):
+        """Ejecuta `cantidad` acciones entre dos órdenes al precio de la que esperaba"""
+        importe = cantidad * precio
+        if compra['precio'] is None:
+            movimientos = [(compra['usuario'], -importe * (1 + COMISION_ACCIONES))]
+        else:
+            # La reserva se hizo al precio límite: sale de @reservas y vuelve la mejora de precio
+            movimientos = [(RESERVAS, -cantidad * compra['precio'] * (1 + COMISION_ACCIONES)),
+                           (compra['usuario'], cantidad * (compra['precio'] - precio) * (1 + COMISION_ACCIONES))]
+        movimientos.append((venta['usuario'], importe * (1 - COMISION_ACCIONES)))
+        movimientos.append((BANCO, 2 * importe * COMISION_ACCIONES))
+        self._asentar(movimientos, 'acciones', fecha)
+        self._ajustar_posicion(compra['usuario'], compra['simbolo'], cantidad)
+        self.contabilidad.comprar(compra['usuario'], compra['simbolo'], cantidad, precio * (1 + COMISION_ACCIONES))
+        self.contabilidad.vender(venta['usuario'], venta['simbolo'], cantidad, precio * (1 - COMISION_ACCIONES))
+        compra['restante'] -= cantidad
+        venta['restante'] -= cantidad
+    
+    def _liquidar_con_banco(self, orden, cantidad, precio, fecha):
+        importe = cantidad * precio
+        if orden['lado'] == 'compra':
+            self._asentar([(orden['usuario'], -importe * (1 + COMISION_ACCIONES)),
+                           (BANCO, importe * (1 + COMISION_ACCIONES))], 'acciones', fecha)
+            self._ajustar_posicion(orden['usuario'], orden['simbolo'], cantidad)
+            self.contabilidad.comprar(orden['usuario'], orden['simbolo'], cantidad, precio * (1 + COMISION_ACCIONES))
+        else:
+            self._asentar([(orden['usuario'], importe * (1 - COMISION_ACCIONES)),
+                           (BANCO, -importe * (1 - COMISION_ACCIONES))], 'acciones', fecha)
+            self.contabilidad.vender(orden['usuario'], orden['simbolo'], cantidad, precio * (1 - COMISION_ACCIONES))
+        orden['restante'] -= cantidad
+    
+    def _registrar_ejecucion(self, orden, cantidad, importe, fecha):
+        comision = importe * COMISION_ACCIONES
+        if orden['lado'] == 'compra':
+            tipo, monto, verbo = 'compra_acciones', importe + comision, 'Compra'
+        else:
+            tipo, monto, verbo = 'venta_acciones', importe - comision, 'Venta'
+        self.transacciones.append({
+            'usuario': orden['usuario'],
+            'tipo': tipo,
+            'monto': monto,
+            'fecha': fecha,
+            'estado': 'completado',
+            'descripcion': f'{verbo} de {cantidad} acciones {orden["simbolo"]} a {importe / cantidad:.2f} c/u '
+                           f'(orden #{orden["id"]})'
+        })
+    
+    def _cancelar_orden(self, usuario, orden_id, fecha):
+        orden = self.ordenes.obtener(orden_id)
+        if orden is None or orden['usuario'] != usuario:
+            raise ErrorBanco('Orden no encontrada', 404)
+        self._retirar_orden(orden_id)
+        # Devolver lo que quedaba reservado
+        if orden['lado'] == 'compra':
+            reservado = orden['restante'] * orden['precio'] * (1 + COMISION_ACCIONES)
+            self._asentar([(RESERVAS, -reservado), (usuario, reservado)], 'reserva_orden', fecha)
+        else:
+            self._ajustar_posicion(usuario, orden['simbolo'], orden['restante'])
+        return {'orden_id': orden_id, 'estado': 'cancelada', 'restante': orden['restante'],
+                'nuevo_saldo': self.saldo(usuario)}
+    
+    # ----------------------
+    # Importación masiva
+    # ----------------------
+    
+    def importar_usuarios(self, filas):
+        """Alta de un lote de clientes validados (ver importacion.py).
+        
+        Todo el lote es una sola operación. Devuelve [(indice, error)] con
+        las filas rechazadas.
+        """
+        numeros = self._reservar_numeros_cuenta(len(filas))
+        fecha = self._ahora()
+        usuarios = [{
+            'usuario': fila['usuario'],
+            'password': fila['password_sha256'] or self._hash_password(fila['password']),
+            'nombre': fila['nombre'],
+            'email': fila['email'],
+            'numero_cuenta': numero,
+            'saldo': fila['saldo'],
+            'fecha': fecha
+        } for fila, numero in zip(filas, numeros)]
+        return self._ejecutar('importar_usuarios',
+                              cuentas=tuple(u['usuario'] for u in usuarios),
+                              usuarios=usuarios)
+    
+    def _aplicar_importar_usuarios(self, usuarios):
+        rechazos = []
+        vistos = set()
+        aperturas = []
+        for indice, datos in enumerate(usuarios):
+            usuario = datos['usuario']
+            if usuario in vistos or usuario in self.usuarios:
+                rechazos.append((indice, 'El usuario ya existe'))
+                continue
+            vistos.add(usuario)
+            
+            self._crear_usuario(usuario, {
+                'password': datos['password'],
+                'tipo': 'usuario',
+                'nombre': datos['nombre'],
+                'email': datos['email'],
+                'numero_cuenta': datos['numero_cuenta'],
+                'saldo': 0,
+                'fecha_creacion': datos['fecha'],
+                'inversiones': {},
+                'prestamos': []
+            })
+            aperturas.append((usuario, datos['saldo']))
+            self.transacciones.append({
+                'usuario': usuario,
+                'tipo': 'apertura_cuenta',
+                'monto': datos['saldo'],
+                'fecha': datos['fecha'],
+                'estado': 'completado',
+                'descripcion': 'Migración de cuenta'
+            })
+        if aperturas:
+            # Todo el lote entra en un solo asiento
+            aperturas.append((EXTERNO, -sum(monto for _, monto in aperturas)))
+            self._asentar(aperturas, 'apertura_cuenta', usuarios[0]['fecha'])
+        return rechazos
+    
+    def importar_transacciones(self, filas):
+        """Carga histórica de movimientos: van al libro sin tocar los saldos,
+        que llegan ya migrados con los clientes. Devuelve [(indice, error)]."""
+        return self._ejecutar('importar_transacciones',
+                              cuentas=tuple({fila['usuario'] for fila in filas}),
+                              transacciones=filas)
+    
+    def _aplicar_importar_transacciones(self, transacciones):
+        rechazos = []
+        for indice, transaccion in enumerate(transacciones):
+            if transaccion['usuario'] not in self.usuarios:
+                rechazos.append((indice, 'Usuario no encontrado'))
+                continue
+            self.transacciones.append(dict(transaccion))
+        return rechazos
+
+
+def crear_banco():
+    """Banco configurado por entorno.
+    
+    CHIQUIBANK_BACKEND=sqlite guarda el estado en la base SQLite de
+    CHIQUIBANK_SQLITE; si no, el estado vive en memoria y CHIQUIBANK_DATOS
+    activa el log en disco y el archivado del historial antiguo.
+    CHIQUIBANK_MODELO_RIESGO elige el modelo de riesgo de crédito ('reglas'
+    o 'logistico').
+    """
+    if os.environ.get('CHIQUIBANK_BACKEND') == 'sqlite':
+        from banco_sqlite import BancoSQLite
+        banco = BancoSQLite(os.environ.get('CHIQUIBANK_SQLITE', 'chiquibank.db'))
+    else:
+        directorio = os.environ.get('CHIQUIBANK_DATOS')
+        if directorio:
+            banco = BancoRealista(almacen=AlmacenWAL(directorio), historico=os.path.join(directorio, 'historico'))
+        else:
+            banco = BancoRealista()
+    
+    modelo = os.environ.get('CHIQUIBANK_MODELO_RIESGO')
+    if modelo:
+        banco.riesgo.modelo = MODELOS[modelo]()
+    return banco
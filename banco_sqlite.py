@@ -0,0 +1,951 @@
+"""BancoRealista sobre una base SQLite embebida.
+
+El estado (usuarios, portafolios, préstamos, transacciones, solicitudes,
+órdenes en reposo y eventos con sus apuestas) vive en la base en lugar de
+en el heap del proceso, de modo que varios workers pueden compartir un
+mismo banco. Cada hilo usa su propia conexión
+en modo WAL y cada operación corre en una transacción `BEGIN IMMEDIATE`,
+que la serializa frente a los demás procesos.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+from banco_realista import BancoRealista
+from cuentas import AsignadorCuentas
+from agregados import CAMPOS
+from apuestas import EVENTOS_INICIALES, MotorApuestas
+from contabilidad import Contabilidad, Posicion
+from diario import fecha_de_corte, validar_asiento
+from ordenes import MotorOrdenes
+from persistencia import AlmacenMemoria
+
+# Segundos que un worker conserva el mercado sin renovarlo antes de que
+# otro lo tome
+CONCESION_MERCADO = 30
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS usuarios (
+    usuario TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    nombre TEXT,
+    email TEXT,
+    numero_cuenta TEXT,
+    saldo REAL NOT NULL DEFAULT 0,
+    fecha_creacion TEXT,
+    interes_hasta TEXT,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_usuarios_numero_cuenta ON usuarios (numero_cuenta);
+
+CREATE TABLE IF NOT EXISTS portafolios (
+    usuario TEXT NOT NULL,
+    simbolo TEXT NOT NULL,
+    cantidad INTEGER NOT NULL,
+    PRIMARY KEY (usuario, simbolo)
+);
+
+CREATE TABLE IF NOT EXISTS prestamos (
+    usuario TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    datos TEXT NOT NULL,
+    PRIMARY KEY (usuario, id)
+);
+
+CREATE TABLE IF NOT EXISTS transacciones (
+    id INTEGER PRIMARY KEY,
+    usuario TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    fecha TEXT NOT NULL,
+    datos TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_transacciones_usuario_fecha ON transacciones (usuario, fecha);
+CREATE INDEX IF NOT EXISTS idx_transacciones_usuario_id ON transacciones (usuario, id);
+CREATE INDEX IF NOT EXISTS idx_transacciones_tipo_estado ON transacciones (tipo, estado);
+
+CREATE TABLE IF NOT EXISTS solicitudes (
+    id INTEGER PRIMARY KEY,
+    trans_id INTEGER NOT NULL,
+    datos TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS ordenes (
+    id INTEGER PRIMARY KEY,
+    datos TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS posiciones (
+    usuario TEXT NOT NULL,
+    simbolo TEXT NOT NULL,
+    cantidad INTEGER NOT NULL,
+    costo REAL NOT NULL,
+    datos TEXT NOT NULL,
+    PRIMARY KEY (usuario, simbolo)
+);
+
+CREATE TABLE IF NOT EXISTS eventos (
+    id INTEGER PRIMARY KEY,
+    datos TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS apuestas (
+    id INTEGER PRIMARY KEY,
+    evento_id INTEGER NOT NULL,
+    usuario TEXT NOT NULL,
+    resultado TEXT NOT NULL,
+    monto REAL NOT NULL,
+    cuota REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_apuestas_evento ON apuestas (evento_id);
+
+CREATE TABLE IF NOT EXISTS asientos (
+    id INTEGER PRIMARY KEY,
+    fecha TEXT NOT NULL,
+    concepto TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_asientos_fecha ON asientos (fecha);
+
+CREATE TABLE IF NOT EXISTS movimientos (
+    asiento INTEGER NOT NULL,
+    cuenta TEXT NOT NULL,
+    monto REAL NOT NULL,
+    saldo REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_movimientos_cuenta_asiento ON movimientos (cuenta, asiento);
+CREATE INDEX IF NOT EXISTS idx_movimientos_asiento ON movimientos (asiento);
+
+CREATE TABLE IF NOT EXISTS cuentas_diario (
+    cuenta TEXT PRIMARY KEY,
+    saldo REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS banco (
+    clave TEXT PRIMARY KEY,
+    valor
+);
+"""
+
+
+class PoolConexiones:
+    """Una conexión por hilo a la misma base SQLite"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._local = threading.local()
+        self._conexiones = []
+        self._bloqueo = threading.Lock()
+
+    def conexion(self):
+        con = getattr(self._local, 'con', None)
+        if con is None:
+            # isolation_level=None: las transacciones se abren explícitamente.
+            # sqlite3 guarda las sentencias preparadas en cached_statements.
+            con = sqlite3.connect(self.ruta, timeout=30, isolation_level=None,
+                                  check_same_thread=False, cached_statements=256)
+            con.row_factory = sqlite3.Row
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('PRAGMA synchronous=NORMAL')
+            self._local.con = con
+            with self._bloqueo:
+                self._conexiones.append(con)
+        return con
+
+    @contextmanager
+    def transaccion(self):
+        """Transacción de escritura; las anidadas se unen a la exterior"""
+        con = self.conexion()
+        if con.in_transaction:
+            yield con
+            return
+        con.execute('BEGIN IMMEDIATE')
+        try:
+            yield con
+        except BaseException:
+            con.execute('ROLLBACK')
+            raise
+        con.execute('COMMIT')
+
+    def __len__(self):
+        return len(self._conexiones)
+
+    def cerrar(self):
+        with self._bloqueo:
+            for con in self._conexiones:
+                con.close()
+            self._conexiones = []
+        self._local = threading.local()
+
+
+class VistaUsuarios(Mapping):
+    """Acceso de sólo lectura a los usuarios con la forma de los dicts en memoria"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def _fila_a_dict(self, fila, prestamos):
+        datos = dict(fila)
+        datos['inversiones'] = {}
+        datos['prestamos'] = prestamos
+        return datos
+
+    def __getitem__(self, usuario):
+        con = self.pool.conexion()
+        fila = con.execute('SELECT * FROM usuarios WHERE usuario = ?', (usuario,)).fetchone()
+        if fila is None:
+            raise KeyError(usuario)
+        prestamos = [json.loads(p['datos']) for p in con.execute(
+            'SELECT datos FROM prestamos WHERE usuario = ? ORDER BY id', (usuario,))]
+        return self._fila_a_dict(fila, prestamos)
+
+    def __contains__(self, usuario):
+        return self.pool.conexion().execute(
+            'SELECT 1 FROM usuarios WHERE usuario = ?', (usuario,)).fetchone() is not None
+
+    def __iter__(self):
+        return (fila[0] for fila in self.pool.conexion().execute('SELECT usuario FROM usuarios'))
+
+    def __len__(self):
+        return self.pool.conexion().execute('SELECT COUNT(*) FROM usuarios').fetchone()[0]
+
+    def values(self):
+        con = self.pool.conexion()
+        prestamos = {}
+        for p in con.execute('SELECT usuario, datos FROM prestamos ORDER BY usuario, id'):
+            prestamos.setdefault(p['usuario'], []).append(json.loads(p['datos']))
+        return [self._fila_a_dict(fila, prestamos.get(fila['usuario'], []))
+                for fila in con.execute('SELECT * FROM usuarios')]
+
+
+class VistaPortafolios(Mapping):
+    """Portafolios como {usuario: {simbolo: cantidad}}, de sólo lectura"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __getitem__(self, usuario):
+        con = self.pool.conexion()
+        portafolio = {fila['simbolo']: fila['cantidad'] for fila in con.execute(
+            'SELECT simbolo, cantidad FROM portafolios WHERE usuario = ? AND cantidad != 0', (usuario,))}
+        if not portafolio and con.execute(
+                "SELECT 1 FROM usuarios WHERE usuario = ? AND tipo = 'usuario'", (usuario,)).fetchone() is None:
+            raise KeyError(usuario)
+        return portafolio
+
+    def __iter__(self):
+        return (fila[0] for fila in self.pool.conexion().execute(
+            "SELECT usuario FROM usuarios WHERE tipo = 'usuario'"))
+
+    def __len__(self):
+        return self.pool.conexion().execute(
+            "SELECT COUNT(*) FROM usuarios WHERE tipo = 'usuario'").fetchone()[0]
+
+    def items(self):
+        # Una consulta para todos en lugar de dos por usuario: se recorre al arrancar
+        portafolios = {}
+        for fila in self.pool.conexion().execute(
+                "SELECT u.usuario, p.simbolo, p.cantidad FROM usuarios u "
+                "LEFT JOIN portafolios p ON p.usuario = u.usuario AND p.cantidad != 0 "
+                "WHERE u.tipo = 'usuario'"):
+            portafolio = portafolios.setdefault(fila[0], {})
+            if fila[1] is not None:
+                portafolio[fila[1]] = fila[2]
+        return portafolios.items()
+
+
+class LibroSQLite:
+    """Mismo contrato que LibroTransacciones, sobre la tabla transacciones"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __len__(self):
+        return self.pool.conexion().execute('SELECT COUNT(*) FROM transacciones').fetchone()[0]
+
+    def __iter__(self):
+        return (json.loads(fila[0]) for fila in self.pool.conexion().execute(
+            'SELECT datos FROM transacciones ORDER BY id'))
+
+    def __getitem__(self, trans_id):
+        fila = self.pool.conexion().execute(
+            'SELECT datos FROM transacciones WHERE id = ?', (trans_id,)).fetchone()
+        if fila is None:
+            raise IndexError(trans_id)
+        return json.loads(fila[0])
+
+    def append(self, transaccion):
+        with self.pool.transaccion() as con:
+            trans_id = con.execute(
+                "SELECT COALESCE(MAX(id) + 1, 0) FROM transacciones").fetchone()[0]
+            transaccion['id'] = trans_id
+            con.execute('INSERT INTO transacciones (id, usuario, tipo, estado, fecha, datos) '
+                        'VALUES (?, ?, ?, ?, ?, ?)',
+                        (trans_id, transaccion['usuario'], transaccion['tipo'],
+                         transaccion['estado'], transaccion['fecha'], json.dumps(transaccion)))
+        return trans_id
+
+    def extend(self, transacciones):
+        with self.pool.transaccion() as con:
+            primero = con.execute("SELECT COALESCE(MAX(id) + 1, 0) FROM transacciones").fetchone()[0]
+            for trans_id, transaccion in enumerate(transacciones, primero):
+                transaccion['id'] = trans_id
+            con.executemany('INSERT INTO transacciones (id, usuario, tipo, estado, fecha, datos) '
+                            'VALUES (?, ?, ?, ?, ?, ?)',
+                            ((t['id'], t['usuario'], t['tipo'], t['estado'], t['fecha'], json.dumps(t))
+                             for t in transacciones))
+
+    def actualizar_estado(self, trans_id, estado, **campos):
+        with self.pool.transaccion() as con:
+            transaccion = self[trans_id]
+            transaccion['estado'] = estado
+            transaccion.update(campos)
+            con.execute('UPDATE transacciones SET estado = ?, datos = ? WHERE id = ?',
+                        (estado, json.dumps(transaccion), trans_id))
+        return transaccion
+
+    def desde(self, trans_id):
+        return [json.loads(fila[0]) for fila in self.pool.conexion().execute(
+            'SELECT datos FROM transacciones WHERE id >= ? ORDER BY id', (trans_id,))]
+
+    def por_usuario(self, usuario, cursor=None, limite=None):
+        con = self.pool.conexion()
+        filas = con.execute(
+            'SELECT id, datos FROM transacciones WHERE usuario = ? AND id < ? ORDER BY id DESC LIMIT ?',
+            (usuario, cursor if cursor is not None else 2 ** 62,
+             limite + 1 if limite is not None else -1)).fetchall()
+        siguiente_cursor = None
+        if limite is not None and len(filas) > limite:
+            filas = filas[:limite]
+            siguiente_cursor = filas[-1]['id']
+        return [json.loads(fila['datos']) for fila in filas], siguiente_cursor
+
+    def historial(self, usuario, desde=None, hasta=None):
+        """Transacciones de un usuario por id con fecha en [desde, hasta), leídas por tandas"""
+        cursor = self.pool.conexion().execute(
+            'SELECT datos FROM transacciones WHERE usuario = ? AND fecha >= ? AND fecha < ? ORDER BY id',
+            (usuario, desde or '', hasta or '\uffff'))
+        while True:
+            filas = cursor.fetchmany(500)
+            if not filas:
+                return
+            for fila in filas:
+                yield json.loads(fila[0])
+
+    def archivar(self):
+        # Las filas ya viven en disco
+        return 0
+
+    def estadisticas(self):
+        return {'en_memoria': 0, 'archivadas': len(self)}
+
+    def contar_usuario(self, usuario):
+        return self.pool.conexion().execute(
+            'SELECT COUNT(*) FROM transacciones WHERE usuario = ?', (usuario,)).fetchone()[0]
+
+    def por_tipo_estado(self, tipo, estado):
+        return [json.loads(fila[0]) for fila in self.pool.conexion().execute(
+            'SELECT datos FROM transacciones WHERE tipo = ? AND estado = ? ORDER BY id', (tipo, estado))]
+
+
+class ColaSQLite:
+    """Mismo contrato que ColaSolicitudes, sobre la tabla solicitudes"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __len__(self):
+        return self.pool.conexion().execute('SELECT COUNT(*) FROM solicitudes').fetchone()[0]
+
+    def __iter__(self):
+        return iter([json.loads(fila[0]) for fila in self.pool.conexion().execute(
+            'SELECT datos FROM solicitudes ORDER BY id')])
+
+    def __contains__(self, solicitud_id):
+        return self.pool.conexion().execute(
+            'SELECT 1 FROM solicitudes WHERE id = ?', (solicitud_id,)).fetchone() is not None
+
+    def nuevo_id(self):
+        with self.pool.transaccion() as con:
+            return con.execute("UPDATE banco SET valor = valor + 1 WHERE clave = 'ultima_solicitud' "
+                               "RETURNING valor").fetchone()[0]
+
+    def agregar(self, solicitud, trans_id):
+        self.pool.conexion().execute('INSERT INTO solicitudes (id, trans_id, datos) VALUES (?, ?, ?)',
+                                     (solicitud['id'], trans_id, json.dumps(solicitud)))
+
+    def obtener(self, solicitud_id):
+        fila = self.pool.conexion().execute(
+            'SELECT datos FROM solicitudes WHERE id = ?', (solicitud_id,)).fetchone()
+        return json.loads(fila[0]) if fila else None
+
+    def retirar(self, solicitud_id):
+        with self.pool.transaccion() as con:
+            fila = con.execute('SELECT trans_id, datos FROM solicitudes WHERE id = ?',
+                               (solicitud_id,)).fetchone()
+            if fila is None:
+                return None, None
+            con.execute('DELETE FROM solicitudes WHERE id = ?', (solicitud_id,))
+            return json.loads(fila['datos']), fila['trans_id']
+
+    def ids(self):
+        return [fila[0] for fila in self.pool.conexion().execute('SELECT id FROM solicitudes ORDER BY id')]
+
+
+class AgregadosSQLite:
+    """Mismo contrato que Agregados, sobre la tabla banco.
+
+    Cada operación suma a los totales en su propia transacción, así todos
+    los workers leen los mismos y un rollback también los deshace.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def sumar(self, campo, delta):
+        self.pool.conexion().execute('UPDATE banco SET valor = valor + ? WHERE clave = ?', (delta, campo))
+
+    def fijar(self, valores):
+        with self.pool.transaccion() as con:
+            con.executemany('UPDATE banco SET valor = ? WHERE clave = ?',
+                            ((valor, campo) for campo, valor in valores.items()))
+
+    def como_dict(self):
+        valores = dict(self.pool.conexion().execute(
+            'SELECT clave, valor FROM banco WHERE clave IN (?, ?, ?)', CAMPOS).fetchall())
+        return {campo: valores[campo] for campo in CAMPOS}
+
+    def __getattr__(self, campo):
+        if campo in CAMPOS:
+            return self.como_dict()[campo]
+        raise AttributeError(campo)
+
+    @property
+    def ultima_reconciliacion(self):
+        fila = self.pool.conexion().execute(
+            "SELECT valor FROM banco WHERE clave = 'ultima_reconciliacion'").fetchone()
+        return json.loads(fila[0]) if fila and fila[0] else None
+
+    def reconciliar(self, recalculados, tolerancia=1e-6):
+        """Compara con un recálculo completo, corrige y devuelve las diferencias"""
+        with self.pool.transaccion() as con:
+            actuales = self.como_dict()
+            diferencias = {campo: recalculados[campo] - actuales[campo]
+                           for campo in CAMPOS
+                           if abs(recalculados[campo] - actuales[campo]) > tolerancia}
+            self.fijar(recalculados)
+            con.execute("INSERT OR REPLACE INTO banco (clave, valor) VALUES ('ultima_reconciliacion', ?)",
+                        (json.dumps({'fecha': time.strftime("%Y-%m-%d %H:%M:%S"),
+                                     'diferencias': diferencias}),))
+        return diferencias
+
+
+class DiarioSQLite:
+    """Mismo contrato que Diario, sobre las tablas asientos y movimientos.
+
+    Cada movimiento guarda el saldo que dejó en su cuenta y cuentas_diario
+    lleva el saldo actual, así las consultas no suman el diario entero.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __len__(self):
+        return self.pool.conexion().execute('SELECT COUNT(*) FROM asientos').fetchone()[0]
+
+    def asentar(self, movimientos, concepto, fecha):
+        validar_asiento(movimientos, concepto)
+        with self.pool.transaccion() as con:
+            # Las fechas nunca retroceden: la del último asiento es la máxima
+            ultimo = con.execute('SELECT id, fecha FROM asientos ORDER BY id DESC LIMIT 1').fetchone()
+            asiento = ultimo['id'] + 1 if ultimo else 0
+            con.execute('INSERT INTO asientos (id, fecha, concepto) VALUES (?, ?, ?)',
+                        (asiento, max(fecha, ultimo['fecha']) if ultimo else fecha, concepto))
+            filas = []
+            for cuenta, monto in movimientos:
+                if not monto:
+                    continue
+                saldo = con.execute(
+                    'INSERT INTO cuentas_diario (cuenta, saldo) VALUES (?, ?) '
+                    'ON CONFLICT (cuenta) DO UPDATE SET saldo = saldo + excluded.saldo RETURNING saldo',
+                    (cuenta, monto)).fetchone()[0]
+                filas.append((asiento, cuenta, monto, saldo))
+            con.executemany('INSERT INTO movimientos (asiento, cuenta, monto, saldo) VALUES (?, ?, ?, ?)', filas)
+        return asiento
+
+    def saldo(self, cuenta, asiento=None, fecha=None):
+        con = self.pool.conexion()
+        if fecha is not None:
+            asiento = con.execute('SELECT COALESCE(MAX(id), -1) FROM asientos WHERE fecha <= ?',
+                                  (fecha_de_corte(fecha),)).fetchone()[0]
+        if asiento is None:
+            fila = con.execute('SELECT saldo FROM cuentas_diario WHERE cuenta = ?', (cuenta,)).fetchone()
+        else:
+            fila = con.execute('SELECT saldo FROM movimientos WHERE cuenta = ? AND asiento <= ? '
+                               'ORDER BY asiento DESC LIMIT 1', (cuenta, asiento)).fetchone()
+        return fila[0] if fila else 0.0
+
+    def saldos(self):
+        return dict(self.pool.conexion().execute('SELECT cuenta, saldo FROM cuentas_diario').fetchall())
+
+    def descuadre(self):
+        return self.pool.conexion().execute('SELECT COALESCE(SUM(saldo), 0) FROM cuentas_diario').fetchone()[0]
+
+    def asiento(self, asiento):
+        con = self.pool.conexion()
+        fila = con.execute('SELECT fecha, concepto FROM asientos WHERE id = ?', (asiento,)).fetchone()
+        if fila is None:
+            raise IndexError(asiento)
+        return {'id': asiento, 'fecha': fila['fecha'], 'concepto': fila['concepto'],
+                'movimientos': [tuple(m) for m in con.execute(
+                    'SELECT cuenta, monto FROM movimientos WHERE asiento = ? ORDER BY rowid', (asiento,))]}
+
+
+class ContabilidadSQLite(Contabilidad):
+    """Contabilidad con las posiciones en la tabla posiciones.
+
+    `cantidad` y `costo` van en columnas propias para que la pasada de
+    valoración no tenga que decodificar los lotes.
+    """
+
+    def __init__(self, pool, metodo='fifo'):
+        super().__init__(metodo)
+        self.pool = pool
+
+    def _leer(self, usuario, simbolo):
+        fila = self.pool.conexion().execute(
+            'SELECT datos FROM posiciones WHERE usuario = ? AND simbolo = ?', (usuario, simbolo)).fetchone()
+        return Posicion(**json.loads(fila[0])) if fila else None
+
+    def _guardar(self, usuario, simbolo, posicion):
+        self.pool.conexion().execute(
+            'INSERT OR REPLACE INTO posiciones (usuario, simbolo, cantidad, costo, datos) VALUES (?, ?, ?, ?, ?)',
+            (usuario, simbolo, posicion.cantidad, posicion.costo, json.dumps(posicion.como_dict())))
+
+    def posiciones_de(self, usuario):
+        return {fila['simbolo']: Posicion(**json.loads(fila['datos'])) for fila in self.pool.conexion().execute(
+            'SELECT simbolo, datos FROM posiciones WHERE usuario = ?', (usuario,))}
+
+    def _todas(self):
+        for fila in self.pool.conexion().execute(
+                'SELECT usuario, simbolo, cantidad, costo FROM posiciones WHERE cantidad != 0'):
+            yield fila['usuario'], fila['simbolo'], Posicion(fila['cantidad'], fila['costo'])
+
+
+class AlmacenSQLite(AlmacenMemoria):
+    """La base ya es durable: no hay log que escribir, sólo conexiones que cerrar"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def cerrar(self):
+        self.pool.cerrar()
+
+    def estadisticas(self):
+        con = self.pool.conexion()
+        return {
+            'motor': 'sqlite',
+            'ruta': self.pool.ruta,
+            'conexiones': len(self.pool),
+            'paginas': con.execute('PRAGMA page_count').fetchone()[0],
+            'modo_journal': con.execute('PRAGMA journal_mode').fetchone()[0],
+        }
+
+
+class BancoSQLite(BancoRealista):
+    """BancoRealista cuyo estado vive en SQLite.
+
+    Sólo reimplementa las primitivas de estado; las operaciones y las rutas
+    son las mismas que en memoria.
+    """
+
+    def __init__(self, ruta):
+        self.pool = PoolConexiones(ruta)
+        super().__init__(almacen=AlmacenSQLite(self.pool))
+
+    def _crear_estado_inicial(self):
+        self.cuentas = AsignadorCuentas()
+        self.pool.conexion().executescript(ESQUEMA)
+        with self.pool.transaccion() as con:
+            # Bases creadas antes de los intereses no tienen la columna
+            columnas = {fila[1] for fila in con.execute('PRAGMA table_info(usuarios)')}
+            if 'interes_hasta' not in columnas:
+                con.execute('ALTER TABLE usuarios ADD COLUMN interes_hasta TEXT')
+            if 'version' not in columnas:
+                con.execute('ALTER TABLE usuarios ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+            con.execute("INSERT OR IGNORE INTO banco (clave, valor) VALUES ('saldo_banco', 50000000)")
+            con.execute("INSERT OR IGNORE INTO banco (clave, valor) VALUES ('ultima_solicitud', 0)")
+            con.execute("INSERT OR IGNORE INTO banco (clave, valor) VALUES ('ultima_orden', 0)")
+            con.execute("INSERT OR IGNORE INTO banco (clave, valor) VALUES ('ultimo_cierre_mes', NULL)")
+            con.execute("INSERT OR IGNORE INTO banco (clave, valor) VALUES ('ultimo_devengo', NULL)")
+            con.execute("INSERT OR IGNORE INTO banco (clave, valor) VALUES ('ultimo_evento', 0)")
+            con.execute("INSERT OR IGNORE INTO banco (clave, valor) VALUES ('mercado', NULL)")
+            con.execute("INSERT OR IGNORE INTO banco (clave, valor) VALUES ('version_ordenes', 0)")
+            con.execute("INSERT OR IGNORE INTO banco (clave, valor) VALUES ('version_apuestas', 0)")
+            con.execute('INSERT OR IGNORE INTO usuarios (usuario, password, tipo, nombre, saldo, fecha_creacion) '
+                        "VALUES ('admin', ?, 'admin', 'Director del Banco', 0, ?)",
+                        (self._hash_password('admin123'), self._ahora()))
+        self.usuarios = VistaUsuarios(self.pool)
+        self.portafolios = VistaPortafolios(self.pool)
+        self.transacciones = LibroSQLite(self.pool)
+        self.solicitudes_pendientes = ColaSQLite(self.pool)
+        # Los totales viven en la base, compartidos por todos los workers;
+        # una base que todavía no los tiene arranca del recálculo completo
+        with self.pool.transaccion() as con:
+            con.executemany('INSERT OR IGNORE INTO banco (clave, valor) VALUES (?, ?)',
+                            self.calcular_agregados().items())
+        self.agregados = AgregadosSQLite(self.pool)
+        # El libro de órdenes y los eventos se casan y liquidan en memoria,
+        # pero la verdad está en las tablas (ver `_motor`)
+        self._motores = {'ordenes': (None, None), 'apuestas': (None, None)}
+        self._lecturas = {'ordenes': (None, None), 'apuestas': (None, None)}
+        self._bloqueo_lecturas = threading.Lock()
+        self.contabilidad = ContabilidadSQLite(self.pool)
+        with self.pool.transaccion():
+            self.contabilidad.inicializar(self.portafolios, self.mercado.instantanea())
+        with self.pool.transaccion() as con:
+            if con.execute('SELECT COUNT(*) FROM eventos').fetchone()[0] == 0:
+                for evento in MotorApuestas(EVENTOS_INICIALES).eventos.values():
+                    con.execute('INSERT INTO eventos (id, datos) VALUES (?, ?)',
+                                (evento.id, json.dumps(evento.exportar())))
+                con.execute("UPDATE banco SET valor = MAX(valor, ?) WHERE clave = 'ultimo_evento'",
+                            (max(evento['id'] for evento in EVENTOS_INICIALES),))
+        # Último tick del mercado compartido adoptado (ver actualizar_mercado)
+        self._tick_compartido = None
+        # Una base anterior al diario lo abre con los saldos que ya tiene
+        self.diario = DiarioSQLite(self.pool)
+        with self.pool.transaccion():
+            if not len(self.diario):
+                self._abrir_diario()
+
+    @property
+    def saldo_banco(self):
+        return self.pool.conexion().execute(
+            "SELECT valor FROM banco WHERE clave = 'saldo_banco'").fetchone()[0]
+
+    @property
+    def ultimo_cierre_mes(self):
+        return self.pool.conexion().execute(
+            "SELECT valor FROM banco WHERE clave = 'ultimo_cierre_mes'").fetchone()[0]
+
+    def _fijar_ultimo_cierre(self, mes):
+        self.pool.conexion().execute("UPDATE banco SET valor = ? WHERE clave = 'ultimo_cierre_mes'", (mes,))
+
+    @property
+    def ultimo_devengo(self):
+        return self.pool.conexion().execute(
+            "SELECT valor FROM banco WHERE clave = 'ultimo_devengo'").fetchone()[0]
+
+    def _fijar_ultimo_devengo(self, dia):
+        self.pool.conexion().execute("UPDATE banco SET valor = ? WHERE clave = 'ultimo_devengo'", (dia,))
+
+    def actualizar_mercado(self):
+        """Un solo worker mueve los precios; los demás adoptan los suyos.
+        
+        El que mueve el mercado guarda en la base sus precios y una concesión
+        que renueva en cada tick; si deja de renovarla (murió o se apagó),
+        el próximo worker que actualice la toma.
+        """
+        ahora = time.time()
+        with self.pool.transaccion() as con:
+            fila = con.execute("SELECT valor FROM banco WHERE clave = 'mercado'").fetchone()[0]
+            compartido = json.loads(fila) if fila else None
+            if compartido is None or compartido['lider'] == os.getpid() or compartido['hasta'] < ahora:
+                instantanea = self.mercado.avanzar()
+                con.execute("UPDATE banco SET valor = ? WHERE clave = 'mercado'", (json.dumps({
+                    'lider': os.getpid(), 'hasta': ahora + CONCESION_MERCADO, 'tick': instantanea.secuencia,
+                    'precios': {simbolo: instantanea.precio(simbolo) for simbolo in instantanea}}),))
+            elif (compartido['lider'], compartido['tick']) != self._tick_compartido:
+                self._tick_compartido = (compartido['lider'], compartido['tick'])
+                instantanea = self.mercado.fijar(compartido['precios'])
+            else:
+                return self.mercado.instantanea()
+        self.contabilidad.valorar(instantanea)
+        return instantanea
+
+    def a_cargo_de_tareas(self):
+        # El worker que tiene la concesión del mercado corre también las tareas
+        fila = self.pool.conexion().execute("SELECT valor FROM banco WHERE clave = 'mercado'").fetchone()[0]
+        compartido = json.loads(fila) if fila else None
+        return compartido is not None and compartido['lider'] == os.getpid() and compartido['hasta'] >= time.time()
+
+    def _ejecutar(self, operacion, cuentas=None, **datos):
+        # BEGIN IMMEDIATE ya serializa las escrituras entre hilos y procesos
+        with self.pool.transaccion():
+            self._motor('ordenes')
+            self._motor('apuestas')
+            versiones = dict(self._motores)
+            try:
+                return getattr(self, '_aplicar_' + operacion)(**datos)
+            except BaseException:
+                # Lo que la operación cambió en memoria no llega a la base
+                for clave, (motor, version) in self._motores.items():
+                    if (motor, version) != versiones[clave]:
+                        self._motores[clave] = (motor, None)
+                raise
+
+    def _generar_numero_cuenta(self):
+        # Otros procesos emiten de sus propios bloques; el índice único decide
+        con = self.pool.conexion()
+        while True:
+            numero = self.cuentas.asignar()
+            if con.execute('SELECT 1 FROM usuarios WHERE numero_cuenta = ?', (numero,)).fetchone() is None:
+                return numero
+
+    def _reservar_numeros_cuenta(self, cantidad):
+        return [self._generar_numero_cuenta() for _ in range(cantidad)]
+
+    def buscar_por_cuenta(self, numero_cuenta):
+        fila = self.pool.conexion().execute(
+            'SELECT usuario FROM usuarios WHERE numero_cuenta = ?', (numero_cuenta,)).fetchone()
+        return fila[0] if fila else None
+
+    # ----------------------
+    # Primitivas de estado
+    # ----------------------
+
+    def saldo(self, usuario):
+        fila = self.pool.conexion().execute(
+            'SELECT saldo FROM usuarios WHERE usuario = ?', (usuario,)).fetchone()
+        if fila is None:
+            raise KeyError(usuario)
+        return fila[0]
+
+    def prestamos_de(self, usuario):
+        return [json.loads(fila[0]) for fila in self.pool.conexion().execute(
+            'SELECT datos FROM prestamos WHERE usuario = ? ORDER BY id', (usuario,))]
+
+    def _crear_usuario(self, usuario, datos):
+        self.pool.conexion().execute(
+            'INSERT INTO usuarios (usuario, password, tipo, nombre, email, numero_cuenta, saldo, fecha_creacion) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (usuario, datos['password'], datos['tipo'], datos.get('nombre'), datos.get('email'),
+             datos.get('numero_cuenta'), datos.get('saldo', 0), datos.get('fecha_creacion')))
+        self.agregados.sumar('total_usuarios', 1)
+        self.agregados.sumar('total_depositos', datos.get('saldo', 0))
+
+    def _tocar(self, *usuarios):
+        # La versión vive en la base para que la vean todos los workers
+        self.pool.conexion().executemany('UPDATE usuarios SET version = version + 1 WHERE usuario = ?',
+                                         ((usuario,) for usuario in usuarios))
+
+    def version_usuario(self, usuario):
+        fila = self.pool.conexion().execute('SELECT version FROM usuarios WHERE usuario = ?', (usuario,)).fetchone()
+        return fila[0] if fila else None
+
+    def bloqueo_global(self):
+        return self.pool.transaccion()
+
+    # ----------------------
+    # Órdenes y eventos compartidos
+    # ----------------------
+    # Cada escritura en ordenes, eventos o apuestas suma uno a su
+    # 'version_<motor>' en la misma transacción. Un worker que encuentra en
+    # la base otra versión que la de su copia la vuelve a cargar: dentro de
+    # una transacción de escritura reemplaza la copia compartida; fuera de
+    # ella no la toca, porque puede estar cambiando otro hilo, y usa una
+    # copia de sólo lectura que se carga una vez por versión.
+
+    @property
+    def ordenes(self):
+        return self._motor('ordenes')
+
+    @property
+    def apuestas(self):
+        return self._motor('apuestas')
+
+    def _motor(self, clave):
+        con = self.pool.conexion()
+        version = con.execute('SELECT valor FROM banco WHERE clave = ?', ('version_' + clave,)).fetchone()[0]
+        motor, vista = self._motores[clave]
+        if motor is not None and version == vista:
+            return motor
+        cargar = self._cargar_ordenes if clave == 'ordenes' else self._cargar_apuestas
+        if con.in_transaction:
+            motor = cargar(con)
+            self._motores[clave] = (motor, version)
+            return motor
+        with self._bloqueo_lecturas:
+            copia, vista = self._lecturas[clave]
+            if copia is not None and version == vista:
+                return copia
+            con.execute('BEGIN')
+            try:
+                # La versión de la copia es la de la instantánea que se carga
+                version = con.execute('SELECT valor FROM banco WHERE clave = ?',
+                                      ('version_' + clave,)).fetchone()[0]
+                copia = cargar(con)
+            finally:
+                con.execute('COMMIT')
+            self._lecturas[clave] = (copia, version)
+            return copia
+
+    def _cargar_ordenes(self, con):
+        motor = MotorOrdenes()
+        for fila in con.execute('SELECT datos FROM ordenes ORDER BY id'):
+            motor.agregar(json.loads(fila[0]))
+        return motor
+
+    def _cargar_apuestas(self, con):
+        eventos = {}
+        for fila in con.execute('SELECT datos FROM eventos ORDER BY id'):
+            datos = json.loads(fila[0])
+            eventos[datos['id']] = dict(datos, apuestas={})
+        for fila in con.execute('SELECT evento_id, usuario, resultado, monto, cuota FROM apuestas ORDER BY id'):
+            eventos[fila['evento_id']]['apuestas'].setdefault(fila['resultado'], []).append(
+                (fila['usuario'], fila['monto'], fila['cuota']))
+        motor = MotorApuestas()
+        motor.importar({'ultimo_id': max(eventos, default=0), 'eventos': list(eventos.values())})
+        return motor
+
+    def _cambio(self, clave):
+        """Anota que la operación en curso cambió las tablas de `clave`"""
+        version = self.pool.conexion().execute(
+            'UPDATE banco SET valor = valor + 1 WHERE clave = ? RETURNING valor', ('version_' + clave,)).fetchone()[0]
+        self._motores[clave] = (self._motores[clave][0], version)
+
+    def _nuevo_id_orden(self):
+        return self.pool.conexion().execute(
+            "UPDATE banco SET valor = valor + 1 WHERE clave = 'ultima_orden' RETURNING valor").fetchone()[0]
+
+    def _reposar_orden(self, orden):
+        self.pool.conexion().execute('INSERT INTO ordenes (id, datos) VALUES (?, ?)',
+                                     (orden['id'], json.dumps(orden)))
+        super()._reposar_orden(orden)
+        self._cambio('ordenes')
+
+    def _actualizar_orden(self, orden):
+        self.pool.conexion().execute('UPDATE ordenes SET datos = ? WHERE id = ?',
+                                     (json.dumps(orden), orden['id']))
+        self._cambio('ordenes')
+
+    def _retirar_orden(self, orden_id):
+        self.pool.conexion().execute('DELETE FROM ordenes WHERE id = ?', (orden_id,))
+        orden = super()._retirar_orden(orden_id)
+        self._cambio('ordenes')
+        return orden
+
+    def _nuevo_id_evento(self):
+        return self.pool.conexion().execute(
+            "UPDATE banco SET valor = valor + 1 WHERE clave = 'ultimo_evento' RETURNING valor").fetchone()[0]
+
+    def _guardar_evento(self, evento):
+        self.pool.conexion().execute('UPDATE eventos SET datos = ? WHERE id = ?',
+                                     (json.dumps(evento.exportar()), evento.id))
+        self._cambio('apuestas')
+
+    def _crear_evento(self, evento):
+        self.pool.conexion().execute('INSERT INTO eventos (id, datos) VALUES (?, ?)',
+                                     (evento.id, json.dumps(evento.exportar())))
+        super()._crear_evento(evento)
+        self._cambio('apuestas')
+
+    def _registrar_apuesta(self, evento, usuario, resultado, monto):
+        cuota = super()._registrar_apuesta(evento, usuario, resultado, monto)
+        self.pool.conexion().execute(
+            'INSERT INTO apuestas (evento_id, usuario, resultado, monto, cuota) VALUES (?, ?, ?, ?, ?)',
+            (evento.id, usuario, resultado, monto, cuota))
+        self._guardar_evento(evento)
+        return cuota
+
+    def _cerrar_evento(self, evento):
+        super()._cerrar_evento(evento)
+        self._guardar_evento(evento)
+
+    def _liquidar_evento(self, evento, resultado):
+        # Las apuestas liquidadas ya están en el libro de transacciones; todas
+        # estaban en memoria porque la operación empezó por sincronizarla
+        premios = super()._liquidar_evento(evento, resultado)
+        self.pool.conexion().execute('DELETE FROM apuestas WHERE evento_id = ?', (evento.id,))
+        self._guardar_evento(evento)
+        return premios
+
+    def _mover_saldo_banco(self, monto):
+        self.pool.conexion().execute(
+            "UPDATE banco SET valor = valor + ? WHERE clave = 'saldo_banco'", (monto,))
+
+    def _ajustar_posicion(self, usuario, simbolo, cantidad):
+        self.pool.conexion().execute(
+            'INSERT INTO portafolios (usuario, simbolo, cantidad) VALUES (?, ?, ?) '
+            'ON CONFLICT (usuario, simbolo) DO UPDATE SET cantidad = cantidad + excluded.cantidad',
+            (usuario, simbolo, cantidad))
+        self._tocar(usuario)
+
+    def _agregar_prestamo(self, usuario, prestamo):
+        self.pool.conexion().execute(
+            'INSERT INTO prestamos (usuario, id, datos) VALUES (?, ?, ?)',
+            (usuario, prestamo['id'], json.dumps(prestamo)))
+        self.agregados.sumar('total_prestamos', prestamo['monto_restante'])
+        self._tocar(usuario)
+
+    def _todos_los_prestamos(self):
+        for fila in self.pool.conexion().execute('SELECT usuario, datos FROM prestamos'):
+            yield fila['usuario'], json.loads(fila['datos'])
+
+    def _actualizar_prestamos(self, cambios):
+        con = self.pool.conexion()
+        con.executemany('UPDATE prestamos SET datos = json_patch(datos, ?) WHERE usuario = ? AND id = ?',
+                        ((json.dumps(campos), usuario, prestamo_id) for usuario, prestamo_id, campos in cambios))
+        self._tocar(*{usuario for usuario, _, _ in cambios})
+        self.agregados.fijar({'total_prestamos': self.calcular_agregados()['total_prestamos']})
+
+    def _saldos(self):
+        return dict(self.pool.conexion().execute('SELECT usuario, saldo FROM usuarios').fetchall())
+
+    def _cuentas_para_interes(self, usuarios):
+        return [tuple(fila) for fila in self.pool.conexion().execute(
+            "SELECT usuario, saldo, COALESCE(interes_hasta, substr(fecha_creacion, 1, 10)) FROM usuarios "
+            "WHERE tipo = 'usuario' AND usuario IN (SELECT value FROM json_each(?))", (json.dumps(usuarios),))]
+
+    def _mover_saldos(self, movimientos):
+        con = self.pool.conexion()
+        con.executemany('UPDATE usuarios SET saldo = saldo + ?, version = version + 1 WHERE usuario = ?',
+                        ((monto, usuario) for usuario, monto in movimientos))
+        # Como en calcular_agregados, total_depositos sólo suma clientes
+        clientes = {fila[0] for fila in con.execute(
+            "SELECT usuario FROM usuarios WHERE tipo = 'usuario' AND usuario IN (SELECT value FROM json_each(?))",
+            (json.dumps([usuario for usuario, _ in movimientos]),))}
+        self.agregados.sumar('total_depositos', sum(monto for usuario, monto in movimientos if usuario in clientes))
+
+    def _marcar_interes(self, usuarios, dia):
+        self.pool.conexion().execute(
+            'UPDATE usuarios SET interes_hasta = ? WHERE usuario IN (SELECT value FROM json_each(?))',
+            (dia, json.dumps(usuarios)))
+
+    def _actualizar_prestamo(self, usuario, prestamo_id, **cambios):
+        con = self.pool.conexion()
+        prestamo = json.loads(con.execute('SELECT datos FROM prestamos WHERE usuario = ? AND id = ?',
+                                          (usuario, prestamo_id)).fetchone()[0])
+        if 'monto_restante' in cambios:
+            self.agregados.sumar('total_prestamos', cambios['monto_restante'] - prestamo['monto_restante'])
+        prestamo.update(cambios)
+        con.execute('UPDATE prestamos SET datos = ? WHERE usuario = ? AND id = ?',
+                    (json.dumps(prestamo), usuario, prestamo_id))
+        self._tocar(usuario)
+        return prestamo
+
+    # ----------------------
+    # Agregados
+    # ----------------------
+
+    def calcular_agregados(self):
+        con = self.pool.conexion()
+        total_usuarios, total_depositos = con.execute(
+            "SELECT COUNT(*), COALESCE(SUM(saldo), 0) FROM usuarios WHERE tipo = 'usuario'").fetchone()
+        total_prestamos = con.execute(
+            "SELECT COALESCE(SUM(json_extract(datos, '$.monto_restante')), 0) FROM prestamos").fetchone()[0]
+        return {
+            'total_usuarios': total_usuarios,
+            'total_depositos': total_depositos,
+            'total_prestamos': total_prestamos,
+        }
+
+    def reconciliar_agregados(self):
+        # Recalcular y corregir en la misma transacción de escritura, para no
+        # pisar lo que otro worker sume entre medio
+        with self.pool.transaccion():
+            return self.agregados.reconciliar(self.calcular_agregados())
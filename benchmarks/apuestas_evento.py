@@ -0,0 +1,78 @@
+"""Volumen de apuestas sobre un mismo evento y su liquidación.
+
+`--usuarios` clientes apuestan desde varios hilos `--apuestas` veces a un
+solo evento; se mide apuestas por segundo, la latencia de cada apuesta
+(p50/p99) y cuánto tarda liquidar el evento entero. Al final comprueba
+que el dinero se conserva (saldos + banco).
+
+    python benchmarks/apuestas_evento.py --apuestas 200000
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apuestas import RESULTADOS  # noqa: E402
+from banco_realista import BancoRealista  # noqa: E402
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--usuarios', type=int, default=20000)
+    parser.add_argument('--apuestas', type=int, default=200000)
+    parser.add_argument('--hilos', type=int, default=8)
+    args = parser.parse_args()
+
+    banco = BancoRealista()
+    usuarios = [f'cliente{i}' for i in range(args.usuarios)]
+    banco.importar_usuarios([{'usuario': u, 'password': 'x', 'password_sha256': None, 'nombre': u,
+                              'email': '', 'saldo': 1000000} for u in usuarios])
+    evento = banco.crear_evento('Final del benchmark', 2.1, 3.0, 3.2)
+    dinero_inicial = sum(banco._saldos().values()) + banco.saldo_banco
+
+    latencias = [[] for _ in range(args.hilos)]
+
+    def trabajador(indice):
+        azar = random.Random(indice)
+        for _ in range(args.apuestas // args.hilos):
+            inicio = time.perf_counter()
+            banco.apostar_deportes(azar.choice(usuarios), evento['id'], round(azar.uniform(10, 200), 2),
+                                   azar.choices(RESULTADOS, weights=(5, 2, 3))[0])
+            latencias[indice].append(time.perf_counter() - inicio)
+
+    hilos = [threading.Thread(target=trabajador, args=(i,)) for i in range(args.hilos)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    segundos = time.perf_counter() - inicio
+    todas = [l for lista in latencias for l in lista]
+    print(f'apuestas: {len(todas)} en {segundos:.2f} s ({len(todas) / segundos:.0f}/s), '
+          f'p50 {percentil(todas, 0.5) * 1000:.3f} ms, p99 {percentil(todas, 0.99) * 1000:.3f} ms')
+    print('cuotas finales:', banco.apuestas.evento(evento['id']).cuotas())
+
+    banco.cerrar_evento(evento['id'])
+    inicio = time.perf_counter()
+    resumen = banco.liquidar_evento(evento['id'], 'local')
+    print(f"liquidación: {resumen['apuestas']} apuestas, {resumen['ganadores']} ganadores, "
+          f"{resumen['pagado']:.2f} pagado de {resumen['apostado']:.2f} en {time.perf_counter() - inicio:.3f} s")
+
+    correcto = abs(sum(banco._saldos().values()) + banco.saldo_banco - dinero_inicial) < 1e-6 * dinero_inicial
+    print('dinero:', 'OK' if correcto else 'ERROR')
+    banco.cerrar()
+    if not correcto:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,396 @@
+"""Prueba de carga de las rutas de ChiquiBank con líneas base.
+
+Puebla el banco de app.py con `--usuarios` clientes, `--transacciones`
+movimientos históricos, `--prestamos` préstamos y `--posiciones` compras
+de acciones, y recorre cada ruta (registro, login, comprar_acciones,
+apostar_deportes, solicitar_prestamo, procesar_solicitud,
+/api/transacciones, el estado de cuenta, los paneles de cliente, de
+inversiones y de administración) con `--hilos` clientes en paralelo,
+primero con el cliente de pruebas de Flask y luego contra un servidor WSGI
+local real. Reporta peticiones por segundo, latencia p50/p95/p99,
+respuestas con error y el pico de memoria (RSS).
+
+`--guardar NOMBRE` deja los resultados en benchmarks/lineas_base/NOMBRE.json
+y `--comparar NOMBRE` los contrasta con esa línea base: marca como
+regresión lo que empeore más que `--tolerancia` y sale con código 1.
+
+    python benchmarks/carga.py --guardar local
+    python benchmarks/carga.py --comparar local
+    python benchmarks/carga.py --usuarios 50000 --transacciones 1000000 --modos servidor
+    python benchmarks/carga.py --sqlite /tmp/carga.db --escenarios login transacciones
+"""
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import queue
+import random
+import resource
+import sys
+import threading
+import time
+import urllib.parse
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+LINEAS_BASE = os.path.join(DIRECTORIO, 'lineas_base')
+sys.path.insert(0, os.path.dirname(DIRECTORIO))
+
+PASSWORD = 'clave123'
+LOTE = 10000
+TIPOS_HISTORICOS = ('abono', 'cargo', 'transferencia_enviada', 'transferencia_recibida', 'deposito', 'retiro')
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else 0
+
+
+def rss_mb():
+    """Pico de memoria residente del proceso (ru_maxrss viene en KB en Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# ----------------------
+# Población
+# ----------------------
+
+def poblar(banco, args):
+    azar = random.Random(0)
+    usuarios = [f'carga{i}' for i in range(args.usuarios)]
+    hash_password = hashlib.sha256(PASSWORD.encode()).hexdigest()
+    for inicio in range(0, len(usuarios), LOTE):
+        banco.importar_usuarios([{'usuario': u, 'password': PASSWORD, 'password_sha256': hash_password,
+                                  'nombre': u, 'email': f'{u}@carga.test', 'saldo': azar.uniform(5000, 50000)}
+                                 for u in usuarios[inicio:inicio + LOTE]])
+
+    for inicio in range(0, args.transacciones, LOTE):
+        banco.importar_transacciones([{
+            'usuario': azar.choice(usuarios),
+            'tipo': azar.choice(TIPOS_HISTORICOS),
+            'monto': round(azar.uniform(1, 2000), 2),
+            'fecha': f'2025-{azar.randint(1, 12):02d}-{azar.randint(1, 28):02d} 12:00:00',
+            'estado': 'completado',
+            'descripcion': 'Histórico de carga'
+        } for _ in range(min(LOTE, args.transacciones - inicio))])
+
+    for _ in range(args.prestamos):
+        banco.otorgar_prestamo(azar.choice(usuarios), round(azar.uniform(500, 5000), 2), azar.choice((6, 12, 24)))
+
+    simbolos = list(banco.mercado.instantanea())
+    for _ in range(args.posiciones):
+        banco.comprar_acciones(azar.choice(usuarios), azar.choice(simbolos), azar.randint(1, 5))
+    return usuarios
+
+
+# ----------------------
+# Clientes
+# ----------------------
+
+class ClientePruebas:
+    """Cliente de pruebas de Flask: mide la app sin red ni servidor"""
+
+    def __init__(self, app):
+        self.cliente = app.test_client()
+
+    def pedir(self, metodo, ruta, formulario=None, json_=None):
+        respuesta = self.cliente.open(ruta, method=metodo, data=formulario, json=json_)
+        respuesta.get_data()  # las respuestas por trozos se generan al leerlas
+        respuesta.close()
+        return respuesta.status_code
+
+
+class ClienteHTTP:
+    """Conexión keep-alive a un servidor local que guarda la cookie de sesión"""
+
+    def __init__(self, puerto):
+        self.conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=60)
+        self.cookie = None
+
+    def pedir(self, metodo, ruta, formulario=None, json_=None):
+        cabeceras = {}
+        cuerpo = None
+        if formulario is not None:
+            cuerpo = urllib.parse.urlencode(formulario)
+            cabeceras['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif json_ is not None:
+            cuerpo = json.dumps(json_)
+            cabeceras['Content-Type'] = 'application/json'
+        if self.cookie:
+            cabeceras['Cookie'] = self.cookie
+        self.conexion.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+        respuesta = self.conexion.getresponse()
+        respuesta.read()
+        cookie = respuesta.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return respuesta.status
+
+
+def iniciar_sesion(cliente, usuario):
+    estado = cliente.pedir('POST', '/login', formulario={'usuario': usuario, 'password': PASSWORD})
+    if estado != 302:
+        raise RuntimeError(f'No se pudo iniciar sesión como {usuario}: {estado}')
+
+
+# ----------------------
+# Escenarios
+# ----------------------
+# Cada escenario es (sesión, preparar, petición): la sesión con la que entra
+# cada hilo ('usuario', 'admin' o None), una preparación fuera del
+# cronómetro y la petición, que devuelve el código HTTP.
+
+def _registro(contexto, cliente, azar, i):
+    usuario = f'nuevo{contexto["corrida"]}_{threading.get_ident()}_{i}'
+    return cliente.pedir('POST', '/registro', formulario={
+        'usuario': usuario, 'password': PASSWORD, 'nombre': usuario, 'email': f'{usuario}@carga.test'})
+
+
+def _login(contexto, cliente, azar, i):
+    return cliente.pedir('POST', '/login', formulario={
+        'usuario': azar.choice(contexto['usuarios']), 'password': PASSWORD})
+
+
+def _comprar_acciones(contexto, cliente, azar, i):
+    return cliente.pedir('POST', '/comprar_acciones', json_={
+        'simbolo': azar.choice(contexto['simbolos']), 'cantidad': 1})
+
+
+def _apostar_deportes(contexto, cliente, azar, i):
+    return cliente.pedir('POST', '/apostar_deportes', json_={
+        'evento_id': azar.choice(contexto['eventos']), 'monto': 10, 'resultado': azar.choice(('local', 'empate'))})
+
+
+def _solicitar_prestamo(contexto, cliente, azar, i):
+    return cliente.pedir('POST', '/solicitar_prestamo', json_={
+        'monto': round(azar.uniform(500, 5000), 2), 'plazo_meses': 12})
+
+
+def _preparar_solicitudes(contexto, banco, peticiones):
+    contexto['solicitudes'] = cola = queue.SimpleQueue()
+    azar = random.Random(1)
+    for _ in range(peticiones):
+        cola.put(banco.crear_solicitud(azar.choice(contexto['usuarios']), 'deposito', 100, 'Carga')['id'])
+
+
+def _procesar_solicitud(contexto, cliente, azar, i):
+    return cliente.pedir('POST', '/api/procesar_solicitud', json_={
+        'solicitud_id': contexto['solicitudes'].get_nowait(), 'accion': 'aprobar'})
+
+
+def _transacciones(contexto, cliente, azar, i):
+    return cliente.pedir('GET', '/api/transacciones?limite=50')
+
+
+def _exportar(contexto, cliente, azar, i):
+    return cliente.pedir('GET', '/api/transacciones/exportar?formato=csv')
+
+
+def _panel(contexto, cliente, azar, i):
+    return cliente.pedir('GET', '/usuario')
+
+
+def _inversiones(contexto, cliente, azar, i):
+    return cliente.pedir('GET', '/inversiones')
+
+
+def _admin(contexto, cliente, azar, i):
+    return cliente.pedir('GET', '/admin')
+
+
+ESCENARIOS = {
+    'registro': (None, None, _registro),
+    'login': (None, None, _login),
+    'comprar_acciones': ('usuario', None, _comprar_acciones),
+    'apostar_deportes': ('usuario', None, _apostar_deportes),
+    'solicitar_prestamo': ('usuario', None, _solicitar_prestamo),
+    'procesar_solicitud': ('admin', _preparar_solicitudes, _procesar_solicitud),
+    'transacciones': ('usuario', None, _transacciones),
+    'exportar': ('usuario', None, _exportar),
+    'panel': ('usuario', None, _panel),
+    'inversiones': ('usuario', None, _inversiones),
+    'admin': ('admin', None, _admin),
+}
+
+
+def correr(nombre, nuevo_cliente, contexto, banco, peticiones, hilos):
+    sesion, preparar, peticion = ESCENARIOS[nombre]
+    por_hilo = max(1, peticiones // hilos)
+    if preparar:
+        preparar(contexto, banco, por_hilo * hilos)
+    clientes = []
+    for indice in range(hilos):
+        cliente = nuevo_cliente()
+        if sesion == 'admin':
+            cliente.pedir('POST', '/login', formulario={'usuario': 'admin', 'password': 'admin123'})
+        elif sesion == 'usuario':
+            iniciar_sesion(cliente, contexto['usuarios'][indice % len(contexto['usuarios'])])
+        clientes.append(cliente)
+
+    latencias = [[] for _ in range(hilos)]
+    codigos = [{} for _ in range(hilos)]
+
+    def trabajador(indice):
+        azar = random.Random(indice)
+        cliente = clientes[indice]
+        for i in range(por_hilo):
+            inicio = time.perf_counter()
+            codigo = peticion(contexto, cliente, azar, i)
+            latencias[indice].append(time.perf_counter() - inicio)
+            codigos[indice][codigo] = codigos[indice].get(codigo, 0) + 1
+
+    trabajadores = [threading.Thread(target=trabajador, args=(i,)) for i in range(hilos)]
+    inicio = time.perf_counter()
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    segundos = time.perf_counter() - inicio
+
+    todas = [l for lista in latencias for l in lista]
+    total = {}
+    for por_hilo_codigos in codigos:
+        for codigo, cuenta in por_hilo_codigos.items():
+            total[str(codigo)] = total.get(str(codigo), 0) + cuenta
+    return {
+        'peticiones': len(todas),
+        'por_segundo': len(todas) / segundos,
+        'p50_ms': percentil(todas, 0.50) * 1000,
+        'p95_ms': percentil(todas, 0.95) * 1000,
+        'p99_ms': percentil(todas, 0.99) * 1000,
+        'errores': sum(c for codigo, c in total.items() if int(codigo) >= 500),
+        'codigos': total,
+    }
+
+
+def iniciar_servidor(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class SinRegistro(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    servidor = make_server('127.0.0.1', 0, app, threaded=True, request_handler=SinRegistro)
+    hilo = threading.Thread(target=servidor.serve_forever, name='servidor-carga', daemon=True)
+    hilo.start()
+    return servidor
+
+
+# ----------------------
+# Líneas base
+# ----------------------
+
+# (métrica, True si más alto es mejor)
+METRICAS_COMPARADAS = (('por_segundo', True), ('p50_ms', False), ('p99_ms', False))
+
+
+def comparar(actual, base, tolerancia):
+    """Lista de regresiones [(modo, escenario, métrica, base, actual)]"""
+    regresiones = []
+    for modo, escenarios in actual['resultados'].items():
+        for nombre, resultado in escenarios.items():
+            anterior = base['resultados'].get(modo, {}).get(nombre)
+            if anterior is None:
+                continue
+            for metrica, mas_es_mejor in METRICAS_COMPARADAS:
+                antes, ahora = anterior[metrica], resultado[metrica]
+                peor = ahora < antes * (1 - tolerancia) if mas_es_mejor else ahora > antes * (1 + tolerancia)
+                if peor:
+                    regresiones.append((modo, nombre, metrica, antes, ahora))
+    if actual['rss_mb'] > base['rss_mb'] * (1 + tolerancia):
+        regresiones.append(('proceso', '-', 'rss_mb', base['rss_mb'], actual['rss_mb']))
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--usuarios', type=int, default=5000)
+    parser.add_argument('--transacciones', type=int, default=100000)
+    parser.add_argument('--prestamos', type=int, default=1000)
+    parser.add_argument('--posiciones', type=int, default=2000)
+    parser.add_argument('--peticiones', type=int, default=2000, help='por escenario y modo')
+    parser.add_argument('--hilos', type=int, default=8)
+    parser.add_argument('--escenarios', nargs='+', choices=list(ESCENARIOS), default=list(ESCENARIOS))
+    parser.add_argument('--modos', nargs='+', choices=('cliente', 'servidor'), default=['cliente', 'servidor'])
+    parser.add_argument('--con-limites', action='store_true',
+                        help='deja activos el límite por usuario y el descarte de carga')
+    parser.add_argument('--sqlite', help='ruta de una base nueva para medir con BancoSQLite')
+    parser.add_argument('--guardar', metavar='NOMBRE', help='guarda los resultados como línea base')
+    parser.add_argument('--comparar', metavar='NOMBRE', help='compara con una línea base guardada')
+    parser.add_argument('--tolerancia', type=float, default=0.25)
+    args = parser.parse_args()
+
+    if args.sqlite:
+        os.environ['CHIQUIBANK_BACKEND'] = 'sqlite'
+        os.environ['CHIQUIBANK_SQLITE'] = args.sqlite
+    import app as aplicacion
+    banco = aplicacion.banco
+    if not args.con_limites:
+        aplicacion.limitador.limites = {}
+        aplicacion.admision.max_en_curso = aplicacion.admision.max_cola = float('inf')
+        aplicacion.admision.latencia_maxima = float('inf')
+
+    inicio = time.perf_counter()
+    usuarios = poblar(banco, args)
+    print(f'población: {len(usuarios)} usuarios, {len(banco.transacciones)} transacciones en '
+          f'{time.perf_counter() - inicio:.1f} s, RSS {rss_mb():.0f} MB')
+
+    contexto = {'usuarios': usuarios, 'simbolos': list(banco.mercado.instantanea()),
+                'eventos': [e['id'] for e in banco.eventos_deportivos if e['estado'] == 'abierto']}
+    resultados = {}
+    servidor = None
+    for corrida, modo in enumerate(args.modos):
+        contexto['corrida'] = corrida
+        if modo == 'cliente':
+            def nuevo_cliente():
+                return ClientePruebas(aplicacion.app)
+        else:
+            servidor = iniciar_servidor(aplicacion.app)
+
+            def nuevo_cliente(puerto=servidor.server_port):
+                return ClienteHTTP(puerto)
+        print(f'\n{modo}: {args.hilos} hilos, {args.peticiones} peticiones por ruta')
+        print(f'{"ruta":<20} {"pet/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"5xx":>5}  códigos')
+        resultados[modo] = {}
+        for nombre in args.escenarios:
+            resultado = correr(nombre, nuevo_cliente, contexto, banco, args.peticiones, args.hilos)
+            resultados[modo][nombre] = resultado
+            print(f'{nombre:<20} {resultado["por_segundo"]:>9.0f} {resultado["p50_ms"]:>8.2f} '
+                  f'{resultado["p95_ms"]:>8.2f} {resultado["p99_ms"]:>8.2f} {resultado["errores"]:>5}  '
+                  f'{resultado["codigos"]}')
+        if servidor is not None:
+            servidor.shutdown()
+            servidor = None
+
+    actual = {'parametros': {clave: valor for clave, valor in vars(args).items()
+                             if clave not in ('guardar', 'comparar', 'tolerancia')},
+              'resultados': resultados, 'rss_mb': rss_mb(),
+              'fecha': time.strftime('%Y-%m-%d %H:%M:%S')}
+    print(f'\nRSS pico: {actual["rss_mb"]:.0f} MB')
+    banco.cerrar()
+
+    if args.guardar:
+        os.makedirs(LINEAS_BASE, exist_ok=True)
+        ruta = os.path.join(LINEAS_BASE, f'{args.guardar}.json')
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            json.dump(actual, archivo, ensure_ascii=False, indent=2)
+        print(f'línea base guardada en {ruta}')
+
+    if args.comparar:
+        with open(os.path.join(LINEAS_BASE, f'{args.comparar}.json'), encoding='utf-8') as archivo:
+            base = json.load(archivo)
+        distintos = [clave for clave, valor in actual['parametros'].items()
+                     if base['parametros'].get(clave) != valor]
+        if distintos:
+            print(f'⚠️ parámetros distintos de la línea base: {", ".join(distintos)}')
+        regresiones = comparar(actual, base, args.tolerancia)
+        for modo, nombre, metrica, antes, ahora in regresiones:
+            print(f'REGRESIÓN {modo}/{nombre} {metrica}: {antes:.2f} -> {ahora:.2f}')
+        print(f'comparación con {args.comparar} ({base["fecha"]}):',
+              'OK' if not regresiones else f'{len(regresiones)} regresiones')
+        if regresiones:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Tiempo del cierre de mes de préstamos sobre una cartera grande.
+
+Crea `--prestamos` préstamos repartidos entre `--usuarios` clientes (una
+parte sin saldo suficiente, para ejercitar la mora) y mide el cierre de
+varios meses seguidos: la pasada de cálculo sola y el cierre completo
+(cálculo + aplicar cambios, cobros y transacciones) dentro del banco.
+
+    python benchmarks/cierre_mes.py --prestamos 1000000
+    python benchmarks/cierre_mes.py --prestamos 1000000 --sqlite /tmp/cierre.db
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from banco_realista import BancoRealista  # noqa: E402
+from prestamos import cerrar_mes, nuevo_prestamo  # noqa: E402
+
+MESES = ('2030-01', '2030-02', '2030-03')
+
+
+def poblar(banco, prestamos, usuarios):
+    """Carga la cartera directamente con las primitivas (sin una operación por alta)"""
+    azar = random.Random(0)
+    por_usuario = max(1, prestamos // usuarios)
+    creados = 0
+    with banco.bloqueo_global():
+        for i in range(usuarios):
+            usuario = f'cliente{i}'
+            # Uno de cada diez clientes no llega a pagar sus cuotas
+            saldo = 0 if i % 10 == 0 else azar.uniform(5000, 50000)
+            banco._crear_usuario(usuario, {'password': '', 'tipo': 'usuario', 'nombre': usuario,
+                                           'email': '', 'numero_cuenta': f'BENCH{i}', 'saldo': saldo,
+                                           'fecha_creacion': '2029-12-01 00:00:00'})
+            for j in range(por_usuario if i < usuarios - 1 else prestamos - creados):
+                banco._agregar_prestamo(usuario, nuevo_prestamo(
+                    j + 1, azar.uniform(500, 20000), 0.12, azar.choice((6, 12, 24, 36)), '2029-12-15 00:00:00'))
+                creados += 1
+    return creados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--prestamos', type=int, default=1000000)
+    parser.add_argument('--usuarios', type=int, default=250000)
+    parser.add_argument('--sqlite', help='ruta de una base nueva para medir con BancoSQLite')
+    args = parser.parse_args()
+
+    if args.sqlite:
+        from banco_sqlite import BancoSQLite
+        for sufijo in ('', '-wal', '-shm'):
+            if os.path.exists(args.sqlite + sufijo):
+                os.remove(args.sqlite + sufijo)
+        banco = BancoSQLite(args.sqlite)
+    else:
+        banco = BancoRealista()
+
+    inicio = time.perf_counter()
+    creados = poblar(banco, args.prestamos, args.usuarios)
+    print(f'cartera: {creados} préstamos, {args.usuarios} clientes ({time.perf_counter() - inicio:.1f} s de carga)')
+
+    inicio = time.perf_counter()
+    cambios, _, _ = cerrar_mes(banco._todos_los_prestamos(), banco._saldos(), MESES[0])
+    print(f'pasada de cálculo sola: {time.perf_counter() - inicio:.2f} s ({len(cambios)} préstamos)')
+
+    print(f"{'mes':<8} {'segundos':>9} {'préstamos/s':>12} {'cobrado':>16} {'en mora':>9} {'incobrables':>12}")
+    for mes in MESES:
+        inicio = time.perf_counter()
+        resumen = banco.cerrar_mes(mes)
+        segundos = time.perf_counter() - inicio
+        print(f"{mes:<8} {segundos:>9.2f} {resumen['prestamos'] / segundos:>12.0f} {resumen['cobrado']:>16.2f} "
+              f"{resumen['en_mora']:>9} {resumen['incobrables']:>12}")
+    banco.cerrar()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Devengo de intereses sobre muchas cuentas con tráfico en paralelo.
+
+Crea `--cuentas` clientes, deja varios hilos haciendo transferencias y
+mide la corrida de intereses: cuentas por segundo y la latencia de las
+transferencias antes y durante la corrida (p50/p99/máx). Una segunda
+corrida pone al día 30 días de una vez. Al final comprueba que el dinero
+se conserva (saldos + banco).
+
+    python benchmarks/devengo_intereses.py --cuentas 200000
+    python benchmarks/devengo_intereses.py --cuentas 200000 --sqlite /tmp/devengo.db
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from banco_realista import BancoRealista  # noqa: E402
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else 0
+
+
+def poblar(banco, cuentas):
+    """Carga las cuentas con las primitivas, sin una operación por alta"""
+    azar = random.Random(0)
+    usuarios = [f'cliente{i}' for i in range(cuentas)]
+    with banco.bloqueo_global():
+        for i, usuario in enumerate(usuarios):
+            banco._crear_usuario(usuario, {'password': '', 'tipo': 'usuario', 'nombre': usuario,
+                                           'email': '', 'numero_cuenta': f'BENCH{i}',
+                                           'saldo': azar.uniform(0, 50000),
+                                           'fecha_creacion': '2030-01-01 00:00:00'})
+    return usuarios
+
+
+class Trafico:
+    """Hilos que transfieren entre cuentas al azar y anotan la latencia"""
+
+    def __init__(self, banco, usuarios, hilos):
+        self.banco = banco
+        self.usuarios = usuarios
+        self.latencias = []
+        self._seguir = True
+        self._hilos = [threading.Thread(target=self._trabajar, args=(i,)) for i in range(hilos)]
+
+    def _trabajar(self, indice):
+        azar = random.Random(indice)
+        while self._seguir:
+            origen, destino = azar.sample(self.usuarios, 2)
+            inicio = time.perf_counter()
+            self.banco.transferir(origen, destino, 0.01)
+            self.latencias.append(time.perf_counter() - inicio)
+
+    def medir(self):
+        """Latencias desde la última llamada"""
+        latencias, self.latencias = self.latencias, []
+        return latencias
+
+    def iniciar(self):
+        for hilo in self._hilos:
+            hilo.start()
+
+    def detener(self):
+        self._seguir = False
+        for hilo in self._hilos:
+            hilo.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cuentas', type=int, default=200000)
+    parser.add_argument('--hilos', type=int, default=4)
+    parser.add_argument('--sqlite', help='ruta de una base nueva para medir con BancoSQLite')
+    args = parser.parse_args()
+
+    if args.sqlite:
+        from banco_sqlite import BancoSQLite
+        for sufijo in ('', '-wal', '-shm'):
+            if os.path.exists(args.sqlite + sufijo):
+                os.remove(args.sqlite + sufijo)
+        banco = BancoSQLite(args.sqlite)
+    else:
+        banco = BancoRealista()
+
+    usuarios = poblar(banco, args.cuentas)
+    dinero_inicial = sum(banco._saldos().values()) + banco.saldo_banco
+    trafico = Trafico(banco, usuarios, args.hilos)
+    trafico.iniciar()
+    time.sleep(1)
+
+    print(f"{'fase':<22} {'segundos':>9} {'cuentas/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'máx ms':>8}")
+    latencias = trafico.medir()
+    print(f"{'sin corrida':<22} {'':>9} {'':>10} {percentil(latencias, 0.5) * 1000:>8.2f} "
+          f"{percentil(latencias, 0.99) * 1000:>8.2f} {max(latencias) * 1000:>8.2f}")
+    for fase, dia in (('1 día', '2030-01-02'), ('30 días de una vez', '2030-02-01')):
+        inicio = time.perf_counter()
+        resumen = banco.devengar_intereses(dia)
+        segundos = time.perf_counter() - inicio
+        latencias = trafico.medir()
+        print(f"{fase:<22} {segundos:>9.2f} {resumen['cuentas'] / segundos:>10.0f} "
+              f"{percentil(latencias, 0.5) * 1000:>8.2f} {percentil(latencias, 0.99) * 1000:>8.2f} "
+              f"{max(latencias) * 1000:>8.2f}")
+    trafico.detener()
+
+    # Los intereses salen del banco: el total se conserva
+    correcto = abs(sum(banco._saldos().values()) + banco.saldo_banco - dinero_inicial) < 1e-6 * dinero_inicial
+    print('dinero:', 'OK' if correcto else 'ERROR')
+    banco.cerrar()
+    if not correcto:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Asientos del diario y consultas de saldo a una fecha pasada.
+
+Varios hilos hacen `--operaciones` transferencias entre `--usuarios`
+clientes (cada una es un asiento); se mide asientos por segundo y luego
+la latencia de consultar el saldo de una cuenta en un asiento al azar
+(p50/p99), que no depende del largo del diario. Al final comprueba que el
+diario cuadra y coincide con los saldos.
+
+    python benchmarks/diario_saldos.py --operaciones 200000
+    python benchmarks/diario_saldos.py --operaciones 50000 --sqlite /tmp/diario.db
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from banco_realista import BancoRealista, ErrorBanco  # noqa: E402
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--usuarios', type=int, default=10000)
+    parser.add_argument('--operaciones', type=int, default=200000)
+    parser.add_argument('--hilos', type=int, default=8)
+    parser.add_argument('--consultas', type=int, default=20000)
+    parser.add_argument('--sqlite', help='ruta de una base nueva para medir con BancoSQLite')
+    args = parser.parse_args()
+
+    if args.sqlite:
+        from banco_sqlite import BancoSQLite
+        banco = BancoSQLite(args.sqlite)
+    else:
+        banco = BancoRealista()
+    usuarios = [f'cliente{i}' for i in range(args.usuarios)]
+    banco.importar_usuarios([{'usuario': u, 'password': 'x', 'password_sha256': None, 'nombre': u,
+                              'email': '', 'saldo': 10000} for u in usuarios])
+
+    def trabajador(indice):
+        azar = random.Random(indice)
+        for _ in range(args.operaciones // args.hilos):
+            origen, destino = azar.sample(usuarios, 2)
+            try:
+                banco.transferir(origen, destino, round(azar.uniform(1, 100), 2))
+            except ErrorBanco:
+                pass
+
+    hilos = [threading.Thread(target=trabajador, args=(i,)) for i in range(args.hilos)]
+    asientos = len(banco.diario)
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    segundos = time.perf_counter() - inicio
+    asientos = len(banco.diario) - asientos
+    print(f'asientos: {asientos} en {segundos:.2f} s ({asientos / segundos:.0f}/s)')
+
+    azar = random.Random(0)
+    total = len(banco.diario)
+    latencias = []
+    for _ in range(args.consultas):
+        usuario, asiento = azar.choice(usuarios), azar.randrange(total)
+        inicio = time.perf_counter()
+        banco.diario.saldo(usuario, asiento=asiento)
+        latencias.append(time.perf_counter() - inicio)
+    print(f'saldo en un asiento pasado ({total} asientos): p50 {percentil(latencias, 0.5) * 1000:.3f} ms, '
+          f'p99 {percentil(latencias, 0.99) * 1000:.3f} ms')
+
+    verificacion = banco.verificar_diario()
+    correcto = not verificacion['diferencias'] and abs(verificacion['descuadre']) < 1e-3
+    print('diario:', 'OK' if correcto else f"ERROR {verificacion['descuadre']} {verificacion['diferencias']}")
+    banco.cerrar()
+    if not correcto:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
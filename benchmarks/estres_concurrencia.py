@@ -0,0 +1,89 @@
+"""Prueba de estrés de las operaciones de saldo con varios hilos.
+
+Crea una población de cuentas y lanza transferencias aleatorias entre ellas
+desde varios hilos. Al final comprueba que el dinero total no cambió y que
+ninguna cuenta quedó en negativo, y reporta operaciones por segundo con
+bloqueos por franjas frente a un único bloqueo global (una sola franja).
+
+    python benchmarks/estres_concurrencia.py --usuarios 1000 --operaciones 20000
+    python benchmarks/estres_concurrencia.py --wal /tmp/chiquibank-estres
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from banco_realista import BancoRealista, ErrorBanco  # noqa: E402
+from bloqueos import BloqueosPorCuenta  # noqa: E402
+from persistencia import AlmacenWAL  # noqa: E402
+
+
+def crear_banco(usuarios, franjas, directorio_wal):
+    almacen = AlmacenWAL(directorio_wal) if directorio_wal else None
+    banco = BancoRealista(almacen=almacen)
+    banco._bloqueos = BloqueosPorCuenta(franjas)
+    for i in range(usuarios):
+        banco.registrar_usuario(f'usuario{i}', 'clave123', f'Usuario {i}', '', 1000)
+    return banco
+
+
+def ejecutar(banco, usuarios, operaciones, hilos):
+    cuentas = [f'usuario{i}' for i in range(usuarios)]
+    por_hilo = operaciones // hilos
+    rechazadas = [0] * hilos
+
+    def trabajador(indice):
+        azar = random.Random(indice)
+        for _ in range(por_hilo):
+            origen, destino = azar.sample(cuentas, 2)
+            try:
+                banco.transferir(origen, destino, azar.uniform(1, 400))
+            except ErrorBanco:
+                rechazadas[indice] += 1
+
+    trabajadores = [threading.Thread(target=trabajador, args=(i,)) for i in range(hilos)]
+    inicio = time.perf_counter()
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    return por_hilo * hilos / (time.perf_counter() - inicio), sum(rechazadas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--usuarios', type=int, default=1000)
+    parser.add_argument('--operaciones', type=int, default=20000)
+    parser.add_argument('--hilos', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--wal', help='directorio para medir con el log en disco activado')
+    args = parser.parse_args()
+
+    print(f"{'bloqueo':<10} {'hilos':>5} {'ops/s':>12} {'rechazadas':>11}  consistencia")
+    for nombre, franjas in (('global', 1), ('franjas', 64)):
+        for hilos in args.hilos:
+            directorio = None
+            if args.wal:
+                directorio = tempfile.mkdtemp(dir=args.wal if os.path.isdir(args.wal) else None)
+            banco = crear_banco(args.usuarios, franjas, directorio)
+            total_inicial = sum(banco.saldo(f'usuario{i}') for i in range(args.usuarios))
+
+            ops, rechazadas = ejecutar(banco, args.usuarios, args.operaciones, hilos)
+
+            saldos = [banco.saldo(f'usuario{i}') for i in range(args.usuarios)]
+            correcto = abs(sum(saldos) - total_inicial) < 1e-6 and min(saldos) >= 0
+            print(f"{nombre:<10} {hilos:>5} {ops:>12.0f} {rechazadas:>11}  {'OK' if correcto else 'ERROR'}")
+            banco.cerrar()
+            if directorio:
+                shutil.rmtree(directorio, ignore_errors=True)
+            if not correcto:
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
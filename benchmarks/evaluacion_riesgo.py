@@ -0,0 +1,85 @@
+"""Latencia de la evaluación de riesgo y de la repuntuación de la cartera.
+
+Llena el libro con `--transacciones` movimientos de `--usuarios` clientes
+(transferencias, apuestas y préstamos), construye los perfiles desde cero y
+luego mide evaluaciones de solicitudes sueltas (p50/p99) mientras siguen
+llegando transacciones, y la repuntuación de toda la cartera con cada
+modelo.
+
+    python benchmarks/evaluacion_riesgo.py --usuarios 20000 --transacciones 500000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from banco_realista import BancoRealista, ErrorBanco  # noqa: E402
+from riesgo import MODELOS  # noqa: E402
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else 0
+
+
+def movimiento(banco, usuarios, azar):
+    origen, destino = azar.sample(usuarios, 2)
+    sorteo = azar.random()
+    try:
+        if sorteo < 0.7:
+            banco.transferir(origen, destino, round(azar.uniform(1, 500), 2))
+        elif sorteo < 0.95:
+            banco.apostar_deportes(origen, azar.randint(1, 3), round(azar.uniform(1, 100), 2), 'local')
+        else:
+            banco.otorgar_prestamo(origen, round(azar.uniform(500, 5000), 2), azar.choice((6, 12, 24)))
+    except ErrorBanco:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--usuarios', type=int, default=20000)
+    parser.add_argument('--transacciones', type=int, default=500000)
+    parser.add_argument('--evaluaciones', type=int, default=20000)
+    args = parser.parse_args()
+
+    azar = random.Random(0)
+    banco = BancoRealista()
+    usuarios = [f'cliente{i}' for i in range(args.usuarios)]
+    banco.importar_usuarios([{'usuario': u, 'password': 'x', 'password_sha256': None, 'nombre': u,
+                              'email': '', 'saldo': azar.uniform(0, 20000)} for u in usuarios])
+    inicio = time.perf_counter()
+    for _ in range(args.transacciones):
+        movimiento(banco, usuarios, azar)
+    print(f'libro: {len(banco.transacciones)} transacciones ({time.perf_counter() - inicio:.1f} s de carga)')
+
+    inicio = time.perf_counter()
+    banco.riesgo.perfiles.actualizar()
+    print(f'perfiles desde cero: {time.perf_counter() - inicio:.2f} s')
+
+    # Entre evaluación y evaluación llegan movimientos nuevos
+    latencias = []
+    for _ in range(args.evaluaciones):
+        movimiento(banco, usuarios, azar)
+        usuario = azar.choice(usuarios)
+        inicio = time.perf_counter()
+        banco.riesgo.evaluar(usuario, azar.uniform(500, 10000), 12)
+        latencias.append(time.perf_counter() - inicio)
+    print(f'evaluación: p50 {percentil(latencias, 0.5) * 1000:.3f} ms, '
+          f'p99 {percentil(latencias, 0.99) * 1000:.3f} ms')
+
+    for nombre, modelo in MODELOS.items():
+        banco.riesgo.modelo = modelo()
+        inicio = time.perf_counter()
+        cartera = banco.riesgo.evaluar_cartera()
+        rechazados = sum(1 for fila in cartera if fila['puntaje'] >= 0.2)
+        print(f'cartera ({nombre}): {len(cartera)} deudores en {time.perf_counter() - inicio:.2f} s, '
+              f'{rechazados} con puntaje >= 0.2')
+    banco.cerrar()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Memoria y latencia del libro de transacciones con el historial archivado.
+
+Llena dos libros con `--filas` transacciones de `--usuarios` clientes: uno
+todo en memoria y otro que archiva en segmentos dejando `--en-memoria`
+filas recientes. Mide el tiempo de archivar, la memoria de cada libro tal
+como queda al recuperarlo de un snapshot (tracemalloc), la latencia p50/p99
+de una página de historial y el ritmo y el pico de memoria al exportar el
+historial completo de un usuario. Comprueba que ambos libros devuelven
+exactamente las mismas filas.
+
+    python benchmarks/historial_archivado.py --filas 1000000 --usuarios 10000
+"""
+import argparse
+import gc
+import os
+import pickle
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from libro_transacciones import LibroTransacciones  # noqa: E402
+
+TIPOS = ('deposito', 'retiro', 'abono', 'cargo', 'compra_acciones', 'transferencia_enviada')
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else 0
+
+
+def generar(cantidad, usuarios, semilla=7):
+    azar = random.Random(semilla)
+    inicio = time.mktime((2023, 1, 1, 0, 0, 0, 0, 0, -1))
+    for i in range(cantidad):
+        tipo = azar.choice(TIPOS)
+        yield {
+            'usuario': f'cliente{azar.randrange(usuarios):06d}',
+            'tipo': tipo,
+            'monto': round(azar.uniform(1, 5000), 2),
+            'fecha': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(inicio + i * 30)),
+            'estado': 'completado',
+            'descripcion': f'{tipo} {i}',
+        }
+
+
+def memoria(snapshot, directorio=None):
+    """Bytes que ocupa un libro recuperado de su snapshot"""
+    gc.collect()
+    tracemalloc.start()
+    libro = LibroTransacciones(directorio)
+    libro.importar(pickle.loads(snapshot))
+    gc.collect()
+    actual, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return libro, actual
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--filas', type=int, default=1000000)
+    parser.add_argument('--usuarios', type=int, default=10000)
+    parser.add_argument('--en-memoria', type=int, default=100000)
+    parser.add_argument('--consultas', type=int, default=2000)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix='historico-')
+    try:
+        completo = LibroTransacciones()
+        completo.extend(generar(args.filas, args.usuarios))
+        libro = LibroTransacciones(directorio)
+        libro.extend(generar(args.filas, args.usuarios))
+        inicio = time.perf_counter()
+        libro.archivar(retener=args.en_memoria, minimo=0)
+        segundos_archivado = time.perf_counter() - inicio
+
+        completo, bytes_completo = memoria(pickle.dumps(completo.exportar()))
+        libro, bytes_archivado = memoria(pickle.dumps(libro.exportar()), directorio)
+        estadisticas = libro.estadisticas()
+        print(f'en memoria: {bytes_completo / 2 ** 20:.1f} MiB ({bytes_completo / args.filas:.0f} B/fila)')
+        print(f'archivado:  {bytes_archivado / 2 ** 20:.1f} MiB en memoria + '
+              f'{estadisticas["bytes_en_disco"] / 2 ** 20:.1f} MiB en disco '
+              f'({estadisticas["bytes_en_disco"] / max(1, estadisticas["archivadas"]):.1f} B/fila archivada), '
+              f'archivar {segundos_archivado:.2f} s')
+
+        azar = random.Random(1)
+        usuarios = [f'cliente{azar.randrange(args.usuarios):06d}' for _ in range(args.consultas)]
+        for nombre, objeto in (('en memoria', completo), ('archivado', libro)):
+            latencias = []
+            for usuario in usuarios:
+                inicio = time.perf_counter()
+                objeto.por_usuario(usuario, limite=100)
+                latencias.append(time.perf_counter() - inicio)
+            print(f'página de 100 ({nombre}): p50 {percentil(latencias, 0.5) * 1e3:.3f} ms, '
+                  f'p99 {percentil(latencias, 0.99) * 1e3:.3f} ms')
+
+        usuario = usuarios[0]
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        exportadas = sum(1 for _ in libro.historial(usuario))
+        segundos = time.perf_counter() - inicio
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'exportar {usuario}: {exportadas} filas en {segundos * 1e3:.1f} ms '
+              f'({exportadas / segundos:.0f} filas/s), pico {pico / 2 ** 10:.0f} KiB')
+
+        iguales = all(completo.por_usuario(u) == libro.por_usuario(u) for u in usuarios[:200])
+        iguales = iguales and list(completo.historial(usuario)) == list(libro.historial(usuario))
+        if not iguales:
+            print('resultados: ERROR')
+            sys.exit(1)
+        print('resultados: OK')
+    finally:
+        shutil.rmtree(directorio)
+
+
+if __name__ == '__main__':
+    main()
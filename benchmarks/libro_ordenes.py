@@ -0,0 +1,158 @@
+"""Rendimiento del libro de órdenes y del casado por lotes.
+
+Deja `--en-reposo` órdenes límite en los libros (compras por debajo y ventas
+por encima del precio de referencia) y luego lanza desde varios hilos una
+mezcla de órdenes límite que cruzan, órdenes de mercado y cancelaciones.
+Reporta órdenes por segundo, la latencia de cada orden vista por el
+cliente (p50/p99) y el tiempo de casado de cada lote, con lotes de hasta
+1000 órdenes frente a lotes de una sola. Al final comprueba que el dinero
+se conserva (saldos + banco + reservas de las compras abiertas).
+
+    python benchmarks/libro_ordenes.py --en-reposo 20000 --ordenes 20000
+    python benchmarks/libro_ordenes.py --wal /tmp/chiquibank-ordenes
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from banco_realista import COMISION_ACCIONES, BancoRealista, ErrorBanco  # noqa: E402
+from persistencia import AlmacenWAL  # noqa: E402
+
+SIMBOLOS = ('TECH', 'ENERGY', 'BANK', 'REALESTATE')
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else 0
+
+
+def crear_banco(usuarios, en_reposo, tamano_lote, directorio_wal):
+    banco = BancoRealista(almacen=AlmacenWAL(directorio_wal) if directorio_wal else None)
+    banco._procesador_ordenes.tamano_maximo = tamano_lote
+    cuentas = [f'usuario{i}' for i in range(usuarios)]
+    for usuario in cuentas:
+        banco.registrar_usuario(usuario, 'clave123', usuario, '', 10000000)
+        for simbolo in SIMBOLOS:
+            banco.enviar_orden(usuario, simbolo, 'compra', 'mercado', 500)
+
+    azar = random.Random(0)
+    mercado = banco.mercado.instantanea()
+    for _ in range(en_reposo):
+        simbolo = azar.choice(SIMBOLOS)
+        referencia = mercado.precio(simbolo)
+        lado = azar.choice(('compra', 'venta'))
+        distancia = azar.uniform(0.01, 0.10) * referencia
+        precio = round(referencia - distancia if lado == 'compra' else referencia + distancia, 2)
+        banco.enviar_orden(azar.choice(cuentas), simbolo, lado, 'limite', azar.randint(1, 5), precio)
+    return banco, cuentas
+
+
+def dinero_total(banco, cuentas):
+    reservado = sum(orden['restante'] * orden['precio'] * (1 + COMISION_ACCIONES)
+                    for usuario in cuentas for orden in banco.ordenes.abiertas_de(usuario)
+                    if orden['lado'] == 'compra')
+    return sum(banco.saldo(u) for u in cuentas) + banco.saldo_banco + reservado
+
+
+def ejecutar(banco, cuentas, ordenes, hilos):
+    por_hilo = ordenes // hilos
+    latencias = [[] for _ in range(hilos)]
+    rechazadas = [0] * hilos
+    mercado = banco.mercado.instantanea()
+
+    def trabajador(indice):
+        azar = random.Random(indice + 1)
+        mias = []
+        for _ in range(por_hilo):
+            usuario = azar.choice(cuentas)
+            simbolo = azar.choice(SIMBOLOS)
+            referencia = mercado.precio(simbolo)
+            lado = azar.choice(('compra', 'venta'))
+            sorteo = azar.random()
+            inicio = time.perf_counter()
+            try:
+                if sorteo < 0.1 and mias:
+                    dueno, orden_id = mias.pop(azar.randrange(len(mias)))
+                    banco.cancelar_orden(dueno, orden_id)
+                elif sorteo < 0.3:
+                    banco.enviar_orden(usuario, simbolo, lado, 'mercado', azar.randint(1, 5))
+                else:
+                    # Límite alrededor de la referencia: parte cruza, parte queda en reposo
+                    desvio = azar.uniform(-0.08, 0.08) * referencia
+                    precio = round(referencia + desvio if lado == 'compra' else referencia - desvio, 2)
+                    orden = banco.enviar_orden(usuario, simbolo, lado, 'limite', azar.randint(1, 10), precio)
+                    if orden['restante']:
+                        mias.append((usuario, orden['orden_id']))
+            except ErrorBanco:
+                rechazadas[indice] += 1
+            latencias[indice].append(time.perf_counter() - inicio)
+
+    tiempos_lote = []
+    procesar = banco._procesador_ordenes.procesar
+
+    def procesar_midiendo(peticiones):
+        inicio = time.perf_counter()
+        resultados = procesar(peticiones)
+        tiempos_lote.append((time.perf_counter() - inicio, len(peticiones)))
+        return resultados
+
+    banco._procesador_ordenes.procesar = procesar_midiendo
+    trabajadores = [threading.Thread(target=trabajador, args=(i,)) for i in range(hilos)]
+    inicio = time.perf_counter()
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    segundos = time.perf_counter() - inicio
+    todas = [l for lista in latencias for l in lista]
+    return {
+        'ordenes_s': len(todas) / segundos,
+        'p50_ms': percentil(todas, 0.50) * 1000,
+        'p99_ms': percentil(todas, 0.99) * 1000,
+        'lote_medio': sum(n for _, n in tiempos_lote) / len(tiempos_lote),
+        'casado_p99_ms': percentil([t for t, _ in tiempos_lote], 0.99) * 1000,
+        'rechazadas': sum(rechazadas),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--usuarios', type=int, default=200)
+    parser.add_argument('--en-reposo', type=int, default=20000)
+    parser.add_argument('--ordenes', type=int, default=20000)
+    parser.add_argument('--hilos', type=int, default=16)
+    parser.add_argument('--wal', help='directorio para medir con el log en disco activado')
+    args = parser.parse_args()
+
+    print(f"{'lote máx':>8} {'en reposo':>10} {'órdenes/s':>10} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'lote medio':>10} {'casado p99 ms':>14} {'rechazadas':>10}  dinero")
+    for tamano_lote in (1, 1000):
+        directorio = None
+        if args.wal:
+            directorio = tempfile.mkdtemp(dir=args.wal if os.path.isdir(args.wal) else None)
+        banco, cuentas = crear_banco(args.usuarios, args.en_reposo, tamano_lote, directorio)
+        en_reposo = len(banco.ordenes)
+        total_inicial = dinero_total(banco, cuentas)
+
+        r = ejecutar(banco, cuentas, args.ordenes, args.hilos)
+
+        correcto = abs(dinero_total(banco, cuentas) - total_inicial) < 1e-3 * len(cuentas)
+        print(f"{tamano_lote:>8} {en_reposo:>10} {r['ordenes_s']:>10.0f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+              f"{r['lote_medio']:>10.1f} {r['casado_p99_ms']:>14.2f} {r['rechazadas']:>10}  "
+              f"{'OK' if correcto else 'ERROR'}")
+        banco.cerrar()
+        if directorio:
+            shutil.rmtree(directorio, ignore_errors=True)
+        if not correcto:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
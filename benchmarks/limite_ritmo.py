@@ -0,0 +1,66 @@
+"""Costo de una comprobación del limitador y de su desalojo LRU.
+
+Varios hilos consultan el limitador con `--usuarios` claves distintas y un
+máximo de `--max-cubos` cubos, de modo que con más usuarios que cubos cada
+consulta nueva desaloja uno. Se mide comprobaciones por segundo y la
+latencia p50/p99, y que la memoria queda acotada.
+
+    python benchmarks/limite_ritmo.py --usuarios 1000000 --max-cubos 100000
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from limites import LIMITES_POR_RUTA, Limitador  # noqa: E402
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--usuarios', type=int, default=1000000)
+    parser.add_argument('--max-cubos', type=int, default=100000)
+    parser.add_argument('--consultas', type=int, default=1000000)
+    parser.add_argument('--hilos', type=int, default=4)
+    args = parser.parse_args()
+
+    limitador = Limitador(max_cubos=args.max_cubos)
+    rutas = list(LIMITES_POR_RUTA)
+    latencias = [[] for _ in range(args.hilos)]
+
+    def trabajador(indice):
+        azar = random.Random(indice)
+        for _ in range(args.consultas // args.hilos):
+            usuario, ruta = azar.randrange(args.usuarios), azar.choice(rutas)
+            inicio = time.perf_counter()
+            limitador.permitir(usuario, ruta)
+            latencias[indice].append(time.perf_counter() - inicio)
+
+    hilos = [threading.Thread(target=trabajador, args=(i,)) for i in range(args.hilos)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    segundos = time.perf_counter() - inicio
+    todas = [l for lista in latencias for l in lista]
+    print(f'comprobaciones: {len(todas)} en {segundos:.2f} s ({len(todas) / segundos:.0f}/s), '
+          f'p50 {percentil(todas, 0.5) * 1e6:.1f} µs, p99 {percentil(todas, 0.99) * 1e6:.1f} µs')
+    estadisticas = limitador.estadisticas()
+    print(estadisticas)
+    if estadisticas['cubos'] > args.max_cubos:
+        print('memoria: ERROR')
+        sys.exit(1)
+    print('memoria: OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Bloqueos por cuenta para servir peticiones en varios hilos"""
+import threading
+from contextlib import contextmanager
+
+
+class BloqueosPorCuenta:
+    """Bloqueos repartidos en franjas según la cuenta.
+
+    Dos operaciones sobre cuentas distintas casi nunca comparten franja y
+    corren en paralelo; dos operaciones sobre la misma cuenta se
+    serializan. Las franjas se toman siempre en orden creciente, así una
+    operación con dos cuentas (una transferencia) no puede entrar en
+    interbloqueo con otra que tome las mismas cuentas al revés.
+    """
+
+    def __init__(self, franjas=64):
+        self._franjas = [threading.RLock() for _ in range(franjas)]
+
+    def _indices(self, cuentas):
+        return sorted({hash(cuenta) % len(self._franjas) for cuenta in cuentas})
+
+    def repartir(self, cuentas, tamano):
+        """Parte `cuentas` en lotes de hasta `tamano` que caen en una sola franja.
+
+        Un proceso por lotes que bloquea un lote así sólo detiene a las
+        operaciones de esa franja; el resto del banco sigue atendiendo.
+        """
+        por_franja = {}
+        for cuenta in cuentas:
+            por_franja.setdefault(hash(cuenta) % len(self._franjas), []).append(cuenta)
+        for _, grupo in sorted(por_franja.items()):
+            for inicio in range(0, len(grupo), tamano):
+                yield grupo[inicio:inicio + tamano]
+
+    @contextmanager
+    def bloquear(self, *cuentas):
+        franjas = [self._franjas[i] for i in self._indices(cuentas)]
+        for franja in franjas:
+            franja.acquire()
+        try:
+            yield
+        finally:
+            for franja in reversed(franjas):
+                franja.release()
+
+    @contextmanager
+    def bloquear_todo(self):
+        """Detiene todas las operaciones (snapshots, procesos por lotes)"""
+        for franja in self._franjas:
+            franja.acquire()
+        try:
+            yield
+        finally:
+            for franja in reversed(self._franjas):
+                franja.release()
@@ -0,0 +1,65 @@
+"""Caché de páginas renderizadas por usuario y versión del estado.
+
+Cada entrada guarda el HTML de una página junto con la versión de los
+datos con que se armó: la versión de las cuentas del usuario (ver
+`BancoRealista.version_usuario`), la secuencia del mercado o los propios
+valores que muestra la página. Si al volver a pedirla la versión es la
+misma se devuelve el HTML guardado, sin recalcular ni renderizar; si
+cambió, la entrada ya no sirve y se reemplaza. No hace falta invalidar
+nada explícitamente.
+
+Las entradas viven en un OrderedDict por orden de uso; pasado
+`max_entradas` se desaloja la que lleva más tiempo sin pedirse, igual que
+los cubos del limitador.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+MAX_ENTRADAS = 20000
+
+
+class Pagina:
+    __slots__ = ('version', 'html', 'etag')
+
+    def __init__(self, version, html):
+        self.version = version
+        self.html = html
+        self.etag = hashlib.sha1(html.encode()).hexdigest()
+
+
+class CachePaginas:
+    """HTML por clave (página, usuario), válido mientras no cambie su versión"""
+
+    def __init__(self, max_entradas=MAX_ENTRADAS):
+        self.max_entradas = max_entradas
+        self._paginas = OrderedDict()
+        self._bloqueo = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+    def obtener(self, clave, version):
+        """La página guardada si se armó con `version`, o None"""
+        with self._bloqueo:
+            pagina = self._paginas.get(clave)
+            if pagina is None or pagina.version != version:
+                self.fallos += 1
+                return None
+            self._paginas.move_to_end(clave)
+            self.aciertos += 1
+            return pagina
+
+    def guardar(self, clave, version, html):
+        pagina = Pagina(version, html)
+        with self._bloqueo:
+            self._paginas[clave] = pagina
+            self._paginas.move_to_end(clave)
+            if len(self._paginas) > self.max_entradas:
+                self._paginas.popitem(last=False)
+                self.desalojos += 1
+        return pagina
+
+    def estadisticas(self):
+        return {'paginas': len(self._paginas), 'max_entradas': self.max_entradas, 'aciertos': self.aciertos,
+                'fallos': self.fallos, 'desalojos': self.desalojos}
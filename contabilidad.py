@@ -0,0 +1,185 @@
+"""Contabilidad de portafolios: lotes, costo y ganancias.
+
+Cada compra abre un lote (cantidad y costo unitario con comisión) y cada
+venta consume lotes por FIFO o al costo promedio, acumulando la ganancia
+realizada. El valor y la ganancia no realizada de todos los usuarios se
+calculan de una pasada por cada instantánea del mercado; entre ticks sólo
+se recalculan los usuarios que operaron.
+"""
+from collections import deque
+
+METODOS = ('fifo', 'promedio')
+
+VALORACION_VACIA = {'valor': 0, 'costo': 0, 'no_realizado': 0}
+
+
+class Posicion:
+    """Acciones de un usuario en un símbolo con su costo y lo ya realizado"""
+
+    __slots__ = ('cantidad', 'costo', 'realizado', 'lotes')
+
+    def __init__(self, cantidad=0, costo=0, realizado=0, lotes=()):
+        self.cantidad = cantidad
+        self.costo = costo
+        self.realizado = realizado
+        self.lotes = deque(list(lote) for lote in lotes)
+
+    def costo_medio(self):
+        return self.costo / self.cantidad if self.cantidad else 0
+
+    def como_dict(self):
+        return {'cantidad': self.cantidad, 'costo': self.costo,
+                'realizado': self.realizado, 'lotes': [list(lote) for lote in self.lotes]}
+
+
+class Contabilidad:
+    """Posiciones por usuario y símbolo, en memoria.
+
+    ContabilidadSQLite (banco_sqlite.py) guarda las mismas posiciones en la
+    base reimplementando sólo `_leer`, `_guardar`, `posiciones_de` y
+    `_todas`.
+    """
+
+    def __init__(self, metodo='fifo'):
+        if metodo not in METODOS:
+            raise ValueError(f'Método de costo desconocido: {metodo}')
+        self.metodo = metodo
+        self._posiciones = {}
+        self._valoracion = (None, {})
+        self._sucios = set()
+
+    # ----------------------
+    # Almacenamiento
+    # ----------------------
+
+    def _leer(self, usuario, simbolo):
+        return self._posiciones.get(usuario, {}).get(simbolo)
+
+    def _guardar(self, usuario, simbolo, posicion):
+        self._posiciones.setdefault(usuario, {})[simbolo] = posicion
+
+    def posiciones_de(self, usuario):
+        return dict(self._posiciones.get(usuario, {}))
+
+    def _todas(self):
+        """(usuario, simbolo, posicion) de cada posición con acciones"""
+        # Copias: el hilo de órdenes puede abrir posiciones mientras tanto
+        for usuario, posiciones in list(self._posiciones.items()):
+            for simbolo, posicion in list(posiciones.items()):
+                if posicion.cantidad:
+                    yield usuario, simbolo, posicion
+
+    def exportar(self):
+        return {'metodo': self.metodo,
+                'posiciones': {usuario: {simbolo: posicion.como_dict() for simbolo, posicion in posiciones.items()}
+                               for usuario, posiciones in self._posiciones.items()}}
+
+    def importar(self, estado):
+        self.__init__(estado['metodo'])
+        for usuario, posiciones in estado['posiciones'].items():
+            for simbolo, datos in posiciones.items():
+                self._guardar(usuario, simbolo, Posicion(**datos))
+
+    # ----------------------
+    # Operaciones
+    # ----------------------
+
+    def comprar(self, usuario, simbolo, cantidad, costo_unitario):
+        posicion = self._leer(usuario, simbolo) or Posicion()
+        posicion.cantidad += cantidad
+        posicion.costo += cantidad * costo_unitario
+        if self.metodo == 'fifo':
+            posicion.lotes.append([cantidad, costo_unitario])
+        self._guardar(usuario, simbolo, posicion)
+        self._sucios.add(usuario)
+
+    def vender(self, usuario, simbolo, cantidad, ingreso_unitario):
+        """Da de baja `cantidad` acciones y devuelve la ganancia realizada"""
+        posicion = self._leer(usuario, simbolo) or Posicion()
+        # Acciones sin lote conocido (anteriores a la contabilidad) cuestan 0
+        vendidas = min(cantidad, posicion.cantidad)
+        if self.metodo == 'fifo':
+            costo = 0
+            pendiente = vendidas
+            while pendiente:
+                lote = posicion.lotes[0]
+                usadas = min(pendiente, lote[0])
+                costo += usadas * lote[1]
+                lote[0] -= usadas
+                pendiente -= usadas
+                if not lote[0]:
+                    posicion.lotes.popleft()
+        else:
+            costo = vendidas * posicion.costo_medio()
+        ganancia = cantidad * ingreso_unitario - costo
+        posicion.cantidad -= vendidas
+        posicion.costo = posicion.costo - costo if posicion.cantidad else 0
+        posicion.realizado += ganancia
+        self._guardar(usuario, simbolo, posicion)
+        self._sucios.add(usuario)
+        return ganancia
+
+    def inicializar(self, portafolios, mercado):
+        """Abre posiciones para acciones que no tienen lotes, al precio actual.
+
+        Sirve para estados anteriores a la contabilidad: esas acciones
+        empiezan con ganancia cero en lugar de un costo inventado.
+        """
+        for usuario, portafolio in portafolios.items():
+            for simbolo, cantidad in portafolio.items():
+                if cantidad > 0 and self._leer(usuario, simbolo) is None and simbolo in mercado:
+                    self.comprar(usuario, simbolo, cantidad, mercado.precio(simbolo))
+
+    # ----------------------
+    # Valoración
+    # ----------------------
+
+    def valorar(self, mercado):
+        """Valora a todos los usuarios con una instantánea del mercado, de una pasada"""
+        # Lo que opere durante la pasada queda marcado en el conjunto nuevo
+        self._sucios = set()
+        valores = {}
+        for usuario, simbolo, posicion in self._todas():
+            if simbolo not in mercado:
+                continue
+            acumulado = valores.get(usuario)
+            if acumulado is None:
+                acumulado = valores[usuario] = {'valor': 0, 'costo': 0}
+            acumulado['valor'] += posicion.cantidad * mercado.precio(simbolo)
+            acumulado['costo'] += posicion.costo
+        for acumulado in valores.values():
+            acumulado['no_realizado'] = acumulado['valor'] - acumulado['costo']
+        self._valoracion = (mercado.secuencia, valores)
+        return valores
+
+    def valoracion(self, usuario, mercado):
+        """Valor, costo y ganancia no realizada del portafolio de `usuario`.
+
+        Sale de la última pasada de `valorar` si es de esta misma instantánea
+        y el usuario no operó desde entonces; si no, se calcula sólo para él.
+        """
+        secuencia, valores = self._valoracion
+        if secuencia == mercado.secuencia and usuario not in self._sucios:
+            return valores.get(usuario, VALORACION_VACIA)
+        return self.resumen(usuario, mercado)['total']
+
+    def resumen(self, usuario, mercado):
+        """Detalle por símbolo (cantidad, costo medio, valor, ganancias) y totales"""
+        simbolos = {}
+        total = {'valor': 0, 'costo': 0, 'no_realizado': 0, 'realizado': 0}
+        for simbolo, posicion in sorted(self.posiciones_de(usuario).items()):
+            total['realizado'] += posicion.realizado
+            if not posicion.cantidad or simbolo not in mercado:
+                continue
+            valor = posicion.cantidad * mercado.precio(simbolo)
+            simbolos[simbolo] = {
+                'cantidad': posicion.cantidad,
+                'costo_medio': posicion.costo_medio(),
+                'valor': valor,
+                'no_realizado': valor - posicion.costo,
+                'realizado': posicion.realizado,
+            }
+            total['valor'] += valor
+            total['costo'] += posicion.costo
+        total['no_realizado'] = total['valor'] - total['costo']
+        return {'simbolos': simbolos, 'total': total}
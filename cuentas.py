@@ -0,0 +1,95 @@
+"""Asignación de números de cuenta ChiquiBank"""
+import random
+import threading
+
+PREFIJO = 'CHQ'
+DIGITOS = 7  # dígitos del cuerpo, sin contar el verificador
+TAMANO_BLOQUE = 10000
+
+
+def digito_verificador(cuerpo):
+    """Dígito de Luhn para una cadena de dígitos"""
+    total = 0
+    for i, caracter in enumerate(reversed(cuerpo)):
+        d = int(caracter)
+        if i % 2 == 0:
+            d *= 2
+            if d > 9:
+                d -= 9
+        total += d
+    return str((10 - total % 10) % 10)
+
+
+def es_valido(numero):
+    """Comprueba formato y dígito verificador de un número de cuenta.
+
+    Las cuentas antiguas (CHQ + 7 dígitos) no tienen verificador y se
+    aceptan tal cual.
+    """
+    if not numero or not numero.startswith(PREFIJO):
+        return False
+    digitos = numero[len(PREFIJO):]
+    if not digitos.isdigit():
+        return False
+    if len(digitos) == DIGITOS:
+        return True
+    return len(digitos) == DIGITOS + 1 and digito_verificador(digitos[:-1]) == digitos[-1]
+
+
+class AsignadorCuentas:
+    """Emite números de cuenta únicos en O(1) y resuelve número -> usuario.
+
+    El espacio de 10^7 cuerpos se divide en bloques de TAMANO_BLOQUE que se
+    reservan en orden aleatorio; dentro del bloque activo los números salen
+    consecutivos, así que emitir uno nunca depende de cuántos existen ya.
+    Cada número lleva un dígito verificador de Luhn.
+    """
+
+    def __init__(self):
+        self._usuario_de = {}
+        self._emitidos = set()
+        self._bloques = list(range(10 ** DIGITOS // TAMANO_BLOQUE))
+        random.shuffle(self._bloques)
+        self._siguiente = 0
+        self._fin_bloque = 0
+        self._bloqueo = threading.Lock()
+
+    def __len__(self):
+        return len(self._usuario_de)
+
+    def _reservar_bloque(self):
+        if not self._bloques:
+            raise RuntimeError('No quedan números de cuenta disponibles')
+        bloque = self._bloques.pop()
+        self._siguiente = bloque * TAMANO_BLOQUE
+        self._fin_bloque = self._siguiente + TAMANO_BLOQUE
+
+    def _emitir(self):
+        while True:
+            if self._siguiente >= self._fin_bloque:
+                self._reservar_bloque()
+            cuerpo = str(self._siguiente).zfill(DIGITOS)
+            self._siguiente += 1
+            numero = PREFIJO + cuerpo + digito_verificador(cuerpo)
+            if numero not in self._emitidos:
+                self._emitidos.add(numero)
+                return numero
+
+    def asignar(self):
+        """Emite un número de cuenta nuevo"""
+        with self._bloqueo:
+            return self._emitir()
+
+    def reservar(self, cantidad):
+        """Emite `cantidad` números de una vez (altas masivas)"""
+        with self._bloqueo:
+            return [self._emitir() for _ in range(cantidad)]
+
+    def registrar(self, numero, usuario):
+        """Asocia un número (nuevo o recuperado del log) a su usuario"""
+        with self._bloqueo:
+            self._emitidos.add(numero)
+            self._usuario_de[numero] = usuario
+
+    def usuario_de(self, numero):
+        return self._usuario_de.get(numero)
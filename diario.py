@@ -0,0 +1,191 @@
+"""Diario de partida doble del banco.
+
+Todo movimiento de dinero es un asiento: una lista de movimientos
+(cuenta, monto) que suma cero. Las cuentas de clientes son sus nombres de
+usuario; las del banco empiezan por '@':
+
+    @banco      fondos propios del banco (`saldo_banco`)
+    @externo    el mundo exterior: depósitos, retiros, abonos, cargos y
+                saldos de apertura entran y salen por aquí
+    @reservas   dinero reservado por órdenes de compra límite en reposo
+    @impuestos  impuesto retenido en los depósitos
+
+Como cada asiento suma cero, la suma de todas las cuentas es siempre cero.
+Los asientos no se modifican nunca: una corrección es otro asiento.
+
+Los movimientos se guardan en arrays (cuenta, monto) y cada cuenta lleva,
+por cada movimiento, el número de asiento y el saldo que quedó, así el
+saldo de una cuenta en un asiento o una fecha pasados sale de una búsqueda
+binaria en lugar de reproducir el diario.
+"""
+import math
+import threading
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+
+BANCO = '@banco'
+EXTERNO = '@externo'
+RESERVAS = '@reservas'
+IMPUESTOS = '@impuestos'
+
+# Descuadre tolerado por redondeo, relativo al volumen del asiento
+TOLERANCIA = 1e-9
+
+
+def es_cuenta_cliente(cuenta):
+    return not cuenta.startswith('@')
+
+
+def validar_asiento(movimientos, concepto):
+    """Lanza ValueError si un monto no es finito o el asiento no suma cero.
+
+    NaN no es mayor que ninguna tolerancia: sin mirar cada monto, un
+    asiento con NaN pasaría por cuadrado.
+    """
+    for cuenta, monto in movimientos:
+        if not math.isfinite(monto):
+            raise ValueError(f'Monto no finito para {cuenta}: {concepto}')
+    suma = sum(monto for _, monto in movimientos)
+    if abs(suma) > TOLERANCIA * max(1.0, sum(abs(monto) for _, monto in movimientos)):
+        raise ValueError(f'Asiento descuadrado en {suma:.6f}: {concepto}')
+
+
+def fecha_de_corte(fecha):
+    """Fecha 'AAAA-MM-DD HH:MM:SS' hasta la que cuenta un saldo.
+
+    Las fechas de los asientos se comparan como texto, así que un día solo
+    ('AAAA-MM-DD') quedaría antes de todos sus asientos: se lleva al final
+    del día. Cualquier otra forma lanza ValueError.
+    """
+    if len(fecha) == 10:
+        fecha += ' 23:59:59'
+    if len(fecha) != 19:
+        raise ValueError(f'Fecha inválida: {fecha}')
+    datetime.strptime(fecha, '%Y-%m-%d %H:%M:%S')
+    return fecha
+
+
+class HistorialCuenta:
+    """Saldo de una cuenta después de cada uno de sus movimientos"""
+
+    __slots__ = ('asientos', 'saldos')
+
+    def __init__(self):
+        self.asientos = array('q')
+        self.saldos = array('d')
+
+    def saldo(self):
+        return self.saldos[-1] if self.saldos else 0.0
+
+    def saldo_en(self, asiento):
+        """Saldo al terminar el asiento `asiento`"""
+        i = bisect_right(self.asientos, asiento)
+        return self.saldos[i - 1] if i else 0.0
+
+
+class Diario:
+    """Asientos inmutables en memoria.
+
+    DiarioSQLite (banco_sqlite.py) guarda lo mismo en tablas con el mismo
+    contrato.
+    """
+
+    def __init__(self):
+        self._nombres = []
+        self._ids = {}
+        self._historiales = []
+        # Los movimientos del asiento a son _cuentas/_montos[_inicio[a]:_inicio[a + 1]]
+        self._inicio = array('q', [0])
+        self._cuentas = array('q')
+        self._montos = array('d')
+        self._fechas = []
+        self._conceptos = []
+        self._bloqueo = threading.Lock()
+
+    def __len__(self):
+        return len(self._fechas)
+
+    def _id_cuenta(self, cuenta):
+        cuenta_id = self._ids.get(cuenta)
+        if cuenta_id is None:
+            cuenta_id = self._ids[cuenta] = len(self._nombres)
+            self._nombres.append(cuenta)
+            self._historiales.append(HistorialCuenta())
+        return cuenta_id
+
+    def asentar(self, movimientos, concepto, fecha):
+        """Registra un asiento y devuelve su número.
+
+        Lanza ValueError si los movimientos no suman cero o alguno no es
+        finito. Las fechas de los asientos nunca retroceden: una operación
+        que llega con una fecha anterior a la del último asiento queda con
+        la del último.
+        """
+        validar_asiento(movimientos, concepto)
+        with self._bloqueo:
+            asiento = len(self._fechas)
+            if self._fechas and fecha < self._fechas[-1]:
+                fecha = self._fechas[-1]
+            for cuenta, monto in movimientos:
+                if not monto:
+                    continue
+                cuenta_id = self._id_cuenta(cuenta)
+                self._cuentas.append(cuenta_id)
+                self._montos.append(monto)
+                historial = self._historiales[cuenta_id]
+                historial.asientos.append(asiento)
+                historial.saldos.append(historial.saldo() + monto)
+            self._inicio.append(len(self._cuentas))
+            self._fechas.append(fecha)
+            self._conceptos.append(concepto)
+            return asiento
+
+    # ----------------------
+    # Consultas
+    # ----------------------
+
+    def saldo(self, cuenta, asiento=None, fecha=None):
+        """Saldo actual de `cuenta`, o al terminar un asiento o una fecha.
+
+        `fecha` es un día o una fecha con hora (ver `fecha_de_corte`).
+        """
+        if fecha is not None:
+            fecha = fecha_de_corte(fecha)
+        cuenta_id = self._ids.get(cuenta)
+        if cuenta_id is None:
+            return 0.0
+        historial = self._historiales[cuenta_id]
+        if fecha is not None:
+            asiento = bisect_right(self._fechas, fecha) - 1
+        if asiento is None:
+            return historial.saldo()
+        return historial.saldo_en(asiento)
+
+    def saldos(self):
+        """Saldo actual de cada cuenta"""
+        return {nombre: historial.saldo() for nombre, historial in zip(self._nombres, self._historiales)}
+
+    def descuadre(self):
+        """Suma de todas las cuentas; cero salvo redondeo"""
+        return sum(historial.saldo() for historial in self._historiales)
+
+    def asiento(self, asiento):
+        inicio, fin = self._inicio[asiento], self._inicio[asiento + 1]
+        return {'id': asiento, 'fecha': self._fechas[asiento], 'concepto': self._conceptos[asiento],
+                'movimientos': [(self._nombres[self._cuentas[i]], self._montos[i]) for i in range(inicio, fin)]}
+
+    # ----------------------
+    # Snapshots
+    # ----------------------
+
+    def exportar(self):
+        return {'cuentas': [self._nombres[i] for i in self._cuentas], 'montos': list(self._montos),
+                'inicio': list(self._inicio), 'fechas': list(self._fechas), 'conceptos': list(self._conceptos)}
+
+    def importar(self, estado):
+        self.__init__()
+        cuentas, montos, inicio = estado['cuentas'], estado['montos'], estado['inicio']
+        for asiento, (fecha, concepto) in enumerate(zip(estado['fechas'], estado['conceptos'])):
+            self.asentar(list(zip(cuentas[inicio[asiento]:inicio[asiento + 1]],
+                                  montos[inicio[asiento]:inicio[asiento + 1]])), concepto, fecha)
@@ -0,0 +1,50 @@
+"""Configuración de gunicorn para servir ChiquiBank en producción.
+
+WEB_CONCURRENCY fija los workers (procesos) y CHIQUIBANK_HILOS los hilos de
+cada uno. Cada worker arma su propio banco al arrancar, así que con más de
+un worker el estado tiene que vivir en SQLite (CHIQUIBANK_BACKEND=sqlite),
+que todos comparten; con el banco en memoria cada proceso tendría el suyo.
+El worker que mueve el mercado es también el único que corre el cierre de
+mes, los intereses y el archivado. No arranca sin CHIQUIBANK_DATOS (o
+CHIQUIBANK_SQLITE): en producción el estado tiene que ir a disco.
+"""
+import os
+import sys
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+threads = int(os.environ.get('CHIQUIBANK_HILOS', 8))
+worker_class = 'gthread'
+
+# El stream del mercado mantiene conexiones abiertas (a lo sumo la mitad de
+# los hilos, ver CHIQUIBANK_MAX_STREAMS)
+timeout = 120
+keepalive = 5
+
+# Al recibir SIGTERM cada worker termina sus peticiones y cierra el banco
+graceful_timeout = 30
+
+# Sin preload: el banco arranca hilos y abre archivos, que no sobreviven
+# al fork; cada worker lo crea después
+preload_app = False
+
+accesslog = '-'
+
+
+def on_starting(server):
+    sqlite = os.environ.get('CHIQUIBANK_BACKEND') == 'sqlite'
+    if server.cfg.workers > 1 and not sqlite:
+        raise SystemExit('Con más de un worker el banco tiene que estar en SQLite: '
+                         'define CHIQUIBANK_BACKEND=sqlite (y CHIQUIBANK_SQLITE) o usa WEB_CONCURRENCY=1')
+    # Sin ruta explícita el banco vive en memoria o junto al código, y un
+    # reinicio o un deploy borra todas las cuentas
+    if not os.environ.get('CHIQUIBANK_SQLITE' if sqlite else 'CHIQUIBANK_DATOS'):
+        raise SystemExit('El banco no sobreviviría a un reinicio: define CHIQUIBANK_DATOS '
+                         '(o CHIQUIBANK_SQLITE con CHIQUIBANK_BACKEND=sqlite) en un disco persistente')
+
+
+def worker_exit(server, worker):
+    # Vacía el log y guarda el snapshot final (o cierra las conexiones SQLite)
+    app = sys.modules.get('app')
+    if app is not None:
+        app.banco.cerrar()
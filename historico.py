@@ -0,0 +1,424 @@
+"""Segmentos columnares comprimidos para el historial frío de transacciones.
+
+Un segmento guarda un lote inmutable de transacciones ordenadas por
+(usuario, id), en bloques de `FILAS_POR_BLOQUE` filas. Dentro de cada
+bloque cada columna va aparte y comprimida con zlib: ids y fechas (segundos
+desde la época) como enteros de 64 bits, montos como double, tipo y estado
+como códigos de un diccionario del segmento, y descripción y campos sueltos
+como cadenas. Una fila ocupa así unas decenas de bytes en disco en lugar de
+un dict de cientos de bytes en memoria.
+
+El directorio de usuarios (nombre y primera fila de cada uno) va sin
+comprimir y se busca por bisección directamente sobre el mmap: abrir un
+segmento sólo lee su pie, y leer el historial de un usuario descomprime
+únicamente los bloques donde están sus filas, de a uno.
+
+    [bloques][directorio de usuarios][pie JSON zlib][largo del pie][MAGIA]
+"""
+import calendar
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from array import array
+from itertools import accumulate
+
+MAGIA = b'CHQSEG01'
+FILAS_POR_BLOQUE = 1024
+
+# Centinelas de las columnas fijas: el valor real va en la columna 'extra'
+SIN_FECHA = -2 ** 63
+SIN_CODIGO = 0xFFFF
+MONTO_FLOAT, MONTO_ENTERO, MONTO_EXTRA = 0, 1, 2
+
+CAMPOS_FIJOS = frozenset(('id', 'usuario', 'tipo', 'estado', 'fecha', 'monto', 'descripcion'))
+
+# Segundos al inicio de cada día ya visto: las fechas de un lote se repiten
+_dias = {}
+
+
+def _dia(texto):
+    valor = _dias.get(texto)
+    if valor is None:
+        try:
+            valor = calendar.timegm((int(texto[0:4]), int(texto[5:7]), int(texto[8:10]), 0, 0, 0))
+        except ValueError:
+            return None
+        if texto_fecha(valor)[:10] != texto:
+            return None
+        if len(_dias) > 100000:
+            _dias.clear()
+        _dias[texto] = valor
+    return valor
+
+
+def segundos(fecha):
+    """'AAAA-MM-DD HH:MM:SS' a segundos desde la época, o None si no tiene esa forma"""
+    if not isinstance(fecha, str) or len(fecha) != 19 or fecha[10] != ' ' or fecha[13] != ':' or fecha[16] != ':':
+        return None
+    dia = _dia(fecha[:10])
+    hora, minuto, segundo = fecha[11:13], fecha[14:16], fecha[17:19]
+    # Sólo se codifica si vuelve exactamente al mismo texto
+    if dia is None or not (hora.isdigit() and minuto.isdigit() and segundo.isdigit()):
+        return None
+    if hora >= '24' or minuto >= '60' or segundo >= '60':
+        return None
+    return dia + int(hora) * 3600 + int(minuto) * 60 + int(segundo)
+
+
+def texto_fecha(valor):
+    return '%04d-%02d-%02d %02d:%02d:%02d' % time.gmtime(valor)[:6]
+
+
+def _cadenas(valores):
+    codificadas = [valor.encode() for valor in valores]
+    return array('I', map(len, codificadas)).tobytes() + b''.join(codificadas)
+
+
+class _Cadenas:
+    """Columna de cadenas descomprimida; cada una se decodifica al pedirla"""
+
+    __slots__ = ('datos', 'desplazamientos')
+
+    def __init__(self, datos, cantidad):
+        self.datos = datos
+        self.desplazamientos = array('I', accumulate(array('I', datos[:4 * cantidad]), initial=4 * cantidad))
+
+    def __getitem__(self, j):
+        return self.datos[self.desplazamientos[j]:self.desplazamientos[j + 1]].decode()
+
+
+def _codigo(diccionario, valor):
+    if not isinstance(valor, str):
+        return SIN_CODIGO
+    codigo = diccionario.get(valor)
+    if codigo is None:
+        codigo = diccionario[valor] = len(diccionario)
+    return codigo
+
+
+def _codificar_bloque(filas, tipos, estados):
+    ids, fechas, montos, clases = array('q'), array('q'), array('d'), array('b')
+    codigos_tipo, codigos_estado = array('H'), array('H')
+    descripciones, extras = [], []
+    for fila in filas:
+        extra = {} if fila.keys() <= CAMPOS_FIJOS else {
+            clave: valor for clave, valor in fila.items() if clave not in CAMPOS_FIJOS}
+        ids.append(fila['id'])
+
+        fecha = segundos(fila.get('fecha'))
+        if fecha is None:
+            fechas.append(SIN_FECHA)
+            if 'fecha' in fila:
+                extra['fecha'] = fila['fecha']
+        else:
+            fechas.append(fecha)
+
+        monto = fila.get('monto')
+        if type(monto) is float:
+            montos.append(monto)
+            clases.append(MONTO_FLOAT)
+        elif type(monto) is int and abs(monto) < 2 ** 53:
+            montos.append(monto)
+            clases.append(MONTO_ENTERO)
+        else:
+            montos.append(0.0)
+            clases.append(MONTO_EXTRA)
+            if 'monto' in fila:
+                extra['monto'] = monto
+
+        for campo, diccionario, codigos in (('tipo', tipos, codigos_tipo), ('estado', estados, codigos_estado)):
+            codigo = _codigo(diccionario, fila.get(campo))
+            codigos.append(codigo)
+            if codigo == SIN_CODIGO and campo in fila:
+                extra[campo] = fila[campo]
+
+        descripcion = fila.get('descripcion')
+        if isinstance(descripcion, str):
+            descripciones.append(descripcion)
+        else:
+            descripciones.append('')
+            extra['descripcion'] = descripcion
+        extras.append(json.dumps(extra, ensure_ascii=False) if extra else '')
+
+    columnas = {
+        'id': ids.tobytes(),
+        'fecha': fechas.tobytes(),
+        'monto': montos.tobytes(),
+        'clase_monto': clases.tobytes(),
+        'tipo': codigos_tipo.tobytes(),
+        'estado': codigos_estado.tobytes(),
+        'descripcion': _cadenas(descripciones),
+        'extra': _cadenas(extras),
+    }
+    validas = [fecha for fecha in fechas if fecha != SIN_FECHA]
+    resumen = {
+        'filas': len(filas),
+        'id_min': min(ids), 'id_max': max(ids),
+        # Sin fechas codificables el bloque no puede descartarse por rango
+        'fecha_min': min(validas) if len(validas) == len(fechas) else None,
+        'fecha_max': max(validas) if len(validas) == len(fechas) else None,
+    }
+    return columnas, resumen
+
+
+def escribir_segmento(ruta, filas):
+    """Escribe `filas` (dicts con 'id' y 'usuario') como un segmento en `ruta`.
+
+    Se escribe a un temporal que se renombra al terminar, así nunca queda
+    un segmento a medias con el nombre definitivo.
+    """
+    filas = sorted(filas, key=lambda fila: (fila['usuario'], fila['id']))
+    tipos, estados, bloques = {}, {}, []
+    temporal = ruta + '.tmp'
+    with open(temporal, 'wb') as f:
+        for inicio in range(0, len(filas), FILAS_POR_BLOQUE):
+            columnas, resumen = _codificar_bloque(filas[inicio:inicio + FILAS_POR_BLOQUE], tipos, estados)
+            resumen['columnas'] = {}
+            for nombre, datos in columnas.items():
+                comprimido = zlib.compress(datos, 6)
+                resumen['columnas'][nombre] = (f.tell(), len(comprimido))
+                f.write(comprimido)
+            bloques.append(resumen)
+
+        # Directorio de usuarios: nombres, sus desplazamientos y su primera fila
+        nombres, inicios = [], array('Q')
+        for posicion, fila in enumerate(filas):
+            if not nombres or nombres[-1] != fila['usuario']:
+                nombres.append(fila['usuario'])
+                inicios.append(posicion)
+        inicios.append(len(filas))
+        codificados = [nombre.encode() for nombre in nombres]
+        desplazamientos = array('Q', [0])
+        for nombre in codificados:
+            desplazamientos.append(desplazamientos[-1] + len(nombre))
+        directorio = {'cantidad': len(nombres)}
+        for clave, datos in (('inicios', inicios.tobytes()), ('desplazamientos', desplazamientos.tobytes()),
+                             ('nombres', b''.join(codificados))):
+            f.write(b'\0' * (-f.tell() % 8))
+            directorio[clave] = f.tell()
+            f.write(datos)
+
+        pie = zlib.compress(json.dumps({
+            'filas': len(filas),
+            'id_min': min((fila['id'] for fila in filas), default=0),
+            'id_max': max((fila['id'] for fila in filas), default=-1),
+            'tipos': list(tipos),
+            'estados': list(estados),
+            'bloques': bloques,
+            'usuarios': directorio,
+        }).encode())
+        f.write(pie)
+        f.write(struct.pack('<Q', len(pie)))
+        f.write(MAGIA)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+
+
+class Segmento:
+    """Segmento abierto para lectura a través de mmap.
+
+    Es inmutable, así que lo pueden leer varios hilos sin bloqueos.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.nombre = os.path.basename(ruta)
+        with open(ruta, 'rb') as f:
+            self._mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        fin = len(self._mapa)
+        if fin < 16 or self._mapa[fin - 8:] != MAGIA:
+            raise ValueError(f'{ruta}: no es un segmento de historial')
+        largo, = struct.unpack_from('<Q', self._mapa, fin - 16)
+        pie = json.loads(zlib.decompress(self._mapa[fin - 16 - largo:fin - 16]))
+        self.filas = pie['filas']
+        self.id_min = pie['id_min']
+        self.id_max = pie['id_max']
+        self.tipos = pie['tipos']
+        self.estados = pie['estados']
+        self._bloques = pie['bloques']
+        usuarios = pie['usuarios']
+        self._cantidad_usuarios = usuarios['cantidad']
+        self._vista = memoryview(self._mapa)
+        largo = 8 * (self._cantidad_usuarios + 1)
+        self._inicios = self._vista[usuarios['inicios']:usuarios['inicios'] + largo].cast('Q')
+        self._desplazamientos = self._vista[usuarios['desplazamientos']:usuarios['desplazamientos'] + largo].cast('Q')
+        self._nombres = usuarios['nombres']
+        self._cache = (None, None)
+
+    def __len__(self):
+        return self.filas
+
+    def cerrar(self):
+        self._inicios.release()
+        self._desplazamientos.release()
+        self._vista.release()
+        self._mapa.close()
+
+    def bytes_en_disco(self):
+        return len(self._mapa)
+
+    # ----------------------
+    # Directorio de usuarios
+    # ----------------------
+
+    def _usuario(self, indice):
+        desde = self._nombres + self._desplazamientos[indice]
+        hasta = self._nombres + self._desplazamientos[indice + 1]
+        return self._mapa[desde:hasta].decode()
+
+    def _rango_usuario(self, usuario):
+        """Posiciones [desde, hasta) de las filas de `usuario`"""
+        bajo, alto = 0, self._cantidad_usuarios
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            if self._usuario(medio) < usuario:
+                bajo = medio + 1
+            else:
+                alto = medio
+        if bajo < self._cantidad_usuarios and self._usuario(bajo) == usuario:
+            return self._inicios[bajo], self._inicios[bajo + 1]
+        return 0, 0
+
+    def contar(self, usuario):
+        desde, hasta = self._rango_usuario(usuario)
+        return hasta - desde
+
+    # ----------------------
+    # Bloques
+    # ----------------------
+
+    def _bloque(self, indice):
+        """Columnas descomprimidas de un bloque (se guarda sólo el último leído)"""
+        cacheado, columnas = self._cache
+        if cacheado == indice:
+            return columnas
+        resumen = self._bloques[indice]
+        crudas = {nombre: zlib.decompress(self._mapa[desde:desde + largo])
+                  for nombre, (desde, largo) in resumen['columnas'].items()}
+        filas = resumen['filas']
+        columnas = {
+            'id': array('q', crudas['id']),
+            'fecha': array('q', crudas['fecha']),
+            'monto': array('d', crudas['monto']),
+            'clase_monto': array('b', crudas['clase_monto']),
+            'tipo': array('H', crudas['tipo']),
+            'estado': array('H', crudas['estado']),
+            'descripcion': _Cadenas(crudas['descripcion'], filas),
+            'extra': _Cadenas(crudas['extra'], filas),
+        }
+        self._cache = (indice, columnas)
+        return columnas
+
+    def _fila(self, columnas, j, usuario):
+        fila = {'id': columnas['id'][j], 'usuario': usuario}
+        tipo, estado = columnas['tipo'][j], columnas['estado'][j]
+        if tipo != SIN_CODIGO:
+            fila['tipo'] = self.tipos[tipo]
+        clase = columnas['clase_monto'][j]
+        if clase == MONTO_FLOAT:
+            fila['monto'] = columnas['monto'][j]
+        elif clase == MONTO_ENTERO:
+            fila['monto'] = int(columnas['monto'][j])
+        fecha = columnas['fecha'][j]
+        if fecha != SIN_FECHA:
+            fila['fecha'] = texto_fecha(fecha)
+        if estado != SIN_CODIGO:
+            fila['estado'] = self.estados[estado]
+        fila['descripcion'] = columnas['descripcion'][j]
+        extra = columnas['extra'][j]
+        if extra:
+            fila.update(json.loads(extra))
+        return fila
+
+    def _usuarios_por_posicion(self, desde, hasta):
+        """(usuario, fin de sus filas) para cada usuario con filas en [desde, hasta)"""
+        bajo, alto = 0, self._cantidad_usuarios
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            if self._inicios[medio + 1] <= desde:
+                bajo = medio + 1
+            else:
+                alto = medio
+        while bajo < self._cantidad_usuarios and self._inicios[bajo] < hasta:
+            yield self._usuario(bajo), self._inicios[bajo + 1]
+            bajo += 1
+
+    # ----------------------
+    # Lectura
+    # ----------------------
+
+    def filas_usuario(self, usuario, reverso=False, desde=None, hasta=None):
+        """Filas de `usuario` por id (creciente, o decreciente con `reverso`).
+
+        `desde` y `hasta` acotan la fecha ('AAAA-MM-DD HH:MM:SS', hasta
+        exclusivo); los bloques fuera del rango ni se descomprimen.
+        """
+        inicio, fin = self._rango_usuario(usuario)
+        if inicio == fin:
+            return
+        minimo, maximo = segundos(desde) if desde else None, segundos(hasta) if hasta else None
+        primero, ultimo = inicio // FILAS_POR_BLOQUE, (fin - 1) // FILAS_POR_BLOQUE
+        indices = range(ultimo, primero - 1, -1) if reverso else range(primero, ultimo + 1)
+        for indice in indices:
+            resumen = self._bloques[indice]
+            if resumen['fecha_min'] is not None and (
+                    (minimo is not None and resumen['fecha_max'] < minimo)
+                    or (maximo is not None and resumen['fecha_min'] >= maximo)):
+                continue
+            columnas = self._bloque(indice)
+            base = indice * FILAS_POR_BLOQUE
+            posiciones = range(max(inicio, base) - base, min(fin, base + resumen['filas']) - base)
+            for j in (reversed(posiciones) if reverso else posiciones):
+                fecha = columnas['fecha'][j]
+                if (desde or hasta) and fecha == SIN_FECHA:
+                    fila = self._fila(columnas, j, usuario)
+                    texto = fila.get('fecha', '')
+                    if (desde and texto < desde) or (hasta and texto >= hasta):
+                        continue
+                    yield fila
+                    continue
+                if (minimo is not None and fecha < minimo) or (maximo is not None and fecha >= maximo):
+                    continue
+                yield self._fila(columnas, j, usuario)
+
+    def filas_bloques(self, tipo=None, estado=None):
+        """Todas las filas en orden de (usuario, id), opcionalmente de un tipo y estado"""
+        codigo_tipo = self.tipos.index(tipo) if tipo in self.tipos else None
+        codigo_estado = self.estados.index(estado) if estado in self.estados else None
+        if (tipo is not None and codigo_tipo is None) or (estado is not None and codigo_estado is None):
+            return
+        for indice, resumen in enumerate(self._bloques):
+            columnas = self._bloque(indice)
+            base = indice * FILAS_POR_BLOQUE
+            j = 0
+            for usuario, fin in self._usuarios_por_posicion(base, base + resumen['filas']):
+                while j < min(fin - base, resumen['filas']):
+                    if ((codigo_tipo is None or columnas['tipo'][j] == codigo_tipo)
+                            and (codigo_estado is None or columnas['estado'][j] == codigo_estado)):
+                        yield self._fila(columnas, j, usuario)
+                    j += 1
+
+    def __iter__(self):
+        """Todas las filas por id; ordena el segmento entero en memoria"""
+        return iter(sorted(self.filas_bloques(), key=lambda fila: fila['id']))
+
+    def fila(self, trans_id):
+        """Búsqueda puntual por id: recorre los bloques cuyo rango de ids la contiene"""
+        if not self.id_min <= trans_id <= self.id_max:
+            return None
+        for indice, resumen in enumerate(self._bloques):
+            if not resumen['id_min'] <= trans_id <= resumen['id_max']:
+                continue
+            columnas = self._bloque(indice)
+            try:
+                j = columnas['id'].index(trans_id)
+            except ValueError:
+                continue
+            base = indice * FILAS_POR_BLOQUE
+            usuario = next(self._usuarios_por_posicion(base + j, base + j + 1))[0]
+            return self._fila(columnas, j, usuario)
+        return None
@@ -0,0 +1,170 @@
+"""Importación masiva de clientes y transacciones (NDJSON o CSV).
+
+Las filas se leen en streaming, se validan una a una y se aplican al banco
+en lotes: cada lote es una sola operación (un solo registro en el log y
+una sola reserva de números de cuenta), en lugar de una petición por fila.
+"""
+import csv
+import json
+import math
+import time
+
+TAMANO_LOTE = 1000
+MAXIMO_ERRORES_REPORTADOS = 1000
+
+TIPOS_TRANSACCION = {'deposito', 'retiro', 'apertura_cuenta', 'compra_acciones',
+                     'venta_acciones', 'apuesta_deportiva', 'premio_apuesta', 'prestamo_otorgado',
+                     'pago_prestamo', 'interes', 'abono', 'cargo',
+                     'transferencia_enviada', 'transferencia_recibida'}
+
+
+def detectar_formato(nombre_o_tipo):
+    """'csv' o 'ndjson' a partir de un Content-Type o nombre de archivo"""
+    if nombre_o_tipo and 'csv' in nombre_o_tipo.lower():
+        return 'csv'
+    return 'ndjson'
+
+
+def leer_lineas(flujo, tamano_bloque=1 << 16):
+    """Líneas de un flujo binario leído por bloques (más rápido que readline)"""
+    resto = b''
+    while True:
+        bloque = flujo.read(tamano_bloque)
+        if not bloque:
+            break
+        lineas = (resto + bloque).split(b'\n')
+        resto = lineas.pop()
+        for linea in lineas:
+            yield linea + b'\n'
+    if resto:
+        yield resto
+
+
+def leer_filas(lineas, formato):
+    """Genera (numero_fila, fila) a partir de líneas en bytes o texto.
+
+    Las líneas que no se pueden interpretar se devuelven como
+    (numero_fila, ValueError) para reportarlas sin cortar la importación.
+    """
+    textos = (l.decode('utf-8') if isinstance(l, bytes) else l for l in lineas)
+    if formato == 'csv':
+        for numero, fila in enumerate(csv.DictReader(textos), start=2):
+            yield numero, fila
+        return
+    for numero, linea in enumerate(textos, start=1):
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError:
+            yield numero, ValueError('JSON inválido')
+            continue
+        if not isinstance(fila, dict):
+            yield numero, ValueError('Se esperaba un objeto JSON')
+            continue
+        yield numero, fila
+
+
+def validar_usuario(fila):
+    usuario = (fila.get('usuario') or '').strip()
+    if len(usuario) < 4:
+        raise ValueError('Usuario muy corto (mínimo 4 caracteres)')
+    if fila.get('password_sha256'):
+        password_hash = fila['password_sha256']
+        password = None
+    else:
+        password = fila.get('password') or ''
+        password_hash = None
+        if len(password) < 6:
+            raise ValueError('Contraseña muy corta (mínimo 6 caracteres)')
+    saldo = float(fila.get('saldo') or 0)
+    if not math.isfinite(saldo):
+        raise ValueError('Saldo inválido')
+    if saldo < 0:
+        raise ValueError('Saldo negativo')
+    return {
+        'usuario': usuario,
+        'password': password,
+        'password_sha256': password_hash,
+        'nombre': fila.get('nombre') or usuario,
+        'email': fila.get('email') or '',
+        'saldo': saldo,
+    }
+
+
+def validar_transaccion(fila):
+    usuario = (fila.get('usuario') or '').strip()
+    if not usuario:
+        raise ValueError('Falta el usuario')
+    tipo = fila.get('tipo')
+    if tipo not in TIPOS_TRANSACCION:
+        raise ValueError(f'Tipo de transacción desconocido: {tipo}')
+    if not fila.get('fecha'):
+        raise ValueError('Falta la fecha')
+    monto = float(fila.get('monto'))
+    if not math.isfinite(monto):
+        raise ValueError('Monto inválido')
+    return {
+        'usuario': usuario,
+        'tipo': tipo,
+        'monto': monto,
+        'fecha': fila['fecha'],
+        'estado': fila.get('estado') or 'completado',
+        'descripcion': fila.get('descripcion') or '',
+    }
+
+
+def importar(banco, flujo, formato, tipo):
+    """Importa 'usuarios' o 'transacciones' desde un flujo binario.
+
+    Devuelve un resumen con los importados y los errores por fila.
+    """
+    if tipo == 'usuarios':
+        validar, aplicar = validar_usuario, banco.importar_usuarios
+    else:
+        validar, aplicar = validar_transaccion, banco.importar_transacciones
+
+    inicio = time.perf_counter()
+    importados = 0
+    errores = []
+    total_errores = 0
+    lote, numeros = [], []
+
+    def reportar(numero, error):
+        nonlocal total_errores
+        total_errores += 1
+        if len(errores) < MAXIMO_ERRORES_REPORTADOS:
+            errores.append({'fila': numero, 'error': str(error)})
+
+    def vaciar():
+        nonlocal importados
+        rechazos = aplicar(lote)
+        importados += len(lote) - len(rechazos)
+        for indice, error in rechazos:
+            reportar(numeros[indice], error)
+        lote.clear()
+        numeros.clear()
+
+    for numero, fila in leer_filas(leer_lineas(flujo), formato):
+        if isinstance(fila, Exception):
+            reportar(numero, fila)
+            continue
+        try:
+            lote.append(validar(fila))
+        except (TypeError, ValueError) as e:
+            reportar(numero, e)
+            continue
+        numeros.append(numero)
+        if len(lote) >= TAMANO_LOTE:
+            vaciar()
+    if lote:
+        vaciar()
+
+    segundos = time.perf_counter() - inicio
+    return {
+        'importados': importados,
+        'total_errores': total_errores,
+        'errores': errores,
+        'segundos': round(segundos, 3),
+        'filas_por_segundo': round((importados + total_errores) / segundos, 1) if segundos else 0,
+    }
@@ -0,0 +1,59 @@
+"""Intereses de las cuentas de ahorro.
+
+El interés se devenga por día, compuesto a la tasa pasiva anual / 365.
+Cada cuenta recuerda hasta qué día tiene el interés abonado
+(`interes_hasta`, inclusive). Devengar hasta el día D le abona de una vez
+todos los días que le falten con el factor (1 + tasa/365) ** dias - 1:
+ponerse al día después de varios días sin correr no recorre cada día por
+separado, y volver a correr hasta el mismo día no abona nada.
+"""
+from datetime import date
+
+DIAS_POR_ANIO = 365
+
+
+def validar_dia(dia):
+    """True si `dia` es una fecha 'AAAA-MM-DD' válida"""
+    try:
+        return len(dia) == 10 and date.fromisoformat(dia) is not None
+    except (TypeError, ValueError):
+        return False
+
+
+def factor_interes(tasa_anual, dias):
+    """Interés compuesto diario de `dias` días por unidad de saldo"""
+    return (1 + tasa_anual / DIAS_POR_ANIO) ** dias - 1
+
+
+def devengar(cuentas, tasa_anual, dia):
+    """Calcula el interés hasta `dia` ('AAAA-MM-DD') de varias cuentas.
+
+    `cuentas` son tuplas (usuario, saldo, interes_hasta). No modifica
+    nada: devuelve los abonos [(usuario, interes, dias)], los usuarios cuyo
+    `interes_hasta` pasa a ser `dia` y un resumen. Las cuentas sin saldo
+    también avanzan, para que un depósito posterior no cobre días pasados.
+    """
+    hasta = date.fromisoformat(dia).toordinal()
+    # Pocas fechas distintas entre muchas cuentas: cada una se convierte una vez
+    ordinales = {}
+    factores = {}
+    abonos = []
+    al_dia = []
+    total = 0
+    for usuario, saldo, interes_hasta in cuentas:
+        desde = ordinales.get(interes_hasta)
+        if desde is None:
+            desde = ordinales[interes_hasta] = date.fromisoformat(interes_hasta[:10]).toordinal()
+        dias = hasta - desde
+        if dias <= 0:
+            continue
+        al_dia.append(usuario)
+        if saldo <= 0:
+            continue
+        factor = factores.get(dias)
+        if factor is None:
+            factor = factores[dias] = factor_interes(tasa_anual, dias)
+        interes = saldo * factor
+        abonos.append((usuario, interes, dias))
+        total += interes
+    return abonos, al_dia, {'dia': dia, 'cuentas': len(al_dia), 'abonadas': len(abonos), 'interes': total}
@@ -0,0 +1,306 @@
+"""Libro de transacciones de ChiquiBank con índices por usuario, tipo y estado"""
+import glob
+import heapq
+import os
+import threading
+from bisect import bisect_left
+from itertools import islice
+
+from historico import Segmento, escribir_segmento
+
+# Filas recientes que se quedan en memoria al archivar, y mínimo de filas
+# cerradas para que valga la pena escribir un segmento
+FILAS_EN_MEMORIA = 100000
+FILAS_POR_SEGMENTO = 100000
+
+# Una transacción en estos estados todavía puede cambiar: nunca se archiva
+ESTADOS_ABIERTOS = {'pendiente_aprobacion'}
+
+
+def _id(transaccion):
+    return transaccion['id']
+
+
+def _id_inverso(transaccion):
+    return -transaccion['id']
+
+
+class LibroTransacciones:
+    """Registro en orden de llegada de todas las transacciones del banco.
+
+    Cada transacción recibe un 'id' creciente. Se mantiene un índice por
+    usuario (ids en orden de inserción) y un índice secundario por
+    (tipo, estado), así consultar un historial cuesta O(filas devueltas)
+    en lugar de recorrer el libro completo.
+
+    Con `directorio`, `archivar()` pasa las filas cerradas más antiguas a
+    segmentos columnares en disco (ver historico.py) y las consultas leen
+    las dos capas. En memoria quedan las filas desde `_base` más las
+    anteriores que siguen abiertas (`_retenidas`); los índices sólo cubren
+    las filas en memoria. Archivar reemplaza las listas en lugar de
+    modificarlas, así un lector que tomó una vista sigue viendo filas
+    coherentes.
+    """
+
+    def __init__(self, directorio=None):
+        self.directorio = directorio
+        self._filas = []
+        self._base = 0
+        self._retenidas = {}
+        self._segmentos = []
+        self._por_usuario = {}
+        self._por_tipo_estado = {}
+        self._bloqueo = threading.Lock()
+        self._archivando = threading.Lock()
+
+    def __len__(self):
+        return self._base + len(self._filas)
+
+    def __iter__(self):
+        """Todas las transacciones por id; cada segmento se ordena entero en memoria"""
+        filas, base, retenidas, segmentos = self._vista()
+        en_memoria = heapq.merge(sorted(retenidas.values(), key=_id), filas, key=_id)
+        return heapq.merge(*segmentos, en_memoria, key=_id)
+
+    def __getitem__(self, trans_id):
+        filas, base, retenidas, segmentos = self._vista()
+        if trans_id >= base:
+            return filas[trans_id - base]
+        if trans_id in retenidas:
+            return retenidas[trans_id]
+        for segmento in segmentos:
+            transaccion = segmento.fila(trans_id)
+            if transaccion is not None:
+                return transaccion
+        raise IndexError(trans_id)
+
+    def _vista(self):
+        with self._bloqueo:
+            return self._filas, self._base, self._retenidas, self._segmentos
+
+    def _indexar(self, transaccion):
+        trans_id = transaccion['id']
+        self._por_usuario.setdefault(transaccion['usuario'], []).append(trans_id)
+        clave = (transaccion['tipo'], transaccion['estado'])
+        self._por_tipo_estado.setdefault(clave, {})[trans_id] = None
+
+    def append(self, transaccion):
+        """Agrega una transacción al final del libro y devuelve su id"""
+        with self._bloqueo:
+            trans_id = self._base + len(self._filas)
+            transaccion['id'] = trans_id
+            self._filas.append(transaccion)
+            self._indexar(transaccion)
+            return trans_id
+
+    def extend(self, transacciones):
+        """Agrega muchas transacciones tomando el bloqueo una sola vez"""
+        with self._bloqueo:
+            for transaccion in transacciones:
+                transaccion['id'] = self._base + len(self._filas)
+                self._filas.append(transaccion)
+                self._indexar(transaccion)
+
+    def cargar(self, transacciones):
+        """Reconstruye el libro y sus índices a partir de filas ya numeradas"""
+        self._filas = []
+        self._base = 0
+        self._retenidas = {}
+        self._segmentos = []
+        self._por_usuario = {}
+        self._por_tipo_estado = {}
+        for transaccion in transacciones:
+            self.append(transaccion)
+
+    def exportar(self):
+        """Estado para el snapshot: las filas en memoria y los segmentos que lo completan"""
+        with self._bloqueo:
+            return {
+                'base': self._base,
+                'segmentos': [segmento.nombre for segmento in self._segmentos],
+                'retenidas': list(self._retenidas.values()),
+                'filas': list(self._filas),
+            }
+
+    def importar(self, estado):
+        """Contrario de `exportar`. Los segmentos del directorio que el
+        snapshot no nombra quedaron de un archivado posterior sin snapshot:
+        sus filas vuelven con el log, así que se borran."""
+        nombres = set(estado['segmentos'])
+        segmentos = [Segmento(os.path.join(self.directorio, nombre)) for nombre in estado['segmentos']]
+        if self.directorio:
+            for ruta in glob.glob(os.path.join(self.directorio, '*.seg')):
+                if os.path.basename(ruta) not in nombres:
+                    os.remove(ruta)
+        with self._bloqueo:
+            self._base = estado['base']
+            self._filas = list(estado['filas'])
+            self._retenidas = {transaccion['id']: transaccion for transaccion in estado['retenidas']}
+            self._segmentos = segmentos
+            self._reindexar()
+
+    def _reindexar(self):
+        self._por_usuario = {}
+        self._por_tipo_estado = {}
+        for transaccion in sorted(self._retenidas.values(), key=_id):
+            self._indexar(transaccion)
+        for transaccion in self._filas:
+            self._indexar(transaccion)
+
+    def actualizar_estado(self, trans_id, estado, **campos):
+        """Cambia el estado de una transacción manteniendo el índice secundario"""
+        with self._bloqueo:
+            if trans_id >= self._base:
+                transaccion = self._filas[trans_id - self._base]
+            else:
+                # Las filas abiertas nunca se archivan
+                transaccion = self._retenidas[trans_id]
+            anterior = (transaccion['tipo'], transaccion['estado'])
+            self._por_tipo_estado[anterior].pop(trans_id, None)
+            transaccion['estado'] = estado
+            transaccion.update(campos)
+            self._por_tipo_estado.setdefault((transaccion['tipo'], estado), {})[trans_id] = None
+            return transaccion
+
+    def desde(self, trans_id):
+        """Transacciones con id >= `trans_id`, en orden"""
+        with self._bloqueo:
+            if trans_id >= self._base:
+                return self._filas[trans_id - self._base:]
+        return [transaccion for transaccion in self if transaccion['id'] >= trans_id]
+
+    # ----------------------
+    # Consultas por usuario
+    # ----------------------
+
+    def _capas_usuario(self, usuario):
+        """Vista coherente de las filas de `usuario`: (ids, cantidad, buscar, segmentos).
+
+        Las listas de ids sólo crecen por el final, así que `cantidad` fija
+        qué filas en memoria entran en la vista.
+        """
+        with self._bloqueo:
+            ids = self._por_usuario.get(usuario, [])
+            filas, base, retenidas, segmentos = self._filas, self._base, self._retenidas, self._segmentos
+            cantidad = len(ids)
+
+        def buscar(trans_id):
+            return filas[trans_id - base] if trans_id >= base else retenidas[trans_id]
+        return ids, cantidad, buscar, segmentos
+
+    def por_usuario(self, usuario, cursor=None, limite=None):
+        """Historial de un usuario, de la más reciente a la más antigua.
+
+        `cursor` es el id (exclusivo) desde el que continuar hacia atrás.
+        Devuelve (transacciones, siguiente_cursor); el cursor es None cuando
+        no quedan más filas.
+        """
+        ids, cantidad, buscar, segmentos = self._capas_usuario(usuario)
+        fin = cantidad if cursor is None else bisect_left(ids, cursor, 0, cantidad)
+        if not segmentos:
+            inicio = 0 if limite is None else max(0, fin - limite)
+            pagina = [buscar(i) for i in reversed(ids[inicio:fin])]
+            return pagina, ids[inicio] if inicio > 0 else None
+        en_memoria = (buscar(ids[i]) for i in range(fin - 1, -1, -1))
+        archivadas = [segmento.filas_usuario(usuario, reverso=True) for segmento in segmentos]
+        filas = heapq.merge(en_memoria, *archivadas, key=_id_inverso)
+        if cursor is not None:
+            filas = (transaccion for transaccion in filas if transaccion['id'] < cursor)
+        if limite is None:
+            return list(filas), None
+        pagina = list(islice(filas, limite))
+        hay_mas = len(pagina) == limite and next(filas, None) is not None
+        return pagina, pagina[-1]['id'] if hay_mas else None
+
+    def historial(self, usuario, desde=None, hasta=None):
+        """Transacciones de un usuario por id, con fecha en [desde, hasta).
+
+        Es un generador que lee las dos capas a medida que avanza: sirve para
+        exportar un historial largo sin tenerlo entero en memoria.
+        """
+        ids, cantidad, buscar, segmentos = self._capas_usuario(usuario)
+        en_memoria = (buscar(ids[i]) for i in range(cantidad))
+        en_memoria = (transaccion for transaccion in en_memoria
+                      if (desde is None or transaccion['fecha'] >= desde)
+                      and (hasta is None or transaccion['fecha'] < hasta))
+        archivadas = [segmento.filas_usuario(usuario, desde=desde, hasta=hasta) for segmento in segmentos]
+        return heapq.merge(*archivadas, en_memoria, key=_id)
+
+    def contar_usuario(self, usuario):
+        ids, cantidad, _, segmentos = self._capas_usuario(usuario)
+        return cantidad + sum(segmento.contar(usuario) for segmento in segmentos)
+
+    def por_tipo_estado(self, tipo, estado):
+        """Transacciones de un tipo y estado dados, en orden de llegada"""
+        with self._bloqueo:
+            ids = list(self._por_tipo_estado.get((tipo, estado), {}))
+            segmentos = self._segmentos
+        en_memoria = [self[i] for i in ids]
+        archivadas = [transaccion for segmento in segmentos for transaccion in segmento.filas_bloques(tipo, estado)]
+        if not archivadas:
+            return en_memoria
+        return sorted(archivadas + en_memoria, key=_id)
+
+    # ----------------------
+    # Archivado
+    # ----------------------
+
+    def archivar(self, retener=FILAS_EN_MEMORIA, minimo=FILAS_POR_SEGMENTO):
+        """Pasa a un segmento en disco las filas cerradas anteriores a las
+        `retener` más recientes. El segmento se escribe fuera del bloqueo;
+        sólo el cambio de capas final lo toma. Devuelve cuántas archivó."""
+        if self.directorio is None:
+            return 0
+        with self._archivando:
+            with self._bloqueo:
+                corte = self._base + len(self._filas) - retener
+                if corte - self._base < minimo:
+                    return 0
+                candidatas = [transaccion for transaccion in self._retenidas.values()
+                              if transaccion['estado'] not in ESTADOS_ABIERTOS]
+                candidatas += [transaccion for transaccion in self._filas[:corte - self._base]
+                               if transaccion['estado'] not in ESTADOS_ABIERTOS]
+
+            segmento = None
+            if candidatas:
+                os.makedirs(self.directorio, exist_ok=True)
+                ruta = os.path.join(self.directorio, f'historico-{corte:012d}.seg')
+                escribir_segmento(ruta, candidatas)
+                _sincronizar_directorio(self.directorio)
+                segmento = Segmento(ruta)
+
+            archivadas = {transaccion['id'] for transaccion in candidatas}
+            with self._bloqueo:
+                retenidas = {trans_id: transaccion for trans_id, transaccion in self._retenidas.items()
+                             if trans_id not in archivadas}
+                for transaccion in self._filas[:corte - self._base]:
+                    if transaccion['id'] not in archivadas:
+                        retenidas[transaccion['id']] = transaccion
+                self._filas = self._filas[corte - self._base:]
+                self._base = corte
+                self._retenidas = retenidas
+                if segmento is not None:
+                    self._segmentos = self._segmentos + [segmento]
+                self._reindexar()
+            return len(candidatas)
+
+    def estadisticas(self):
+        filas, _, retenidas, segmentos = self._vista()
+        return {
+            'en_memoria': len(filas) + len(retenidas),
+            'retenidas': len(retenidas),
+            'archivadas': sum(len(segmento) for segmento in segmentos),
+            'segmentos': len(segmentos),
+            'bytes_en_disco': sum(segmento.bytes_en_disco() for segmento in segmentos),
+        }
+
+
+def _sincronizar_directorio(directorio):
+    try:
+        fd = os.open(directorio, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
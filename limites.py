@@ -0,0 +1,182 @@
+"""Límite de ritmo y control de admisión para las rutas que mueven dinero.
+
+`Limitador` es un cubo de fichas por clave (usuario, ruta): cada petición
+gasta una ficha y el cubo se rellena a `tasa` fichas por segundo hasta
+`capacidad`. El relleno se calcula al consultar, así cada comprobación es
+O(1) y no hay hilo de fondo. Los cubos viven en un OrderedDict por orden
+de uso; pasado `max_cubos` se desaloja el que lleva más tiempo sin uso (un
+cubo desalojado vuelve lleno, que es lo mismo que uno inactivo).
+
+Cada worker de gunicorn tiene su propio limitador: `limites_por_worker`
+reparte cada límite entre ellos para que, sumados, den el configurado.
+
+`CupoConexiones` cuenta las conexiones largas (el stream del mercado)
+que un worker sostiene a la vez: cada una ocupa un hilo mientras dura.
+
+`ControlAdmision` rechaza de entrada cuando el proceso ya está saturado:
+demasiadas peticiones en curso, demasiadas órdenes en cola o una latencia
+reciente por encima del umbral. La latencia es una media móvil que se
+reduce a la mitad cada `vida_media` segundos sin peticiones, así el
+rechazo no se queda pegado cuando deja de entrar tráfico.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+# (capacidad, fichas por segundo) por ruta, con el nombre del endpoint de Flask
+LIMITES_POR_RUTA = {
+    'apostar_deportes': (10, 2),
+    'comprar_acciones': (10, 2),
+    'ordenes': (20, 5),
+    'cancelar_orden': (20, 5),
+    'solicitar_transaccion': (5, 0.5),
+    'transferir': (10, 2),
+    'solicitar_prestamo': (3, 0.1),
+}
+
+MAX_CUBOS = 100000
+MAX_EN_CURSO = 64
+MAX_COLA_ORDENES = 5000
+LATENCIA_MAXIMA = 1.0  # segundos
+
+
+def limites_por_worker(workers, limites=None):
+    """Parte de cada límite que le toca a uno de `workers` procesos.
+
+    La capacidad no baja de una ficha, si no la ruta quedaría cerrada: con
+    muchos workers una ráfaga puede pasar hasta una vez por worker.
+    """
+    return {ruta: (max(1, capacidad / workers), tasa / workers)
+            for ruta, (capacidad, tasa) in (limites or LIMITES_POR_RUTA).items()}
+
+
+class Cubo:
+    __slots__ = ('fichas', 'ultimo')
+
+    def __init__(self, fichas, ultimo):
+        self.fichas = fichas
+        self.ultimo = ultimo
+
+
+class Limitador:
+    """Cubos de fichas por clave con desalojo LRU"""
+
+    def __init__(self, limites=None, max_cubos=MAX_CUBOS, reloj=time.monotonic):
+        self.limites = limites or LIMITES_POR_RUTA
+        self.max_cubos = max_cubos
+        self.reloj = reloj
+        self._cubos = OrderedDict()
+        self._bloqueo = threading.Lock()
+        self.permitidas = 0
+        self.limitadas = 0
+        self.desalojos = 0
+
+    def permitir(self, usuario, ruta):
+        """Gasta una ficha; devuelve 0 si hay, o los segundos hasta la próxima"""
+        limite = self.limites.get(ruta)
+        if limite is None:
+            return 0
+        capacidad, tasa = limite
+        clave = (usuario, ruta)
+        with self._bloqueo:
+            ahora = self.reloj()
+            cubo = self._cubos.get(clave)
+            if cubo is None:
+                cubo = self._cubos[clave] = Cubo(capacidad, ahora)
+                if len(self._cubos) > self.max_cubos:
+                    self._cubos.popitem(last=False)
+                    self.desalojos += 1
+            else:
+                self._cubos.move_to_end(clave)
+                cubo.fichas = min(capacidad, cubo.fichas + (ahora - cubo.ultimo) * tasa)
+                cubo.ultimo = ahora
+            if cubo.fichas >= 1:
+                cubo.fichas -= 1
+                self.permitidas += 1
+                return 0
+            self.limitadas += 1
+            return (1 - cubo.fichas) / tasa
+
+    def estadisticas(self):
+        return {'cubos': len(self._cubos), 'max_cubos': self.max_cubos, 'permitidas': self.permitidas,
+                'limitadas': self.limitadas, 'desalojos': self.desalojos}
+
+
+class ControlAdmision:
+    """Descarte de carga global según peticiones en curso, cola y latencia.
+
+    `cola` es una función que devuelve la profundidad de la cola a vigilar
+    (las órdenes pendientes de casar).
+    """
+
+    def __init__(self, cola=None, max_en_curso=MAX_EN_CURSO, max_cola=MAX_COLA_ORDENES,
+                 latencia_maxima=LATENCIA_MAXIMA, vida_media=5.0, reloj=time.monotonic):
+        self.cola = cola or (lambda: 0)
+        self.max_en_curso = max_en_curso
+        self.max_cola = max_cola
+        self.latencia_maxima = latencia_maxima
+        self.vida_media = vida_media
+        self.reloj = reloj
+        self.en_curso = 0
+        self._latencia = 0.0
+        self._medida = reloj()
+        self._bloqueo = threading.Lock()
+        self.admitidas = 0
+        self.descartadas = {'en_curso': 0, 'cola': 0, 'latencia': 0}
+
+    def latencia(self):
+        """Media móvil de la latencia, decaída por el tiempo sin medidas"""
+        return self._latencia * 0.5 ** ((self.reloj() - self._medida) / self.vida_media)
+
+    def entrar(self):
+        """Admite la petición (y la cuenta en curso) o devuelve el motivo del rechazo"""
+        with self._bloqueo:
+            if self.en_curso >= self.max_en_curso:
+                motivo = 'en_curso'
+            elif self.cola() >= self.max_cola:
+                motivo = 'cola'
+            elif self.latencia() > self.latencia_maxima:
+                motivo = 'latencia'
+            else:
+                self.en_curso += 1
+                self.admitidas += 1
+                return None
+            self.descartadas[motivo] += 1
+            return motivo
+
+    def salir(self, segundos):
+        with self._bloqueo:
+            self.en_curso -= 1
+            self._latencia = 0.8 * self.latencia() + 0.2 * segundos
+            self._medida = self.reloj()
+
+    def estadisticas(self):
+        return {'en_curso': self.en_curso, 'max_en_curso': self.max_en_curso, 'cola': self.cola(),
+                'max_cola': self.max_cola, 'latencia': self.latencia(), 'latencia_maxima': self.latencia_maxima,
+                'admitidas': self.admitidas, 'descartadas': dict(self.descartadas)}
+
+
+class CupoConexiones:
+    """Cuántas conexiones largas puede haber abiertas a la vez"""
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self.en_uso = 0
+        self.rechazadas = 0
+        self._bloqueo = threading.Lock()
+
+    def tomar(self):
+        """True si hay lugar (y lo ocupa); cada True se devuelve con `soltar`"""
+        with self._bloqueo:
+            if self.en_uso >= self.maximo:
+                self.rechazadas += 1
+                return False
+            self.en_uso += 1
+            return True
+
+    def soltar(self):
+        with self._bloqueo:
+            self.en_uso -= 1
+
+    def estadisticas(self):
+        return {'en_uso': self.en_uso, 'maximo': self.maximo, 'rechazadas': self.rechazadas}
@@ -0,0 +1,255 @@
+"""Motor de simulación del mercado de valores.
+
+Un hilo de fondo avanza todos los símbolos en un solo paso por tick y
+publica una instantánea inmutable; los handlers sólo leen la instantánea
+vigente, sin bloqueos, y los suscriptores en streaming esperan la
+siguiente con `esperar`. Precios, parámetros e historial viven en arrays
+columnares (`array('d')`) en lugar de un dict por símbolo. El paso sigue
+siendo O(n) en el número de símbolos (un gauss y un max/min por símbolo),
+pero sin crear dicts ni copiar el historial, y publicar la instantánea no
+depende de n: comparte los arrays en lugar de copiarlos.
+"""
+import json
+import random
+import threading
+import time
+from array import array
+from collections import deque, namedtuple
+from collections.abc import Mapping
+
+PRECIO_MINIMO = 10  # Mínimo 10 ChiqDollars
+TICKS_POR_VELA = 12
+VELAS_MAXIMAS = 500
+
+ACCIONES_INICIALES = {
+    'TECH': {'precio': 150, 'volatilidad': 0.15, 'dividendo': 0.04},
+    'ENERGY': {'precio': 80, 'volatilidad': 0.08, 'dividendo': 0.06},
+    'BANK': {'precio': 120, 'volatilidad': 0.12, 'dividendo': 0.05},
+    'REALESTATE': {'precio': 95, 'volatilidad': 0.10, 'dividendo': 0.03},
+}
+
+Cotizacion = namedtuple('Cotizacion', 'simbolo precio volatilidad dividendo')
+
+
+class InstantaneaMercado(Mapping):
+    """Estado del mercado en un tick: simbolo -> Cotizacion.
+
+    Nunca se modifica después de publicarse; el motor crea arrays nuevos en
+    cada tick y los comparte con la instantánea sin copiarlos.
+    """
+
+    def __init__(self, secuencia, fecha, indice, precios, volatilidades, dividendos):
+        self.secuencia = secuencia
+        self.fecha = fecha
+        self._indice = indice
+        self._precios = precios
+        self._volatilidades = volatilidades
+        self._dividendos = dividendos
+        self._json = None
+
+    def __getitem__(self, simbolo):
+        i = self._indice[simbolo]
+        return Cotizacion(simbolo, self._precios[i], self._volatilidades[i], self._dividendos[i])
+
+    def __iter__(self):
+        return iter(self._indice)
+
+    def __len__(self):
+        return len(self._indice)
+
+    def __contains__(self, simbolo):
+        return simbolo in self._indice
+
+    def precio(self, simbolo):
+        return self._precios[self._indice[simbolo]]
+
+    def como_dict(self):
+        return {
+            'secuencia': self.secuencia,
+            'fecha': self.fecha,
+            'acciones': {simbolo: {'precio': round(self._precios[i], 2),
+                                   'volatilidad': self._volatilidades[i],
+                                   'dividendo': self._dividendos[i]}
+                         for simbolo, i in self._indice.items()},
+        }
+
+    def como_json(self):
+        """`como_dict` serializado una sola vez, compartido por todos los suscriptores"""
+        if self._json is None:
+            self._json = json.dumps(self.como_dict())
+        return self._json
+
+
+class Mercado:
+    """Precios de todos los símbolos y su historial OHLC.
+
+    Las velas se guardan por columnas: cada vela cerrada son cuatro arrays
+    (apertura, máximo, mínimo, cierre) con un valor por símbolo, en una cola
+    acotada a VELAS_MAXIMAS. El historial de un símbolo es su columna en
+    cada una de ellas.
+    """
+
+    def __init__(self, acciones=None, ticks_por_vela=TICKS_POR_VELA, velas_maximas=VELAS_MAXIMAS):
+        self.ticks_por_vela = ticks_por_vela
+        self._bloqueo = threading.Lock()  # un solo escritor: el ticker
+        self._simbolos = []
+        self._indice = {}
+        self._precios = array('d')
+        self._volatilidades = array('d')
+        self._dividendos = array('d')
+        self._velas = deque(maxlen=velas_maximas)
+        self._secuencia = 0
+        self._nuevo_tick = threading.Condition()
+        self.suscriptores = 0
+        self._agregar(acciones or ACCIONES_INICIALES)
+
+    # ----------------------
+    # Escritura
+    # ----------------------
+
+    def _agregar(self, acciones):
+        indice = dict(self._indice)
+        precios = array('d', self._precios)
+        volatilidades = array('d', self._volatilidades)
+        dividendos = array('d', self._dividendos)
+        for simbolo, datos in acciones.items():
+            if simbolo in indice:
+                continue
+            indice[simbolo] = len(self._simbolos)
+            self._simbolos.append(simbolo)
+            precios.append(datos['precio'])
+            volatilidades.append(datos['volatilidad'])
+            dividendos.append(datos.get('dividendo', 0))
+        self._indice = indice
+        self._precios, self._volatilidades, self._dividendos = precios, volatilidades, dividendos
+        # Los símbolos nuevos empiezan una vela nueva con todos los demás
+        self._abrir_vela()
+        self._publicar()
+
+    def agregar_simbolos(self, acciones):
+        """Da de alta símbolos {simbolo: {precio, volatilidad, dividendo}}"""
+        with self._bloqueo:
+            self._agregar(acciones)
+
+    def avanzar(self):
+        """Un tick: mueve todos los precios y publica la instantánea"""
+        gauss = random.gauss
+        with self._bloqueo:
+            self._tick(array('d', [max(PRECIO_MINIMO, p * (1 + gauss(0, v)))
+                                   for p, v in zip(self._precios, self._volatilidades)]))
+        return self._instantanea
+
+    def fijar(self, precios):
+        """Un tick con precios dados {simbolo: precio}, p. ej. los de otro proceso"""
+        with self._bloqueo:
+            self._tick(array('d', [precios.get(simbolo, p) for simbolo, p in zip(self._simbolos, self._precios)]))
+        return self._instantanea
+
+    def _tick(self, precios):
+        self._precios = precios
+        self._maximos = array('d', map(max, self._maximos, precios))
+        self._minimos = array('d', map(min, self._minimos, precios))
+        self._ticks_vela += 1
+        if self._ticks_vela >= self.ticks_por_vela:
+            self._cerrar_vela()
+        self._publicar()
+
+    def _abrir_vela(self):
+        self._apertura_vela = time.time()
+        self._aperturas = self._precios
+        self._maximos = array('d', self._precios)
+        self._minimos = array('d', self._precios)
+        self._ticks_vela = 0
+
+    def _cerrar_vela(self):
+        self._velas.append((self._apertura_vela, self._indice,
+                            self._aperturas, self._maximos, self._minimos, self._precios))
+        self._abrir_vela()
+
+    def _publicar(self):
+        self._secuencia += 1
+        instantanea = InstantaneaMercado(
+            self._secuencia, time.strftime("%Y-%m-%d %H:%M:%S"), self._indice,
+            self._precios, self._volatilidades, self._dividendos)
+        with self._nuevo_tick:
+            self._instantanea = instantanea
+            self._nuevo_tick.notify_all()
+
+    # ----------------------
+    # Lectura (sin bloqueos)
+    # ----------------------
+
+    def instantanea(self):
+        return self._instantanea
+
+    def precio(self, simbolo):
+        return self._instantanea.precio(simbolo)
+
+    def esperar(self, secuencia, timeout=None):
+        """Espera una instantánea posterior a `secuencia` y devuelve la vigente.
+
+        Un suscriptor lento no acumula ticks: al despertar recibe sólo la
+        última instantánea, así su "buffer" nunca pasa de una. Si vence el
+        timeout devuelve la misma instantánea que ya tenía. Cualquier
+        secuencia distinta cuenta como nueva, también una menor (el cliente
+        traía una secuencia de antes de un reinicio).
+        """
+        with self._nuevo_tick:
+            self._nuevo_tick.wait_for(lambda: self._instantanea.secuencia != secuencia, timeout)
+            return self._instantanea
+
+    def suscribir(self, secuencia=0, latido=15):
+        """Genera instantáneas nuevas, o None cada `latido` segundos sin ticks"""
+        with self._nuevo_tick:
+            self.suscriptores += 1
+        try:
+            while True:
+                instantanea = self.esperar(secuencia, latido)
+                if instantanea.secuencia == secuencia:
+                    yield None
+                    continue
+                secuencia = instantanea.secuencia
+                yield instantanea
+        finally:
+            with self._nuevo_tick:
+                self.suscriptores -= 1
+
+    def historial(self, simbolo, limite=None):
+        """Velas cerradas de un símbolo, de la más antigua a la más reciente"""
+        velas = []
+        for inicio, indice, aperturas, maximos, minimos, cierres in list(self._velas):
+            i = indice.get(simbolo)
+            if i is None:
+                continue
+            velas.append({'inicio': inicio, 'apertura': aperturas[i], 'maximo': maximos[i],
+                          'minimo': minimos[i], 'cierre': cierres[i]})
+        return velas[-limite:] if limite else velas
+
+    # ----------------------
+    # Persistencia
+    # ----------------------
+
+    def exportar(self):
+        instantanea = self._instantanea
+        return {simbolo: {'precio': cotizacion.precio, 'volatilidad': cotizacion.volatilidad,
+                          'dividendo': cotizacion.dividendo}
+                for simbolo, cotizacion in instantanea.items()}
+
+    def importar(self, acciones):
+        with self._bloqueo:
+            self._simbolos = []
+            self._indice = {}
+            self._precios = array('d')
+            self._volatilidades = array('d')
+            self._dividendos = array('d')
+            self._velas.clear()
+            self._agregar(acciones)
+
+
+def acciones_sinteticas(cantidad, semilla=0):
+    """Símbolos de prueba para ejercitar el motor con miles de acciones"""
+    azar = random.Random(semilla)
+    return {f'SIM{i:05d}': {'precio': round(azar.uniform(20, 500), 2),
+                            'volatilidad': round(azar.uniform(0.01, 0.05), 3),
+                            'dividendo': round(azar.uniform(0, 0.06), 3)}
+            for i in range(cantidad)}
@@ -0,0 +1,209 @@
+"""Instrumentación: histogramas de latencia, medidores y perfilador.
+
+`Histograma` agrupa duraciones en cubetas log-lineales al estilo HDR:
+16 cubetas por potencia de dos de microsegundos, del microsegundo a unos
+doce días, con un error relativo por debajo del 6% y memoria fija (un
+array de 608 contadores) sin importar cuántas medidas reciba.
+
+`Metricas` junta los histogramas por nombre y los medidores (funciones
+que devuelven un valor al consultarlas) y los escribe en el formato de
+texto de Prometheus.
+
+`Perfilador` muestrea las pilas de todos los hilos cada `intervalo`
+segundos mientras está activo y las acumula en el formato plegado que
+leen flamegraph.pl y speedscope ("hilo;modulo:funcion;... muestras").
+"""
+import sys
+import threading
+from array import array
+from collections import Counter
+
+SUB_BITS = 4
+SUB = 1 << SUB_BITS
+CUBETAS = 38 * SUB
+
+CUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def _indice(microsegundos):
+    if microsegundos < 2 * SUB:
+        return microsegundos
+    exponente = microsegundos.bit_length() - SUB_BITS - 1
+    return min(exponente * SUB + (microsegundos >> exponente), CUBETAS - 1)
+
+
+def _limites(indice):
+    """Microsegundos [desde, hasta) que cubre una cubeta"""
+    if indice < 2 * SUB:
+        return indice, indice + 1
+    exponente, mantisa = indice // SUB - 1, indice % SUB + SUB
+    return mantisa << exponente, (mantisa + 1) << exponente
+
+
+class Histograma:
+    """Duraciones en segundos en cubetas de tamaño fijo"""
+
+    __slots__ = ('cuentas', 'total', 'suma', 'maximo', '_bloqueo')
+
+    def __init__(self):
+        self.cuentas = array('q', bytes(8 * CUBETAS))
+        self.total = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+        self._bloqueo = threading.Lock()
+
+    def registrar(self, segundos):
+        indice = _indice(int(segundos * 1e6))
+        with self._bloqueo:
+            self.cuentas[indice] += 1
+            self.total += 1
+            self.suma += segundos
+            if segundos > self.maximo:
+                self.maximo = segundos
+
+    def percentiles(self, cuantiles=CUANTILES):
+        """{cuantil: segundos}, con el punto medio de la cubeta que lo contiene"""
+        with self._bloqueo:
+            cuentas, total = list(self.cuentas), self.total
+        resultado = {}
+        acumulado, indice = 0, 0
+        for cuantil in sorted(cuantiles):
+            objetivo = max(1, cuantil * total)
+            while indice < CUBETAS - 1 and acumulado + cuentas[indice] < objetivo:
+                acumulado += cuentas[indice]
+                indice += 1
+            desde, hasta = _limites(indice)
+            resultado[cuantil] = (desde + hasta) / 2e6 if total else 0.0
+        return resultado
+
+
+def _etiquetas(etiquetas):
+    if not etiquetas:
+        return ''
+    pares = ','.join('{}="{}"'.format(clave, str(valor).replace('\\', r'\\').replace('"', r'\"'))
+                     for clave, valor in etiquetas)
+    return '{' + pares + '}'
+
+
+class Metricas:
+    """Registro de histogramas y medidores con salida Prometheus"""
+
+    def __init__(self, prefijo='chiquibank'):
+        self.prefijo = prefijo
+        self._histogramas = {}
+        self._ayudas = {}
+        self._medidores = []
+        self._bloqueo = threading.Lock()
+
+    def histograma(self, nombre, ayuda='', **etiquetas):
+        clave = (nombre, tuple(etiquetas.items()))
+        histograma = self._histogramas.get(clave)
+        if histograma is None:
+            with self._bloqueo:
+                histograma = self._histogramas.setdefault(clave, Histograma())
+                self._ayudas.setdefault(nombre, ayuda)
+        return histograma
+
+    def agregar(self, nombre, histograma, ayuda='', **etiquetas):
+        """Publica un histograma que lleva otro objeto (p. ej. una tarea)"""
+        with self._bloqueo:
+            self._histogramas[(nombre, tuple(etiquetas.items()))] = histograma
+            self._ayudas.setdefault(nombre, ayuda)
+
+    def medir(self, nombre, segundos, ayuda='', **etiquetas):
+        self.histograma(nombre, ayuda, **etiquetas).registrar(segundos)
+
+    def medidor(self, nombre, ayuda, funcion, tipo='gauge'):
+        """`funcion()` devuelve un número o un dict {etiquetas (tupla de pares): número}"""
+        self._medidores.append((nombre, ayuda, funcion, tipo))
+
+    def prometheus(self):
+        lineas = []
+        por_nombre = {}
+        for (nombre, etiquetas), histograma in list(self._histogramas.items()):
+            por_nombre.setdefault(nombre, []).append((etiquetas, histograma))
+        for nombre, series in sorted(por_nombre.items()):
+            completo = f'{self.prefijo}_{nombre}'
+            lineas.append(f'# HELP {completo} {self._ayudas.get(nombre) or nombre}')
+            lineas.append(f'# TYPE {completo} summary')
+            for etiquetas, histograma in series:
+                for cuantil, valor in histograma.percentiles().items():
+                    lineas.append(f'{completo}{_etiquetas(etiquetas + (("quantile", cuantil),))} {valor:.6f}')
+                lineas.append(f'{completo}_sum{_etiquetas(etiquetas)} {histograma.suma:.6f}')
+                lineas.append(f'{completo}_count{_etiquetas(etiquetas)} {histograma.total}')
+        for nombre, ayuda, funcion, tipo in self._medidores:
+            completo = f'{self.prefijo}_{nombre}'
+            try:
+                valor = funcion()
+            except Exception:  # un medidor roto no debe tumbar el resto
+                continue
+            lineas.append(f'# HELP {completo} {ayuda}')
+            lineas.append(f'# TYPE {completo} {tipo}')
+            if isinstance(valor, dict):
+                for etiquetas, numero in valor.items():
+                    lineas.append(f'{completo}{_etiquetas(etiquetas)} {numero}')
+            else:
+                lineas.append(f'{completo} {valor}')
+        return '\n'.join(lineas) + '\n'
+
+
+class Perfilador:
+    """Perfilador por muestreo que se enciende y apaga en caliente"""
+
+    def __init__(self, intervalo=0.01, max_pilas=10000):
+        self.intervalo = intervalo
+        self.max_pilas = max_pilas
+        self.pilas = Counter()
+        self.muestras = 0
+        self.descartadas = 0
+        self._detener = None
+        self._hilo = None
+        self._bloqueo = threading.Lock()
+
+    @property
+    def activo(self):
+        return self._hilo is not None
+
+    def iniciar(self):
+        with self._bloqueo:
+            if self._hilo is None:
+                self._detener = threading.Event()
+                self._hilo = threading.Thread(target=self._bucle, args=(self._detener,),
+                                              name='perfilador', daemon=True)
+                self._hilo.start()
+
+    def detener(self):
+        with self._bloqueo:
+            if self._hilo is not None:
+                self._detener.set()
+                self._hilo.join()
+                self._hilo = None
+
+    def reiniciar(self):
+        self.pilas = Counter()
+        self.muestras = self.descartadas = 0
+
+    def _bucle(self, detener):
+        propio = threading.get_ident()
+        while not detener.wait(self.intervalo):
+            nombres = {hilo.ident: hilo.name for hilo in threading.enumerate()}
+            for ident, marco in sys._current_frames().items():
+                if ident == propio:
+                    continue
+                marcos = []
+                while marco is not None:
+                    codigo = marco.f_code
+                    marcos.append(f'{marco.f_globals.get("__name__", "?")}:{codigo.co_name}')
+                    marco = marco.f_back
+                marcos.append(nombres.get(ident, str(ident)))
+                pila = ';'.join(reversed(marcos))
+                # Acotado: las pilas nuevas por encima del máximo sólo se cuentan
+                if pila in self.pilas or len(self.pilas) < self.max_pilas:
+                    self.pilas[pila] += 1
+                else:
+                    self.descartadas += 1
+            self.muestras += 1
+
+    def plegado(self):
+        """Pilas en formato plegado, una por línea, de la más a la menos vista"""
+        return ''.join(f'{pila} {cuenta}\n' for pila, cuenta in self.pilas.most_common())
@@ -0,0 +1,238 @@
+"""Libro de órdenes de acciones y procesamiento de órdenes por lotes.
+
+Cada símbolo tiene un libro con prioridad precio-tiempo: las órdenes límite
+que no se ejecutan quedan en reposo en dos montículos (compras y ventas) y
+las cancelaciones se resuelven con borrado perezoso. Las órdenes que llegan
+de los handlers no se casan una por una: `ProcesadorLotes` las junta y el
+banco las ejecuta en lotes, una sola operación registrada por lote.
+"""
+import heapq
+import queue
+import threading
+
+LADOS = ('compra', 'venta')
+TIPOS = ('mercado', 'limite')
+
+
+class LibroOrdenes:
+    """Órdenes límite en reposo de un símbolo.
+
+    Compras en un montículo de (-precio, id) y ventas en uno de (precio, id):
+    la cima es siempre el mejor precio y, a igual precio, la orden más
+    antigua (los id son crecientes). Retirar una orden sólo la quita de
+    `ordenes`; su entrada se descarta cuando llega a la cima.
+    """
+
+    def __init__(self):
+        self._compras = []
+        self._ventas = []
+        self.ordenes = {}
+
+    def __len__(self):
+        return len(self.ordenes)
+
+    def agregar(self, orden):
+        self.ordenes[orden['id']] = orden
+        if orden['lado'] == 'compra':
+            heapq.heappush(self._compras, (-orden['precio'], orden['id']))
+        else:
+            heapq.heappush(self._ventas, (orden['precio'], orden['id']))
+
+    def retirar(self, orden_id):
+        orden = self.ordenes.pop(orden_id, None)
+        # Si las entradas muertas dominan, reconstruir evita que crezcan sin fin
+        if len(self._compras) + len(self._ventas) > 2 * len(self.ordenes) + 1024:
+            self._compactar()
+        return orden
+
+    def _compactar(self):
+        self._compras = [e for e in self._compras if e[1] in self.ordenes]
+        self._ventas = [e for e in self._ventas if e[1] in self.ordenes]
+        heapq.heapify(self._compras)
+        heapq.heapify(self._ventas)
+
+    def _cima(self, monticulo):
+        while monticulo and monticulo[0][1] not in self.ordenes:
+            heapq.heappop(monticulo)
+        return self.ordenes[monticulo[0][1]] if monticulo else None
+
+    def mejor_compra(self):
+        return self._cima(self._compras)
+
+    def mejor_venta(self):
+        return self._cima(self._ventas)
+
+    def contraparte(self, lado, limite=None):
+        """Mejor orden en reposo que cruza con una orden entrante de `lado`.
+
+        `limite` es el precio límite de la orden entrante (None si es de
+        mercado). El llamador la ejecuta y la retira si queda en cero.
+        """
+        if lado == 'compra':
+            orden = self.mejor_venta()
+            if orden is not None and limite is not None and orden['precio'] > limite:
+                return None
+        else:
+            orden = self.mejor_compra()
+            if orden is not None and limite is not None and orden['precio'] < limite:
+                return None
+        return orden
+
+    def mejor_precio_ajeno(self, lado, usuario):
+        """Precio de la mejor contraparte de `lado` que no es de `usuario` (None si no hay)"""
+        orden = self.contraparte(lado)
+        if orden is None or orden['usuario'] != usuario:
+            return orden['precio'] if orden is not None else None
+        # Rara vez la cima es del propio usuario: sólo entonces se recorre el libro
+        monticulo, signo = (self._ventas, 1) if lado == 'compra' else (self._compras, -1)
+        for clave, orden_id in sorted(monticulo):
+            orden = self.ordenes.get(orden_id)
+            if orden is not None and orden['usuario'] != usuario:
+                return clave * signo
+        return None
+
+    def profundidad(self, niveles=10):
+        """Cantidades agregadas por precio en los mejores `niveles` de cada lado"""
+        def agregar_niveles(monticulo, signo):
+            por_precio = {}
+            for clave, orden_id in sorted(monticulo):
+                orden = self.ordenes.get(orden_id)
+                if orden is None:
+                    continue
+                precio = clave * signo
+                if precio not in por_precio and len(por_precio) == niveles:
+                    break
+                por_precio[precio] = por_precio.get(precio, 0) + orden['restante']
+            return [{'precio': precio, 'cantidad': cantidad} for precio, cantidad in por_precio.items()]
+        return {'compras': agregar_niveles(self._compras, -1),
+                'ventas': agregar_niveles(self._ventas, 1)}
+
+
+class MotorOrdenes:
+    """Libros de todos los símbolos más los índices por id y por usuario"""
+
+    def __init__(self):
+        self.libros = {}
+        self._ordenes = {}
+        self._por_usuario = {}
+        self._ultimo_id = 0
+
+    def __len__(self):
+        return len(self._ordenes)
+
+    def nuevo_id(self):
+        self._ultimo_id += 1
+        return self._ultimo_id
+
+    def libro(self, simbolo):
+        libro = self.libros.get(simbolo)
+        if libro is None:
+            libro = self.libros[simbolo] = LibroOrdenes()
+        return libro
+
+    def obtener(self, orden_id):
+        return self._ordenes.get(orden_id)
+
+    def agregar(self, orden):
+        self._ultimo_id = max(self._ultimo_id, orden['id'])
+        self.libro(orden['simbolo']).agregar(orden)
+        self._ordenes[orden['id']] = orden
+        self._por_usuario.setdefault(orden['usuario'], set()).add(orden['id'])
+
+    def retirar(self, orden_id):
+        orden = self._ordenes.pop(orden_id, None)
+        if orden is None:
+            return None
+        self.libros[orden['simbolo']].retirar(orden_id)
+        ids = self._por_usuario[orden['usuario']]
+        ids.discard(orden_id)
+        if not ids:
+            del self._por_usuario[orden['usuario']]
+        return orden
+
+    def abiertas_de(self, usuario):
+        return [self._ordenes[i] for i in sorted(self._por_usuario.get(usuario, ()))]
+
+    def todas(self):
+        return list(self._ordenes.values())
+
+    def exportar(self):
+        return {'ultimo_id': self._ultimo_id,
+                'abiertas': [dict(orden) for orden in self._ordenes.values()]}
+
+    def importar(self, estado):
+        self.__init__()
+        for orden in sorted(estado['abiertas'], key=lambda o: o['id']):
+            self.agregar(dict(orden))
+        self._ultimo_id = estado['ultimo_id']
+
+
+class ProcesadorLotes:
+    """Junta peticiones de muchos hilos y las procesa por lotes en un hilo.
+
+    No hay ventana fija: mientras se procesa un lote, lo que llega se acumula
+    y forma el siguiente, así con poca carga cada petición sale sola y con
+    ráfagas el costo por lote se reparte entre hasta `tamano_maximo`
+    peticiones. `procesar(peticiones)` devuelve un resultado por petición;
+    si un resultado es una excepción, `enviar` la relanza en el hilo que
+    la envió.
+    """
+
+    def __init__(self, nombre, procesar, tamano_maximo=1000):
+        self.nombre = nombre
+        self.procesar = procesar
+        self.tamano_maximo = tamano_maximo
+        self._cola = queue.SimpleQueue()
+        self._hilo = None
+        self._bloqueo = threading.Lock()
+        self.lotes = 0
+        self.peticiones = 0
+
+    def _arrancar(self):
+        with self._bloqueo:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name=self.nombre, daemon=True)
+                self._hilo.start()
+
+    def enviar(self, peticion):
+        if self._hilo is None:
+            self._arrancar()
+        pendiente = {'listo': threading.Event(), 'resultado': None}
+        self._cola.put((peticion, pendiente))
+        pendiente['listo'].wait()
+        if isinstance(pendiente['resultado'], Exception):
+            raise pendiente['resultado']
+        return pendiente['resultado']
+
+    def pendientes(self):
+        """Peticiones en cola que todavía no entraron en un lote"""
+        return self._cola.qsize()
+
+    def _bucle(self):
+        while True:
+            lote = [self._cola.get()]
+            if lote[0] is None:
+                return
+            while len(lote) < self.tamano_maximo:
+                try:
+                    elemento = self._cola.get_nowait()
+                except queue.Empty:
+                    break
+                if elemento is None:
+                    self._cola.put(None)  # terminar después de este lote
+                    break
+                lote.append(elemento)
+            try:
+                resultados = self.procesar([peticion for peticion, _ in lote])
+            except Exception as e:
+                resultados = [e] * len(lote)
+            self.lotes += 1
+            self.peticiones += len(lote)
+            for (_, pendiente), resultado in zip(lote, resultados):
+                pendiente['resultado'] = resultado
+                pendiente['listo'].set()
+
+    def cerrar(self):
+        if self._hilo is not None:
+            self._cola.put(None)
+            self._hilo.join()
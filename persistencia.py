@@ -0,0 +1,278 @@
+"""Motores de almacenamiento para el estado de BancoRealista.
+
+BancoRealista aplica cada operación en memoria y luego la entrega al
+almacén con `registrar(operacion, datos)`. `confirmar(ticket)` espera a que
+la operación sea durable. El almacén por defecto no persiste nada; el
+`AlmacenWAL` escribe un log de escritura anticipada con commit agrupado y
+snapshots periódicos, y reproduce ambos al arrancar.
+"""
+import glob
+import json
+import os
+import pickle
+import threading
+import time
+from collections import deque
+
+
+class AlmacenMemoria:
+    """Sin persistencia: el estado vive sólo en el proceso"""
+
+    def abrir(self, banco):
+        pass
+
+    def registrar(self, operacion, datos):
+        return None
+
+    def confirmar(self, ticket):
+        pass
+
+    def cerrar(self):
+        pass
+
+    def estadisticas(self):
+        return {'motor': 'memoria'}
+
+
+class AlmacenWAL:
+    """Log de escritura anticipada en disco con commit agrupado.
+
+    Cada operación se añade como una línea JSON con un número de secuencia.
+    Un hilo escritor junta todas las operaciones que llegan durante
+    `ventana_commit` segundos y las escribe con un único fsync. Cada
+    `operaciones_por_snapshot` operaciones se guarda un snapshot compacto del
+    banco y se descartan los segmentos del log que ya cubre, de modo que la
+    recuperación sólo reproduce la cola reciente del log.
+    """
+
+    def __init__(self, directorio, ventana_commit=0.002, operaciones_por_snapshot=50000):
+        self.directorio = directorio
+        self.ventana_commit = ventana_commit
+        self.operaciones_por_snapshot = operaciones_por_snapshot
+        self._banco = None
+        self._seq = 0
+        self._durable = 0
+        self._pendientes = []
+        self._corte_rotacion = None
+        self._archivo = None
+        self._ruta_segmento = None
+        self._primer_seq_segmento = 1
+        self._desde_snapshot = 0
+        self._snapshot_en_curso = False
+        self._cerrado = False
+        self._condicion = threading.Condition()
+        self._escritor = None
+
+        # Métricas
+        self._latencias = deque(maxlen=10000)
+        self._lotes = 0
+        self._operaciones_escritas = 0
+        self._recuperacion_segundos = 0.0
+        self._operaciones_reproducidas = 0
+        self._snapshot_segundos = 0.0
+
+    # ----------------------
+    # Arranque y recuperación
+    # ----------------------
+
+    def abrir(self, banco):
+        """Recupera el estado del banco desde disco e inicia el escritor"""
+        os.makedirs(self.directorio, exist_ok=True)
+        self._banco = banco
+        inicio = time.perf_counter()
+
+        corte = 0
+        ruta_snapshot = os.path.join(self.directorio, 'snapshot.pkl')
+        if os.path.exists(ruta_snapshot):
+            with open(ruta_snapshot, 'rb') as f:
+                snapshot = pickle.load(f)
+            corte = snapshot['seq']
+            banco.importar_estado(snapshot['estado'])
+
+        self._seq = corte
+        for ruta in self._segmentos():
+            with open(ruta, 'rb+') as f:
+                while True:
+                    posicion = f.tell()
+                    linea = f.readline()
+                    if not linea:
+                        break
+                    try:
+                        registro = json.loads(linea)
+                    except ValueError:
+                        # Última línea a medio escribir antes de una caída
+                        f.truncate(posicion)
+                        break
+                    if registro['seq'] <= corte:
+                        continue
+                    banco.reproducir(registro['op'], registro['datos'])
+                    self._seq = registro['seq']
+                    self._operaciones_reproducidas += 1
+
+        self._durable = self._seq
+        self._desde_snapshot = self._operaciones_reproducidas
+        self._abrir_segmento(self._seq + 1)
+        self._recuperacion_segundos = time.perf_counter() - inicio
+
+        self._escritor = threading.Thread(target=self._escribir, name='wal-escritor', daemon=True)
+        self._escritor.start()
+
+    def _segmentos(self):
+        rutas = glob.glob(os.path.join(self.directorio, 'wal-*.log'))
+        return sorted(rutas, key=lambda r: int(os.path.basename(r)[4:-4]))
+
+    def _abrir_segmento(self, primer_seq):
+        if self._archivo:
+            self._archivo.close()
+        self._ruta_segmento = os.path.join(self.directorio, f'wal-{primer_seq:012d}.log')
+        self._archivo = open(self._ruta_segmento, 'ab')
+        self._primer_seq_segmento = primer_seq
+
+    # ----------------------
+    # Escritura
+    # ----------------------
+
+    def registrar(self, operacion, datos):
+        """Encola una operación ya aplicada; devuelve el ticket para confirmar"""
+        linea = json.dumps({'op': operacion, 'datos': datos}, ensure_ascii=False)
+        with self._condicion:
+            self._seq += 1
+            seq = self._seq
+            # El seq se inserta al inicio de la línea para no volver a serializar
+            self._pendientes.append((seq, ('{"seq": %d, ' % seq + linea[1:] + '\n').encode()))
+            self._condicion.notify_all()
+        return seq, time.perf_counter()
+
+    def confirmar(self, ticket):
+        """Espera a que la operación del ticket esté escrita y sincronizada"""
+        seq, inicio = ticket
+        with self._condicion:
+            while self._durable < seq and not self._cerrado:
+                self._condicion.wait()
+        self._latencias.append(time.perf_counter() - inicio)
+
+    def _escribir(self):
+        while True:
+            with self._condicion:
+                while not self._pendientes and self._corte_rotacion is None and not self._cerrado:
+                    self._condicion.wait()
+                if self._cerrado and not self._pendientes:
+                    return
+            # Ventana de agrupación: más operaciones por fsync
+            if self.ventana_commit:
+                time.sleep(self.ventana_commit)
+            with self._condicion:
+                lote, self._pendientes = self._pendientes, []
+                corte = self._corte_rotacion
+                self._corte_rotacion = None
+
+            if corte is not None:
+                antes = b''.join(linea for seq, linea in lote if seq <= corte)
+                lote = [(seq, linea) for seq, linea in lote if seq > corte]
+                self._archivo.write(antes)
+                self._sincronizar()
+                self._abrir_segmento(corte + 1)
+            self._archivo.write(b''.join(linea for _, linea in lote))
+            self._sincronizar()
+
+            with self._condicion:
+                if lote:
+                    self._durable = max(self._durable, lote[-1][0])
+                elif corte is not None:
+                    self._durable = max(self._durable, corte)
+                self._lotes += 1
+                self._operaciones_escritas += len(lote)
+                self._desde_snapshot += len(lote)
+                pedir_snapshot = (self._desde_snapshot >= self.operaciones_por_snapshot
+                                  and not self._snapshot_en_curso)
+                if pedir_snapshot:
+                    self._snapshot_en_curso = True
+                self._condicion.notify_all()
+
+            if pedir_snapshot:
+                threading.Thread(target=self.snapshot, name='wal-snapshot', daemon=True).start()
+
+    def _sincronizar(self):
+        self._archivo.flush()
+        os.fsync(self._archivo.fileno())
+
+    # ----------------------
+    # Snapshots
+    # ----------------------
+
+    def snapshot(self):
+        """Guarda un snapshot compacto y descarta los segmentos que cubre"""
+        inicio = time.perf_counter()
+        try:
+            # Con el banco bloqueado ninguna operación puede aplicarse ni
+            # encolarse, así que el estado corresponde exactamente a `corte`.
+            with self._banco.bloqueo_global():
+                with self._condicion:
+                    corte = self._seq
+                    self._corte_rotacion = corte
+                    self._desde_snapshot = 0
+                    self._condicion.notify_all()
+                datos = pickle.dumps({'seq': corte, 'estado': self._banco.exportar_estado()},
+                                     protocol=pickle.HIGHEST_PROTOCOL)
+
+            temporal = os.path.join(self.directorio, 'snapshot.tmp')
+            with open(temporal, 'wb') as f:
+                f.write(datos)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporal, os.path.join(self.directorio, 'snapshot.pkl'))
+            self._sincronizar_directorio()
+
+            # Esperar a que el escritor rote de segmento antes de borrar
+            with self._condicion:
+                while self._primer_seq_segmento <= corte and not self._cerrado:
+                    self._condicion.wait()
+            for ruta in self._segmentos():
+                primer_seq = int(os.path.basename(ruta)[4:-4])
+                if primer_seq <= corte and ruta != self._ruta_segmento:
+                    os.remove(ruta)
+        finally:
+            self._snapshot_segundos = time.perf_counter() - inicio
+            self._snapshot_en_curso = False
+
+    def _sincronizar_directorio(self):
+        try:
+            fd = os.open(self.directorio, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def cerrar(self):
+        """Vacía el log, guarda un snapshot final y detiene el escritor"""
+        if self._escritor is None or self._cerrado:
+            return
+        self.snapshot()
+        with self._condicion:
+            self._cerrado = True
+            self._condicion.notify_all()
+        self._escritor.join()
+        self._archivo.close()
+
+    def estadisticas(self):
+        latencias = sorted(self._latencias)
+
+        def percentil(p):
+            if not latencias:
+                return 0.0
+            return latencias[min(len(latencias) - 1, int(len(latencias) * p))] * 1000
+
+        return {
+            'motor': 'wal',
+            'directorio': self.directorio,
+            'secuencia': self._seq,
+            'recuperacion_segundos': round(self._recuperacion_segundos, 4),
+            'operaciones_reproducidas': self._operaciones_reproducidas,
+            'ultimo_snapshot_segundos': round(self._snapshot_segundos, 4),
+            'latencia_commit_p50_ms': round(percentil(0.50), 3),
+            'latencia_commit_p99_ms': round(percentil(0.99), 3),
+            'lotes_escritos': self._lotes,
+            'operaciones_por_lote': round(self._operaciones_escritas / self._lotes, 2) if self._lotes else 0,
+        }
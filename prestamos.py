@@ -0,0 +1,126 @@
+"""Servicio de préstamos: tablas de amortización y cierre de mes.
+
+Los préstamos usan cuota fija (sistema francés) sobre la tasa anual.
+`monto_restante` es el saldo adeudado: capital más intereses devengados y
+no pagados. El cierre de mes recorre todos los préstamos en una sola
+pasada: devenga el interés del mes, cobra la cuota (más lo atrasado) del
+saldo disponible de cada usuario y marca la mora.
+"""
+
+# Meses seguidos sin pagar completo a partir de los cuales un préstamo se
+# considera incobrable
+MESES_INCOBRABLE = 3
+
+# Saldo por debajo del cual un préstamo se da por pagado
+TOLERANCIA_PAGO = 0.005
+
+ESTADOS_VIGENTES = ('activo', 'en_mora')
+
+
+def cuota_fija(monto, tasa_anual, plazo_meses):
+    """Cuota mensual constante que amortiza `monto` en `plazo_meses`"""
+    tasa = tasa_anual / 12
+    if not tasa:
+        return monto / plazo_meses
+    return monto * tasa / (1 - (1 + tasa) ** -plazo_meses)
+
+
+def tabla_amortizacion(monto, tasa_anual, plazo_meses):
+    """Cuota, interés, capital y saldo de cada mes"""
+    tasa = tasa_anual / 12
+    cuota = cuota_fija(monto, tasa_anual, plazo_meses)
+    saldo = monto
+    tabla = []
+    for mes in range(1, plazo_meses + 1):
+        interes = saldo * tasa
+        capital = cuota - interes if mes < plazo_meses else saldo
+        saldo -= capital
+        tabla.append({'mes': mes, 'cuota': interes + capital, 'interes': interes,
+                      'capital': capital, 'saldo': max(saldo, 0)})
+    return tabla
+
+
+def nuevo_prestamo(prestamo_id, monto, tasa_anual, plazo_meses, fecha):
+    return {
+        'id': prestamo_id,
+        'monto_original': monto,
+        'monto_restante': monto,
+        'tasa_interes': tasa_anual,
+        'plazo_meses': plazo_meses,
+        'cuota_mensual': cuota_fija(monto, tasa_anual, plazo_meses),
+        'cuotas_restantes': plazo_meses,
+        'atrasado': 0,
+        'meses_en_mora': 0,
+        'fecha_otorgamiento': fecha,
+        'estado': 'activo'
+    }
+
+
+def cerrar_mes(prestamos, saldos, mes):
+    """Calcula el cierre de `mes` ('AAAA-MM') para todos los préstamos.
+
+    `prestamos` son pares (usuario, prestamo) y `saldos` el saldo disponible
+    de cada usuario, que se va consumiendo préstamo a préstamo. No modifica
+    nada: devuelve los cambios de cada préstamo, lo cobrado a cada usuario
+    y un resumen, para que el banco los aplique con sus primitivas.
+
+    Un préstamo otorgado durante `mes` (aunque sea el último día) no entra:
+    su primer interés y su primera cuota son los del mes siguiente.
+    """
+    cambios = []
+    cobros = {}
+    # Acumuladores locales: esta pasada recorre millones de préstamos
+    total_prestamos = total_interes = total_cobrado = 0
+    en_mora = incobrables = pagados = 0
+    vigentes = ESTADOS_VIGENTES
+    agregar_cambio = cambios.append
+    for usuario, prestamo in prestamos:
+        if prestamo['estado'] not in vigentes or prestamo['fecha_otorgamiento'][:7] >= mes:
+            continue
+        # Préstamos anteriores al motor no traen cuotas_restantes/atrasado/meses_en_mora
+        cuotas_restantes = prestamo.get('cuotas_restantes', prestamo['plazo_meses'])
+        atrasado = prestamo.get('atrasado', 0)
+        saldo = prestamo['monto_restante']
+
+        interes = saldo * prestamo['tasa_interes'] / 12
+        saldo += interes
+        exigible = prestamo['cuota_mensual'] + atrasado if cuotas_restantes > 1 else saldo
+        if exigible > saldo:
+            exigible = saldo
+        disponible = saldos.get(usuario, 0)
+        pagado = exigible if disponible >= exigible else (disponible if disponible > 0 else 0)
+        if pagado:
+            saldos[usuario] = disponible - pagado
+            cobros[usuario] = cobros.get(usuario, 0) + pagado
+        saldo -= pagado
+        atrasado = exigible - pagado
+
+        if atrasado > TOLERANCIA_PAGO:
+            meses_en_mora = prestamo.get('meses_en_mora', 0) + 1
+        else:
+            meses_en_mora = 0
+        if saldo <= TOLERANCIA_PAGO:
+            estado, saldo, atrasado = 'pagado', 0, 0
+            pagados += 1
+        elif meses_en_mora >= MESES_INCOBRABLE:
+            estado = 'incobrable'
+            incobrables += 1
+        elif meses_en_mora:
+            estado = 'en_mora'
+            en_mora += 1
+        else:
+            estado = 'activo'
+
+        agregar_cambio((usuario, prestamo['id'], {
+            'monto_restante': saldo,
+            'cuotas_restantes': cuotas_restantes - 1 if cuotas_restantes else 0,
+            'atrasado': atrasado,
+            'meses_en_mora': meses_en_mora,
+            'estado': estado,
+        }))
+        total_prestamos += 1
+        total_interes += interes
+        total_cobrado += pagado
+    resumen = {'mes': mes, 'prestamos': total_prestamos, 'interes': total_interes, 'cobrado': total_cobrado,
+               'en_mora': en_mora, 'incobrables': incobrables, 'pagados': pagados}
+    return cambios, cobros, resumen
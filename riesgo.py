@@ -0,0 +1,218 @@
+"""Análisis de riesgo de crédito.
+
+`PerfilesRiesgo` resume el libro de transacciones en un perfil por usuario
+(entradas y salidas por mes, pérdidas en apuestas) y lo mantiene al
+día de forma incremental: cada actualización lee sólo las transacciones
+nuevas desde la anterior. Los depósitos y retiros pendientes de aprobación
+se apartan y se cuentan cuando se resuelven.
+
+El modelo que decide es intercambiable: cualquier objeto con
+`evaluar(caracteristicas, cuota)` que devuelva una `Evaluacion`.
+"""
+import math
+import threading
+from collections import namedtuple
+
+from prestamos import ESTADOS_VIGENTES, cuota_fija
+
+# Ingreso mensual que se supone a quien todavía no tiene movimientos
+INGRESO_SUPUESTO = 2000
+
+# Parte del ingreso mensual que puede ir a cuotas de préstamos
+CAPACIDAD_PAGO = 0.3
+
+ENTRADAS = {'abono', 'transferencia_recibida', 'interes', 'venta_acciones', 'deposito'}
+SALIDAS = {'cargo', 'transferencia_enviada', 'compra_acciones', 'retiro'}
+PENDIENTE = 'pendiente_aprobacion'
+
+CARACTERISTICAS = ('ingreso_mensual', 'gasto_mensual', 'perdidas_apuestas', 'saldo', 'deuda',
+                   'cuotas', 'prestamos_en_mora', 'meses_historial')
+
+# `puntaje` es la probabilidad estimada de impago, de 0 a 1
+Evaluacion = namedtuple('Evaluacion', 'aprobado puntaje motivo')
+
+
+class Perfil:
+    """Movimientos acumulados de un usuario"""
+
+    __slots__ = ('entradas', 'salidas', 'perdido', 'meses')
+
+    def __init__(self):
+        self.entradas = 0
+        self.salidas = 0
+        self.perdido = 0
+        self.meses = set()
+
+
+class PerfilesRiesgo:
+    """Perfiles de todos los usuarios, construidos a partir del libro"""
+
+    def __init__(self, libro):
+        self.libro = libro
+        self._perfiles = {}
+        self._siguiente = 0
+        self._pendientes = set()
+        self._bloqueo = threading.Lock()
+
+    def actualizar(self):
+        """Incorpora las transacciones nuevas y las pendientes ya resueltas"""
+        with self._bloqueo:
+            for transaccion in self.libro.desde(self._siguiente):
+                self._siguiente = transaccion['id'] + 1
+                if transaccion['estado'] == PENDIENTE:
+                    self._pendientes.add(transaccion['id'])
+                else:
+                    self._incorporar(transaccion)
+            for trans_id in list(self._pendientes):
+                transaccion = self.libro[trans_id]
+                if transaccion['estado'] != PENDIENTE:
+                    self._pendientes.discard(trans_id)
+                    self._incorporar(transaccion)
+
+    def _incorporar(self, transaccion):
+        perfil = self._perfiles.get(transaccion['usuario'])
+        if perfil is None:
+            perfil = self._perfiles[transaccion['usuario']] = Perfil()
+        tipo = transaccion['tipo']
+        monto = abs(transaccion['monto'])
+        perfil.meses.add(transaccion['fecha'][:7])
+        if tipo in ('deposito', 'retiro') and transaccion['estado'] != 'aprobado':
+            return
+        if tipo in ENTRADAS:
+            perfil.entradas += monto
+        elif tipo in SALIDAS:
+            perfil.salidas += monto
+        elif tipo in ('apuesta_deportiva', 'premio_apuesta'):
+            # Las apuestas van en negativo y los premios en positivo
+            perfil.perdido -= transaccion['monto']
+
+    def perfil(self, usuario):
+        return self._perfiles.get(usuario) or Perfil()
+
+    def caracteristicas(self, usuario, saldo, prestamos):
+        """Vector de CARACTERISTICAS (como dict) de un usuario"""
+        perfil = self.perfil(usuario)
+        meses = len(perfil.meses)
+        vigentes = [p for p in prestamos if p.get('estado', 'activo') in ESTADOS_VIGENTES]
+        return {
+            'ingreso_mensual': perfil.entradas / meses if perfil.entradas else INGRESO_SUPUESTO,
+            'gasto_mensual': perfil.salidas / meses if meses else 0,
+            'perdidas_apuestas': max(perfil.perdido, 0) / meses if meses else 0,
+            'saldo': saldo,
+            'deuda': sum(p['monto_restante'] for p in vigentes),
+            'cuotas': sum(p['cuota_mensual'] for p in vigentes),
+            'prestamos_en_mora': sum(1 for p in prestamos if p.get('estado') in ('en_mora', 'incobrable')),
+            'meses_historial': meses,
+        }
+
+
+# ----------------------
+# Modelos
+# ----------------------
+
+class ModeloReglas:
+    """La regla de siempre (cuotas hasta el 30% del ingreso), con el
+    ingreso estimado del historial en lugar de uno fijo"""
+
+    nombre = 'reglas'
+
+    def evaluar(self, caracteristicas, cuota):
+        if caracteristicas['prestamos_en_mora']:
+            return Evaluacion(False, 1.0, 'Tiene préstamos en mora')
+        disponible = caracteristicas['ingreso_mensual'] - caracteristicas['perdidas_apuestas']
+        carga = (caracteristicas['cuotas'] + cuota) / disponible if disponible > 0 else math.inf
+        if carga > CAPACIDAD_PAGO:
+            return Evaluacion(False, min(1.0, carga), 'Capacidad de pago insuficiente')
+        return Evaluacion(True, carga, 'Capacidad de pago suficiente')
+
+
+class ModeloLogistico:
+    """Regresión logística sobre razones derivadas del perfil.
+
+    Los pesos no salen de un entrenamiento: están elegidos a mano para que
+    la carga de cuotas y las pérdidas en apuestas suban el riesgo y el
+    saldo y la antigüedad lo bajen.
+    """
+
+    nombre = 'logistico'
+
+    PESOS = {
+        'carga': 6.0,            # (cuotas + nueva cuota) / ingreso
+        'apuestas': 3.0,         # pérdidas en apuestas / ingreso
+        'gasto': 1.0,            # gasto / ingreso
+        'mora': 2.5,             # préstamos en mora o incobrables
+        'colchon': -0.3,         # meses de cuotas que cubre el saldo (hasta 12)
+        'antiguedad': -0.1,      # meses con movimientos (hasta 24)
+    }
+    SESGO = -3.0
+
+    def __init__(self, umbral=0.2):
+        self.umbral = umbral
+
+    def razones(self, caracteristicas, cuota):
+        ingreso = max(caracteristicas['ingreso_mensual'], 1)
+        cuotas = caracteristicas['cuotas'] + cuota
+        return {
+            'carga': cuotas / ingreso,
+            'apuestas': caracteristicas['perdidas_apuestas'] / ingreso,
+            'gasto': min(caracteristicas['gasto_mensual'] / ingreso, 3),
+            'mora': caracteristicas['prestamos_en_mora'],
+            'colchon': min(caracteristicas['saldo'] / cuotas, 12) if cuotas else 12,
+            'antiguedad': min(caracteristicas['meses_historial'], 24),
+        }
+
+    def evaluar(self, caracteristicas, cuota):
+        razones = self.razones(caracteristicas, cuota)
+        z = self.SESGO + sum(self.PESOS[clave] * valor for clave, valor in razones.items())
+        puntaje = 1 / (1 + math.exp(-z))
+        if puntaje >= self.umbral:
+            # El motivo es la razón que más empuja hacia el rechazo
+            peor = max(razones, key=lambda clave: self.PESOS[clave] * razones[clave])
+            return Evaluacion(False, puntaje, f'Riesgo alto ({peor})')
+        return Evaluacion(True, puntaje, 'Riesgo aceptable')
+
+
+MODELOS = {'reglas': ModeloReglas, 'logistico': ModeloLogistico}
+
+
+# ----------------------
+# Servicio
+# ----------------------
+
+class ServicioRiesgo:
+    """Evalúa solicitudes de préstamo y la cartera con el modelo activo"""
+
+    def __init__(self, banco, modelo=None):
+        self.banco = banco
+        self.modelo = modelo or ModeloReglas()
+        self.perfiles = PerfilesRiesgo(banco.transacciones)
+
+    def evaluar(self, usuario, monto, plazo_meses):
+        """Evaluación de una solicitud de `monto` a `plazo_meses`"""
+        self.perfiles.actualizar()
+        caracteristicas = self.perfiles.caracteristicas(
+            usuario, self.banco.saldo(usuario), self.banco.prestamos_de(usuario))
+        cuota = cuota_fija(monto, self.banco.tasa_interes_activa, plazo_meses)
+        return self.modelo.evaluar(caracteristicas, cuota)
+
+    def evaluar_cartera(self):
+        """Vuelve a puntuar a todos los deudores con préstamos vigentes.
+
+        Una pasada sobre los préstamos y los saldos; devuelve una lista
+        ordenada del mayor al menor riesgo.
+        """
+        self.perfiles.actualizar()
+        por_usuario = {}
+        for usuario, prestamo in self.banco._todos_los_prestamos():
+            por_usuario.setdefault(usuario, []).append(prestamo)
+        saldos = self.banco._saldos()
+        cartera = []
+        for usuario, prestamos in por_usuario.items():
+            caracteristicas = self.perfiles.caracteristicas(usuario, saldos.get(usuario, 0), prestamos)
+            if not caracteristicas['deuda']:
+                continue
+            evaluacion = self.modelo.evaluar(caracteristicas, 0)
+            cartera.append({'usuario': usuario, 'puntaje': evaluacion.puntaje, 'motivo': evaluacion.motivo,
+                            'deuda': caracteristicas['deuda'], 'cuotas': caracteristicas['cuotas']})
+        cartera.sort(key=lambda fila: fila['puntaje'], reverse=True)
+        return cartera
@@ -0,0 +1,69 @@
+"""Cola de solicitudes pendientes de aprobación"""
+import threading
+
+
+class ColaSolicitudes:
+    """Solicitudes de depósito/retiro pendientes, indexadas por id.
+
+    Los ids son crecientes y nunca se reutilizan. Cada solicitud queda
+    enlazada con su fila del libro de transacciones, de modo que aprobarla
+    o rechazarla no requiere recorrer ni la cola ni el libro.
+    """
+
+    def __init__(self):
+        self._pendientes = {}
+        self._transaccion_de = {}
+        self._ultimo_id = 0
+        self._bloqueo = threading.Lock()
+
+    def __len__(self):
+        return len(self._pendientes)
+
+    def __iter__(self):
+        return iter(list(self._pendientes.values()))
+
+    def __contains__(self, solicitud_id):
+        return solicitud_id in self._pendientes
+
+    def nuevo_id(self):
+        with self._bloqueo:
+            self._ultimo_id += 1
+            return self._ultimo_id
+
+    def agregar(self, solicitud, trans_id):
+        """Encola una solicitud (con su 'id' ya asignado) y la enlaza al libro"""
+        with self._bloqueo:
+            # Al reproducir el log los ids llegan ya asignados
+            self._ultimo_id = max(self._ultimo_id, solicitud['id'])
+            self._pendientes[solicitud['id']] = solicitud
+            self._transaccion_de[solicitud['id']] = trans_id
+
+    def obtener(self, solicitud_id):
+        return self._pendientes.get(solicitud_id)
+
+    def retirar(self, solicitud_id):
+        """Saca una solicitud de la cola y devuelve (solicitud, trans_id).
+
+        Devuelve (None, None) si no existe o ya fue procesada; así dos
+        administradores no pueden procesar la misma solicitud a la vez.
+        """
+        with self._bloqueo:
+            solicitud = self._pendientes.pop(solicitud_id, None)
+            trans_id = self._transaccion_de.pop(solicitud_id, None)
+            return solicitud, trans_id
+
+    def ids(self):
+        return list(self._pendientes)
+
+    def exportar(self):
+        with self._bloqueo:
+            return {
+                'ultimo_id': self._ultimo_id,
+                'pendientes': [(s, self._transaccion_de[i]) for i, s in self._pendientes.items()],
+            }
+
+    def importar(self, estado):
+        with self._bloqueo:
+            self._ultimo_id = estado['ultimo_id']
+            self._pendientes = {s['id']: s for s, _ in estado['pendientes']}
+            self._transaccion_de = {s['id']: trans_id for s, trans_id in estado['pendientes']}
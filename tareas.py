@@ -0,0 +1,36 @@
+"""Tareas de fondo del banco"""
+import threading
+import time
+
+from metricas import Histograma
+
+
+class TareaPeriodica:
+    """Ejecuta una función cada `intervalo` segundos en un hilo de fondo"""
+
+    def __init__(self, nombre, intervalo, funcion):
+        self.nombre = nombre
+        self.intervalo = intervalo
+        self.funcion = funcion
+        self.errores = 0
+        # Cuánto tarda cada ejecución (ver /metrics)
+        self.duracion = Histograma()
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._bucle, name=nombre, daemon=True)
+
+    def iniciar(self):
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self._detener.set()
+
+    def _bucle(self):
+        while not self._detener.wait(self.intervalo):
+            inicio = time.perf_counter()
+            try:
+                self.funcion()
+            except Exception as e:  # una tarea fallida no debe matar el hilo
+                self.errores += 1
+                print(f"⚠️ Error en tarea {self._hilo.name}: {e}")
+            self.duracion.registrar(time.perf_counter() - inicio)
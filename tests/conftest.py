@@ -0,0 +1,70 @@
+"""Fixtures comunes: bancos en memoria y en SQLite y la app de Flask"""
+import itertools
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from banco_realista import BancoRealista  # noqa: E402
+from banco_sqlite import BancoSQLite  # noqa: E402
+
+_nombres = itertools.count(1)
+
+
+def nuevo_usuario(banco, saldo=1000, prefijo='cliente'):
+    """Da de alta un cliente con nombre único y devuelve su usuario"""
+    usuario = f'{prefijo}{next(_nombres)}'
+    banco.registrar_usuario(usuario, 'clave', usuario.title(), f'{usuario}@chiquibank.test', saldo)
+    return usuario
+
+
+@pytest.fixture
+def banco():
+    banco = BancoRealista()
+    yield banco
+    banco.cerrar()
+
+
+@pytest.fixture
+def banco_sqlite(tmp_path):
+    banco = BancoSQLite(str(tmp_path / 'banco.db'))
+    yield banco
+    banco.cerrar()
+
+
+@pytest.fixture(params=['memoria', 'sqlite'])
+def bancos(request, tmp_path):
+    """El mismo test contra los dos backends"""
+    if request.param == 'memoria':
+        banco = BancoRealista()
+    else:
+        banco = BancoSQLite(str(tmp_path / 'banco.db'))
+    yield banco
+    banco.cerrar()
+
+
+@pytest.fixture(scope='session')
+def modulo_app():
+    # app arma su banco al importarse: en memoria y sin log en disco
+    for variable in ('CHIQUIBANK_BACKEND', 'CHIQUIBANK_DATOS'):
+        os.environ.pop(variable, None)
+    import app
+    yield app
+    app.banco.cerrar()
+
+
+@pytest.fixture
+def cliente(modulo_app):
+    limites = modulo_app.limitador.limites
+    modulo_app.limitador.limites = {}
+    yield modulo_app.app.test_client()
+    modulo_app.limitador.limites = limites
+
+
+def iniciar_sesion(cliente, usuario, tipo='usuario'):
+    with cliente.session_transaction() as sesion:
+        sesion['usuario'] = usuario
+        sesion['tipo'] = tipo
+        sesion['nombre'] = usuario.title()
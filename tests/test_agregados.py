@@ -0,0 +1,57 @@
+import pytest
+
+from agregados import Agregados
+from banco_realista import ErrorBanco
+from banco_sqlite import BancoSQLite
+from conftest import nuevo_usuario
+
+
+def test_reconciliar_corrige_y_devuelve_las_diferencias():
+    agregados = Agregados()
+    agregados.sumar('total_depositos', 100)
+    agregados.sumar('total_usuarios', 1)
+    diferencias = agregados.reconciliar({'total_usuarios': 1, 'total_depositos': 90, 'total_prestamos': 0})
+    assert diferencias == {'total_depositos': -10}
+    assert agregados.total_depositos == 90
+    assert agregados.ultima_reconciliacion['diferencias'] == diferencias
+
+
+def test_totales_incrementales_coinciden_con_el_recalculo(bancos):
+    ana, beto = nuevo_usuario(bancos, saldo=500), nuevo_usuario(bancos, saldo=300)
+    bancos.transferir(ana, beto, 120)
+    bancos.acreditar('admin', 75)
+    bancos.otorgar_prestamo(beto, 1000, 12)
+    with pytest.raises(ErrorBanco):
+        bancos.transferir(ana, beto, 10 ** 6)
+    bancos.apostar_deportes(ana, 1, 50, 'empate')
+    assert bancos.agregados.como_dict() == pytest.approx(bancos.calcular_agregados())
+    assert bancos.reconciliar_agregados() == {}
+
+
+def test_sqlite_comparte_los_totales_entre_workers(tmp_path):
+    ruta = str(tmp_path / 'banco.db')
+    uno, otro = BancoSQLite(ruta), BancoSQLite(ruta)
+    try:
+        nuevo_usuario(uno, saldo=200)
+        nuevo_usuario(otro, saldo=50)
+        esperado = {'total_usuarios': 2, 'total_depositos': 250, 'total_prestamos': 0}
+        assert uno.agregados.como_dict() == esperado
+        assert otro.agregados.como_dict() == esperado
+        uno.reconciliar_agregados()
+        assert otro.agregados.ultima_reconciliacion['diferencias'] == {}
+    finally:
+        uno.cerrar()
+        otro.cerrar()
+
+
+def test_sqlite_deshace_los_totales_de_una_operacion_fallida(banco_sqlite, monkeypatch):
+    usuario = nuevo_usuario(banco_sqlite, saldo=100)
+    antes = banco_sqlite.agregados.como_dict()
+
+    def falla(*args, **kwargs):
+        raise ErrorBanco('falla después de mover saldos')
+    monkeypatch.setattr(banco_sqlite.transacciones, 'append', falla)
+    with pytest.raises(ErrorBanco):
+        banco_sqlite.acreditar(usuario, 40)
+    assert banco_sqlite.agregados.como_dict() == antes
+    assert banco_sqlite.saldo(usuario) == 100
@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+from apuestas import Evento, MotorApuestas
+from banco_realista import ErrorBanco
+from conftest import nuevo_usuario
+
+
+def test_evento_abre_con_sus_cuotas_iniciales_y_baja_lo_apostado():
+    cuotas = {'local': 2.1, 'empate': 3.0, 'visitante': 3.2}
+    evento = Evento.con_cuotas(1, 'A vs B', cuotas)
+    assert evento.cuotas() == cuotas
+    assert evento.apostar('ana', 'local', 1000) == 2.1
+    assert evento.cuotas()['local'] < 2.1
+    assert evento.cuotas()['visitante'] > 3.2
+
+
+def test_liquidar_paga_una_vez_por_ganador():
+    evento = Evento.con_cuotas(1, 'A vs B', {'local': 2.0, 'empate': 3.5, 'visitante': 4.0})
+    primera = evento.apostar('ana', 'local', 10)
+    segunda = evento.apostar('ana', 'local', 10)
+    evento.apostar('beto', 'visitante', 10)
+    assert evento.liquidar('local') == {'ana': pytest.approx(10 * primera + 10 * segunda)}
+    assert (evento.estado, evento.resultado) == ('liquidado', 'local')
+
+
+def test_ids_de_eventos_unicos_entre_hilos():
+    motor = MotorApuestas()
+    ids = []
+    hilos = [threading.Thread(target=lambda: ids.extend(motor.nuevo_id() for _ in range(500)))
+             for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert sorted(ids) == list(range(1, 4001))
+
+
+def test_ciclo_de_un_evento(bancos):
+    ganador = nuevo_usuario(bancos, saldo=100)
+    perdedor = nuevo_usuario(bancos, saldo=100)
+    evento = bancos.crear_evento('Local vs Visita', 2.0, 3.5, 4.0)
+    assert (evento['cuota_local'], evento['cuota_empate'], evento['cuota_visitante']) == (2.0, 3.5, 4.0)
+
+    apuesta = bancos.apostar_deportes(ganador, evento['id'], 50, 'local')
+    bancos.apostar_deportes(perdedor, evento['id'], 50, 'visitante')
+    # Sólo se liquida un evento cerrado, y cerrado ya no acepta apuestas
+    with pytest.raises(ErrorBanco) as error:
+        bancos.liquidar_evento(evento['id'], 'local')
+    assert error.value.codigo == 409
+    bancos.cerrar_evento(evento['id'])
+    with pytest.raises(ErrorBanco) as error:
+        bancos.apostar_deportes(perdedor, evento['id'], 10, 'local')
+    assert error.value.codigo == 409
+
+    resultado = bancos.liquidar_evento(evento['id'], 'local')
+    assert (resultado['apuestas'], resultado['ganadores']) == (2, 1)
+    assert bancos.saldo(ganador) == pytest.approx(50 + apuesta['premio_posible'])
+    assert bancos.saldo(perdedor) == pytest.approx(50)
+    with pytest.raises(ErrorBanco):
+        bancos.liquidar_evento(evento['id'], 'local')
+    assert bancos.verificar_diario()['descuadre'] == pytest.approx(0, abs=1e-6)
+
+
+@pytest.mark.parametrize('cuotas', [(3.0, 4.0, 5.0), (2.0, 3.0, 1.0), ('2', 3.0, 3.0)])
+def test_crear_evento_rechaza_cuotas_sin_margen_o_invalidas(bancos, cuotas):
+    # 1/3 + 1/4 + 1/5 < 1: el banco perdería con cualquier resultado
+    with pytest.raises(ErrorBanco):
+        bancos.crear_evento('Sin margen', *cuotas)
+
+
+def test_eventos_creados_a_la_vez_tienen_ids_distintos(bancos):
+    ids = []
+    hilos = [threading.Thread(target=lambda i=i: ids.append(bancos.crear_evento(f'Evento {i}', 2.0, 3.0, 3.0)['id']))
+             for i in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert len(set(ids)) == 8
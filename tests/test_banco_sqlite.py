@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+from banco_realista import ErrorBanco
+from banco_sqlite import BancoSQLite, PoolConexiones
+from conftest import nuevo_usuario
+
+
+def test_pool_da_una_conexion_por_hilo(tmp_path):
+    pool = PoolConexiones(str(tmp_path / 'pool.db'))
+    conexiones = []
+    hilo = threading.Thread(target=lambda: conexiones.append(pool.conexion()))
+    hilo.start()
+    hilo.join()
+    assert pool.conexion() is pool.conexion()
+    assert conexiones[0] is not pool.conexion()
+    assert len(pool) == 2
+    assert pool.conexion().execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    pool.cerrar()
+
+
+def test_transaccion_anidada_se_une_a_la_exterior(tmp_path):
+    pool = PoolConexiones(str(tmp_path / 'pool.db'))
+    pool.conexion().execute('CREATE TABLE t (x)')
+    with pytest.raises(RuntimeError):
+        with pool.transaccion() as con:
+            con.execute('INSERT INTO t VALUES (1)')
+            with pool.transaccion() as interna:
+                interna.execute('INSERT INTO t VALUES (2)')
+            raise RuntimeError
+    assert pool.conexion().execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+    pool.cerrar()
+
+
+def test_el_estado_sobrevive_a_reabrir_la_base(tmp_path):
+    ruta = str(tmp_path / 'banco.db')
+    banco = BancoSQLite(ruta)
+    ana, beto = nuevo_usuario(banco, saldo=500), nuevo_usuario(banco, saldo=0)
+    banco.transferir(ana, beto, 120)
+    banco.otorgar_prestamo(ana, 1000, 12)
+    numero = banco.usuarios[beto]['numero_cuenta']
+    banco.cerrar()
+
+    banco = BancoSQLite(ruta)
+    try:
+        assert banco.saldo(beto) == pytest.approx(120)
+        assert banco.saldo(ana) == pytest.approx(380 + 1000)
+        assert len(banco.prestamos_de(ana)) == 1
+        assert banco.buscar_por_cuenta(numero) == beto
+        assert banco.verificar_diario()['descuadre'] == pytest.approx(0, abs=1e-6)
+    finally:
+        banco.cerrar()
+
+
+def test_operacion_rechazada_no_deja_rastro(banco_sqlite):
+    ana, beto = nuevo_usuario(banco_sqlite, saldo=50), nuevo_usuario(banco_sqlite, saldo=0)
+    transacciones = len(banco_sqlite.transacciones)
+    with pytest.raises(ErrorBanco):
+        banco_sqlite.transferir(ana, beto, 80)
+    assert banco_sqlite.saldo(ana) == 50
+    assert banco_sqlite.saldo(beto) == 0
+    assert len(banco_sqlite.transacciones) == transacciones
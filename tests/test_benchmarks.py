@@ -0,0 +1,46 @@
+import importlib.util
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CARGA = os.path.join(RAIZ, 'benchmarks', 'carga.py')
+
+
+def _carga():
+    spec = importlib.util.spec_from_file_location('carga', CARGA)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def _resultados(por_segundo, p99_ms, rss_mb=100):
+    return {'resultados': {'cliente': {'login': {'por_segundo': por_segundo, 'p50_ms': 1.0, 'p99_ms': p99_ms}}},
+            'rss_mb': rss_mb}
+
+
+def test_comparar_marca_lo_que_empeora_mas_que_la_tolerancia():
+    comparar = _carga().comparar
+    base = _resultados(1000, 10)
+    assert comparar(_resultados(800, 12), base, 0.25) == []
+    assert comparar(_resultados(700, 10), base, 0.25) == [('cliente', 'login', 'por_segundo', 1000, 700)]
+    assert comparar(_resultados(1000, 13, rss_mb=130), base, 0.25) == [
+        ('cliente', 'login', 'p99_ms', 10, 13), ('proceso', '-', 'rss_mb', 100, 130)]
+    # Un escenario que la línea base no tiene no se compara
+    assert comparar(_resultados(1, 1000), {'resultados': {}, 'rss_mb': 100}, 0.25) == []
+
+
+def test_carga_recorre_todas_las_rutas_sin_errores(tmp_path):
+    entorno = {clave: valor for clave, valor in os.environ.items()
+               if clave not in ('CHIQUIBANK_BACKEND', 'CHIQUIBANK_DATOS')}
+    salida = subprocess.run(
+        [sys.executable, CARGA, '--usuarios', '20', '--transacciones', '100', '--prestamos', '2',
+         '--posiciones', '5', '--peticiones', '10', '--hilos', '2', '--modos', 'cliente'],
+        cwd=tmp_path, env=entorno, capture_output=True, text=True, timeout=120)
+    assert salida.returncode == 0, salida.stderr
+    escenarios = _carga().ESCENARIOS
+    filas = {columnas[0]: columnas for columnas in map(str.split, salida.stdout.splitlines())
+             if columnas and columnas[0] in escenarios}
+    assert set(filas) == set(escenarios)
+    # La columna 5xx de cada ruta
+    assert all(columnas[5] == '0' for columnas in filas.values())
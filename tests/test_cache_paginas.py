@@ -0,0 +1,70 @@
+import pytest
+
+from cache_paginas import CachePaginas
+from conftest import iniciar_sesion, nuevo_usuario
+
+
+def test_acierta_solo_con_la_misma_version():
+    cache = CachePaginas()
+    assert cache.obtener(('panel', 'ana'), 1) is None
+    guardada = cache.guardar(('panel', 'ana'), 1, '<p>hola</p>')
+    assert cache.obtener(('panel', 'ana'), 1) is guardada
+    assert cache.obtener(('panel', 'ana'), 2) is None
+    assert cache.obtener(('panel', 'beto'), 1) is None
+    assert cache.estadisticas()['aciertos'] == 1
+    assert cache.estadisticas()['fallos'] == 3
+
+
+def test_desaloja_la_menos_pedida():
+    cache = CachePaginas(max_entradas=2)
+    cache.guardar('a', 1, 'A')
+    cache.guardar('b', 1, 'B')
+    cache.obtener('a', 1)
+    cache.guardar('c', 1, 'C')
+    assert cache.obtener('b', 1) is None
+    assert cache.obtener('a', 1).html == 'A'
+    assert cache.estadisticas()['desalojos'] == 1
+
+
+def test_etag_depende_del_html():
+    cache = CachePaginas()
+    assert cache.guardar('a', 1, 'X').etag == cache.guardar('b', 2, 'X').etag
+    assert cache.guardar('a', 3, 'Y').etag != cache.obtener('b', 2).etag
+
+
+@pytest.fixture
+def cache(modulo_app, monkeypatch):
+    cache = CachePaginas()
+    monkeypatch.setattr(modulo_app, 'cache_paginas', cache)
+    return cache
+
+
+def test_pagina_se_renderiza_una_vez_por_version(cliente, modulo_app, cache):
+    usuario = nuevo_usuario(modulo_app.banco)
+    iniciar_sesion(cliente, usuario)
+    primera = cliente.get('/prestamos')
+    segunda = cliente.get('/prestamos')
+    assert primera.status_code == segunda.status_code == 200
+    assert segunda.data == primera.data
+    assert segunda.headers['ETag'] == primera.headers['ETag']
+    assert (cache.fallos, cache.aciertos) == (1, 1)
+
+    # Sin cambios, una recarga condicional no lleva cuerpo
+    condicional = cliente.get('/prestamos', headers={'If-None-Match': primera.headers['ETag']})
+    assert condicional.status_code == 304
+    assert condicional.data == b''
+
+    # Un préstamo cambia la versión del usuario y la página se vuelve a armar
+    modulo_app.banco.otorgar_prestamo(usuario, 500, 12)
+    cambiada = cliente.get('/prestamos', headers={'If-None-Match': primera.headers['ETag']})
+    assert cambiada.status_code == 200
+    assert cambiada.headers['ETag'] != primera.headers['ETag']
+    assert cache.fallos == 2
+
+
+def test_cada_usuario_tiene_su_pagina(cliente, modulo_app, cache):
+    for usuario in (nuevo_usuario(modulo_app.banco), nuevo_usuario(modulo_app.banco)):
+        iniciar_sesion(cliente, usuario)
+        assert cliente.get('/prestamos').status_code == 200
+    assert cache.estadisticas()['paginas'] == 2
+    assert cache.aciertos == 0
@@ -0,0 +1,93 @@
+import math
+import random
+import sys
+import threading
+
+import pytest
+
+from banco_realista import ErrorBanco
+from bloqueos import BloqueosPorCuenta
+from conftest import nuevo_usuario
+
+NO_FINITOS = [float('nan'), float('inf'), -float('inf')]
+
+
+@pytest.fixture
+def cambios_de_hilo_frecuentes():
+    intervalo = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    yield
+    sys.setswitchinterval(intervalo)
+
+
+def _en_hilos(funcion, hilos=8):
+    errores = []
+
+    def correr(semilla):
+        try:
+            funcion(random.Random(semilla))
+        except Exception as e:
+            errores.append(e)
+    lista = [threading.Thread(target=correr, args=(i,)) for i in range(hilos)]
+    for hilo in lista:
+        hilo.start()
+    for hilo in lista:
+        hilo.join(timeout=60)
+    assert not any(hilo.is_alive() for hilo in lista)
+    assert errores == []
+
+
+def test_transferencias_concurrentes_conservan_el_total(bancos, cambios_de_hilo_frecuentes):
+    usuarios = [nuevo_usuario(bancos, saldo=100) for _ in range(10)]
+
+    def transferir(azar):
+        for _ in range(150):
+            origen, destino = azar.sample(usuarios, 2)
+            try:
+                bancos.transferir(origen, destino, azar.choice((1, 5, 17.5, 60)))
+            except ErrorBanco:
+                pass
+    _en_hilos(transferir)
+
+    saldos = [bancos.saldo(usuario) for usuario in usuarios]
+    assert sum(saldos) == pytest.approx(1000)
+    assert min(saldos) >= 0
+    assert bancos.verificar_diario()['descuadre'] == pytest.approx(0, abs=1e-6)
+
+
+def test_transferencias_cruzadas_no_se_interbloquean(banco):
+    ana, beto = nuevo_usuario(banco, saldo=1000), nuevo_usuario(banco, saldo=1000)
+
+    def ida_y_vuelta(azar):
+        origen, destino = (ana, beto) if azar.random() < 0.5 else (beto, ana)
+        for _ in range(300):
+            banco.transferir(origen, destino, 1)
+            banco.transferir(destino, origen, 1)
+    _en_hilos(ida_y_vuelta)
+    assert banco.saldo(ana) + banco.saldo(beto) == pytest.approx(2000)
+
+
+def test_bloqueos_toman_las_franjas_en_orden():
+    bloqueos = BloqueosPorCuenta(franjas=4)
+    indices = bloqueos._indices(['e', 'd', 'c', 'b', 'a', 'a'])
+    assert indices == sorted(set(indices))
+    lotes = list(bloqueos.repartir([f'u{i}' for i in range(20)], 3))
+    assert sorted(c for lote in lotes for c in lote) == sorted(f'u{i}' for i in range(20))
+    assert all(len({hash(c) % 4 for c in lote}) == 1 and len(lote) <= 3 for lote in lotes)
+
+
+@pytest.mark.parametrize('monto', NO_FINITOS)
+def test_montos_no_finitos_se_rechazan_en_cada_entrada(bancos, monto):
+    ana, beto = nuevo_usuario(bancos, saldo=100), nuevo_usuario(bancos, saldo=100)
+    for operacion in (lambda: bancos.acreditar(ana, monto),
+                      lambda: bancos.debitar(ana, monto),
+                      lambda: bancos.transferir(ana, beto, monto),
+                      lambda: bancos.apostar_deportes(ana, 1, monto, 'local'),
+                      lambda: bancos.otorgar_prestamo(ana, monto, 12)):
+        with pytest.raises(ErrorBanco):
+            operacion()
+    with pytest.raises(ErrorBanco):
+        bancos.registrar_usuario('nan' + ana, 'clave', 'Nan', 'nan@chiquibank.test', monto)
+    assert bancos.saldo(ana) == 100
+    assert bancos.saldo(beto) == 100
+    assert math.isfinite(bancos.verificar_diario()['descuadre'])
@@ -0,0 +1,76 @@
+import pytest
+
+from conftest import nuevo_usuario
+from contabilidad import Contabilidad
+from mercado import Mercado
+
+
+def _mercado(precio):
+    mercado = Mercado({'TECH': {'precio': precio, 'volatilidad': 0.1}})
+    return mercado.instantanea()
+
+
+def test_fifo_consume_los_lotes_mas_antiguos():
+    contabilidad = Contabilidad('fifo')
+    contabilidad.comprar('ana', 'TECH', 10, 100)
+    contabilidad.comprar('ana', 'TECH', 10, 200)
+    assert contabilidad.vender('ana', 'TECH', 15, 300) == pytest.approx(15 * 300 - (10 * 100 + 5 * 200))
+    posicion = contabilidad.posiciones_de('ana')['TECH']
+    assert posicion.cantidad == 5
+    assert posicion.costo == pytest.approx(5 * 200)
+    assert [list(lote) for lote in posicion.lotes] == [[5, 200]]
+
+
+def test_promedio_usa_el_costo_medio():
+    contabilidad = Contabilidad('promedio')
+    contabilidad.comprar('ana', 'TECH', 10, 100)
+    contabilidad.comprar('ana', 'TECH', 10, 200)
+    assert contabilidad.vender('ana', 'TECH', 10, 300) == pytest.approx(10 * 300 - 10 * 150)
+    assert contabilidad.posiciones_de('ana')['TECH'].costo_medio() == pytest.approx(150)
+
+
+def test_metodo_desconocido():
+    with pytest.raises(ValueError):
+        Contabilidad('lifo')
+
+
+def test_valoracion_de_una_pasada_y_de_quien_opero():
+    contabilidad = Contabilidad()
+    contabilidad.comprar('ana', 'TECH', 2, 100)
+    contabilidad.comprar('beto', 'TECH', 1, 120)
+    mercado = _mercado(150)
+    valores = contabilidad.valorar(mercado)
+    assert valores['ana'] == {'valor': 300, 'costo': 200, 'no_realizado': 100}
+    # Operar después de la pasada invalida sólo a ese usuario
+    contabilidad.comprar('beto', 'TECH', 1, 150)
+    beto = contabilidad.valoracion('beto', mercado)
+    assert (beto['valor'], beto['costo'], beto['no_realizado']) == (300, 270, 30)
+    assert contabilidad.valoracion('ana', mercado) is valores['ana']
+    assert contabilidad.valoracion('nadie', mercado)['valor'] == 0
+
+
+def test_inicializar_abre_lotes_al_precio_actual():
+    contabilidad = Contabilidad()
+    contabilidad.inicializar({'ana': {'TECH': 4, 'VIEJA': 2}}, _mercado(80))
+    resumen = contabilidad.resumen('ana', _mercado(100))
+    assert resumen['simbolos']['TECH']['no_realizado'] == pytest.approx(4 * 20)
+    assert 'VIEJA' not in resumen['simbolos']
+
+
+def test_exportar_e_importar():
+    contabilidad = Contabilidad()
+    contabilidad.comprar('ana', 'TECH', 3, 100)
+    contabilidad.vender('ana', 'TECH', 1, 130)
+    otra = Contabilidad('promedio')
+    otra.importar(contabilidad.exportar())
+    assert otra.exportar() == contabilidad.exportar()
+
+
+def test_el_banco_lleva_el_costo_con_comision(bancos):
+    usuario = nuevo_usuario(bancos, saldo=100000)
+    simbolo = next(iter(bancos.mercado.instantanea()))
+    precio = bancos.mercado.precio(simbolo)
+    bancos.comprar_acciones(usuario, simbolo, 10)
+    posicion = bancos.contabilidad.posiciones_de(usuario)[simbolo]
+    assert posicion.cantidad == 10
+    assert posicion.costo_medio() == pytest.approx(precio * 1.01)
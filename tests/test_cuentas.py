@@ -0,0 +1,62 @@
+import pytest
+
+from conftest import iniciar_sesion, nuevo_usuario
+from cuentas import DIGITOS, PREFIJO, AsignadorCuentas, digito_verificador, es_valido
+
+
+def test_numeros_emitidos_son_unicos_y_validos():
+    asignador = AsignadorCuentas()
+    numeros = [asignador.asignar() for _ in range(500)] + asignador.reservar(500)
+    assert len(set(numeros)) == 1000
+    assert all(es_valido(numero) for numero in numeros)
+
+
+def test_no_reemite_numeros_registrados():
+    primero = AsignadorCuentas().asignar()
+    otro = AsignadorCuentas()
+    otro.registrar(primero, 'ana')
+    # Forzar que el bloque activo empiece justo en ese número
+    cuerpo = int(primero[len(PREFIJO):len(PREFIJO) + DIGITOS])
+    otro._siguiente, otro._fin_bloque = cuerpo, cuerpo + 2
+    siguiente = str(cuerpo + 1).zfill(DIGITOS)
+    assert otro.asignar() == PREFIJO + siguiente + digito_verificador(siguiente)
+    assert otro.usuario_de(primero) == 'ana'
+
+
+def test_es_valido_comprueba_el_verificador():
+    cuerpo = '1234567'
+    assert es_valido('CHQ' + cuerpo + digito_verificador(cuerpo))
+    assert not es_valido('CHQ' + cuerpo + str((int(digito_verificador(cuerpo)) + 1) % 10))
+    assert es_valido('CHQ' + cuerpo)  # cuentas antiguas sin verificador
+    assert not es_valido('XYZ' + cuerpo)
+    assert not es_valido('CHQ12a4567')
+    assert not es_valido('')
+
+
+def test_buscar_por_cuenta(bancos):
+    usuario = nuevo_usuario(bancos)
+    numero = bancos.usuarios[usuario]['numero_cuenta']
+    assert es_valido(numero)
+    assert bancos.buscar_por_cuenta(numero) == usuario
+    assert bancos.buscar_por_cuenta('CHQ00000000') is None
+
+
+@pytest.mark.parametrize('monto', ['NaN', 'Infinity', '-Infinity', '"nan"', '"abc"', 'null', 'true', '[1]'])
+def test_transferir_por_api_rechaza_montos_invalidos(cliente, modulo_app, monto):
+    banco = modulo_app.banco
+    ana, beto = nuevo_usuario(banco), nuevo_usuario(banco)
+    iniciar_sesion(cliente, ana)
+    cuerpo = '{"cuenta_destino": "%s", "monto": %s}' % (banco.usuarios[beto]['numero_cuenta'], monto)
+    respuesta = cliente.post('/api/transferir', data=cuerpo, content_type='application/json')
+    assert respuesta.status_code == 400
+    assert banco.saldo(ana) == 1000
+
+
+def test_transferir_por_api_a_un_numero_de_cuenta(cliente, modulo_app):
+    banco = modulo_app.banco
+    ana, beto = nuevo_usuario(banco), nuevo_usuario(banco)
+    iniciar_sesion(cliente, ana)
+    respuesta = cliente.post('/api/transferir', json={
+        'cuenta_destino': banco.usuarios[beto]['numero_cuenta'].lower(), 'monto': '25.5'})
+    assert respuesta.status_code == 200
+    assert banco.saldo(beto) == pytest.approx(1025.5)
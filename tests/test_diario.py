@@ -0,0 +1,91 @@
+import pytest
+
+from banco_realista import ErrorBanco
+from conftest import iniciar_sesion, nuevo_usuario
+from diario import Diario, fecha_de_corte, validar_asiento
+
+
+@pytest.mark.parametrize('movimientos', [
+    [('ana', 10), ('@banco', -9)],
+    [('ana', float('nan')), ('@banco', 0)],
+    [('ana', float('nan')), ('@banco', float('nan'))],
+    [('ana', float('inf')), ('@banco', -float('inf'))],
+])
+def test_rechaza_asientos_descuadrados_o_no_finitos(movimientos):
+    with pytest.raises(ValueError):
+        validar_asiento(movimientos, 'prueba')
+
+
+def test_tolera_el_redondeo():
+    validar_asiento([('ana', 0.1), ('beto', 0.2), ('@banco', -0.3)], 'prueba')
+
+
+def test_fecha_de_corte():
+    assert fecha_de_corte('2026-01-31') == '2026-01-31 23:59:59'
+    assert fecha_de_corte('2026-01-31 10:00:00') == '2026-01-31 10:00:00'
+    for fecha in ('2026-1-31', '2026-02-30', '31/01/2026 10:00'):
+        with pytest.raises(ValueError):
+            fecha_de_corte(fecha)
+
+
+@pytest.fixture
+def diario(bancos):
+    # Diario o DiarioSQLite, según el banco; ya tiene la apertura de hoy,
+    # así que las fechas de las pruebas van después
+    return bancos.diario
+
+
+def test_saldo_a_un_asiento_o_una_fecha(diario):
+    primero = diario.asentar([('ana', 100), ('@externo', -100)], 'abono', '2099-01-10 09:00:00')
+    diario.asentar([('ana', -30), ('beto', 30)], 'transferencia', '2099-01-10 18:00:00')
+    diario.asentar([('ana', 5), ('@banco', -5)], 'interes', '2099-01-11 00:00:00')
+    assert diario.saldo('ana') == 75
+    assert diario.saldo('ana', asiento=primero) == 100
+    # Un día solo cuenta todos los asientos de ese día
+    assert diario.saldo('ana', fecha='2099-01-10') == 70
+    assert diario.saldo('ana', fecha='2099-01-10 12:00:00') == 100
+    assert diario.saldo('ana', fecha='2099-01-09') == 0
+    assert diario.saldo('nadie') == 0
+    assert diario.asiento(primero)['movimientos'] == [('ana', 100), ('@externo', -100)]
+
+
+def test_asiento_invalido_no_deja_rastro(diario):
+    asientos = len(diario)
+    with pytest.raises(ValueError):
+        diario.asentar([('ana', float('nan')), ('@banco', 0)], 'roto', '2026-01-01 00:00:00')
+    assert len(diario) == asientos
+    assert diario.descuadre() == pytest.approx(0, abs=1e-6)
+
+
+def test_las_fechas_no_retroceden():
+    diario = Diario()
+    diario.asentar([('ana', 1), ('@banco', -1)], 'a', '2026-01-10 00:00:00')
+    asiento = diario.asentar([('ana', 1), ('@banco', -1)], 'b', '2026-01-01 00:00:00')
+    assert diario.asiento(asiento)['fecha'] == '2026-01-10 00:00:00'
+
+
+def test_exportar_e_importar():
+    diario = Diario()
+    diario.asentar([('ana', 10), ('@externo', -10)], 'abono', '2026-01-01 00:00:00')
+    otro = Diario()
+    otro.importar(diario.exportar())
+    assert otro.exportar() == diario.exportar()
+    assert otro.saldos() == diario.saldos()
+
+
+def test_las_operaciones_cuadran_con_los_saldos(bancos):
+    ana = nuevo_usuario(bancos, saldo=500)
+    beto = nuevo_usuario(bancos, saldo=0)
+    bancos.transferir(ana, beto, 200)
+    with pytest.raises(ErrorBanco):
+        bancos.transferir(ana, beto, 10 ** 6)
+    verificacion = bancos.verificar_diario()
+    assert verificacion['diferencias'] == {}
+    assert verificacion['descuadre'] == pytest.approx(0, abs=1e-6)
+
+
+def test_ruta_del_diario(cliente, modulo_app):
+    iniciar_sesion(cliente, 'admin', tipo='admin')
+    assert cliente.get('/api/admin/diario').get_json()['diferencias'] == {}
+    assert cliente.get('/api/admin/diario?cuenta=@banco&fecha=2000-01-01').get_json()['saldo'] == 0
+    assert cliente.get('/api/admin/diario?cuenta=@banco&fecha=ayer').status_code == 400
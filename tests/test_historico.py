@@ -0,0 +1,117 @@
+import json
+
+import pytest
+
+from conftest import iniciar_sesion, nuevo_usuario
+from historico import Segmento, escribir_segmento
+from libro_transacciones import LibroTransacciones
+
+FILAS = [
+    {'id': 0, 'usuario': 'ana', 'tipo': 'abono', 'estado': 'completado', 'fecha': '2026-01-01 10:00:00',
+     'monto': 10.5, 'descripcion': 'sueldo'},
+    {'id': 1, 'usuario': 'beto', 'tipo': 'cargo', 'estado': 'completado', 'fecha': '2026-01-02 11:00:00',
+     'monto': -3, 'descripcion': ''},
+    # Campos fuera de lo común van a la columna de extras
+    {'id': 2, 'usuario': 'ana', 'tipo': 'deposito', 'estado': 'aprobado', 'fecha': 'ayer',
+     'monto': 7.25, 'descripcion': 'caja', 'procesado_por': 'admin'},
+]
+
+
+def test_segmento_devuelve_las_mismas_filas(tmp_path):
+    ruta = str(tmp_path / 'prueba.seg')
+    escribir_segmento(ruta, FILAS)
+    segmento = Segmento(ruta)
+    try:
+        assert len(segmento) == 3
+        assert list(segmento.filas_usuario('ana')) == [FILAS[0], FILAS[2]]
+        assert list(segmento.filas_usuario('ana', reverso=True)) == [FILAS[2], FILAS[0]]
+        assert segmento.contar('beto') == 1
+        assert segmento.contar('nadie') == 0
+        assert segmento.fila(1) == FILAS[1]
+        assert segmento.fila(99) is None
+        assert list(segmento.filas_bloques('deposito', 'aprobado')) == [FILAS[2]]
+    finally:
+        segmento.cerrar()
+
+
+def _libro(directorio):
+    libro = LibroTransacciones(str(directorio))
+    for i in range(10):
+        libro.append({'usuario': 'ana' if i % 2 else 'beto', 'tipo': 'abono', 'estado': 'completado',
+                      'fecha': f'2026-01-{i + 1:02d} 00:00:00', 'monto': i, 'descripcion': ''})
+    # Una solicitud antigua que sigue abierta no se archiva
+    libro.actualizar_estado(2, 'pendiente_aprobacion')
+    return libro
+
+
+def test_archivar_conserva_las_consultas(tmp_path):
+    libro = _libro(tmp_path)
+    antes = libro.por_usuario('ana')[0]
+    assert libro.archivar(retener=3, minimo=1) == 6
+    estadisticas = libro.estadisticas()
+    assert (estadisticas['archivadas'], estadisticas['retenidas'], estadisticas['segmentos']) == (6, 1, 1)
+    assert estadisticas['en_memoria'] == 4
+
+    assert libro.por_usuario('ana')[0] == antes
+    pagina, cursor = libro.por_usuario('ana', limite=2)
+    assert [t['id'] for t in pagina] == [9, 7]
+    assert [t['id'] for t in libro.por_usuario('ana', cursor=cursor)[0]] == [5, 3, 1]
+    assert [t['id'] for t in libro.historial('beto', '2026-01-03 00:00:00', '2026-01-07 00:00:00')] == [2, 4]
+    assert [t['id'] for t in libro] == list(range(10))
+    assert libro[0]['monto'] == 0
+    # La retenida se sigue resolviendo en memoria
+    libro.actualizar_estado(2, 'aprobado')
+    assert [t['id'] for t in libro.por_tipo_estado('abono', 'aprobado')] == [2]
+
+
+def test_archivar_respeta_el_minimo(tmp_path):
+    libro = _libro(tmp_path)
+    assert libro.archivar(retener=3, minimo=100) == 0
+    assert libro.estadisticas()['segmentos'] == 0
+    assert LibroTransacciones().archivar(retener=0, minimo=0) == 0
+
+
+def test_snapshot_nombra_sus_segmentos_y_borra_los_demas(tmp_path):
+    libro = _libro(tmp_path)
+    libro.archivar(retener=6, minimo=1)
+    estado = json.loads(json.dumps(libro.exportar()))
+    libro.archivar(retener=2, minimo=1)
+    assert len(list(tmp_path.glob('*.seg'))) == 2
+
+    # Reiniciar desde el snapshot: el segmento posterior se descarta
+    otro = LibroTransacciones(str(tmp_path))
+    otro.importar(estado)
+    assert len(list(tmp_path.glob('*.seg'))) == 1
+    assert [t['id'] for t in otro] == list(range(10))
+
+
+@pytest.fixture
+def sesion(cliente, modulo_app, monkeypatch):
+    banco = modulo_app.banco
+    usuario = nuevo_usuario(banco, saldo=100)
+    monkeypatch.setattr(banco, '_ahora', lambda: '2026-03-10 12:00:00')
+    banco.acreditar(usuario, 25, 'premio')
+    monkeypatch.setattr(banco, '_ahora', lambda: '2026-03-20 12:00:00')
+    banco.debitar(usuario, 5, 'cafe')
+    iniciar_sesion(cliente, usuario)
+    return cliente
+
+
+def test_exportar_csv_y_json_por_rango(sesion):
+    csv = sesion.get('/api/transacciones/exportar?desde=2026-03-01&hasta=2026-03-31')
+    assert csv.mimetype == 'text/csv'
+    assert 'attachment' in csv.headers['Content-Disposition']
+    lineas = csv.get_data(as_text=True).splitlines()
+    assert lineas[0] == 'id,fecha,tipo,descripcion,monto,estado'
+    assert [linea.split(',')[3] for linea in lineas[1:]] == ['premio', 'cafe']
+
+    # `hasta` es inclusive
+    solo_el_10 = sesion.get('/api/transacciones/exportar?formato=json&desde=2026-03-10&hasta=2026-03-10')
+    assert [t['descripcion'] for t in solo_el_10.get_json()] == ['premio']
+
+
+def test_exportar_rechaza_formato_o_fecha_invalidos(sesion, cliente):
+    assert sesion.get('/api/transacciones/exportar?formato=xml').status_code == 400
+    assert sesion.get('/api/transacciones/exportar?desde=10/03/2026').status_code == 400
+    cliente.get('/logout')
+    assert cliente.get('/api/transacciones/exportar').status_code == 401
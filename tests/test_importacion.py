@@ -0,0 +1,73 @@
+import io
+import json
+
+import pytest
+
+from conftest import iniciar_sesion
+from importacion import detectar_formato, importar, leer_lineas
+
+
+def _ndjson(filas):
+    return io.BytesIO(''.join(json.dumps(fila) + '\n' for fila in filas).encode())
+
+
+def test_leer_lineas_no_corta_lineas_entre_bloques():
+    flujo = io.BytesIO(b'uno\ndos\ntres')
+    assert list(leer_lineas(flujo, tamano_bloque=3)) == [b'uno\n', b'dos\n', b'tres']
+
+
+def test_detectar_formato():
+    assert detectar_formato('text/csv; charset=utf-8') == 'csv'
+    assert detectar_formato('clientes.CSV') == 'csv'
+    assert detectar_formato('application/x-ndjson') == 'ndjson'
+    assert detectar_formato(None) == 'ndjson'
+
+
+def test_importar_usuarios_en_lotes(bancos, monkeypatch):
+    monkeypatch.setattr('importacion.TAMANO_LOTE', 2)
+    filas = [{'usuario': f'migrado{i}', 'password': 'secreto1', 'saldo': 10 * i} for i in range(5)]
+    filas.append({'usuario': 'migrado0', 'password': 'secreto1'})
+    resumen = importar(bancos, _ndjson(filas), 'ndjson', 'usuarios')
+    assert resumen['importados'] == 5
+    assert resumen['errores'] == [{'fila': 6, 'error': 'El usuario ya existe'}]
+    assert bancos.saldo('migrado4') == 40
+    assert bancos.buscar_por_cuenta(bancos.usuarios['migrado4']['numero_cuenta']) == 'migrado4'
+    assert bancos.verificar_diario()['descuadre'] == pytest.approx(0, abs=1e-6)
+
+
+def test_importar_usuarios_csv_reporta_filas_invalidas(banco):
+    csv = (b'usuario,password,saldo\n'
+           b'abc,secreto1,1\n'
+           b'valido1,123,1\n'
+           b'valido2,secreto1,-5\n'
+           b'valido3,secreto1,nan\n'
+           b'valido4,secreto1,inf\n'
+           b'valido5,secreto1,7.5\n')
+    resumen = importar(banco, io.BytesIO(csv), 'csv', 'usuarios')
+    assert resumen['importados'] == 1
+    assert [e['fila'] for e in resumen['errores']] == [2, 3, 4, 5, 6]
+    assert banco.saldo('valido5') == 7.5
+
+
+def test_importar_transacciones_no_mueve_saldos(banco):
+    importar(banco, _ndjson([{'usuario': 'historico1', 'password': 'secreto1', 'saldo': 100}]),
+             'ndjson', 'usuarios')
+    filas = [{'usuario': 'historico1', 'tipo': 'deposito', 'monto': 50, 'fecha': '2020-01-01 10:00:00'},
+             {'usuario': 'historico1', 'tipo': 'invento', 'monto': 1, 'fecha': '2020-01-01'},
+             {'usuario': 'historico1', 'tipo': 'deposito', 'monto': 'NaN', 'fecha': '2020-01-01'},
+             'no es un objeto']
+    resumen = importar(banco, _ndjson(filas), 'ndjson', 'transacciones')
+    assert resumen['importados'] == 1
+    assert resumen['total_errores'] == 3
+    assert banco.saldo('historico1') == 100
+    assert banco.transacciones.contar_usuario('historico1') == 2
+
+
+def test_importar_por_api_solo_admin(cliente):
+    cuerpo = json.dumps({'usuario': 'porapi1', 'password': 'secreto1', 'saldo': 3}) + '\n'
+    assert cliente.post('/api/admin/importar/usuarios', data=cuerpo).status_code == 401
+    iniciar_sesion(cliente, 'admin', tipo='admin')
+    assert cliente.post('/api/admin/importar/otra_cosa', data=cuerpo).status_code == 404
+    respuesta = cliente.post('/api/admin/importar/usuarios', data=cuerpo, content_type='application/x-ndjson')
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()['importados'] == 1
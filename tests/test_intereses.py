@@ -0,0 +1,52 @@
+import pytest
+
+from banco_realista import ErrorBanco
+from conftest import nuevo_usuario
+from intereses import devengar, factor_interes, validar_dia
+
+
+def test_varios_dias_se_abonan_de_una_vez_con_interes_compuesto():
+    cuentas = [('ana', 1000, '2026-01-01'), ('beto', 0, '2026-01-01'), ('caro', 500, '2026-01-11')]
+    abonos, al_dia, resumen = devengar(cuentas, 0.0365, '2026-01-11')
+    assert abonos == [('ana', pytest.approx(1000 * ((1 + 0.0001) ** 10 - 1)), 10)]
+    # Las cuentas sin saldo también avanzan; las que ya están al día no
+    assert al_dia == ['ana', 'beto']
+    assert resumen['abonadas'] == 1
+    assert factor_interes(0.0365, 1) == pytest.approx(0.0001)
+
+
+def test_validar_dia():
+    assert validar_dia('2026-02-28')
+    assert not validar_dia('2026-02-30')
+    assert not validar_dia('2026-2-1')
+    assert not validar_dia(None)
+
+
+def test_el_banco_devenga_cada_dia_una_vez(bancos, monkeypatch):
+    monkeypatch.setattr(bancos, '_ahora', lambda: '2026-01-01 09:00:00')
+    usuario = nuevo_usuario(bancos, saldo=1000)
+    admin = {nombre: datos['saldo'] for nombre, datos in bancos.usuarios.items()
+             if datos['tipo'] != 'usuario'}
+
+    resumen = bancos.devengar_intereses('2026-01-11')
+    interes = 1000 * factor_interes(bancos.tasa_interes_pasiva, 10)
+    assert resumen['interes'] == pytest.approx(interes)
+    assert bancos.saldo(usuario) == pytest.approx(1000 + interes)
+    with pytest.raises(ErrorBanco) as error:
+        bancos.devengar_intereses('2026-01-11')
+    assert error.value.codigo == 409
+
+    # El día siguiente abona sólo un día sobre el saldo ya capitalizado
+    bancos.devengar_intereses('2026-01-12')
+    assert bancos.saldo(usuario) == pytest.approx((1000 + interes) * (1 + bancos.tasa_interes_pasiva / 365))
+    assert bancos.ultimo_devengo == '2026-01-12'
+    # Sólo los clientes cobran intereses
+    assert {nombre: datos['saldo'] for nombre, datos in bancos.usuarios.items()
+            if datos['tipo'] != 'usuario'} == admin
+    assert bancos.agregados.total_depositos == pytest.approx(bancos.calcular_agregados()['total_depositos'])
+    assert bancos.verificar_diario()['descuadre'] == pytest.approx(0, abs=1e-6)
+
+
+def test_dia_invalido(bancos):
+    with pytest.raises(ErrorBanco):
+        bancos.devengar_intereses('2026-13-01')
@@ -0,0 +1,52 @@
+from conftest import nuevo_usuario
+from libro_transacciones import LibroTransacciones
+
+
+def _libro(filas):
+    libro = LibroTransacciones()
+    for usuario, tipo, estado in filas:
+        libro.append({'usuario': usuario, 'tipo': tipo, 'estado': estado, 'monto': 1,
+                      'fecha': '2026-01-01 00:00:00'})
+    return libro
+
+
+def test_por_usuario_devuelve_solo_sus_filas_de_la_mas_reciente():
+    libro = _libro([('ana', 'abono', 'completado'), ('beto', 'abono', 'completado'),
+                    ('ana', 'retiro', 'completado'), ('ana', 'abono', 'completado')])
+    transacciones, cursor = libro.por_usuario('ana')
+    assert [t['id'] for t in transacciones] == [3, 2, 0]
+    assert cursor is None
+    assert libro.contar_usuario('beto') == 1
+    assert libro.por_usuario('nadie') == ([], None)
+
+
+def test_por_usuario_pagina_con_cursor():
+    libro = _libro([('ana', 'abono', 'completado')] * 5)
+    pagina, cursor = libro.por_usuario('ana', limite=2)
+    assert [t['id'] for t in pagina] == [4, 3]
+    pagina, cursor = libro.por_usuario('ana', cursor=cursor, limite=2)
+    assert [t['id'] for t in pagina] == [2, 1]
+    pagina, cursor = libro.por_usuario('ana', cursor=cursor, limite=2)
+    assert [t['id'] for t in pagina] == [0]
+    assert cursor is None
+
+
+def test_actualizar_estado_mueve_el_indice_por_tipo_y_estado():
+    libro = _libro([('ana', 'deposito', 'pendiente_aprobacion'), ('beto', 'deposito', 'pendiente_aprobacion')])
+    libro.actualizar_estado(0, 'aprobado', procesado_por='admin')
+    assert [t['id'] for t in libro.por_tipo_estado('deposito', 'pendiente_aprobacion')] == [1]
+    aprobadas = libro.por_tipo_estado('deposito', 'aprobado')
+    assert [t['id'] for t in aprobadas] == [0]
+    assert aprobadas[0]['procesado_por'] == 'admin'
+
+
+def test_historial_del_banco_separa_las_filas_de_cada_usuario(bancos):
+    ana, beto = nuevo_usuario(bancos), nuevo_usuario(bancos)
+    bancos.acreditar(ana, 50)
+    bancos.transferir(ana, beto, 20)
+    de_ana, _ = bancos.transacciones.por_usuario(ana)
+    de_beto, _ = bancos.transacciones.por_usuario(beto)
+    assert [t['tipo'] for t in de_ana][:2] == ['transferencia_enviada', 'abono']
+    assert de_beto[0]['tipo'] == 'transferencia_recibida'
+    assert all(t['usuario'] == ana for t in de_ana)
+    assert bancos.transacciones.contar_usuario(ana) == len(de_ana)
@@ -0,0 +1,89 @@
+import pytest
+
+from conftest import iniciar_sesion, nuevo_usuario
+from limites import ControlAdmision, CupoConexiones, Limitador, limites_por_worker
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 0.0
+
+    def __call__(self):
+        return self.ahora
+
+
+def test_cubo_gasta_fichas_y_se_rellena_con_el_tiempo():
+    reloj = Reloj()
+    limitador = Limitador({'transferir': (2, 0.5)}, reloj=reloj)
+    assert limitador.permitir('ana', 'transferir') == 0
+    assert limitador.permitir('ana', 'transferir') == 0
+    assert limitador.permitir('ana', 'transferir') == pytest.approx(2)
+    # Cada usuario tiene su cubo y las rutas sin límite pasan siempre
+    assert limitador.permitir('beto', 'transferir') == 0
+    assert limitador.permitir('ana', 'otra_ruta') == 0
+    reloj.ahora = 2
+    assert limitador.permitir('ana', 'transferir') == 0
+    assert limitador.estadisticas()['limitadas'] == 1
+
+
+def test_desaloja_el_cubo_menos_usado():
+    limitador = Limitador({'transferir': (1, 0.001)}, max_cubos=2, reloj=Reloj())
+    for usuario in ('ana', 'beto', 'caro'):
+        limitador.permitir(usuario, 'transferir')
+    assert limitador.estadisticas()['desalojos'] == 1
+    # El de ana se desalojó y vuelve lleno; el de caro sigue vacío
+    assert limitador.permitir('ana', 'transferir') == 0
+    assert limitador.permitir('caro', 'transferir') > 0
+
+
+def test_limites_por_worker_suman_el_configurado():
+    limites = limites_por_worker(4, {'transferir': (10, 2), 'prestamo': (3, 0.1)})
+    assert limites['transferir'] == (2.5, 0.5)
+    # La capacidad no baja de una ficha
+    assert limites['prestamo'] == (1, pytest.approx(0.025))
+
+
+def test_admision_rechaza_por_en_curso_cola_y_latencia():
+    reloj = Reloj()
+    cola = [0]
+    control = ControlAdmision(cola=lambda: cola[0], max_en_curso=1, max_cola=10,
+                              latencia_maxima=1.0, vida_media=5.0, reloj=reloj)
+    assert control.entrar() is None
+    assert control.entrar() == 'en_curso'
+    control.salir(10)
+    assert control.latencia() == pytest.approx(2)
+    assert control.entrar() == 'latencia'
+    # Sin peticiones la latencia decae a la mitad por vida media
+    reloj.ahora = 5
+    assert control.latencia() == pytest.approx(1)
+    reloj.ahora = 10
+    cola[0] = 10
+    assert control.entrar() == 'cola'
+    cola[0] = 0
+    assert control.entrar() is None
+    assert control.estadisticas()['descartadas'] == {'en_curso': 1, 'cola': 1, 'latencia': 1}
+
+
+def test_cupo_de_conexiones():
+    cupo = CupoConexiones(1)
+    assert cupo.tomar()
+    assert not cupo.tomar()
+    cupo.soltar()
+    assert cupo.tomar()
+    assert cupo.estadisticas() == {'en_uso': 1, 'maximo': 1, 'rechazadas': 1}
+
+
+def test_rutas_de_dinero_responden_429_y_503(cliente, modulo_app, monkeypatch):
+    iniciar_sesion(cliente, nuevo_usuario(modulo_app.banco))
+    monkeypatch.setattr(modulo_app.limitador, 'limites', {'transferir': (1, 0.001)})
+    # La primera pasa el límite (y falla por el monto); la segunda no
+    assert cliente.post('/api/transferir', json={'monto': 'x'}).status_code == 400
+    limitada = cliente.post('/api/transferir', json={'monto': 'x'})
+    assert limitada.status_code == 429
+    assert int(limitada.headers['Retry-After']) > 0
+
+    monkeypatch.setattr(modulo_app.limitador, 'limites', {})
+    monkeypatch.setattr(modulo_app.admision, 'max_en_curso', 0)
+    saturada = cliente.post('/api/transferir', json={'monto': 'x'})
+    assert saturada.status_code == 503
+    assert saturada.get_json()['motivo'] == 'en_curso'
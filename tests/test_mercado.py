@@ -0,0 +1,62 @@
+import threading
+
+from mercado import PRECIO_MINIMO, Mercado, acciones_sinteticas
+
+
+def test_avanzar_publica_una_instantanea_nueva_sin_tocar_la_anterior():
+    mercado = Mercado(acciones_sinteticas(50))
+    anterior = mercado.instantanea()
+    precios = {simbolo: anterior.precio(simbolo) for simbolo in anterior}
+    nueva = mercado.avanzar()
+    assert nueva.secuencia == anterior.secuencia + 1
+    assert {simbolo: anterior.precio(simbolo) for simbolo in anterior} == precios
+    assert set(nueva) == set(anterior)
+    assert all(nueva.precio(simbolo) >= PRECIO_MINIMO for simbolo in nueva)
+
+
+def test_fijar_adopta_precios_de_otro_proceso():
+    mercado = Mercado()
+    simbolo = next(iter(mercado.instantanea()))
+    instantanea = mercado.fijar({simbolo: 123.45, 'NO_EXISTE': 1})
+    assert instantanea.precio(simbolo) == 123.45
+    assert 'NO_EXISTE' not in instantanea
+
+
+def test_velas_ohlc_por_simbolo():
+    mercado = Mercado(ticks_por_vela=3)
+    simbolo = next(iter(mercado.instantanea()))
+    apertura = mercado.precio(simbolo)
+    for precio in (apertura - 10, apertura + 30, apertura - 20):
+        mercado.fijar({simbolo: precio})
+    vela, = mercado.historial(simbolo)
+    assert vela['apertura'] == apertura
+    assert (vela['maximo'], vela['minimo'], vela['cierre']) == (apertura + 30, apertura - 20, apertura - 20)
+    mercado.agregar_simbolos({'NUEVO': {'precio': 50, 'volatilidad': 0.1}})
+    assert mercado.historial('NUEVO') == []
+    assert mercado.precio('NUEVO') == 50
+
+
+def test_esperar_despierta_con_el_siguiente_tick():
+    mercado = Mercado()
+    secuencia = mercado.instantanea().secuencia
+    recibidas = []
+    hilo = threading.Thread(target=lambda: recibidas.append(mercado.esperar(secuencia, timeout=5)))
+    hilo.start()
+    mercado.avanzar()
+    hilo.join()
+    assert recibidas[0].secuencia == secuencia + 1
+    # Sin ticks nuevos vence el timeout y devuelve la misma
+    assert mercado.esperar(secuencia + 1, timeout=0.01).secuencia == secuencia + 1
+
+
+def test_como_json_se_serializa_una_vez():
+    instantanea = Mercado().instantanea()
+    assert instantanea.como_json() is instantanea.como_json()
+
+
+def test_exportar_e_importar():
+    mercado = Mercado(acciones_sinteticas(5))
+    mercado.avanzar()
+    otro = Mercado()
+    otro.importar(mercado.exportar())
+    assert otro.exportar() == mercado.exportar()
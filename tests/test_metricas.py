@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+from conftest import iniciar_sesion
+from metricas import Histograma, Metricas, Perfilador
+
+
+def test_percentiles_con_error_relativo_acotado():
+    histograma = Histograma()
+    for milisegundos in range(1, 1001):
+        histograma.registrar(milisegundos / 1000)
+    percentiles = histograma.percentiles()
+    assert percentiles[0.5] == pytest.approx(0.5, rel=0.06)
+    assert percentiles[0.99] == pytest.approx(0.99, rel=0.06)
+    assert histograma.total == 1000
+    assert histograma.maximo == 1.0
+    assert Histograma().percentiles()[0.5] == 0.0
+
+
+def test_salida_prometheus():
+    metricas = Metricas()
+    metricas.medir('ruta_segundos', 0.01, 'Latencia por ruta', ruta='transferir')
+    metricas.medidor('usuarios', 'Usuarios', lambda: 3)
+    metricas.medidor('por_motivo', 'Por motivo', lambda: {(('motivo', 'cola'),): 2}, 'counter')
+    metricas.medidor('roto', 'Roto', lambda: 1 / 0)
+    texto = metricas.prometheus()
+    assert '# TYPE chiquibank_ruta_segundos summary' in texto
+    assert 'chiquibank_ruta_segundos_count{ruta="transferir"} 1' in texto
+    assert 'chiquibank_usuarios 3' in texto
+    assert 'chiquibank_por_motivo{motivo="cola"} 2' in texto
+    # Un medidor que falla no tumba los demás
+    assert 'roto' not in texto
+
+
+def test_perfilador_muestrea_en_caliente():
+    perfilador = Perfilador(intervalo=0.001)
+    perfilador.iniciar()
+    assert perfilador.activo
+    fin = time.monotonic() + 5
+    while not perfilador.muestras and time.monotonic() < fin:
+        time.sleep(0.01)
+    perfilador.detener()
+    assert not perfilador.activo
+    assert perfilador.muestras
+    assert 'test_perfilador_muestrea_en_caliente' in perfilador.plegado()
+    perfilador.reiniciar()
+    assert perfilador.plegado() == ''
+
+
+def test_metrics_pide_autorizacion(cliente, monkeypatch):
+    monkeypatch.delenv('CHIQUIBANK_METRICAS_PUBLICAS', raising=False)
+    monkeypatch.setenv('CHIQUIBANK_METRICAS_TOKEN', 'secreto')
+    assert cliente.get('/metrics').status_code == 401
+    assert cliente.get('/metrics', headers={'Authorization': 'Bearer otro'}).status_code == 401
+    respuesta = cliente.get('/metrics', headers={'Authorization': 'Bearer secreto'})
+    assert respuesta.status_code == 200
+    assert b'# TYPE chiquibank_' in respuesta.data
+
+    iniciar_sesion(cliente, 'admin', tipo='admin')
+    assert cliente.get('/metrics').status_code == 200
+
+
+def test_metrics_publicas(cliente, monkeypatch):
+    monkeypatch.delenv('CHIQUIBANK_METRICAS_TOKEN', raising=False)
+    assert cliente.get('/metrics').status_code == 401
+    monkeypatch.setenv('CHIQUIBANK_METRICAS_PUBLICAS', '1')
+    assert cliente.get('/metrics').status_code == 200
@@ -0,0 +1,94 @@
+import pytest
+
+from banco_realista import ErrorBanco
+from conftest import nuevo_usuario
+from ordenes import LibroOrdenes
+
+
+def _orden(orden_id, lado, precio, usuario='ana', cantidad=1):
+    return {'id': orden_id, 'lado': lado, 'precio': precio, 'usuario': usuario,
+            'simbolo': 'TECH', 'cantidad': cantidad, 'restante': cantidad}
+
+
+def test_libro_prioriza_precio_y_luego_antiguedad():
+    libro = LibroOrdenes()
+    for orden in (_orden(1, 'venta', 101), _orden(2, 'venta', 100), _orden(3, 'venta', 100),
+                  _orden(4, 'compra', 98), _orden(5, 'compra', 99)):
+        libro.agregar(orden)
+    assert libro.mejor_venta()['id'] == 2
+    assert libro.mejor_compra()['id'] == 5
+    assert libro.contraparte('compra', limite=99) is None
+    assert libro.contraparte('venta', limite=99)['id'] == 5
+    libro.retirar(2)
+    assert libro.contraparte('compra')['id'] == 3
+    assert libro.profundidad()['ventas'] == [{'precio': 100, 'cantidad': 1}, {'precio': 101, 'cantidad': 1}]
+
+
+def test_mejor_precio_ajeno_salta_las_ordenes_propias():
+    libro = LibroOrdenes()
+    libro.agregar(_orden(1, 'venta', 100, usuario='ana'))
+    libro.agregar(_orden(2, 'venta', 105, usuario='beto'))
+    assert libro.mejor_precio_ajeno('compra', 'beto') == 100
+    assert libro.mejor_precio_ajeno('compra', 'ana') == 105
+    assert libro.mejor_precio_ajeno('venta', 'ana') is None
+
+
+def _simbolo(banco):
+    return next(iter(banco.mercado.instantanea()))
+
+
+def _con_acciones(banco, cantidad, saldo=10000):
+    usuario = nuevo_usuario(banco, saldo=saldo)
+    banco.comprar_acciones(usuario, _simbolo(banco), cantidad)
+    return usuario
+
+
+def test_orden_limite_cruza_al_precio_de_la_que_esperaba(bancos):
+    simbolo = _simbolo(bancos)
+    precio = round(bancos.mercado.precio(simbolo), 2)
+    vendedor = _con_acciones(bancos, 5)
+    comprador = nuevo_usuario(bancos, saldo=10000)
+    assert bancos.enviar_orden(vendedor, simbolo, 'venta', 'limite', 5, precio)['estado'] == 'abierta'
+
+    resultado = bancos.enviar_orden(comprador, simbolo, 'compra', 'limite', 3, precio + 5)
+    assert resultado['estado'] == 'completada'
+    assert resultado['precio_medio'] == pytest.approx(precio)
+    # Lo reservado de más por el límite vuelve al comprador
+    assert bancos.saldo(comprador) == pytest.approx(10000 - 3 * precio * 1.01)
+    assert bancos.portafolios[comprador][simbolo] == 3
+    assert bancos.ordenes.libro(simbolo).mejor_venta()['restante'] == 2
+    assert bancos.verificar_diario()['descuadre'] == pytest.approx(0, abs=1e-6)
+
+
+def test_cancelar_devuelve_lo_reservado(bancos):
+    simbolo = _simbolo(bancos)
+    usuario = nuevo_usuario(bancos, saldo=1000)
+    orden = bancos.enviar_orden(usuario, simbolo, 'compra', 'limite', 2, 10)
+    assert bancos.saldo(usuario) == pytest.approx(1000 - 2 * 10 * 1.01)
+    assert bancos.cancelar_orden(usuario, orden['orden_id'])['estado'] == 'cancelada'
+    assert bancos.saldo(usuario) == pytest.approx(1000)
+    with pytest.raises(ErrorBanco):
+        bancos.cancelar_orden(usuario, orden['orden_id'])
+
+
+def test_orden_rechazada_no_cancela_la_propia_en_reposo(bancos):
+    simbolo = _simbolo(bancos)
+    usuario = _con_acciones(bancos, 3, saldo=1000)
+    propia = bancos.enviar_orden(usuario, simbolo, 'venta', 'limite', 3, 10 ** 6)
+    bancos.debitar(usuario, bancos.saldo(usuario))
+
+    with pytest.raises(ErrorBanco, match='Fondos insuficientes'):
+        bancos.enviar_orden(usuario, simbolo, 'compra', 'mercado', 1)
+    assert bancos.ordenes.obtener(propia['orden_id']) is not None
+    assert bancos.portafolios[usuario].get(simbolo, 0) == 0
+
+
+def test_orden_propia_se_cancela_antes_de_cruzar_consigo(bancos):
+    simbolo = _simbolo(bancos)
+    usuario = _con_acciones(bancos, 3, saldo=100000)
+    propia = bancos.enviar_orden(usuario, simbolo, 'venta', 'limite', 3, 1)
+    resultado = bancos.enviar_orden(usuario, simbolo, 'compra', 'mercado', 1)
+    assert resultado['estado'] == 'completada'
+    assert bancos.ordenes.obtener(propia['orden_id']) is None
+    # Las tres acciones de la venta cancelada vuelven, más la comprada al banco
+    assert bancos.portafolios[usuario][simbolo] == 4
@@ -0,0 +1,85 @@
+import glob
+import os
+
+import pytest
+
+from banco_realista import BancoRealista
+from conftest import nuevo_usuario
+from persistencia import AlmacenWAL
+
+
+def _estado(banco):
+    return {
+        'saldos': {usuario: round(datos['saldo'], 6) for usuario, datos in banco.usuarios.items()},
+        'portafolios': {usuario: dict(posiciones) for usuario, posiciones in banco.portafolios.items()},
+        'transacciones': len(banco.transacciones),
+        'solicitudes': banco.solicitudes_pendientes.ids(),
+        'saldo_banco': round(banco.saldo_banco, 6),
+    }
+
+
+def _operar(banco):
+    ana, beto = nuevo_usuario(banco, saldo=5000), nuevo_usuario(banco, saldo=5000)
+    banco.acreditar(ana, 120)
+    banco.transferir(ana, beto, 75.5)
+    banco.crear_solicitud(beto, 'deposito', 40, 'pendiente')
+    banco.otorgar_prestamo(ana, 1000, 12)
+    banco.apostar_deportes(beto, 1, 30, 'local')
+    simbolo = next(iter(banco.mercado.instantanea()))
+    banco.comprar_acciones(ana, simbolo, 2)
+
+
+@pytest.fixture
+def directorio(tmp_path):
+    return str(tmp_path / 'datos')
+
+
+def test_reproducir_el_log_reconstruye_los_saldos(directorio):
+    original = BancoRealista(almacen=AlmacenWAL(directorio))
+    _operar(original)
+    esperado = _estado(original)
+    # Sin cerrar: como una caída, sólo queda el log
+    assert not os.path.exists(os.path.join(directorio, 'snapshot.pkl'))
+
+    recuperado = BancoRealista(almacen=AlmacenWAL(directorio))
+    try:
+        assert _estado(recuperado) == esperado
+        assert recuperado.verificar_diario()['descuadre'] == pytest.approx(0, abs=1e-6)
+    finally:
+        recuperado.cerrar()
+        original.cerrar()
+
+
+def test_snapshot_al_cerrar_y_log_posterior(directorio):
+    banco = BancoRealista(almacen=AlmacenWAL(directorio))
+    _operar(banco)
+    banco.cerrar()
+    assert os.path.exists(os.path.join(directorio, 'snapshot.pkl'))
+
+    banco = BancoRealista(almacen=AlmacenWAL(directorio))
+    usuario = nuevo_usuario(banco, saldo=10)
+    esperado = _estado(banco)
+    recuperado = BancoRealista(almacen=AlmacenWAL(directorio))
+    try:
+        assert _estado(recuperado) == esperado
+        assert recuperado.saldo(usuario) == 10
+    finally:
+        recuperado.cerrar()
+        banco.cerrar()
+
+
+def test_linea_a_medio_escribir_se_descarta(directorio):
+    banco = BancoRealista(almacen=AlmacenWAL(directorio))
+    usuario = nuevo_usuario(banco, saldo=100)
+    esperado = _estado(banco)
+    segmento = sorted(glob.glob(os.path.join(directorio, 'wal-*.log')))[-1]
+    with open(segmento, 'ab') as f:
+        f.write(b'{"seq": 99999, "op": "acreditar", "dat')
+
+    recuperado = BancoRealista(almacen=AlmacenWAL(directorio))
+    try:
+        assert _estado(recuperado) == esperado
+        assert recuperado.saldo(usuario) == 100
+    finally:
+        recuperado.cerrar()
+        banco.cerrar()
@@ -0,0 +1,76 @@
+import pytest
+
+from banco_realista import ErrorBanco
+from conftest import nuevo_usuario
+from prestamos import MESES_INCOBRABLE, cerrar_mes, cuota_fija, nuevo_prestamo, tabla_amortizacion
+
+
+def test_tabla_amortiza_todo_el_capital_con_cuota_fija():
+    tabla = tabla_amortizacion(1200, 0.12, 12)
+    assert sum(fila['capital'] for fila in tabla) == pytest.approx(1200)
+    assert tabla[-1]['saldo'] == pytest.approx(0)
+    assert {round(fila['cuota'], 6) for fila in tabla} == {round(cuota_fija(1200, 0.12, 12), 6)}
+    assert cuota_fija(1200, 0, 12) == 100
+
+
+@pytest.mark.parametrize('fecha', ['2026-01-15 12:00:00', '2026-01-31 23:59:59'])
+def test_prestamo_otorgado_en_el_mes_que_se_cierra_no_paga_hasta_el_siguiente(fecha):
+    prestamo = nuevo_prestamo(1, 1200, 0.12, 12, fecha)
+    cambios, cobros, resumen = cerrar_mes([('ana', prestamo)], {'ana': 5000}, '2026-01')
+    assert (cambios, cobros, resumen['prestamos']) == ([], {}, 0)
+
+    cambios, cobros, resumen = cerrar_mes([('ana', prestamo)], {'ana': 5000}, '2026-02')
+    assert resumen['interes'] == pytest.approx(12)
+    assert cobros['ana'] == pytest.approx(prestamo['cuota_mensual'])
+    _, _, campos = cambios[0]
+    assert campos['cuotas_restantes'] == 11
+    assert campos['monto_restante'] == pytest.approx(1200 + 12 - prestamo['cuota_mensual'])
+
+
+def test_sin_saldo_entra_en_mora_y_termina_incobrable():
+    prestamo = nuevo_prestamo(1, 1200, 0.12, 12, '2025-12-01 00:00:00')
+    for numero in range(1, MESES_INCOBRABLE + 1):
+        assert prestamo['estado'] != 'incobrable'
+        cambios, cobros, _ = cerrar_mes([('ana', prestamo)], {'ana': 0}, f'2026-{numero:02d}')
+        assert cobros == {}
+        prestamo = dict(prestamo, **cambios[0][2])
+        assert prestamo['meses_en_mora'] == numero
+    assert prestamo['estado'] == 'incobrable'
+    # Lo atrasado se acumula con la cuota del mes
+    assert prestamo['atrasado'] > 2 * prestamo['cuota_mensual']
+
+
+def test_pago_parcial_con_el_saldo_disponible():
+    prestamo = nuevo_prestamo(1, 1200, 0.12, 12, '2025-12-01 00:00:00')
+    cambios, cobros, resumen = cerrar_mes([('ana', prestamo)], {'ana': 40}, '2026-01')
+    assert cobros == {'ana': 40}
+    assert cambios[0][2]['estado'] == 'en_mora'
+    assert cambios[0][2]['atrasado'] == pytest.approx(prestamo['cuota_mensual'] - 40)
+    assert resumen['en_mora'] == 1
+
+
+def test_cierre_del_banco_con_un_prestamo_de_mitad_de_mes(bancos, monkeypatch):
+    usuario = nuevo_usuario(bancos, saldo=5000)
+    monkeypatch.setattr(bancos, '_ahora', lambda: '2026-03-15 10:00:00')
+    bancos.otorgar_prestamo(usuario, 1200, 12)
+    saldo = bancos.saldo(usuario)
+
+    assert bancos.cerrar_mes('2026-03')['prestamos'] == 0
+    assert bancos.saldo(usuario) == saldo
+
+    resumen = bancos.cerrar_mes('2026-04')
+    cuota = bancos.prestamos_de(usuario)[0]['cuota_mensual']
+    assert resumen['prestamos'] == 1
+    assert bancos.saldo(usuario) == pytest.approx(saldo - cuota)
+    assert bancos.prestamos_de(usuario)[0]['cuotas_restantes'] == 11
+    assert bancos.agregados.total_prestamos == pytest.approx(bancos.calcular_agregados()['total_prestamos'])
+    assert bancos.verificar_diario()['descuadre'] == pytest.approx(0, abs=1e-6)
+
+
+def test_cada_mes_se_cierra_una_vez_y_en_orden(bancos):
+    bancos.cerrar_mes('2026-05')
+    with pytest.raises(ErrorBanco) as error:
+        bancos.cerrar_mes('2026-04')
+    assert error.value.codigo == 409
+    with pytest.raises(ErrorBanco):
+        bancos.cerrar_mes('2026-5')
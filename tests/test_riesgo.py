@@ -0,0 +1,67 @@
+import pytest
+
+from conftest import iniciar_sesion, nuevo_usuario
+from riesgo import CARACTERISTICAS, INGRESO_SUPUESTO, ModeloLogistico, ModeloReglas, PerfilesRiesgo
+
+
+def _caracteristicas(**cambios):
+    caracteristicas = dict.fromkeys(CARACTERISTICAS, 0)
+    caracteristicas.update(ingreso_mensual=3000, saldo=5000, meses_historial=12)
+    caracteristicas.update(cambios)
+    return caracteristicas
+
+
+def test_reglas_limitan_la_carga_de_cuotas():
+    modelo = ModeloReglas()
+    assert modelo.evaluar(_caracteristicas(), 900).aprobado
+    assert modelo.evaluar(_caracteristicas(), 901).motivo == 'Capacidad de pago insuficiente'
+    # Las pérdidas en apuestas se descuentan del ingreso
+    assert not modelo.evaluar(_caracteristicas(perdidas_apuestas=1000), 900).aprobado
+    assert modelo.evaluar(_caracteristicas(prestamos_en_mora=1), 1).motivo == 'Tiene préstamos en mora'
+
+
+def test_logistico_sube_el_riesgo_con_las_apuestas():
+    modelo = ModeloLogistico()
+    sano = modelo.evaluar(_caracteristicas(saldo=0, meses_historial=1), 300)
+    apostador = modelo.evaluar(_caracteristicas(saldo=0, meses_historial=1, perdidas_apuestas=2000), 300)
+    assert sano.aprobado
+    assert apostador.puntaje > sano.puntaje
+    assert (apostador.aprobado, apostador.motivo) == (False, 'Riesgo alto (apuestas)')
+
+
+def test_perfil_cuenta_los_depositos_pendientes_cuando_se_aprueban(banco):
+    usuario = nuevo_usuario(banco, saldo=0)
+    perfiles = PerfilesRiesgo(banco.transacciones)
+    assert perfiles.caracteristicas(usuario, 0, [])['ingreso_mensual'] == INGRESO_SUPUESTO
+
+    solicitud = banco.crear_solicitud(usuario, 'deposito', 600, 'sueldo')
+    perfiles.actualizar()
+    assert perfiles.perfil(usuario).entradas == 0
+    banco.procesar_solicitud(solicitud['id'], 'aprobar', 'admin')
+    perfiles.actualizar()
+    assert perfiles.perfil(usuario).entradas > 0
+    # Cada transacción se incorpora una sola vez
+    entradas = perfiles.perfil(usuario).entradas
+    perfiles.actualizar()
+    assert perfiles.perfil(usuario).entradas == entradas
+
+
+def test_cartera_ordena_a_los_deudores_por_riesgo(bancos):
+    prudente = nuevo_usuario(bancos, saldo=5000)
+    apurado = nuevo_usuario(bancos, saldo=0)
+    bancos.otorgar_prestamo(prudente, 100, 12)
+    bancos.otorgar_prestamo(apurado, 5000, 6)
+    cartera = [fila['usuario'] for fila in bancos.riesgo.evaluar_cartera()]
+    assert cartera.index(apurado) < cartera.index(prudente)
+
+
+def test_solicitar_prestamo_evalua_el_riesgo(cliente, modulo_app):
+    usuario = nuevo_usuario(modulo_app.banco)
+    iniciar_sesion(cliente, usuario)
+    rechazo = cliente.post('/solicitar_prestamo', json={'monto': 10 ** 6, 'plazo_meses': 12})
+    assert rechazo.status_code == 400
+    assert 0 <= rechazo.get_json()['puntaje_riesgo'] <= 1
+
+    aprobado = cliente.post('/solicitar_prestamo', json={'monto': 100, 'plazo_meses': 12}).get_json()
+    assert aprobado['mensaje'] == 'Préstamo aprobado'
+    assert aprobado['nuevo_saldo'] == pytest.approx(modulo_app.banco.saldo(usuario))
@@ -0,0 +1,74 @@
+import pytest
+
+from banco_realista import ErrorBanco
+from conftest import iniciar_sesion, nuevo_usuario
+from solicitudes import ColaSolicitudes
+
+
+def test_cola_no_reutiliza_ids_y_retira_una_sola_vez():
+    cola = ColaSolicitudes()
+    for trans_id in (10, 11):
+        cola.agregar({'id': cola.nuevo_id(), 'estado': 'pendiente'}, trans_id)
+    assert cola.ids() == [1, 2]
+    assert cola.retirar(1) == ({'id': 1, 'estado': 'pendiente'}, 10)
+    assert cola.retirar(1) == (None, None)
+    assert cola.nuevo_id() == 3
+
+
+def test_aprobar_deposito_acredita_neto_de_impuesto(bancos):
+    usuario = nuevo_usuario(bancos, saldo=0)
+    solicitud = bancos.crear_solicitud(usuario, 'deposito', 100, 'sueldo')
+    mensaje, estado = bancos.procesar_solicitud(solicitud['id'], 'aprobar', 'admin')
+    assert estado == 'aprobado'
+    assert bancos.saldo(usuario) == pytest.approx(100 - bancos.calcular_impuesto(100))
+    assert solicitud['id'] not in bancos.solicitudes_pendientes
+    # Ya procesada: otro administrador no la encuentra
+    assert bancos.procesar_solicitud(solicitud['id'], 'aprobar', 'admin') is None
+
+
+def test_retiro_sin_fondos_se_rechaza_al_aprobar(bancos):
+    usuario = nuevo_usuario(bancos, saldo=100)
+    solicitud = bancos.crear_solicitud(usuario, 'retiro', 80, '')
+    bancos.debitar(usuario, 50)
+    assert bancos.procesar_solicitud(solicitud['id'], 'aprobar', 'admin')[1] == 'rechazado_fondos'
+    assert bancos.saldo(usuario) == pytest.approx(50)
+
+
+@pytest.mark.parametrize('monto', [float('nan'), float('inf'), 0, -5, '10', True, None])
+def test_crear_solicitud_rechaza_montos_invalidos(bancos, monto):
+    usuario = nuevo_usuario(bancos)
+    with pytest.raises(ErrorBanco):
+        bancos.crear_solicitud(usuario, 'deposito', monto, '')
+    assert len(bancos.solicitudes_pendientes) == 0
+
+
+def test_crear_solicitud_rechaza_tipos_desconocidos(banco):
+    with pytest.raises(ErrorBanco):
+        banco.crear_solicitud(nuevo_usuario(banco), 'prestamo', 10, '')
+
+
+def test_solicitud_heredada_con_monto_invalido_sigue_pendiente(banco):
+    usuario = nuevo_usuario(banco)
+    solicitud = banco.crear_solicitud(usuario, 'deposito', 10, '')
+    # Como las que se registraban antes de validar el monto
+    banco.solicitudes_pendientes.obtener(solicitud['id'])['monto'] = 'abc'
+    with pytest.raises(ErrorBanco):
+        banco.procesar_solicitud(solicitud['id'], 'aprobar', 'admin')
+    assert solicitud['id'] in banco.solicitudes_pendientes
+    assert banco.procesar_solicitud(solicitud['id'], 'rechazar', 'admin')[1] == 'rechazado'
+
+
+def test_procesado_masivo_informa_errores_sin_500(cliente, modulo_app):
+    banco = modulo_app.banco
+    usuario = nuevo_usuario(banco)
+    buena = banco.crear_solicitud(usuario, 'deposito', 10, '')
+    mala = banco.crear_solicitud(usuario, 'deposito', 10, '')
+    banco.solicitudes_pendientes.obtener(mala['id'])['monto'] = float('nan')
+    iniciar_sesion(cliente, 'admin', tipo='admin')
+    respuesta = cliente.post('/api/procesar_solicitudes', json={
+        'accion': 'aprobar', 'solicitud_ids': [buena['id'], mala['id'], 999999]})
+    assert respuesta.status_code == 200
+    datos = respuesta.get_json()
+    assert datos['por_estado'] == {'aprobado': 1}
+    assert {e['id'] for e in datos['errores']} == {mala['id'], 999999}
+    assert mala['id'] in banco.solicitudes_pendientes
@@ -0,0 +1,66 @@
+import pytest
+
+from conftest import iniciar_sesion, nuevo_usuario
+from limites import CupoConexiones
+
+
+@pytest.fixture
+def sesion(cliente, modulo_app):
+    iniciar_sesion(cliente, nuevo_usuario(modulo_app.banco))
+    return cliente
+
+
+@pytest.fixture
+def cupo(modulo_app, monkeypatch):
+    cupo = CupoConexiones(1)
+    monkeypatch.setattr(modulo_app, 'streams_mercado', cupo)
+    return cupo
+
+
+def test_stream_pide_sesion(cliente):
+    assert cliente.get('/api/mercado/stream').status_code == 401
+
+
+def test_stream_envia_precios_y_portafolio(sesion, cupo):
+    respuesta = sesion.get('/api/mercado/stream', buffered=False)
+    eventos = respuesta.response
+    assert respuesta.status_code == 200
+    assert respuesta.mimetype == 'text/event-stream'
+    assert next(eventos).startswith(b'retry:')
+    tick = next(eventos)
+    assert b'event: precios' in tick and b'event: portafolio' in tick
+    respuesta.close()
+    assert cupo.en_uso == 0
+
+
+def test_sin_lugar_responde_503_hasta_que_se_cierra_uno(sesion, cupo):
+    abierto = sesion.get('/api/mercado/stream', buffered=False)
+    rechazado = sesion.get('/api/mercado/stream')
+    assert rechazado.status_code == 503
+    assert rechazado.headers['Retry-After']
+    assert cupo.estadisticas() == {'en_uso': 1, 'maximo': 1, 'rechazadas': 1}
+    abierto.close()
+    otro = sesion.get('/api/mercado/stream', buffered=False)
+    assert otro.status_code == 200
+    otro.close()
+    assert cupo.en_uso == 0
+
+
+def test_stream_se_cierra_con_fin_al_vencer(sesion, cupo, modulo_app, monkeypatch):
+    monkeypatch.setattr(modulo_app, 'DURACION_STREAM_MERCADO', 0)
+    respuesta = sesion.get('/api/mercado/stream', buffered=False)
+    eventos = respuesta.response
+    next(eventos)
+    assert next(eventos) == b'event: fin\ndata: {}\n\n'
+    assert next(eventos, None) is None
+    respuesta.close()
+    assert cupo.en_uso == 0
+
+
+def test_long_poll_devuelve_el_tick_siguiente_o_el_mismo_al_vencer(cliente, modulo_app):
+    secuencia = modulo_app.banco.mercado.instantanea().secuencia
+    mismo = cliente.get(f'/api/mercado?desde={secuencia}&espera=0.01').get_json()
+    # Salvo que justo haya corrido el tick de fondo
+    assert mismo['secuencia'] in (secuencia, modulo_app.banco.mercado.instantanea().secuencia)
+    # Una secuencia distinta (p. ej. de antes de un reinicio) responde al instante
+    assert cliente.get('/api/mercado?desde=0').get_json()['secuencia'] >= secuencia
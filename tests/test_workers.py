@@ -0,0 +1,120 @@
+import importlib.util
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from banco_realista import BancoRealista
+from banco_sqlite import BancoSQLite
+from conftest import nuevo_usuario
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def dos_workers(tmp_path):
+    # Dos bancos sobre la misma base, como dos workers de gunicorn
+    ruta = str(tmp_path / 'banco.db')
+    uno, otro = BancoSQLite(ruta), BancoSQLite(ruta)
+    yield uno, otro
+    uno.cerrar()
+    otro.cerrar()
+
+
+def _simbolo(banco):
+    return next(iter(banco.mercado.instantanea()))
+
+
+def test_ordenes_y_eventos_se_comparten(dos_workers):
+    uno, otro = dos_workers
+    simbolo = _simbolo(uno)
+    vendedor = nuevo_usuario(uno, saldo=100000)
+    uno.comprar_acciones(vendedor, simbolo, 2)
+    orden = uno.enviar_orden(vendedor, simbolo, 'venta', 'limite', 2, 1)
+    assert otro.ordenes.obtener(orden['orden_id']) is not None
+
+    comprador = nuevo_usuario(otro, saldo=100000)
+    assert otro.enviar_orden(comprador, simbolo, 'compra', 'mercado', 2)['estado'] == 'completada'
+    assert uno.ordenes.obtener(orden['orden_id']) is None
+    assert uno.portafolios[comprador][simbolo] == 2
+
+    evento = uno.crear_evento('Compartido', 2.0, 3.0, 3.0)
+    otro.apostar_deportes(comprador, evento['id'], 10, 'local')
+    assert uno.apuestas.evento(evento['id']).cantidad == 1
+    # Los ids de eventos no se repiten entre workers
+    assert otro.crear_evento('Otro', 2.0, 3.0, 3.0)['id'] != evento['id']
+
+
+def test_copia_de_lectura_se_carga_una_vez_por_version(dos_workers):
+    uno, otro = dos_workers
+    copia = uno.ordenes
+    assert uno.ordenes is copia
+    usuario = nuevo_usuario(otro, saldo=1000)
+    otro.enviar_orden(usuario, _simbolo(otro), 'compra', 'limite', 1, 1)
+    nueva = uno.ordenes
+    assert nueva is not copia
+    assert uno.ordenes is nueva
+
+
+def _fijar_concesion(banco, lider, hasta):
+    with banco.pool.transaccion() as con:
+        con.execute("UPDATE banco SET valor = ? WHERE clave = 'mercado'", (json.dumps({
+            'lider': lider, 'hasta': hasta, 'tick': 10 ** 6, 'precios': {_simbolo(banco): 42.0}}),))
+
+
+def test_solo_el_worker_con_la_concesion_corre_las_tareas(dos_workers):
+    uno, _ = dos_workers
+    assert not uno.a_cargo_de_tareas()
+    uno.actualizar_mercado()
+    assert uno.a_cargo_de_tareas()
+
+    # Otro proceso tiene la concesión: se adoptan sus precios
+    _fijar_concesion(uno, os.getpid() + 1, time.time() + 60)
+    uno.actualizar_mercado()
+    assert not uno.a_cargo_de_tareas()
+    assert uno.mercado.precio(_simbolo(uno)) == 42.0
+
+    # Vencida, la toma el próximo que actualiza
+    _fijar_concesion(uno, os.getpid() + 1, time.time() - 1)
+    uno.actualizar_mercado()
+    assert uno.a_cargo_de_tareas()
+
+
+def test_tareas_de_fondo_se_saltan_sin_estar_a_cargo(monkeypatch):
+    banco = BancoRealista()
+    corridas = []
+    tarea = banco._si_a_cargo(lambda: corridas.append(1))
+    tarea()
+    monkeypatch.setattr(banco, 'a_cargo_de_tareas', lambda: False)
+    tarea()
+    assert corridas == [1]
+    banco.cerrar()
+
+
+def _on_starting():
+    spec = importlib.util.spec_from_file_location('gunicorn_conf', os.path.join(RAIZ, 'gunicorn.conf.py'))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo.on_starting
+
+
+@pytest.mark.parametrize('workers, entorno, arranca', [
+    (1, {'CHIQUIBANK_DATOS': '/var/data/chiquibank'}, True),
+    (1, {}, False),
+    (4, {'CHIQUIBANK_DATOS': '/var/data/chiquibank'}, False),
+    (4, {'CHIQUIBANK_BACKEND': 'sqlite', 'CHIQUIBANK_SQLITE': '/var/data/banco.db'}, True),
+    (4, {'CHIQUIBANK_BACKEND': 'sqlite'}, False),
+])
+def test_gunicorn_exige_almacen_compartido_y_persistente(monkeypatch, workers, entorno, arranca):
+    for variable in ('CHIQUIBANK_BACKEND', 'CHIQUIBANK_DATOS', 'CHIQUIBANK_SQLITE'):
+        monkeypatch.delenv(variable, raising=False)
+    for variable, valor in entorno.items():
+        monkeypatch.setenv(variable, valor)
+    servidor = SimpleNamespace(cfg=SimpleNamespace(workers=workers))
+    if arranca:
+        _on_starting()(servidor)
+    else:
+        with pytest.raises(SystemExit):
+            _on_starting()(servidor)
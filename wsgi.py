@@ -0,0 +1,5 @@
+"""Punto de entrada WSGI para producción (ver gunicorn.conf.py).
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from app import app  # noqa: F401